@@ -0,0 +1,140 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import requests
+
+from zoom_drive_connector.zoom import CopyEngine
+
+from benchmarks.fake_servers import StandInProcess
+
+MB = 1024 * 1024
+KB = 1024
+
+
+def _cpu_time() -> float:
+  """Returns user plus system CPU time of the current process."""
+  usage = resource.getrusage(resource.RUSAGE_SELF)
+  return usage.ru_utime + usage.ru_stime
+
+
+def _measure(copy: Callable[[], None], size: int, repeats: int) -> Dict[str, float]:
+  """Runs `copy` several times and keeps the fastest run.
+
+  :param copy: function performing one copy.
+  :param size: number of bytes copied per run.
+  :param repeats: number of runs.
+  :return: throughput in MB/s and CPU seconds per GB of the fastest run.
+  """
+  best = None
+  for _ in range(repeats):
+    cpu, wall = _cpu_time(), time.perf_counter()
+    copy()
+    wall, cpu = time.perf_counter() - wall, _cpu_time() - cpu
+    if best is None or wall < best[0]:
+      best = (wall, cpu)
+  wall, cpu = best  # type: ignore
+  return {'mb_s': size / MB / wall, 'cpu_s_per_gb': cpu / (size / 1024 / MB)}
+
+
+def _sources(mode: str, source_file: str, url: str) -> Callable:
+  """Returns a function opening a fresh source stream for each run.
+
+  :param mode: `file` to read from a local file, `http` to stream from the stand-in server.
+  :param source_file: path of the local source file.
+  :param url: download URL on the stand-in server.
+  """
+  if mode == 'file':
+    return lambda: open(source_file, 'rb', buffering=0)
+
+  session = requests.Session()
+
+  def open_http():
+    response = session.get(url, stream=True)
+    response.raw.decode_content = True
+    return response.raw
+  return open_http
+
+
+def main():
+  """Compares `shutil.copyfileobj` with `CopyEngine` for a range of block sizes."""
+  parser = argparse.ArgumentParser(description='Microbenchmark of the download copy engine.')
+  parser.add_argument('--size-mb', type=float, default=256, help='amount of data to copy')
+  parser.add_argument('--source', choices=('file', 'http'), default='http',
+                      help='read from a local file or from the stand-in HTTP server')
+  parser.add_argument('--block-sizes-kb', type=int, nargs='+',
+                      default=[64, 256, 1024, 4096, 16384])
+  parser.add_argument('--repeats', type=int, default=3)
+  parser.add_argument('--target', default=None,
+                      help='directory to write to, e.g. on the storage used in production')
+  args = parser.parse_args()
+
+  size = int(args.size_mb * MB)
+  server = None
+  url = ''
+  with tempfile.TemporaryDirectory(dir=args.target) as work_dir:
+    source_file = os.path.join(work_dir, 'source.bin')
+    destination = os.path.join(work_dir, 'destination.mp4')
+
+    if args.source == 'file':
+      with open(source_file, 'wb') as f:
+        for _ in range(size // MB):
+          f.write(os.urandom(MB))
+        f.write(os.urandom(size % MB))
+    else:
+      server = StandInProcess(meetings=1, file_size=size)
+      server.start()
+      url = f'{server.url}/rec/play/meeting-0'
+
+    open_source = _sources(args.source, source_file, url)
+
+    def baseline():
+      source = open_source()
+      with open(destination, 'wb') as f:
+        shutil.copyfileobj(source, f)
+      source.close()
+
+    results = []  # type: List
+    results.append(('shutil.copyfileobj', _measure(baseline, size, args.repeats)))
+
+    for block_kb in args.block_sizes_kb:
+      for preallocate in (False, True):
+        engine = CopyEngine(block_size=block_kb * KB, preallocate=preallocate)
+
+        def run_engine(engine=engine):
+          source = open_source()
+          engine.copy(source, destination, total=size)
+          source.close()
+
+        label = f'CopyEngine {block_kb:>6} KiB' + (' +fallocate' if preallocate else '')
+        results.append((label, _measure(run_engine, size, args.repeats)))
+
+    if server:
+      server.stop()
+
+  print(f'{"method":<36} {"MB/s":>10} {"CPU s/GB":>10}')
+  for label, result in results:
+    print(f'{label:<36} {result["mb_s"]:>10.1f} {result["cpu_s_per_gb"]:>10.2f}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,116 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import json
+import resource
+import tempfile
+import threading
+import time
+from typing import Dict
+
+from zoom_drive_connector import drive, pipeline, slack
+from zoom_drive_connector.configuration import SlackConfig, SystemConfig
+
+from benchmarks.bench_pipeline import MB, _StandInSlackClient, build_configs
+from benchmarks.fake_servers import StandInProcess
+
+ENGINES = {'threads': pipeline.Scheduler, 'asyncio': pipeline.AsyncScheduler}
+
+
+def run(engine: str,
+        meetings: int,
+        file_size: int,
+        concurrency: int,
+        latency: float = 0.0) -> Dict:
+  """Runs one cycle of a scheduler against the stand-in servers with `concurrency` transfers at
+  the same time and samples the number of threads while it runs. Run each engine in its own
+  process, since the peak RSS is that of the whole process.
+
+  :param engine: `threads` or `asyncio`.
+  :param meetings: number of meetings with a recording.
+  :param file_size: size of every recording in bytes.
+  :param concurrency: workers of the threaded engine, transfers of the asyncio engine.
+  :param latency: delay in seconds added to every request.
+  :return: dictionary containing the benchmark report.
+  """
+  server = StandInProcess(meetings=meetings, file_size=file_size, latency=latency)
+  server.start()
+  try:
+    with tempfile.TemporaryDirectory() as work_dir:
+      sys_config, drive_config, _, zoom_config = build_configs(
+          server.url, work_dir, meetings, workers=concurrency, trash_rate=0)
+      sys_config = SystemConfig({**sys_config.settings_dict, 'async_transfers': concurrency})
+      slack_api = slack.SlackAPI(SlackConfig({'key': 'stand-in', 'api_url': f'{server.url}/api'}))
+      slack_api.sc = _StandInSlackClient(server.url)
+      scheduler = ENGINES[engine](zoom_config, sys_config,
+                                  drive.DriveAPI(drive_config, sys_config), slack_api)
+
+      peak_threads = threading.active_count()
+      done = threading.Event()
+
+      def sample():
+        nonlocal peak_threads
+        while not done.wait(0.05):
+          peak_threads = max(peak_threads, threading.active_count())
+
+      sampler = threading.Thread(target=sample, daemon=True)
+      sampler.start()
+      start = time.perf_counter()
+      result = scheduler.run_once()
+      wall_time = time.perf_counter() - start
+      done.set()
+      sampler.join()
+      connections = scheduler.pool.opened if engine == 'asyncio' else None
+      scheduler.close(timeout=60)
+    stats = server.stats()
+  finally:
+    server.stop()
+
+  return {
+    'engine': engine,
+    'meetings': meetings,
+    'file_size_mb': file_size / MB,
+    'concurrency': concurrency,
+    'transferred': result['transferred'],
+    'failed': result['failed'],
+    'wall_time_s': round(wall_time, 3),
+    'recordings_per_s': round(result['transferred'] / wall_time, 1) if wall_time else 0,
+    'peak_threads': peak_threads,
+    'connections_opened': connections,
+    'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    'verified': stats['verified'],
+    'api_calls': sum(stats['calls'].values()),
+  }
+
+
+def main():
+  """Command line entrypoint of the engine benchmark."""
+  parser = argparse.ArgumentParser(
+      description='Compares the threaded and the asyncio engine against local stand-ins.')
+  parser.add_argument('--engine', choices=sorted(ENGINES), default='asyncio')
+  parser.add_argument('--meetings', type=int, default=1000, help='number of meetings')
+  parser.add_argument('--file-size-mb', type=float, default=0.25, help='size of each recording')
+  parser.add_argument('--concurrency', type=int, default=32,
+                      help='transfers running at the same time')
+  parser.add_argument('--latency-ms', type=float, default=50, help='delay added to each request')
+  args = parser.parse_args()
+
+  print(json.dumps(run(args.engine, args.meetings, int(args.file_size_mb * MB), args.concurrency,
+                       latency=args.latency_ms / 1000), indent=2))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,106 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import Dict
+
+from zoom_drive_connector.monitoring import TransferHistory
+from zoom_drive_connector.monitoring.capture import percentiles
+
+MB = 1024 * 1024
+DAY = 86400
+
+
+def fill(history: TransferHistory, rows: int, meetings: int, days: int, seed: int = 1) -> float:
+  """Adds random transfers spread evenly over the last `days` days.
+
+  :return: transfers written per second.
+  """
+  rng = random.Random(seed)
+  end = time.time()
+  start = end - days * DAY
+  started = time.perf_counter()
+  for i in range(rows):
+    size = int(rng.lognormvariate(5, 1) * MB)
+    download = size / (rng.uniform(5, 40) * MB)
+    upload = size / (rng.uniform(2, 20) * MB)
+    failed = rng.random() < 0.02
+    history.add(start + (end - start) * i / rows, f'Meeting {rng.randrange(meetings)}',
+                'failed' if failed else 'ok', size, download + upload + 0.3,
+                {'download': download, 'upload': upload, 'notify': 0.3}, int(failed),
+                ['drive.upload:503'] if failed else [])
+  return rows / (time.perf_counter() - started)
+
+
+def scan(history: TransferHistory, start: float, end: float) -> Dict:
+  """Computes the trend and stage percentiles from the rows, for comparison with the rollups."""
+  db = history._db  # pylint: disable=protected-access
+  trend = db.execute('SELECT CAST(finished / 86400 AS INTEGER), COUNT(*), SUM(bytes) '
+                     'FROM transfers WHERE finished >= ? AND finished < ? GROUP BY 1',
+                     (start, end)).fetchall()
+  downloads = [row[0] for row in db.execute(
+      "SELECT download_s FROM transfers WHERE finished >= ? AND finished < ? AND status = 'ok'",
+      (start, end))]
+  return {'trend': trend, 'download': percentiles(downloads, (50, 95))}
+
+
+def _timed(fn, repeats: int = 3) -> float:
+  best = None
+  for _ in range(repeats):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    best = elapsed if best is None else min(best, elapsed)
+  return best  # type: ignore
+
+
+def main():
+  """Measures how fast transfers are recorded and how long `stats` takes on a large history."""
+  parser = argparse.ArgumentParser(description='Benchmark of the transfer history store.')
+  parser.add_argument('--rows', type=int, default=1000000, help='number of transfers')
+  parser.add_argument('--meetings', type=int, default=2000, help='number of distinct meetings')
+  parser.add_argument('--days', type=int, default=365, help='days the transfers are spread over')
+  parser.add_argument('--range-days', type=int, default=30, help='days covered by the report')
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as work_dir:
+    path = os.path.join(work_dir, 'history.sqlite')
+    history = TransferHistory(path)
+    rate = fill(history, args.rows, args.meetings, args.days)
+    end = time.time()
+    start = end - args.range_days * DAY
+    report = _timed(lambda: history.report(start, end))
+    whole = _timed(lambda: history.report(end - args.days * DAY, end))
+    raw = _timed(lambda: scan(history, start, end))
+    raw_whole = _timed(lambda: scan(history, end - args.days * DAY, end), repeats=1)
+    history.close()
+    size = sum(os.path.getsize(os.path.join(work_dir, name)) for name in os.listdir(work_dir))
+
+  print(f'transfers             {args.rows}')
+  print(f'insert rate           {rate:,.0f} transfers/s')
+  print(f'database size         {size / MB:.1f} MB ({size / args.rows:.0f} bytes/transfer)')
+  print(f'report {args.range_days:>3} days        {report * 1000:.1f} ms (rollups)')
+  print(f'report {args.days:>3} days        {whole * 1000:.1f} ms (rollups)')
+  # The scans only compute the trend and the percentiles of one stage from the rows.
+  print(f'scan {args.range_days:>3} days          {raw * 1000:.1f} ms (rows)')
+  print(f'scan {args.days:>3} days          {raw_whole * 1000:.1f} ms (rows)')
+
+
+if __name__ == '__main__':
+  main()
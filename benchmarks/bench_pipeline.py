@@ -0,0 +1,177 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import json
+import os
+import resource
+import tempfile
+import time
+from typing import Dict
+
+import requests
+
+from zoom_drive_connector import configuration as config, drive, slack, zoom
+from zoom_drive_connector.__main__ import all_steps
+
+from benchmarks.fake_servers import StandInProcess
+
+MB = 1024 * 1024
+
+
+class _StandInSlackClient:
+  def __init__(self, url: str):
+    """Minimal replacement for `SlackClient` posting to the stand-in server. The real client only
+    talks HTTPS to slack.com.
+
+    :param url: base URL of the stand-in server.
+    """
+    self.url = url
+    self.session = requests.Session()
+
+  def api_call(self, method: str, **kwargs) -> Dict:
+    return self.session.post(f'{self.url}/api/{method}', data=kwargs).json()
+
+
+def build_configs(url: str, work_dir: str, meetings: int, **zoom_settings):
+  """Creates the configuration of the connector, pointed at the stand-in server.
+
+  :param url: base URL of the stand-in server.
+  :param work_dir: directory for downloads and credential files.
+  :param meetings: number of meetings to configure.
+  :param zoom_settings: additional settings of the Zoom section, e.g. `workers`.
+  :return: tuple of (SystemConfig, DriveConfig, SlackConfig, ZoomConfig).
+  """
+  credentials = os.path.join(work_dir, 'credentials.json')
+  with open(credentials, 'w', encoding='utf-8') as f:
+    # A far-away expiry keeps the Google client from trying to refresh the token.
+    json.dump({'token': 'stand-in', 'refresh_token': 'stand-in', 'client_id': 'stand-in',
+               'client_secret': 'stand-in', 'expiry': '2999-01-01T00:00:00Z'}, f)
+
+  download_folder = os.path.join(work_dir, 'downloads')
+  os.makedirs(download_folder, exist_ok=True)
+
+  sys_config = config.SystemConfig({'target_folder': download_folder})
+  drive_config = config.DriveConfig({'credentials_json': credentials,
+                                     'client_secret_json': credentials,
+                                     'api_root': url})
+  slack_config = config.SlackConfig({'key': 'stand-in'})
+  zoom_config = config.ZoomConfig({
+    'account_id': 'stand-in', 'client_id': 'stand-in', 'client_secret': 'stand-in',
+    'delete': True, 'api_host': url, 'oauth_host': url,
+    'meetings': [{'id': f'meeting-{i}', 'name': f'Meeting {i}', 'folder_id': 'folder',
+                  'slack_channel': 'channel'} for i in range(meetings)],
+    **zoom_settings})
+  return sys_config, drive_config, slack_config, zoom_config
+
+
+def build_pipeline(url: str, work_dir: str, meetings: int):
+  """Creates the API objects of the connector, pointed at the stand-in server.
+
+  :param url: base URL of the stand-in server.
+  :param work_dir: directory for downloads and credential files.
+  :param meetings: number of meetings to configure.
+  :return: tuple of (ZoomAPI, SlackAPI, DriveAPI, ZoomConfig).
+  """
+  sys_config, drive_config, slack_config, zoom_config = build_configs(url, work_dir, meetings)
+  zoom_api = zoom.ZoomAPI(zoom_config, sys_config)
+  slack_api = slack.SlackAPI(slack_config)
+  slack_api.sc = _StandInSlackClient(url)
+  drive_api = drive.DriveAPI(drive_config, sys_config)
+  return zoom_api, slack_api, drive_api, zoom_config
+
+
+def run(meetings: int,
+        file_size: int,
+        latency: float = 0.0,
+        download_bandwidth: float = 0.0,
+        upload_bandwidth: float = 0.0) -> Dict:
+  """Runs one `all_steps` cycle against the stand-in servers and collects measurements.
+
+  :param meetings: number of meetings with a recording.
+  :param file_size: size of every recording in bytes.
+  :param latency: delay in seconds added to every request.
+  :param download_bandwidth: cap in bytes per second for downloads, 0 for no cap.
+  :param upload_bandwidth: cap in bytes per second for uploads, 0 for no cap.
+  :return: dictionary containing the benchmark report.
+  """
+  server = StandInProcess(meetings=meetings, file_size=file_size, latency=latency,
+                          download_bandwidth=download_bandwidth,
+                          upload_bandwidth=upload_bandwidth)
+  server.start()
+
+  try:
+    with tempfile.TemporaryDirectory() as work_dir:
+      zoom_api, slack_api, drive_api, zoom_config = build_pipeline(server.url, work_dir, meetings)
+      trash_queue = zoom.TrashQueue(zoom_api, rate=0)
+      trash_queue.start()
+
+      start = time.perf_counter()
+      all_steps(zoom_api, slack_api, drive_api, zoom_config, trash_queue)
+      transfer_time = time.perf_counter() - start
+      trash_queue.join(timeout=60)
+      wall_time = time.perf_counter() - start
+      trash_queue.stop()
+
+    stats = server.stats()
+  finally:
+    server.stop()
+
+  total_bytes = meetings * file_size
+  return {
+    'meetings': meetings,
+    'file_size_mb': file_size / MB,
+    'wall_time_s': round(wall_time, 3),
+    'transfer_time_s': round(transfer_time, 3),
+    'throughput_mb_s': round(total_bytes / MB / transfer_time, 2) if transfer_time else 0,
+    'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    'uploaded_files': stats['uploaded_files'],
+    'uploaded_mb': round(stats['uploaded_bytes'] / MB, 2),
+    'trashed': stats['trashed'],
+    'api_calls': stats['calls']
+  }
+
+
+def main():
+  """Command line entrypoint of the pipeline benchmark."""
+  parser = argparse.ArgumentParser(
+      description='End-to-end benchmark of all_steps against local Zoom and Drive stand-ins.')
+  parser.add_argument('--meetings', type=int, default=10, help='number of meetings')
+  parser.add_argument('--file-size-mb', type=float, default=20, help='size of each recording')
+  parser.add_argument('--latency-ms', type=float, default=0, help='delay added to each request')
+  parser.add_argument('--download-mbps', type=float, default=0,
+                      help='download bandwidth cap in MB/s, 0 for none')
+  parser.add_argument('--upload-mbps', type=float, default=0,
+                      help='upload bandwidth cap in MB/s, 0 for none')
+  parser.add_argument('--json', action='store_true', help='print the report as JSON')
+  args = parser.parse_args()
+
+  report = run(args.meetings, int(args.file_size_mb * MB), latency=args.latency_ms / 1000,
+               download_bandwidth=args.download_mbps * MB, upload_bandwidth=args.upload_mbps * MB)
+
+  if args.json:
+    print(json.dumps(report, indent=2))
+    return
+
+  for key, value in report.items():
+    if key == 'api_calls':
+      for endpoint, count in sorted(value.items()):
+        print(f'{"calls." + endpoint:<28} {count}')
+    else:
+      print(f'{key:<28} {value}')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,891 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import collections
+import datetime
+import email
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import re
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# Block of pseudo-random data that recordings are made of.
+_BLOCK = os.urandom(1024 * 1024)
+_CONTENT_RANGE = re.compile(r'bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)')
+# Recordings are streamed in pieces of this size, each the start of `_BLOCK`.
+_PIECE = 256 * 1024
+# Drive file names the connector gives the recordings of the configured stand-in meetings.
+_UPLOAD_NAME = re.compile(r'-Meeting (\d+)\.mp4$')
+_FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+# The recording of meeting `i` started on this day plus `i` days.
+_FIRST_DAY = datetime.datetime(2018, 1, 1, 1, 1, 1)
+
+
+def recording_pieces(size: int):
+  """Yields the content of a stand-in recording of `size` bytes.
+
+  :param size: size of the recording.
+  """
+  sent = 0
+  while sent < size:
+    piece = min(size - sent, _PIECE)
+    yield _BLOCK[:piece]
+    sent += piece
+
+
+def recording_digest(size: int) -> str:
+  """Returns the SHA-256 digest of a stand-in recording of `size` bytes."""
+  digest = hashlib.sha256()
+  for piece in recording_pieces(size):
+    digest.update(piece)
+  return digest.hexdigest()
+
+
+class FaultPlan:
+  def __init__(self,
+               rate_limit: float = 0.0,
+               retry_after: int = 1,
+               server_errors: float = 0.0,
+               burst: int = 3,
+               resets: float = 0.0,
+               truncations: float = 0.0,
+               expired_tokens: float = 0.0,
+               token_lifetime: float = 0.0,
+               endpoints: Optional[List[str]] = None,
+               seed: Optional[int] = None):
+    """Faults the stand-in servers inject into their answers. Rates are the probability that a
+    request gets the fault.
+
+    :param rate_limit: probability of answering 429 with a `Retry-After` header.
+    :param retry_after: number of seconds sent in `Retry-After`.
+    :param server_errors: probability of starting a burst of 503 answers.
+    :param burst: number of consecutive requests to the same service (Zoom, Drive, or Slack) that
+      fail in a burst.
+    :param resets: probability that a download or an upload chunk is cut off by a connection reset
+      halfway through the body.
+    :param truncations: probability that a download ends halfway, short of its Content-Length,
+      with the connection closed cleanly.
+    :param expired_tokens: probability that the Zoom token of a request expires; the request and
+      every later one with the same token get 401 until a new token is requested.
+    :param token_lifetime: seconds after which Zoom tokens are rejected, whatever `expires_in`
+      said; 0 for never.
+    :param endpoints: prefixes of the endpoints faults are injected into, e.g. `zoom.download`;
+      all endpoints if not given.
+    :param seed: seed of the random generator, for repeatable runs.
+    """
+    self.rate_limit = rate_limit
+    self.retry_after = retry_after
+    self.server_errors = server_errors
+    self.burst = max(1, burst)
+    self.resets = resets
+    self.truncations = truncations
+    self.expired_tokens = expired_tokens
+    self.token_lifetime = token_lifetime
+    self.endpoints = endpoints
+    self.seed = seed
+
+  def applies(self, endpoint: str) -> bool:
+    """Returns true if faults are injected into `endpoint`."""
+    return not self.endpoints or any(endpoint.startswith(p) for p in self.endpoints)
+
+
+class StandInState:
+  def __init__(self,
+               meetings: int,
+               file_size: int,
+               latency: float = 0.0,
+               download_bandwidth: float = 0.0,
+               upload_bandwidth: float = 0.0,
+               sizes: Optional[List[int]] = None,
+               available: Optional[List[float]] = None,
+               latencies: Optional[Dict[str, List[float]]] = None,
+               faults: Optional[FaultPlan] = None,
+               folders: Optional[List[str]] = None):
+    """Shared state of the stand-in servers. Besides counting calls, it checks that every
+    recording uploaded to Drive is complete and intact, and that no recording is trashed on Zoom
+    before it was uploaded.
+
+    :param meetings: number of meetings that have a recording available.
+    :param file_size: size of every recording in bytes.
+    :param latency: delay in seconds added to every request.
+    :param download_bandwidth: cap in bytes per second for recording downloads, 0 for no cap.
+    :param upload_bandwidth: cap in bytes per second for Drive uploads, 0 for no cap.
+    :param sizes: size of the recording of each meeting, overriding `file_size`.
+    :param available: seconds after the server started at which the recording of each meeting
+      appears; all recordings are available right away if not given.
+    :param latencies: observed delays per endpoint (e.g. `zoom.download`) that every request
+      picks one from at random, overriding `latency`.
+    :param faults: faults to inject; none if not given.
+    :param folders: IDs of the Drive folders that exist at the start; `folder` if not given.
+    """
+    self.meetings = meetings
+    self.file_size = file_size
+    self.latency = latency
+    self.download_bandwidth = download_bandwidth
+    self.upload_bandwidth = upload_bandwidth
+    self.sizes = sizes
+    self.available = available
+    self.latencies = latencies or {}
+    self.faults = faults or FaultPlan()
+    self.started = time.monotonic()
+    self._random = random.Random(self.faults.seed)
+    self._bursts = {}  # type: Dict[str, int]
+
+    self.calls = collections.Counter()  # type: collections.Counter
+    self.sessions = {}  # type: Dict[str, int]
+    self.uploaded = {}  # type: Dict[str, int]
+    self.trashed = set()  # type: set
+    self.tokens = {}  # type: Dict[str, float]
+    self.injected = collections.Counter()  # type: collections.Counter
+    # Complete and intact uploads per meeting, uploads whose content was wrong, and recordings
+    # trashed before they were uploaded.
+    self.verified = collections.Counter()  # type: collections.Counter
+    self.corrupt = []  # type: List[str]
+    self.violations = []  # type: List[str]
+    self.upload_names = {}  # type: Dict[str, str]
+    self.upload_digests = {}  # type: Dict[str, Any]
+    # Objects of the S3-compatible store by `<bucket>/<key>`, and the parts of unfinished
+    # multipart uploads by upload ID. Kept in memory, so only use small recordings with them.
+    self.objects = {}  # type: Dict[str, bytes]
+    self.multipart = {}  # type: Dict[str, Dict[int, bytes]]
+    # Drive folders by ID with their name and parent, and the parent folder of every upload.
+    self.folders = {folder_id: {'name': folder_id, 'parent': None}
+                    for folder_id in (['folder'] if folders is None else folders)
+                    }  # type: Dict[str, Dict[str, Any]]
+    self.upload_parents = {}  # type: Dict[str, str]
+    self.folder_count = 0
+    self.lock = threading.Lock()
+
+  def count(self, endpoint: str):
+    """Increments the call counter of an endpoint.
+
+    :param endpoint: name of the endpoint.
+    """
+    with self.lock:
+      self.calls[endpoint] += 1
+
+  def request(self, endpoint: str):
+    """Counts a request and waits for the configured or observed latency of the endpoint.
+
+    :param endpoint: name of the endpoint.
+    """
+    self.count(endpoint)
+    samples = self.latencies.get(endpoint)
+    time.sleep(random.choice(samples) if samples else self.latency)
+
+  def fault(self, endpoint: str, body: bool = False) -> Optional[str]:
+    """Decides which fault, if any, to inject into a request.
+
+    :param endpoint: name of the endpoint.
+    :param body: whether the request or response has a body that can be cut off.
+    :return: `rate_limit`, `server_error`, `reset`, `truncation`, or None.
+    """
+    plan = self.faults
+    if not plan.applies(endpoint):
+      return None
+    service = endpoint.split('.', 1)[0]
+    with self.lock:
+      if self._bursts.get(service):
+        self._bursts[service] -= 1
+        kind = 'server_error'  # type: Optional[str]
+      else:
+        kind = None
+        roll = self._random.random()
+        truncations = plan.truncations if endpoint == 'zoom.download' else 0.0
+        for name, rate in (('rate_limit', plan.rate_limit),
+                           ('server_error', plan.server_errors),
+                           ('reset', plan.resets if body else 0.0),
+                           ('truncation', truncations)):
+          if roll < rate:
+            kind = name
+            break
+          roll -= rate
+        if kind == 'server_error':
+          self._bursts[service] = plan.burst - 1
+      if kind:
+        self.injected[f'{endpoint} {kind}'] += 1
+    return kind
+
+  def issue_token(self) -> str:
+    """Creates a new Zoom access token."""
+    with self.lock:
+      token = f'stand-in-token-{len(self.tokens)}-{self._random.random()}'
+      self.tokens[token] = time.monotonic()
+    return token
+
+  def token_valid(self, endpoint: str, authorization: str) -> bool:
+    """Returns false if the Zoom token of a request is unknown or expired.
+
+    :param endpoint: name of the endpoint.
+    :param authorization: value of the Authorization header.
+    """
+    token = authorization[len('Bearer '):]
+    with self.lock:
+      issued = self.tokens.get(token)
+      if issued is None:
+        return False
+      lifetime = self.faults.token_lifetime
+      expired = lifetime and time.monotonic() - issued > lifetime
+      if not expired and self.faults.applies(endpoint):
+        if self._random.random() < self.faults.expired_tokens:
+          expired = True
+          self.injected[f'{endpoint} expired_token'] += 1
+      if expired:
+        del self.tokens[token]
+      return not expired
+
+  def size(self, index: int) -> int:
+    """Returns the size of the recording of a meeting.
+
+    :param index: number of the meeting.
+    """
+    return self.sizes[index] if self.sizes else self.file_size
+
+  def has_recording(self, index: int) -> bool:
+    """Returns true if the meeting has a recording by now.
+
+    :param index: number of the meeting.
+    """
+    if index >= self.meetings:
+      return False
+    return not self.available or time.monotonic() - self.started >= self.available[index]
+
+  def recording_date(self, index: int) -> datetime.datetime:
+    """Returns the start of the recording of a meeting; meeting `i` was recorded `i` days after
+    the first one.
+
+    :param index: number of the meeting.
+    """
+    return _FIRST_DAY + datetime.timedelta(days=index)
+
+  def find_upload(self, name: str) -> Optional[str]:
+    """Returns the session of a finished upload with the given file name, if there is one.
+
+    :param name: name of the Drive file.
+    """
+    with self.lock:
+      for session in self.uploaded:
+        if self.upload_names.get(session) == name:
+          return session
+    return None
+
+  def folder_path(self, folder_id: str) -> str:
+    """Returns the path of a Drive folder from the folder that has no parent, e.g.
+    `folder/Recordings/Meeting 0/2018/01`.
+
+    :param folder_id: ID of the folder.
+    """
+    names = []
+    with self.lock:
+      while folder_id in self.folders:
+        names.append(self.folders[folder_id]['name'])
+        folder_id = self.folders[folder_id]['parent']
+    return '/'.join(reversed(names))
+
+  def upload_folder(self, name: str) -> Optional[str]:
+    """Returns the path of the folder a finished upload was placed in, see `folder_path`.
+
+    :param name: name of the Drive file.
+    """
+    session = self.find_upload(name)
+    if session is None:
+      return None
+    return self.folder_path(self.upload_parents.get(session, ''))
+
+  def snapshot(self) -> Dict:
+    """Returns call counts and transfer totals as a JSON-serializable dict."""
+    with self.lock:
+      return {'calls': dict(self.calls),
+              'uploaded_files': len(self.uploaded),
+              'uploaded_bytes': sum(self.uploaded.values()),
+              'trashed': len(self.trashed),
+              's3_objects': len(self.objects),
+              'folders': len(self.folders),
+              'verified': len(self.verified),
+              'duplicates': sum(self.verified.values()) - len(self.verified),
+              'corrupt': list(self.corrupt),
+              'violations': list(self.violations),
+              'injected': dict(self.injected)}
+
+
+def _throttle(started: float, num_bytes: int, bandwidth: float):
+  """Sleeps until `num_bytes` could have been transferred at `bandwidth` bytes per second.
+
+  :param started: value of the monotonic clock when the transfer started.
+  :param num_bytes: number of bytes transferred so far.
+  :param bandwidth: cap in bytes per second, 0 for no cap.
+  """
+  if bandwidth > 0:
+    delay = started + num_bytes / bandwidth - time.monotonic()
+    if delay > 0:
+      time.sleep(delay)
+
+
+def make_handler(state: StandInState):
+  """Creates a request handler implementing the Zoom, Drive, and Slack endpoints used by the
+  connector, and a MinIO-style S3 store under `/s3` (path-style, e.g. `/s3/<bucket>/<key>`).
+  The S3 store checks that requests carry a Signature Version 4 authorization header and that the
+  body matches its `x-amz-content-sha256` header, but not the signature itself. The Zoom, Drive,
+  and Slack endpoints inject the faults of `state.faults`.
+
+  :param state: shared state of the servers.
+  :return: request handler class.
+  """
+
+  class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+      pass
+
+    def _send_json(self, status: int, payload, headers: Optional[Dict[str, str]] = None):
+      body = json.dumps(payload).encode('utf-8')
+      self.send_response(status)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(body)))
+      for key, value in (headers or {}).items():
+        self.send_header(key, value)
+      self.end_headers()
+      self.wfile.write(body)
+
+    def _read_body(self, bandwidth: float = 0.0) -> int:
+      length = int(self.headers.get('Content-Length', 0))
+      started = time.monotonic()
+      remaining = length
+      while remaining:
+        data = self.rfile.read(min(remaining, 65536))
+        if not data:
+          break
+        remaining -= len(data)
+        _throttle(started, length - remaining, bandwidth)
+      return length - remaining
+
+    def _reset(self):
+      """Aborts the connection with a TCP reset."""
+      self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+      self.connection.close()
+      self.close_connection = True
+
+    def _inject(self, endpoint: str, body: bool = False) -> Optional[str]:
+      """Answers with an error if the fault plan says so. The request body must have been read.
+
+      :param endpoint: name of the endpoint.
+      :param body: whether the body of the request or response may be cut off.
+      :return: the fault; for `reset` and `truncation` the caller has to cut off the body.
+      """
+      fault = state.fault(endpoint, body)
+      slack = endpoint.startswith('slack.')
+      if fault == 'rate_limit':
+        self._send_json(429, {'ok': False, 'error': 'ratelimited'} if slack else
+                        {'code': 429, 'message': 'Too many requests'},
+                        {'Retry-After': str(state.faults.retry_after)})
+      elif fault == 'server_error':
+        self._send_json(503, {'ok': False, 'error': 'service_unavailable'} if slack else
+                        {'code': 503, 'message': 'Service unavailable'})
+      return fault
+
+    def _zoom_request(self, endpoint: str, body: bool = False) -> Optional[str]:
+      """Counts a Zoom API request, checks its token, and injects faults.
+
+      :return: None if the request should be answered normally, otherwise the fault.
+      """
+      state.request(endpoint)
+      if not state.token_valid(endpoint, self.headers.get('Authorization', '')):
+        self._send_json(401, {'code': 124, 'message': 'Invalid access token.'})
+        return 'expired_token'
+      return self._inject(endpoint, body)
+
+    def _base_url(self) -> str:
+      return f'http://{self.headers["Host"]}'
+
+    def _send_xml(self, status: int, body: str, headers: Optional[Dict[str, str]] = None):
+      data = f'<?xml version="1.0" encoding="UTF-8"?>\n{body}'.encode('utf-8')
+      self.send_response(status)
+      self.send_header('Content-Type', 'application/xml')
+      self.send_header('Content-Length', str(len(data)))
+      for key, value in (headers or {}).items():
+        self.send_header(key, value)
+      self.end_headers()
+      self.wfile.write(data)
+
+    def _s3_body(self) -> Optional[bytes]:
+      """Reads the body of an S3 request; answers with an error and returns None if the request is
+      not signed or the body does not match its digest.
+      """
+      length = int(self.headers.get('Content-Length', 0))
+      body = self.rfile.read(length) if length else b''
+      if not self.headers.get('Authorization', '').startswith('AWS4-HMAC-SHA256 Credential='):
+        self._send_xml(403, '<Error><Code>AccessDenied</Code></Error>')
+        return None
+      if hashlib.sha256(body).hexdigest() != self.headers.get('x-amz-content-sha256'):
+        self._send_xml(400, '<Error><Code>XAmzContentSHA256Mismatch</Code></Error>')
+        return None
+      return body
+
+    def _s3_put(self, key: str, query: Dict[str, List[str]]):
+      state.request('s3.put')
+      body = self._s3_body()
+      if body is None:
+        return
+      etag = f'"{hashlib.md5(body).hexdigest()}"'
+      with state.lock:
+        if 'uploadId' in query:
+          parts = state.multipart.get(query['uploadId'][0])
+          if parts is None:
+            self._send_xml(404, '<Error><Code>NoSuchUpload</Code></Error>')
+            return
+          parts[int(query['partNumber'][0])] = body
+        else:
+          state.objects[key] = body
+      self._send_xml(200, '', {'ETag': etag})
+
+    def _s3_post(self, key: str, query: Dict[str, List[str]]):
+      state.request('s3.post')
+      body = self._s3_body()
+      if body is None:
+        return
+      if 'uploads' in query:
+        with state.lock:
+          upload_id = f'upload-{len(state.multipart) + len(state.objects)}-{random.random()}'
+          state.multipart[upload_id] = {}
+        self._send_xml(200, f'<InitiateMultipartUploadResult><Key>{key}</Key>'
+                            f'<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+        return
+
+      with state.lock:
+        parts = state.multipart.pop(query.get('uploadId', [''])[0], None)
+        if parts is None:
+          self._send_xml(404, '<Error><Code>NoSuchUpload</Code></Error>')
+          return
+        numbers = [int(n) for n in re.findall(r'<PartNumber>(\d+)</PartNumber>',
+                                              body.decode('utf-8'))]
+        state.objects[key] = b''.join(parts[n] for n in numbers)
+      self._send_xml(200, f'<CompleteMultipartUploadResult><Key>{key}</Key>'
+                          '</CompleteMultipartUploadResult>')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+      parsed = urllib.parse.urlparse(self.path)
+      path = parsed.path
+
+      if path.startswith('/s3/'):
+        self._s3_post(urllib.parse.unquote(path[len('/s3/'):]),
+                      urllib.parse.parse_qs(parsed.query, keep_blank_values=True))
+      elif path == '/oauth/token':
+        state.request('zoom.token')
+        self._read_body()
+        if not self._inject('zoom.token'):
+          self._send_json(200, {'access_token': state.issue_token(), 'expires_in': 3600})
+      elif path == '/upload/drive/v3/files':
+        state.request('drive.create_session')
+        length = int(self.headers.get('Content-Length', 0))
+        metadata = self.rfile.read(length) if length else b''
+        if self._inject('drive.create_session'):
+          return
+        try:
+          body = json.loads(metadata.decode('utf-8'))
+        except ValueError:
+          body = {}
+        name = body.get('name', '')
+        with state.lock:
+          session = f'session-{len(state.sessions)}'
+          state.sessions[session] = 0
+          state.upload_names[session] = name
+          state.upload_parents[session] = (body.get('parents') or [''])[0]
+          state.upload_digests[session] = hashlib.sha256()
+        location = f'{self._base_url()}/upload/drive/v3/sessions/{session}'
+        self._send_json(200, {}, {'Location': location})
+      elif path == '/drive/v3/files':
+        state.request('drive.create_folder')
+        length = int(self.headers.get('Content-Length', 0))
+        metadata = json.loads(self.rfile.read(length).decode('utf-8') if length else '{}')
+        if not self._inject('drive.create_folder'):
+          self._create_folder(metadata)
+      elif path == '/batch/drive/v3':
+        state.request('drive.batch')
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        if not self._inject('drive.batch'):
+          self._batch(body)
+      elif path.startswith('/api/'):
+        endpoint = 'slack.' + path[len('/api/'):]
+        state.request(endpoint)
+        self._read_body()
+        if not self._inject(endpoint):
+          self._send_json(200, {'ok': True})
+      else:
+        self._send_json(404, {'error': 'not found'})
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+      parsed = urllib.parse.urlparse(self.path)
+      path = parsed.path
+      if path.startswith('/s3/'):
+        self._s3_put(urllib.parse.unquote(path[len('/s3/'):]),
+                     urllib.parse.parse_qs(parsed.query, keep_blank_values=True))
+        return
+      session = path.rsplit('/', 1)[-1]
+      if not path.startswith('/upload/drive/v3/sessions/') or session not in state.sessions:
+        self._send_json(404, {'error': 'unknown session'})
+        return
+
+      state.request('drive.upload_chunk')
+      fault = state.fault('drive.upload_chunk', body=True)
+      length = int(self.headers.get('Content-Length', 0))
+      if fault == 'reset':
+        self.rfile.read(length // 2)
+        self._reset()
+        return
+      data = self._read_chunk(length, state.upload_bandwidth)
+      if fault:
+        self._send_json(429 if fault == 'rate_limit' else 503, {'error': fault},
+                        {'Retry-After': str(state.faults.retry_after)})
+        return
+      match = _CONTENT_RANGE.match(self.headers.get('Content-Range', ''))
+      total = match.group(3) if match else '*'
+
+      with state.lock:
+        if match and match.group(1) and int(match.group(1)) != state.sessions[session]:
+          # Drive only accepts the byte that follows what it has.
+          data = b''
+        state.sessions[session] += len(data)
+        state.upload_digests[session].update(data)
+        done = state.sessions[session]
+
+      if total != '*' and done >= int(total):
+        self._finish_upload(session, done)
+        self._send_json(200, {'id': session,
+                              'webViewLink': f'{self._base_url()}/drive/files/{session}'})
+      else:
+        self._send_json(308, {}, {'Range': f'bytes=0-{done - 1}'} if done else {})
+
+    def _read_chunk(self, length: int, bandwidth: float) -> bytes:
+      started = time.monotonic()
+      data = bytearray()
+      while len(data) < length:
+        piece = self.rfile.read(min(length - len(data), 65536))
+        if not piece:
+          break
+        data += piece
+        _throttle(started, len(data), bandwidth)
+      return bytes(data)
+
+    def _finish_upload(self, session: str, size: int):
+      """Records a finished upload and checks its content if it is the recording of a stand-in
+      meeting.
+      """
+      with state.lock:
+        if session in state.uploaded:
+          # Drive answers again with the file if a finished session is asked for its status.
+          return
+        state.uploaded[session] = size
+        match = _UPLOAD_NAME.search(state.upload_names.get(session, ''))
+        if not match:
+          return
+        index = int(match.group(1))
+        digest = state.upload_digests[session].hexdigest()
+        if size == state.size(index) and digest == recording_digest(size):
+          state.verified[index] += 1
+        else:
+          state.corrupt.append(state.upload_names[session])
+
+    def do_GET(self):  # pylint: disable=invalid-name
+      parsed = urllib.parse.urlparse(self.path)
+      if parsed.path == '/_stats':
+        self._send_json(200, state.snapshot())
+        return
+
+      match = re.match(r'^/v2/meetings/([^/]+)/recordings$', parsed.path)
+      if match:
+        if self._zoom_request('zoom.list_recordings'):
+          return
+        meeting = match.group(1)
+        index = meeting.rsplit('-', 1)[-1]
+        trashed = f'/v2/meetings/uuid-{meeting}/recordings/recording-{meeting}' in state.trashed
+        if not index.isdigit() or not state.has_recording(int(index)) or trashed:
+          self._send_json(404, {'code': 3301, 'message': 'No recordings'})
+          return
+        self._send_json(200, {'recording_files': self._recording_files(int(index))})
+        return
+
+      match = re.match(r'^/v2/users/([^/]+)/recordings$', parsed.path)
+      if match:
+        if not self._zoom_request('zoom.list_user_recordings'):
+          self._list_user_recordings(urllib.parse.parse_qs(parsed.query))
+      elif parsed.path == '/drive/v3/files':
+        state.request('drive.list')
+        if not self._inject('drive.list'):
+          self._list_drive_files(urllib.parse.parse_qs(parsed.query))
+      elif parsed.path.startswith('/drive/v3/files/'):
+        state.request('drive.get')
+        if not self._inject('drive.get'):
+          self._send_json(*self._get_folder(urllib.parse.unquote(parsed.path.rsplit('/', 1)[-1])))
+      elif parsed.path.startswith('/rec/play/'):
+        fault = self._zoom_request('zoom.download', body=True)
+        if fault in (None, 'reset', 'truncation'):
+          index = parsed.path.rsplit('-', 1)[-1]
+          self._stream_recording(state.size(int(index)) if index.isdigit() else state.file_size,
+                                 fault)
+      else:
+        self._send_json(404, {'error': 'not found'})
+
+    def _recording_files(self, index: int) -> List[Dict[str, Any]]:
+      meeting = f'meeting-{index}'
+      start = state.recording_date(index)
+      return [{
+        'file_type': 'MP4',
+        'file_size': state.size(index),
+        'recording_start': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'recording_end': (start + datetime.timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'download_url': f'{self._base_url()}/rec/play/{meeting}',
+        'meeting_id': f'uuid-{meeting}',
+        'id': f'recording-{meeting}'
+      }]
+
+    def _list_user_recordings(self, query: Dict[str, List[str]]):
+      """Lists the recordings that started between `from` and `to`, like Zoom's
+      `/users/{userId}/recordings`. The next page token is the number of the next meeting.
+      """
+      first = datetime.datetime.strptime(query['from'][0], '%Y-%m-%d')
+      last = datetime.datetime.strptime(query['to'][0], '%Y-%m-%d') + datetime.timedelta(days=1)
+      page_size = int(query.get('page_size', ['30'])[0])
+      index = int(query.get('next_page_token', ['0'])[0] or 0)
+      meetings = []
+      while index < state.meetings and len(meetings) < page_size:
+        trashed = f'/v2/meetings/uuid-meeting-{index}/recordings/recording-meeting-{index}'
+        listed = state.has_recording(index) and trashed not in state.trashed
+        if listed and first <= state.recording_date(index) < last:
+          meetings.append({'id': f'meeting-{index}', 'uuid': f'uuid-meeting-{index}',
+                           'recording_files': self._recording_files(index)})
+        index += 1
+      more = any(first <= state.recording_date(i) < last for i in range(index, state.meetings))
+      self._send_json(200, {'from': query['from'][0], 'to': query['to'][0],
+                            'page_size': page_size, 'meetings': meetings,
+                            'next_page_token': str(index) if more else ''})
+
+    def _list_drive_files(self, query: Dict[str, List[str]]):
+      """Answers `name = '...'` queries from the folders or the finished uploads."""
+      q = query.get('q', [''])[0]
+      match = re.search(r"name = '((?:[^'\\]|\\.)*)'", q)
+      name = re.sub(r'\\(.)', r'\1', match.group(1)) if match else None
+      if _FOLDER_MIME_TYPE in q:
+        parent = re.search(r"'([^']*)' in parents", q)
+        with state.lock:
+          folders = [{'id': folder_id} for folder_id, folder in state.folders.items()
+                     if folder['name'] == name and parent and folder['parent'] == parent.group(1)]
+        self._send_json(200, {'files': folders[:1]})
+        return
+      session = state.find_upload(name) if name else None
+      files = [{'id': session, 'webViewLink': f'{self._base_url()}/drive/files/{session}'}
+               ] if session else []
+      self._send_json(200, {'files': files})
+
+    def _create_folder(self, metadata: Dict[str, Any]):
+      parent = (metadata.get('parents') or [None])[0]
+      with state.lock:
+        if metadata.get('mimeType') != _FOLDER_MIME_TYPE or parent not in state.folders:
+          folder_id = None
+        else:
+          state.folder_count += 1
+          folder_id = f'folder-{state.folder_count}'
+          state.folders[folder_id] = {'name': metadata.get('name', ''), 'parent': parent}
+      if folder_id is None:
+        self._send_json(404, {'error': {'code': 404, 'message': f'File not found: {parent}.'}})
+      else:
+        self._send_json(200, {'id': folder_id})
+
+    def _get_folder(self, folder_id: str) -> Tuple[int, Dict[str, Any]]:
+      with state.lock:
+        folder = state.folders.get(folder_id)
+      if folder is None:
+        return 404, {'error': {'code': 404, 'message': f'File not found: {folder_id}.'}}
+      return 200, {'id': folder_id, 'name': folder['name'], 'mimeType': _FOLDER_MIME_TYPE,
+                   'trashed': False}
+
+    def _batch(self, body: bytes):
+      """Answers a batch of `files.get` requests, as sent by `BatchHttpRequest`."""
+      content_type = self.headers.get('Content-Type', '')
+      header = f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8')
+      message = email.message_from_bytes(header + body)
+      boundary = 'stand_in_batch'
+      parts = []
+      for part in message.get_payload():
+        request_line = part.get_payload().split('\n', 1)[0].split(' ')
+        path = urllib.parse.urlparse(request_line[1]).path
+        if request_line[0] == 'GET' and path.startswith('/drive/v3/files/'):
+          status, payload = self._get_folder(urllib.parse.unquote(path.rsplit('/', 1)[-1]))
+        else:
+          status, payload = 404, {'error': {'code': 404, 'message': 'Not found.'}}
+        parts.append(f'--{boundary}\r\nContent-Type: application/http\r\n'
+                     f'Content-ID: <response-{part["Content-ID"][1:-1]}>\r\n\r\n'
+                     f'HTTP/1.1 {status} {"OK" if status == 200 else "Not Found"}\r\n'
+                     f'Content-Type: application/json; charset=UTF-8\r\n\r\n'
+                     f'{json.dumps(payload)}\r\n')
+      data = (''.join(parts) + f'--{boundary}--\r\n').encode('utf-8')
+      self.send_response(200)
+      self.send_header('Content-Type', f'multipart/mixed; boundary={boundary}')
+      self.send_header('Content-Length', str(len(data)))
+      self.end_headers()
+      self.wfile.write(data)
+
+    def _stream_recording(self, size: int, fault: Optional[str] = None):
+      self.send_response(200)
+      self.send_header('Content-Type', 'video/mp4')
+      self.send_header('Content-Length', str(size))
+      self.end_headers()
+
+      started = time.monotonic()
+      sent = 0
+      for piece in recording_pieces(size):
+        if fault and sent + len(piece) > size // 2:
+          # Cut the body off halfway.
+          self.wfile.write(piece[:size // 2 - sent])
+          self.wfile.flush()
+          if fault == 'reset':
+            self._reset()
+          self.close_connection = True
+          return
+        self.wfile.write(piece)
+        sent += len(piece)
+        _throttle(started, sent, state.download_bandwidth)
+
+    def do_DELETE(self):  # pylint: disable=invalid-name
+      path = urllib.parse.urlparse(self.path).path
+      if self._zoom_request('zoom.trash'):
+        return
+      match = re.match(r'^/v2/meetings/[^/]+/recordings/recording-meeting-(\d+)$', path)
+      with state.lock:
+        if match and not state.verified[int(match.group(1))]:
+          state.violations.append(path)
+        state.trashed.add(path)
+      self.send_response(204)
+      self.send_header('Content-Length', '0')
+      self.end_headers()
+
+  return Handler
+
+
+class StandInServer:
+  def __init__(self, state: StandInState, port: int = 0):
+    """Threaded HTTP server serving all stand-in endpoints from a single port.
+
+    :param state: shared state of the servers.
+    :param port: TCP port to listen on. Port 0 picks a free port.
+    """
+    self.state = state
+    self._server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    self._server.daemon_threads = True
+    self._thread = None  # type: Optional[threading.Thread]
+
+  @property
+  def url(self) -> str:
+    """Base URL of the server."""
+    return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+  def start(self):
+    """Serves requests in a background thread."""
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+    self._thread.start()
+
+  def stop(self):
+    """Stops the server."""
+    self._server.shutdown()
+    self._server.server_close()
+
+
+def _serve(settings: Dict, url_queue):
+  server = StandInServer(StandInState(**settings))
+  server.start()
+  url_queue.put(server.url)
+  while True:
+    time.sleep(3600)
+
+
+class StandInProcess:
+  def __init__(self, **settings):
+    """Runs the stand-in servers in a separate process so they do not compete with the pipeline
+    for the GIL or show up in its memory usage. Counters are read back through `/_stats`.
+
+    :param settings: keyword arguments for `StandInState`.
+    """
+    self.settings = settings
+    self.url = ''
+    self._process = None  # type: Optional[multiprocessing.Process]
+
+  def start(self):
+    """Starts the server process and waits until it is listening."""
+    url_queue = multiprocessing.Queue()  # type: multiprocessing.Queue
+    self._process = multiprocessing.Process(target=_serve, args=(self.settings, url_queue),
+                                            daemon=True)
+    self._process.start()
+    self.url = url_queue.get(timeout=30)
+
+  def stats(self) -> Dict:
+    """Fetches call counts and transfer totals from the server process."""
+    with urllib.request.urlopen(f'{self.url}/_stats') as response:
+      return json.loads(response.read().decode('utf-8'))
+
+  def stop(self):
+    """Terminates the server process."""
+    if self._process:
+      self._process.terminate()
+      self._process.join()
+
+
+def main():
+  """Runs the stand-in servers in the foreground."""
+  parser = argparse.ArgumentParser(description='Local stand-ins for the Zoom and Drive APIs.')
+  parser.add_argument('--port', type=int, default=8080)
+  parser.add_argument('--meetings', type=int, default=10)
+  parser.add_argument('--file-size-mb', type=float, default=10)
+  parser.add_argument('--latency-ms', type=float, default=0)
+  parser.add_argument('--rate-limit', type=float, default=0, help='probability of a 429')
+  parser.add_argument('--server-errors', type=float, default=0,
+                      help='probability of a burst of 503s')
+  parser.add_argument('--resets', type=float, default=0,
+                      help='probability of a connection reset in a body')
+  parser.add_argument('--truncations', type=float, default=0,
+                      help='probability of a truncated download')
+  parser.add_argument('--expired-tokens', type=float, default=0,
+                      help='probability of a Zoom token expiring')
+  parser.add_argument('--seed', type=int, default=None, help='seed of the fault generator')
+  args = parser.parse_args()
+
+  faults = FaultPlan(rate_limit=args.rate_limit, server_errors=args.server_errors,
+                     resets=args.resets, truncations=args.truncations,
+                     expired_tokens=args.expired_tokens, seed=args.seed)
+  server = StandInServer(StandInState(args.meetings, int(args.file_size_mb * 1024 * 1024),
+                                      latency=args.latency_ms / 1000, faults=faults),
+                         port=args.port)
+  print(f'Serving on {server.url}')
+  server.start()
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    server.stop()
+
+
+if __name__ == '__main__':
+  main()
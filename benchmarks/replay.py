@@ -0,0 +1,195 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import argparse
+import collections
+import json
+import re
+import statistics
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from zoom_drive_connector import drive, pipeline, slack
+from zoom_drive_connector.monitoring.capture import load_capture, percentiles
+
+from benchmarks.bench_pipeline import MB, _StandInSlackClient, build_configs
+from benchmarks.fake_servers import StandInProcess
+
+# Spans of the capture whose duration is the latency of a single stand-in request. Downloads and
+# upload chunks are dominated by the transfer itself and are replayed as bandwidth instead.
+_LATENCY_SPANS = {
+  'zoom.token': 'zoom.token',
+  'zoom.list_recordings': 'zoom.list_recordings',
+  'zoom.trash': 'zoom.trash',
+  'slack.post_message': 'slack.chat.postMessage',
+}
+_MEETING = re.compile(r'_Meeting (\d+)_')
+
+
+class _RecordingSlackClient(_StandInSlackClient):
+  def __init__(self, url: str):
+    """Stand-in Slack client that remembers when the recording of each meeting was announced.
+
+    :param url: base URL of the stand-in server.
+    """
+    super(_RecordingSlackClient, self).__init__(url)
+    self.posted = {}  # type: Dict[int, float]
+    self.lock = threading.Lock()
+
+  def api_call(self, method: str, **kwargs) -> Dict:
+    response = super(_RecordingSlackClient, self).api_call(method, **kwargs)
+    match = _MEETING.search(kwargs.get('text', ''))
+    if match:
+      with self.lock:
+        self.posted.setdefault(int(match.group(1)), time.monotonic())
+    return response
+
+
+def load_trace(path: str) -> Tuple[List[Dict[str, Any]], Dict[str, List[float]], Dict[str, Any]]:
+  """Extracts the recordings and the call latencies from a capture.
+
+  :param path: file written by `TrafficCapture`.
+  :return: tuple of the transferred recordings (arrival offset and size, ordered by arrival),
+    the observed latencies per stand-in endpoint, and transfer rates and status counts.
+  """
+  records = list(load_capture(path))
+  sizes = {r['trace']: r['bytes'] for r in records
+           if r['span'] == 'zoom.download' and r.get('bytes')}
+
+  recordings = []
+  latencies = collections.defaultdict(list)  # type: Dict[str, List[float]]
+  download_rates, upload_rates = [], []
+  statuses = collections.Counter()  # type: collections.Counter
+  for r in records:
+    if r['span'] == 'recording' and r['trace'] in sizes and 'outcome' not in r:
+      recordings.append({'arrival': r['t'], 'size': sizes[r['trace']]})
+    elif r['span'] in _LATENCY_SPANS:
+      latencies[_LATENCY_SPANS[r['span']]].append(r['duration'])
+    if r['span'] == 'zoom.download' and r.get('bytes') and r['duration'] > 0:
+      download_rates.append(r['bytes'] / r['duration'])
+    elif r['span'] == 'drive.upload' and r.get('bytes') and r['duration'] > 0:
+      upload_rates.append(r['bytes'] / r['duration'])
+    if 'status' in r:
+      statuses[f'{r["span"]} {r["status"]}'] += 1
+
+  recordings.sort(key=lambda rec: rec['arrival'])
+  if recordings:
+    start = recordings[0]['arrival']
+    for rec in recordings:
+      rec['arrival'] -= start
+  return recordings, dict(latencies), {
+    'download_rate': statistics.median(download_rates) if download_rates else 0.0,
+    'upload_rate': statistics.median(upload_rates) if upload_rates else 0.0,
+    'statuses': dict(statuses)}
+
+
+def replay(path: str,
+           speed: float = 1.0,
+           workers: int = 1,
+           scale: float = 1.0,
+           interval: float = 600.0,
+           timeout: float = 600.0) -> Dict[str, Any]:
+  """Plays a capture back through the real scheduler against the stand-in servers. Recordings
+  appear on the stand-in Zoom server at the time they were discovered in production, requests
+  take as long as they did in production, and downloads and uploads run at the observed median
+  rates. All times are divided by `speed`; the reported latencies are scaled back.
+
+  :param path: file written by `TrafficCapture`.
+  :param speed: speed-up factor.
+  :param workers: number of workers of the replayed account.
+  :param scale: factor applied to the number of recordings, e.g. 1.5 for 50% more meetings.
+  :param interval: seconds between runs of the pipeline, before the speed-up.
+  :param timeout: seconds to wait for the last recordings after they appeared, before the
+    speed-up.
+  :return: dictionary containing the replay report.
+  """
+  recordings, latencies, observed = load_trace(path)
+  if not recordings:
+    raise ValueError(f'{path} does not contain any transferred recordings.')
+  count = max(1, round(len(recordings) * scale))
+  jobs = [recordings[i % len(recordings)] for i in range(count)]
+  jobs.sort(key=lambda rec: rec['arrival'])
+
+  server = StandInProcess(
+      meetings=count, file_size=0, sizes=[job['size'] for job in jobs],
+      available=[job['arrival'] / speed for job in jobs],
+      latencies={k: [v / speed for v in values] for k, values in latencies.items()},
+      download_bandwidth=observed['download_rate'] * speed,
+      upload_bandwidth=observed['upload_rate'] * speed)
+  server.start()
+  try:
+    with tempfile.TemporaryDirectory() as work_dir:
+      sys_config, drive_config, slack_config, zoom_config = build_configs(
+          server.url, work_dir, count, workers=workers, trash_rate=0)
+      slack_api = slack.SlackAPI(slack_config)
+      slack_client = _RecordingSlackClient(server.url)
+      slack_api.sc = slack_client
+      scheduler = pipeline.Scheduler(zoom_config, sys_config,
+                                     drive.DriveAPI(drive_config, sys_config), slack_api)
+
+      started = time.monotonic()
+      deadline = started + (jobs[-1]['arrival'] + timeout) / speed
+      runs = 0
+      while len(slack_client.posted) < count and time.monotonic() < deadline:
+        run_started = time.monotonic()
+        scheduler.run_once()
+        runs += 1
+        time.sleep(max(0.0, min(run_started + interval / speed, deadline) - time.monotonic()))
+      wall_time = time.monotonic() - started
+      scheduler.close(timeout=60)
+  finally:
+    server.stop()
+
+  delays = [(posted - started) * speed - jobs[index]['arrival']
+            for index, posted in slack_client.posted.items()]
+  replayed_bytes = sum(jobs[index]['size'] for index in slack_client.posted)
+  return {
+    'recordings': count,
+    'announced': len(slack_client.posted),
+    'workers': workers,
+    'speed': speed,
+    'runs': runs,
+    'wall_time_s': round(wall_time, 3),
+    'replayed_mb': round(replayed_bytes / MB, 2),
+    'throughput_mb_s': round(replayed_bytes / MB / (wall_time * speed), 3),
+    'latency_s': {k: round(v, 1) for k, v in percentiles(delays).items()},
+    'captured_call_latency_s': {k: {p: round(v, 3) for p, v in percentiles(values).items()}
+                                for k, values in sorted(latencies.items())},
+    'captured_statuses': observed['statuses'],
+  }
+
+
+def main():
+  """Command line entrypoint of the trace replay."""
+  parser = argparse.ArgumentParser(
+      description='Replays a capture written with internals.capture_file against local stand-ins.')
+  parser.add_argument('capture', help='capture file')
+  parser.add_argument('--speed', type=float, default=60, help='speed-up factor')
+  parser.add_argument('--workers', type=int, default=1, help='number of workers to simulate')
+  parser.add_argument('--scale', type=float, default=1, help='factor for the number of recordings')
+  parser.add_argument('--interval', type=float, default=600, help='seconds between runs')
+  parser.add_argument('--timeout', type=float, default=3600,
+                      help='seconds to wait after the last recording appeared')
+  args = parser.parse_args()
+
+  report = replay(args.capture, speed=args.speed, workers=args.workers, scale=args.scale,
+                  interval=args.interval, timeout=args.timeout)
+  print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+  main()
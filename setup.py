@@ -27,10 +27,12 @@ setup(
     'google-auth-httplib2==0.1.0',
     'google-auth-oauthlib==0.4.4',
   ],
-  python_requires='>=3.5, <4',
+  python_requires='>=3.7, <4',
   # Development requirements.
   extras_require={
-    'test': ['tox', 'mypy', 'pylint', 'pycodestyle', 'responses']
+    'test': ['tox', 'mypy', 'pylint', 'pycodestyle', 'responses'],
+    # HTTP client of the asyncio engine.
+    'asyncio': ['aiohttp>=3.8,<4']
   },
   # Application entrypoint.
   entry_points={
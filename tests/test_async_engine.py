@@ -0,0 +1,186 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from zoom_drive_connector import aio, drive, pipeline, slack
+from zoom_drive_connector.configuration import SlackConfig, SystemConfig
+
+from benchmarks.fake_servers import StandInServer, StandInState
+from benchmarks.bench_pipeline import _StandInSlackClient, build_configs
+
+MB = 1024 * 1024
+
+
+class TestConnectionPool(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.server = StandInServer(StandInState(meetings=1, file_size=MB))
+    self.server.start()
+    self.addCleanup(self.server.stop)
+
+  def test_keep_alive(self):
+    async def run():
+      pool = aio.ConnectionPool(limit=2)
+      statuses = []
+      for _ in range(5):
+        async with await pool.request('GET', f'{self.server.url}/_stats') as res:
+          statuses.append((res.status, (await res.json())['uploaded_files']))
+      async with await pool.request('POST', f'{self.server.url}/oauth/token') as res:
+        token = (await res.json())['access_token']
+      async with await pool.request('GET', f'{self.server.url}/rec/play/meeting-0',
+                                    headers={'authorization': f'Bearer {token}'}) as res:
+        body = await res.read()
+      await pool.close()
+      return pool.opened, statuses, len(body)
+
+    opened, statuses, size = asyncio.run(run())
+    self.assertEqual(statuses, [(200, 0)] * 5)
+    self.assertEqual(size, MB)
+    self.assertEqual(opened, 1)
+
+  def test_chunked_and_redirect(self):
+    answers = [b'HTTP/1.1 302 Found\r\nLocation: /file\r\nContent-Length: 0\r\n\r\n',
+               b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+               b'5\r\nhello\r\n7;ext=1\r\n, world\r\n0\r\nX-Trailer: 1\r\n\r\n']
+
+    async def handle(reader, writer):
+      for answer in answers:
+        await reader.readuntil(b'\r\n\r\n')
+        writer.write(answer)
+        await writer.drain()
+      writer.close()
+
+    async def run():
+      server = await asyncio.start_server(handle, '127.0.0.1', 0)
+      port = server.sockets[0].getsockname()[1]
+      pool = aio.ConnectionPool()
+      async with server:
+        res = await pool.request('GET', f'http://127.0.0.1:{port}/recording')
+        body = await res.read()
+        await pool.close()
+      return pool.opened, res.status, body
+
+    self.assertEqual(asyncio.run(run()), (1, 200, b'hello, world'))
+
+  def test_truncated_body(self):
+    async def handle(reader, writer):
+      await reader.readuntil(b'\r\n\r\n')
+      writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nshort')
+      await writer.drain()
+      writer.close()
+
+    async def run():
+      server = await asyncio.start_server(handle, '127.0.0.1', 0)
+      port = server.sockets[0].getsockname()[1]
+      pool = aio.ConnectionPool()
+      async with server:
+        try:
+          res = await pool.request('GET', f'http://127.0.0.1:{port}/')
+          await res.read()
+        finally:
+          await pool.close()
+
+    with self.assertRaises(aio.ProtocolError):
+      asyncio.run(run())
+
+  def test_header_injection(self):
+    async def run():
+      pool = aio.ConnectionPool()
+      try:
+        await pool.request('GET', f'{self.server.url}/_stats',
+                           headers={'authorization': 'Bearer token\r\nX-Injected: 1'})
+      finally:
+        await pool.close()
+
+    with self.assertRaises(ValueError):
+      asyncio.run(run())
+
+
+class TestAsyncScheduler(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    work_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(work_dir.cleanup)
+    self.work_dir = work_dir.name
+
+  def scheduler(self, state: StandInState, meetings: int, **internals) -> pipeline.AsyncScheduler:
+    server = StandInServer(state)
+    server.start()
+    self.addCleanup(server.stop)
+    sys_config, drive_config, _, zoom_config = build_configs(server.url, self.work_dir, meetings,
+                                                             trash_rate=0)
+    sys_config = SystemConfig({**sys_config.settings_dict, **internals})
+    slack_api = slack.SlackAPI(SlackConfig({'key': 'stand-in', 'api_url': f'{server.url}/api'}))
+    # Used by the threaded engine, e.g. for recovered recordings.
+    slack_api.sc = _StandInSlackClient(server.url)
+    scheduler = pipeline.AsyncScheduler(zoom_config, sys_config,
+                                        drive.DriveAPI(drive_config, sys_config), slack_api)
+    self.addCleanup(scheduler.close, 10)
+    return scheduler
+
+  def test_run_once(self):
+    state = StandInState(meetings=20, file_size=MB // 2)
+    scheduler = self.scheduler(state, 20, async_connections=4, async_transfers=3)
+
+    self.assertEqual(scheduler.run_once(), {'transferred': 20, 'failed': 0})
+    scheduler.close(10)
+    stats = state.snapshot()
+    self.assertEqual((stats['verified'], stats['duplicates'], stats['trashed']), (20, 0, 20))
+    self.assertEqual(stats['calls']['slack.chat.postMessage'], 20)
+    self.assertEqual(stats['calls']['zoom.token'], 1)
+    self.assertEqual((stats['corrupt'], stats['violations']), ([], []))
+    # Every request of the run shares the four connections of the pool.
+    self.assertLessEqual(scheduler.pool.opened, 4)
+    self.assertEqual(os.listdir(str(scheduler.sys_config.target_folder)), [])
+
+  def test_workers_per_account(self):
+    state = StandInState(meetings=6, file_size=MB // 4)
+    scheduler = self.scheduler(state, 6, async_transfers=32)
+    account = next(iter(scheduler.accounts.values()))
+    account.workers = 2
+
+    work_async = scheduler._work_async  # pylint: disable=protected-access
+    with patch.object(scheduler, '_work_async', wraps=work_async) as work:
+      self.assertEqual(scheduler.run_once(), {'transferred': 6, 'failed': 0})
+    self.assertEqual(work.call_count, 2)
+
+  def test_interrupted_upload_resumes(self):
+    state = StandInState(meetings=1, file_size=2 * MB, upload_bandwidth=MB)
+    scheduler = self.scheduler(state, 1)
+    scheduler.drive_conn.drive_config.settings_dict['upload_chunk_size'] = 256 * 1024
+    timer = threading.Timer(0.5, scheduler.interrupt)
+    timer.start()
+    self.addCleanup(timer.cancel)
+
+    self.assertEqual(scheduler.run_once(), {'transferred': 0, 'failed': 0})
+    folder = str(scheduler.sys_config.target_folder)
+    with open(os.path.join(folder, 'meeting-0.mp4.json'), 'r', encoding='utf-8') as f:
+      session = json.load(f)['upload_sessions']['drive']
+    self.assertGreater(session['progress'], 0)
+    self.assertLess(session['progress'], 2 * MB)
+
+    # The threaded engine picks up the session the asyncio engine saved.
+    scheduler.drive_conn.cancel.clear()
+    self.assertEqual(scheduler.recover(folder)['recovered'], 1)
+    stats = state.snapshot()
+    self.assertEqual((stats['verified'], stats['duplicates'], stats['uploaded_files']), (1, 0, 1))
+    self.assertEqual(stats['calls']['drive.create_session'], 1)
@@ -0,0 +1,158 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from zoom_drive_connector import drive, pipeline
+
+from benchmarks.fake_servers import StandInProcess
+from benchmarks.bench_pipeline import build_configs
+
+RECORDINGS = 12
+FIRST_DAY = datetime.date(2018, 1, 1)
+
+
+class TestDateWindows(unittest.TestCase):
+  def test_split(self):
+    windows = pipeline.date_windows(datetime.date(2018, 1, 1), datetime.date(2018, 3, 5))
+    self.assertEqual(windows, [(datetime.date(2018, 1, 1), datetime.date(2018, 1, 30)),
+                               (datetime.date(2018, 1, 31), datetime.date(2018, 3, 1)),
+                               (datetime.date(2018, 3, 2), datetime.date(2018, 3, 5))])
+
+  def test_single_day_and_empty(self):
+    day = datetime.date(2018, 1, 1)
+    self.assertEqual(pipeline.date_windows(day, day), [(day, day)])
+    self.assertEqual(pipeline.date_windows(day, day - datetime.timedelta(days=1)), [])
+
+
+class TestBackfillCheckpoint(unittest.TestCase):
+  def test_round_trip(self):
+    with tempfile.TemporaryDirectory() as work_dir:
+      path = os.path.join(work_dir, 'state.json')
+      checkpoint = pipeline.BackfillCheckpoint(path)
+      checkpoint.mark_done('rec-1')
+      key = checkpoint.window_key('default', (FIRST_DAY, FIRST_DAY))
+      checkpoint.complete_window(key)
+      checkpoint.mark_done('rec-2')
+
+      # Finishing a window compacts the log into the state file.
+      with open(path, 'r', encoding='utf-8') as f:
+        self.assertEqual(json.load(f), {'done': ['rec-1'],
+                                        'windows': ['default:2018-01-01:2018-01-01']})
+      with open(path + '.log', 'r', encoding='utf-8') as f:
+        self.assertEqual(f.read(), 'rec-2\n')
+
+      # The recordings in the log are done after a restart.
+      loaded = pipeline.BackfillCheckpoint(path)
+      self.assertTrue(loaded.is_done('rec-1'))
+      self.assertTrue(loaded.is_done('rec-2'))
+      self.assertFalse(loaded.is_done('rec-3'))
+      self.assertTrue(loaded.window_done(key))
+
+      checkpoint.save()
+      with open(path, 'r', encoding='utf-8') as f:
+        self.assertEqual(json.load(f)['done'], ['rec-1', 'rec-2'])
+      self.assertEqual(os.path.getsize(path + '.log'), 0)
+
+  def test_cut_off_log_line(self):
+    with tempfile.TemporaryDirectory() as work_dir:
+      path = os.path.join(work_dir, 'state.json')
+      with open(path + '.log', 'w', encoding='utf-8') as f:
+        f.write('rec-1\nrec-')
+      loaded = pipeline.BackfillCheckpoint(path)
+      self.assertEqual(loaded.done, {'rec-1'})
+
+
+class TestBackfill(unittest.TestCase):
+  def setUp(self):
+    sizes = [8 * 1024 + 101 * i for i in range(RECORDINGS)]
+    self.server = StandInProcess(meetings=RECORDINGS, file_size=0, sizes=sizes)
+    self.server.start()
+    self.addCleanup(self.server.stop)
+    work_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(work_dir.cleanup)
+    self.state = os.path.join(work_dir.name, 'state.json')
+
+    # Recordings stay on Zoom so the later backfills see them again.
+    self.sys_config, drive_config, _, zoom_config = build_configs(
+        self.server.url, work_dir.name, RECORDINGS, delete=False, trash_rate=0)
+    self.scheduler = pipeline.Scheduler(zoom_config, self.sys_config,
+                                        drive.DriveAPI(drive_config, self.sys_config), None)
+    self.addCleanup(self.scheduler.close, 1)
+
+  def backfill(self, last_day: int = RECORDINGS - 1, **kwargs):
+    """Runs a backfill of the recordings of the first days until `last_day`."""
+    job = pipeline.Backfill(self.scheduler, FIRST_DAY,
+                            FIRST_DAY + datetime.timedelta(days=last_day),
+                            pipeline.BackfillCheckpoint(self.state), workers=4,
+                            progress=pipeline.BackfillProgress(io.StringIO(), interval=0),
+                            **kwargs)
+    return job.run(), job
+
+  def test_transfers_every_page(self):
+    summary, job = self.backfill(page_size=5)
+    stats = self.server.stats()
+    self.assertEqual(summary['listed'], RECORDINGS)
+    self.assertEqual(summary['transferred'], RECORDINGS)
+    self.assertEqual(stats['verified'], RECORDINGS)
+    self.assertEqual(stats['duplicates'], 0)
+    self.assertEqual(stats['calls']['zoom.list_user_recordings'], 3)
+    self.assertEqual(os.listdir(str(self.sys_config.target_folder)), [])
+    self.assertIn(f'{RECORDINGS}/{RECORDINGS} recordings', job.progress.stream.getvalue())
+
+  def test_resumes_from_checkpoint(self):
+    summary, _ = self.backfill(last_day=4)
+    self.assertEqual(summary['transferred'], 5)
+
+    summary, _ = self.backfill(last_day=29)
+    stats = self.server.stats()
+    self.assertEqual(summary['skipped'], 5)
+    self.assertEqual(summary['transferred'], RECORDINGS - 5)
+    self.assertEqual(stats['verified'], RECORDINGS)
+    self.assertEqual(stats['duplicates'], 0)
+    # Recordings in the checkpoint are not looked up in Drive.
+    self.assertEqual(stats['calls']['drive.list'], RECORDINGS)
+
+  def test_skips_recordings_in_drive(self):
+    self.backfill()
+    os.remove(self.state)
+    summary, _ = self.backfill()
+    stats = self.server.stats()
+    self.assertEqual(summary['skipped'], RECORDINGS)
+    self.assertEqual(summary['transferred'], 0)
+    self.assertEqual(stats['uploaded_files'], RECORDINGS)
+    self.assertEqual(stats['calls']['drive.list'], 2 * RECORDINGS)
+
+  def test_finished_windows_are_not_listed_again(self):
+    self.backfill()
+    summary, _ = self.backfill()
+    self.assertEqual(summary['listed'], 0)
+    self.assertEqual(self.server.stats()['calls']['zoom.list_user_recordings'], 1)
+
+  def test_stopping(self):
+    self.scheduler.stop(grace=0)
+    summary, job = self.backfill()
+    self.assertEqual(summary['transferred'], 0)
+    self.assertEqual(self.server.stats()['uploaded_files'], 0)
+    self.assertFalse(job.checkpoint.windows)
+
+
+if __name__ == '__main__':
+  unittest.main()
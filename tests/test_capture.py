@@ -0,0 +1,76 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import os
+import tempfile
+import unittest
+
+from zoom_drive_connector.monitoring import TrafficCapture, tracing
+from zoom_drive_connector.monitoring.capture import load_capture, percentiles
+
+
+class TestTrafficCapture(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.folder.name, 'capture.jsonl')
+    self.tracer = tracing.Tracer()
+    self.capture = TrafficCapture(self.path, self.tracer)
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def test_anonymized(self):
+    self.capture.start()
+    self.assertTrue(self.tracer.enabled)
+    job = self.tracer.start_span('recording', meeting='Board meeting', meeting_id='123-456')
+    with self.tracer.activate(job):
+      with self.tracer.span('zoom.download', url='https://zoom.us/rec/secret') as span:
+        span.set_tag('http.status_code', 200)
+        span.set_tag('bytes', 1024)
+      with self.tracer.span('slack.post_message', channel='board'):
+        pass
+    job.finish()
+    self.capture.stop()
+    self.assertFalse(self.tracer.enabled)
+
+    download, post, recording = load_capture(self.path)
+    self.assertEqual(download['span'], 'zoom.download')
+    self.assertEqual((download['status'], download['bytes']), (200, 1024))
+    self.assertEqual(download['trace'], recording['trace'])
+    self.assertEqual(post['trace'], recording['trace'])
+    self.assertNotEqual(recording['trace'], job.trace_id)
+
+    with open(self.path, encoding='utf-8') as f:
+      content = f.read()
+    for secret in ('Board meeting', '123-456', 'secret', 'board', job.trace_id):
+      self.assertNotIn(secret, content)
+
+  def test_errors_without_messages(self):
+    self.capture.start()
+    with self.assertRaises(ValueError):
+      with self.tracer.span('drive.upload', file='private.mp4'):
+        raise ValueError('private.mp4 not found')
+    self.capture.stop()
+
+    record, = load_capture(self.path)
+    self.assertTrue(record['error'])
+    self.assertNotIn('private', str(record))
+
+  def test_percentiles(self):
+    values = list(range(1, 101))
+    self.assertEqual(percentiles(values), {'p50': 50, 'p95': 95, 'p99': 99})
+    self.assertEqual(percentiles([3.0]), {'p50': 3.0, 'p95': 3.0, 'p99': 3.0})
+    self.assertEqual(percentiles([]), {})
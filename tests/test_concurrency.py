@@ -0,0 +1,197 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import contextlib
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+import responses
+
+from zoom_drive_connector import pipeline, zoom
+from zoom_drive_connector.configuration import SystemConfig, ZoomConfig
+from zoom_drive_connector.monitoring import metrics
+from zoom_drive_connector.pipeline import concurrency
+
+
+class _Clock:
+  def __init__(self):
+    self.now = 1000.0
+
+  def monotonic(self) -> float:
+    return self.now
+
+
+class TestAIMDLimiter(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.clock = _Clock()
+    patcher = patch.object(concurrency, 'time', self.clock)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def window(self, limiter, size=1000, seconds=1.0, status=None):
+    """Runs `limiter.limit` transfers at the same time."""
+    with contextlib.ExitStack() as stack:
+      transfers = [stack.enter_context(limiter.slot()) for _ in range(limiter.limit)]
+      self.clock.now += seconds
+      for transfer in transfers:
+        transfer.size = size
+        transfer.status = status
+
+  def test_additive_increase(self):
+    limiter = pipeline.AIMDLimiter('test-increase', minimum=1, maximum=3)
+    adjustments = metrics.CONCURRENCY_ADJUSTMENTS.labels('test-increase', 'up', 'probe')
+    before = adjustments.value
+    for expected in (2, 3, 3):
+      self.window(limiter)
+      self.assertEqual(limiter.limit, expected)
+    self.assertEqual(adjustments.value - before, 2)
+    self.assertEqual(metrics.CONCURRENCY_LIMIT.labels('test-increase').value, 3)
+
+  def test_no_increase_without_demand(self):
+    limiter = pipeline.AIMDLimiter('test-idle', minimum=1, maximum=4, initial=2)
+    for _ in range(4):
+      with limiter.slot() as transfer:
+        self.clock.now += 1
+        transfer.size = 1000
+    self.assertEqual(limiter.limit, 2)
+
+  def test_congestion_halves_once(self):
+    limiter = pipeline.AIMDLimiter('test-429', minimum=1, maximum=8, initial=4)
+    self.window(limiter, status=429)
+    self.assertEqual(limiter.limit, 2)
+    self.window(limiter, status=503)
+    self.assertEqual(limiter.limit, 1)
+    self.window(limiter, status='timeout')
+    self.assertEqual(limiter.limit, 1)
+
+  def test_exceptions_are_classified(self):
+    limiter = pipeline.AIMDLimiter('test-exception', initial=4)
+    with self.assertRaises(zoom.ZoomAPIException):
+      with limiter.slot():
+        raise zoom.ZoomAPIException(429, 'Too Many Requests', None, '')
+    self.assertEqual(limiter.limit, 2)
+    with self.assertRaises(ValueError):
+      with limiter.slot():
+        raise ValueError()
+    self.assertEqual(limiter.limit, 2)
+
+  def test_latency_inflation(self):
+    limiter = pipeline.AIMDLimiter('test-latency', minimum=1, maximum=8, initial=4)
+    self.window(limiter, seconds=1)
+    self.assertEqual(limiter.limit, 5)
+    self.window(limiter, seconds=3)
+    self.assertEqual(limiter.limit, 2)
+
+  def test_throughput_drop_undoes_increase(self):
+    limiter = pipeline.AIMDLimiter('test-throughput', minimum=1, maximum=8, initial=2,
+                                   latency_tolerance=10)
+    self.window(limiter, seconds=1)
+    self.assertEqual(limiter.limit, 3)
+    # Three transfers take twice as long as two did.
+    self.window(limiter, seconds=2)
+    self.assertEqual(limiter.limit, 2)
+
+  def test_bounds(self):
+    limiter = pipeline.AIMDLimiter('test-bounds', minimum=2, maximum=3, initial=10)
+    self.assertEqual(limiter.limit, 3)
+    self.window(limiter, status=500)
+    self.assertEqual(limiter.limit, 2)
+    limiter.configure(4, 6)
+    self.assertEqual(limiter.limit, 4)
+
+
+class TestSlots(unittest.TestCase):
+  def test_waits_for_free_slot(self):
+    limiter = pipeline.AIMDLimiter('test-wait', minimum=1, maximum=1)
+    entered = threading.Event()
+
+    def transfer():
+      with limiter.slot():
+        entered.set()
+
+    with limiter.slot():
+      thread = threading.Thread(target=transfer)
+      thread.start()
+      self.assertFalse(entered.wait(0.2))
+    self.assertTrue(entered.wait(5))
+    thread.join()
+
+  def test_failure_status(self):
+    self.assertEqual(pipeline.failure_status(requests.exceptions.ReadTimeout()), 'timeout')
+    self.assertEqual(pipeline.failure_status(requests.exceptions.ConnectionError()), 'connection')
+    http_error = Exception()
+    http_error.resp = MagicMock(status=503)
+    self.assertEqual(pipeline.failure_status(http_error), 503)
+    self.assertIsNone(pipeline.failure_status(OSError('disk full')))
+    self.assertTrue(pipeline.is_congestion(429))
+    self.assertFalse(pipeline.is_congestion(404))
+
+
+class TestAdaptiveWorkers(unittest.TestCase):
+  @responses.activate
+  def test_download_status(self):
+    with tempfile.TemporaryDirectory() as folder:
+      api = zoom.ZoomAPI(ZoomConfig({}), SystemConfig({'target_folder': folder}))
+      api.generate_server_to_server_oath_token = MagicMock(return_value='token')
+      url = 'https://mindsai.zoom.us/recording/share/random-uid'
+      responses.add(responses.GET, url, status=429)
+
+      result = api.pull_file_from_zoom('meeting', recording={'id': 'r', 'url': url})
+      self.assertEqual(result['status'], 429)
+      self.assertEqual(os.listdir(folder), [])
+
+  @patch('zoom_drive_connector.pipeline.scheduler.discover_recording',
+         return_value={'date': None, 'size': 10})
+  @patch('zoom_drive_connector.pipeline.scheduler.process_meeting', return_value=True)
+  def test_scheduler_passes_limits(self, process_meeting, _):
+    meetings = [{'id': str(i), 'name': str(i), 'folder_id': 'f', 'slack_channel': 'c'}
+                for i in range(3)]
+    zoom_config = ZoomConfig({
+      'account_id': 'account', 'trash_rate': 0, 'workers': 2, 'adaptive_concurrency': True,
+      'max_concurrency': 6, 'meetings': meetings})
+    scheduler = pipeline.Scheduler(zoom_config, SystemConfig({'target_folder': '/tmp'}),
+                                   MagicMock(), MagicMock())
+    try:
+      account = scheduler.accounts['account']
+      self.assertEqual(account.workers, 6)
+      self.assertEqual(account.download_limit.limit, 2)
+      self.assertEqual(scheduler.upload_limit.maximum, 6)
+      self.assertEqual(scheduler.run_once(), {'transferred': 3, 'failed': 0})
+    finally:
+      scheduler.close(timeout=1)
+
+    limits = process_meeting.call_args[0][9]
+    self.assertIs(limits.download, account.download_limit)
+    self.assertIs(limits.upload, scheduler.upload_limit)
+
+  def test_disabled(self):
+    scheduler = pipeline.Scheduler(ZoomConfig({'account_id': 'account', 'trash_rate': 0,
+                                               'workers': 2}),
+                                   SystemConfig({'target_folder': '/tmp'}), None, None)
+    try:
+      self.assertIsNone(scheduler.upload_limit)
+      self.assertIsNone(scheduler.accounts['account'].download_limit)
+      self.assertEqual(scheduler.accounts['account'].workers, 2)
+    finally:
+      scheduler.close(timeout=1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,122 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import copy
+import os
+import tempfile
+import unittest
+
+import yaml
+
+from zoom_drive_connector import configuration
+
+
+class TestConfigWatcher(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.config_file = os.path.join(self.folder.name, 'config.yaml')
+    secrets_file = os.path.join(self.folder.name, 'client_secrets.json')
+    open(secrets_file, 'w', encoding='utf-8').close()
+
+    self.document = {
+      'zoom': {'account_id': 'account', 'client_id': 'client', 'client_secret': 'secret',
+               'delete': True,
+               'meetings': [{'id': 'first_id', 'name': 'meeting1', 'folder_id': 'folder1',
+                             'slack_channel': 'channel-1'}]},
+      'slack': {'key': 'slack_key'},
+      'drive': {'credentials_json': os.path.join(self.folder.name, 'credentials.json'),
+                'client_secret_json': secrets_file},
+      'internals': {'target_folder': self.folder.name}
+    }
+    self.write(self.document)
+    self.config = configuration.ConfigInterface(self.config_file)
+    self.watcher = configuration.ConfigWatcher(self.config)
+
+    self.calls = []
+    for section in ('zoom', 'slack', 'drive', 'internals'):
+      self.watcher.subscribe(section, lambda conf, changed, s=section: self.calls.append(
+          (s, changed)))
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def write(self, document, content=None):
+    with open(self.config_file, 'w', encoding='utf-8') as f:
+      f.write(content if content is not None else yaml.safe_dump(document))
+    # Make sure the modification time changes even on file systems with a coarse resolution.
+    stat = os.stat(self.config_file)
+    os.utime(self.config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+  def test_unchanged(self):
+    self.assertFalse(self.watcher.check())
+    self.write(self.document)
+    self.assertFalse(self.watcher.check())
+    self.assertEqual(self.calls, [])
+
+  def test_meetings_swapped_in_place(self):
+    zoom_config = self.config.zoom
+    meetings = zoom_config.meetings
+
+    document = copy.deepcopy(self.document)
+    document['zoom']['meetings'].append({'id': 'second_id', 'name': 'meeting2',
+                                         'folder_id': 'folder2', 'slack_channel': 'channel-2'})
+    self.write(document)
+
+    self.assertTrue(self.watcher.check())
+    self.assertIs(self.config.zoom, zoom_config)
+    self.assertEqual([m['id'] for m in zoom_config.meetings], ['first_id', 'second_id'])
+    # Readers of the old list are not affected.
+    self.assertEqual(len(meetings), 1)
+    self.assertEqual(self.calls, [('zoom', {'meetings'})])
+
+  def test_only_changed_sections_notified(self):
+    document = copy.deepcopy(self.document)
+    document['slack']['key'] = 'new_key'
+    self.write(document)
+
+    self.assertTrue(self.watcher.check())
+    self.assertEqual(self.config.slack.key, 'new_key')
+    self.assertEqual(self.calls, [('slack', {'key'})])
+
+  def test_invalid_file_ignored(self):
+    document = copy.deepcopy(self.document)
+    del document['zoom']['meetings'][0]['folder_id']
+    self.write(document)
+    with self.assertLogs(logger='app', level='ERROR'):
+      self.assertFalse(self.watcher.check())
+
+    self.write(None, content='zoom: [unclosed')
+    with self.assertLogs(logger='app', level='ERROR'):
+      self.assertFalse(self.watcher.check())
+    self.assertEqual(self.config.zoom.meetings[0]['folder_id'], 'folder1')
+    self.assertEqual(self.calls, [])
+
+    # The fixed file is applied.
+    document = copy.deepcopy(self.document)
+    document['zoom']['delete'] = False
+    self.write(document)
+    self.assertTrue(self.watcher.check())
+    self.assertEqual(self.calls, [('zoom', {'delete'})])
+
+  def test_listener_errors_logged(self):
+    self.watcher.subscribe('internals', lambda conf, changed: 1 / 0)
+    document = copy.deepcopy(self.document)
+    document['internals']['download_block_size'] = 4096
+    self.write(document)
+
+    with self.assertLogs(logger='app', level='ERROR'):
+      self.assertTrue(self.watcher.check())
+    self.assertEqual(self.calls, [('internals', {'download_block_size'})])
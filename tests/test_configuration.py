@@ -45,6 +45,11 @@ class TestBaseClass(unittest.TestCase):
       # pylint: disable=unused-variable
       test_value = self.base.test.inner
 
+  def test_get(self):
+    self.assertEqual(self.base.get('hello'), 'world')
+    self.assertIsNone(self.base.get('test'))
+    self.assertEqual(self.base.get('test', 5), 5)
+
 
 class TestSlackConfig(TestSettingsBase):
   # pylint: disable=invalid-name
@@ -0,0 +1,94 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+
+import responses
+
+from zoom_drive_connector import zoom
+from zoom_drive_connector.configuration import ZoomConfig, SystemConfig
+
+
+class TestCopyEngine(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.folder.name, 'out.mp4')
+    self.data = os.urandom(100000)
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def test_copy(self):
+    engine = zoom.CopyEngine(block_size=4096)
+    result = engine.copy(io.BytesIO(self.data), self.path)
+
+    self.assertEqual(result, zoom.CopyResult(len(self.data), None))
+    with open(self.path, 'rb') as f:
+      self.assertEqual(f.read(), self.data)
+
+  def test_hash_and_progress(self):
+    progress = []
+    engine = zoom.CopyEngine(block_size=65536, hash_factory=hashlib.sha256,
+                             progress=lambda done, total: progress.append((done, total)))
+    result = engine.copy(io.BytesIO(self.data), self.path, total=len(self.data))
+
+    self.assertEqual(result.digest, hashlib.sha256(self.data).hexdigest())
+    self.assertEqual(progress, [(65536, len(self.data)), (len(self.data), len(self.data))])
+
+  def test_buffer_reused(self):
+    engine = zoom.CopyEngine(block_size=4096)
+    # pylint: disable=protected-access
+    self.assertIs(engine._buffer(), engine._buffer())
+
+  def test_preallocate(self):
+    engine = zoom.CopyEngine(block_size=4096, preallocate=True)
+    engine.copy(io.BytesIO(self.data), self.path, total=len(self.data))
+    self.assertEqual(os.path.getsize(self.path), len(self.data))
+
+  def test_truncated_source(self):
+    engine = zoom.CopyEngine(block_size=4096, preallocate=True)
+    with self.assertRaises(OSError):
+      engine.copy(io.BytesIO(self.data), self.path, total=len(self.data) + 10)
+    # Space reserved for the missing bytes is released again.
+    self.assertEqual(os.path.getsize(self.path), len(self.data))
+
+
+class TestDownloadRecording(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.api = zoom.ZoomAPI(ZoomConfig({}),
+                            SystemConfig({'target_folder': self.folder.name,
+                                          'download_block_size': 8192}))
+    self.url = 'https://mindsai.zoom.us/recording/share/random-uid'
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  @responses.activate
+  def test_download(self):
+    data = os.urandom(50000)
+    responses.add(responses.GET, self.url, body=data, status=200, stream=True)
+
+    outfile = self.api.download_recording(self.url, 'token')
+
+    self.assertEqual(outfile, os.path.join(self.folder.name, 'random-uid.mp4'))
+    with open(outfile, 'rb') as f:
+      self.assertEqual(f.read(), data)
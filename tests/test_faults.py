@@ -0,0 +1,110 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import os
+import tempfile
+import time
+import unittest
+from typing import Any, Dict
+
+from zoom_drive_connector import drive, pipeline, slack
+
+from benchmarks.bench_pipeline import _StandInSlackClient, build_configs
+from benchmarks.fake_servers import FaultPlan, StandInProcess
+
+RECORDINGS = 200
+# Runs of the pipeline and seconds the recordings may take to get through all faults.
+MAX_RUNS = 15
+MAX_SECONDS = 120
+
+
+class TestFaultInjection(unittest.TestCase):
+  def run_pipeline(self, faults: FaultPlan, recordings: int = RECORDINGS):
+    """Runs the scheduler against faulty stand-ins until every recording is trashed on Zoom.
+
+    :return: the statistics of the stand-ins and the number of runs.
+    """
+    sizes = [16 * 1024 + 997 * i for i in range(recordings)]
+    server = StandInProcess(meetings=recordings, file_size=0, sizes=sizes, faults=faults)
+    server.start()
+    self.addCleanup(server.stop)
+    work_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(work_dir.cleanup)
+
+    sys_config, drive_config, slack_config, zoom_config = build_configs(
+        server.url, work_dir.name, recordings, workers=8, trash_rate=0, trash_backoff=0.05,
+        trash_retries=20)
+    slack_api = slack.SlackAPI(slack_config)
+    slack_api.sc = _StandInSlackClient(server.url)
+    scheduler = pipeline.Scheduler(zoom_config, sys_config,
+                                   drive.DriveAPI(drive_config, sys_config), slack_api)
+    self.addCleanup(scheduler.close, 1)
+
+    started = time.monotonic()
+    deadline = started + MAX_SECONDS
+    runs = 0
+    stats = server.stats()
+    while stats['trashed'] < recordings and runs < MAX_RUNS and time.monotonic() < deadline:
+      scheduler.run_once()
+      runs += 1
+      # In production the trash queue has ten minutes until the next run.
+      for account in scheduler.accounts.values():
+        account.trash_queue.join(timeout=30)
+      stats = server.stats()
+
+    self.assertLess(time.monotonic() - started, MAX_SECONDS)
+    self.assertEqual(os.listdir(str(sys_config.target_folder)), [])
+    return stats, runs
+
+  def assert_no_data_loss(self, stats: Dict[str, Any], recordings: int = RECORDINGS):
+    self.assertEqual(stats['corrupt'], [])
+    self.assertEqual(stats['violations'], [])
+    self.assertEqual(stats['verified'], recordings)
+    self.assertEqual(stats['trashed'], recordings)
+
+  def test_without_faults(self):
+    stats, runs = self.run_pipeline(FaultPlan(), recordings=20)
+    self.assert_no_data_loss(stats, recordings=20)
+    self.assertEqual(runs, 1)
+    self.assertEqual(stats['duplicates'], 0)
+
+  def test_all_faults(self):
+    faults = FaultPlan(rate_limit=0.03, server_errors=0.02, burst=3, resets=0.05,
+                       truncations=0.05, expired_tokens=0.02, seed=44)
+    stats, runs = self.run_pipeline(faults)
+    self.assert_no_data_loss(stats)
+    injected = stats['injected']
+    for kind in ('rate_limit', 'server_error', 'reset', 'truncation', 'expired_token'):
+      self.assertTrue(any(key.endswith(kind) for key in injected), kind)
+    self.assertLessEqual(runs, MAX_RUNS)
+
+  def test_downloads_cut_off(self):
+    stats, _ = self.run_pipeline(FaultPlan(resets=0.2, truncations=0.2,
+                                           endpoints=['zoom.download'], seed=7), recordings=100)
+    self.assert_no_data_loss(stats, recordings=100)
+
+  def test_short_lived_tokens(self):
+    stats, _ = self.run_pipeline(FaultPlan(token_lifetime=0.5, seed=3), recordings=50)
+    self.assert_no_data_loss(stats, recordings=50)
+
+  def test_drive_and_slack_outages(self):
+    stats, _ = self.run_pipeline(FaultPlan(rate_limit=0.05, server_errors=0.02, burst=5,
+                                           resets=0.05, endpoints=['drive.', 'slack.'], seed=11),
+                                 recordings=100)
+    self.assert_no_data_loss(stats, recordings=100)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,155 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import concurrent.futures
+import json
+import os
+import tempfile
+import unittest
+
+from zoom_drive_connector import configuration as config, drive, pipeline
+
+from benchmarks.fake_servers import StandInServer, StandInState
+from benchmarks.bench_pipeline import build_configs
+
+PATH = 'Recordings/Standup/2018/06'
+
+
+class TestFolderResolver(unittest.TestCase):
+  def setUp(self):
+    self.state = StandInState(meetings=0, file_size=0, folders=['folder', 'other'])
+    server = StandInServer(self.state)
+    server.start()
+    self.addCleanup(server.stop)
+    work_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(work_dir.cleanup)
+    self.work_dir = work_dir.name
+
+    sys_config, drive_config, _, _ = build_configs(server.url, self.work_dir, 0)
+    self.drive_api = drive.DriveAPI(drive_config, sys_config)
+    self.cache_file = os.path.join(self.work_dir, 'folders.json')
+
+  def resolver(self, ttl: float = 3600.0) -> drive.FolderResolver:
+    return drive.FolderResolver(self.drive_api, self.cache_file, ttl)
+
+  def test_split_path(self):
+    self.assertEqual(drive.split_path('/Recordings//Standup /2018/'),
+                     ['Recordings', 'Standup', '2018'])
+    self.assertEqual(drive.split_path(''), [])
+
+  def test_creates_missing_folders_once(self):
+    resolver = self.resolver()
+    folder_id = resolver.resolve('folder', PATH)
+    self.assertEqual(self.state.folder_path(folder_id), 'folder/' + PATH)
+    self.assertEqual(self.state.calls['drive.create_folder'], 4)
+
+    # Sibling paths share the folders that exist; repeated paths are answered from memory.
+    self.assertEqual(resolver.resolve('folder', PATH), folder_id)
+    july = resolver.resolve('folder', 'Recordings/Standup/2018/07')
+    self.assertEqual(self.state.folder_path(july), 'folder/Recordings/Standup/2018/07')
+    self.assertEqual(self.state.calls['drive.create_folder'], 5)
+    self.assertEqual(self.state.calls['drive.list'], 5)
+    self.assertEqual(resolver.resolve('folder', ''), 'folder')
+
+  def test_finds_existing_folders(self):
+    folder_id = self.resolver().resolve('folder', PATH)
+    os.remove(self.cache_file)
+    self.assertEqual(self.resolver().resolve('folder', PATH), folder_id)
+    self.assertEqual(self.state.calls['drive.create_folder'], 4)
+
+  def test_cache_file(self):
+    folder_id = self.resolver().resolve('folder', PATH)
+    with open(self.cache_file, 'r', encoding='utf-8') as f:
+      self.assertEqual(len(json.load(f)['folders']), 4)
+    calls = sum(self.state.calls.values())
+
+    self.assertEqual(self.resolver().resolve('folder', PATH), folder_id)
+    self.assertEqual(sum(self.state.calls.values()), calls)
+
+  def test_revalidation(self):
+    folder_id = self.resolver().resolve('folder', PATH)
+
+    # Expired entries are checked before they are used.
+    self.assertEqual(self.resolver(ttl=0).resolve('folder', PATH), folder_id)
+    self.assertEqual(self.state.calls['drive.get'], 4)
+
+    # A folder that was deleted is created again.
+    with self.state.lock:
+      del self.state.folders[folder_id]
+    recreated = self.resolver(ttl=0).resolve('folder', PATH)
+    self.assertNotEqual(recreated, folder_id)
+    self.assertEqual(self.state.folder_path(recreated), 'folder/' + PATH)
+    self.assertEqual(self.state.calls['drive.create_folder'], 5)
+
+  def test_without_create(self):
+    resolver = self.resolver()
+    self.assertIsNone(resolver.resolve('folder', PATH, create=False))
+    self.assertEqual(self.state.calls['drive.create_folder'], 0)
+
+  def test_concurrent_resolve(self):
+    resolver = self.resolver()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+      ids = set(pool.map(lambda _: resolver.resolve('folder', PATH), range(16)))
+    self.assertEqual(len(ids), 1)
+    self.assertEqual(self.state.calls['drive.create_folder'], 4)
+
+  def test_validate(self):
+    self.resolver().validate(['folder', 'other', 'folder'])
+    self.assertEqual(self.state.calls['drive.batch'], 1)
+    self.assertEqual(self.state.calls['drive.get'], 0)
+
+    with self.assertRaises(drive.DriveAPIException) as context:
+      self.resolver().validate(['folder', 'missing', 'gone'])
+    self.assertEqual(context.exception.reason, 'gone does not exist; missing does not exist')
+    self.assertEqual(self.state.calls['drive.batch'], 2)
+
+  def test_upload_to_folder(self):
+    path = os.path.join(self.work_dir, 'recording.mp4')
+    with open(path, 'wb') as f:
+      f.write(os.urandom(300 * 1024))
+    self.drive_api.upload_file(path, 'recording.mp4', 'folder', folder=PATH)
+    self.assertEqual(self.state.upload_folder('recording.mp4'), 'folder/' + PATH)
+    # The default cache lives in the download folder.
+    self.assertTrue(os.path.exists(os.path.join(self.work_dir, 'downloads',
+                                                'drive_folders.json')))
+
+
+class TestMeetingFolders(unittest.TestCase):
+  def test_pipeline(self):
+    state = StandInState(meetings=2, file_size=64 * 1024)
+    server = StandInServer(state)
+    server.start()
+    self.addCleanup(server.stop)
+    work_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(work_dir.cleanup)
+
+    sys_config, drive_config, _, zoom_config = build_configs(server.url, work_dir.name, 2,
+                                                             trash_rate=0)
+    meetings = zoom_config.settings_dict['meetings']
+    meetings[0]['folder'] = 'Recordings/{meeting}/{yyyy}/{mm}'
+    zoom_config = config.ZoomConfig({**zoom_config.settings_dict, 'meetings': meetings})
+    scheduler = pipeline.Scheduler(zoom_config, sys_config,
+                                   drive.DriveAPI(drive_config, sys_config), None)
+    self.addCleanup(scheduler.close, 1)
+
+    self.assertEqual(scheduler.drive_folders(), {'folder'})
+    self.assertEqual(scheduler.run_once()['transferred'], 2)
+    names = sorted(state.upload_names.values())
+    self.assertEqual(state.upload_folder(names[0]), 'folder/Recordings/Meeting 0/2018/01')
+    self.assertEqual(state.upload_folder(names[1]), 'folder')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,152 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import os
+import tempfile
+import unittest
+
+from zoom_drive_connector import drive, pipeline
+from zoom_drive_connector.monitoring import TransferHistory, format_report, tracing
+
+from benchmarks.fake_servers import StandInServer, StandInState
+from benchmarks.bench_pipeline import build_configs
+
+DAY = datetime.datetime(2018, 6, 1, tzinfo=datetime.timezone.utc).timestamp()
+MB = 1024 * 1024
+
+
+class TestTransferHistory(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    folder = tempfile.TemporaryDirectory()
+    self.addCleanup(folder.cleanup)
+    self.path = os.path.join(folder.name, 'history.sqlite')
+    self.tracer = tracing.Tracer()
+    self.history = TransferHistory(self.path, tracer=self.tracer)
+    self.addCleanup(self.history.close)
+
+  def rows(self):
+    return self.history._db.execute(  # pylint: disable=protected-access
+        'SELECT meeting, status, bytes, download_s IS NOT NULL, upload_s IS NOT NULL, retries, '
+        'codes, recovered FROM transfers ORDER BY id').fetchall()
+
+  def test_report(self):
+    for hour in range(48):
+      self.history.add(DAY + hour * 3600 + 60, 'Standup', 'ok', 10 * MB, 5.0,
+                       {'download': 2.0, 'upload': 3.0})
+    self.history.add(DAY + 600, 'Board', 'ok', 100 * MB, 100.0,
+                     {'download': 40.0, 'upload': 60.0})
+    self.history.add(DAY + 700, 'Board', 'failed', 0, 1.0, {'download': 1.0}, 1,
+                     ['zoom.download:503', 'zoom.download:503'])
+    self.history.add(DAY - 600, 'Standup', 'ok', MB, 1000.0, {'download': 1000.0})
+
+    report = self.history.report(DAY, DAY + 2 * 86400)
+    self.assertEqual((report['transfers'], report['failed']), (50, 1))
+    self.assertEqual(report['bytes'], 580 * MB)
+    self.assertEqual([row['period'] for row in report['throughput']],
+                     ['2018-06-01', '2018-06-02'])
+    self.assertEqual(report['throughput'][0]['transfers'], 26)
+    self.assertEqual(report['throughput'][1]['mb_s'], 2.0)
+    self.assertEqual([row['meeting'] for row in report['slowest']], ['Board', 'Standup'])
+    self.assertEqual(report['slowest'][0]['mean_s'], 100.0)
+    self.assertEqual(report['failures'], [{'meeting': 'Board', 'failed': 1, 'transfers': 2,
+                                           'retries': 1}])
+    self.assertEqual(report['errors'], [{'span': 'zoom.download', 'code': '503', 'count': 2}])
+
+    # Stage times are read from histogram bins, so they are accurate to a bin.
+    self.assertAlmostEqual(report['stages']['download']['p50'], 2.0, delta=0.4)
+    self.assertGreater(report['stages']['total']['p95'], 4.0)
+    self.assertLess(report['stages']['total']['p95'], 6.0)
+
+    # Ranges cover whole days.
+    hourly = self.history.report(DAY + 3600, DAY + 3 * 3600, period='hour', top=1)
+    self.assertEqual((hourly['from'], hourly['to']), ('2018-06-01', '2018-06-01'))
+    self.assertEqual(len(hourly['throughput']), 24)
+    self.assertEqual(hourly['throughput'][1]['period'], '2018-06-01 01:00')
+    self.assertEqual(len(hourly['slowest']), 1)
+    self.assertIn('Board', format_report(report))
+
+  def test_prune_keeps_rollups(self):
+    self.history.add(DAY, 'Standup', 'ok', MB, 5.0, {'download': 2.0})
+    self.history.add(DAY + 86400, 'Standup', 'ok', MB, 5.0, {'download': 2.0})
+    self.assertEqual(self.history.prune(DAY + 3600), 1)
+    self.assertEqual(len(self.rows()), 1)
+    self.assertEqual(self.history.report(DAY, DAY + 2 * 86400)['transfers'], 2)
+
+  def test_spans(self):
+    self.history.start()
+    job = self.tracer.start_span('recording', meeting='Standup', account='default')
+    with self.tracer.activate(job):
+      with self.tracer.span('zoom.download') as span:
+        span.set_tag('http.status_code', 200)
+        span.set_tag('bytes', 1024)
+      with self.tracer.span('drive.upload', bytes=1024) as span:
+        span.set_tag('error', '<HttpError 503 when requesting https://drive>')
+      with self.tracer.span('drive.upload', bytes=1024):
+        pass
+      with self.tracer.span('slack.post_message'):
+        pass
+    job.finish()
+
+    # Lookups that found nothing new are not transfers.
+    lookup = self.tracer.start_span('recording', meeting='Board', status='no_recording')
+    with self.tracer.activate(lookup):
+      with self.tracer.span('zoom.list_recordings') as span:
+        span.set_tag('http.status_code', 404)
+    lookup.finish()
+
+    recovered = self.tracer.start_span('recording', meeting='Board', recovered=True)
+    with self.tracer.activate(recovered):
+      with self.tracer.span('drive.upload', bytes=2048):
+        pass
+    recovered.set_tag('error', 'DriveAPIException()')
+    recovered.finish()
+    self.history.stop()
+
+    self.assertEqual(self.rows(), [('Standup', 'ok', 1024, 1, 1, 1, 'drive.upload:503', 0),
+                                   ('Board', 'failed', 2048, 0, 1, 0, None, 1)])
+    self.assertFalse(self.tracer.enabled)
+
+
+class TestPipelineHistory(unittest.TestCase):
+  def test_scheduler(self):
+    state = StandInState(meetings=3, file_size=64 * 1024)
+    server = StandInServer(state)
+    server.start()
+    self.addCleanup(server.stop)
+    work_dir = tempfile.TemporaryDirectory()
+    self.addCleanup(work_dir.cleanup)
+
+    sys_config, drive_config, _, zoom_config = build_configs(server.url, work_dir.name, 3,
+                                                             trash_rate=0)
+    scheduler = pipeline.Scheduler(zoom_config, sys_config,
+                                   drive.DriveAPI(drive_config, sys_config), None)
+    self.addCleanup(scheduler.close, 1)
+    history = TransferHistory(os.path.join(work_dir.name, 'history.sqlite'))
+    self.addCleanup(history.close)
+    history.start()
+    self.addCleanup(history.stop)
+
+    scheduler.run_once()
+    scheduler.run_once()
+    report = history.report(0, 4e9)
+    self.assertEqual((report['transfers'], report['failed']), (3, 0))
+    self.assertEqual(report['bytes'], 3 * 64 * 1024)
+    self.assertEqual(sorted(report['stages']), ['download', 'total', 'upload'])
+
+
+if __name__ == '__main__':
+  unittest.main()
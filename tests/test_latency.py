@@ -0,0 +1,100 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from zoom_drive_connector import pipeline
+from zoom_drive_connector.configuration import MeetingRecord
+from zoom_drive_connector.monitoring import latency
+
+
+def milestones(notified, ended=1000.0):
+  return {'ended': ended, 'discovered': ended + 60, 'downloaded': ended + 120,
+          'uploaded': ended + notified - 10, 'notified': ended + notified}
+
+
+class TestLatencyTracker(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.tracker = latency.LatencyTracker(window=100, objective=600)
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def test_percentiles(self):
+    with self.assertLogs(logger='app', level='INFO'):
+      for notified in range(1, 201):
+        self.tracker.observe('Standup', milestones(notified))
+
+    summary = self.tracker.summary()
+    self.assertEqual(summary['recordings'], 200)
+    # Only the last 100 recordings count.
+    self.assertEqual(summary['stages']['notified'], {'p50': 150, 'p95': 195, 'p99': 199})
+    self.assertEqual(summary['stages']['discovered']['p99'], 60)
+    self.assertTrue(summary['healthy'])
+
+  def test_objective(self):
+    with self.assertLogs(logger='app', level='INFO'):
+      self.tracker.observe('Standup', milestones(300))
+    self.assertEqual(self.tracker.route()[0], 200)
+
+    with self.assertLogs(logger='app', level='INFO'):
+      self.tracker.observe('All hands', milestones(3600))
+    self.assertFalse(self.tracker.healthy())
+    status, content_type, body = self.tracker.route()
+    self.assertEqual((status, content_type), (503, 'application/json'))
+    self.assertFalse(json.loads(body)['healthy'])
+    with self.assertLogs(logger='app', level='WARNING'):
+      self.tracker.log_summary()
+
+  def test_status_file(self):
+    status_file = os.path.join(self.folder.name, 'status.json')
+    self.tracker.configure(window=10, status_file=status_file)
+    with self.assertLogs(logger='app', level='INFO'):
+      self.tracker.observe('Standup', milestones(300))
+    with open(status_file, encoding='utf-8') as f:
+      status = json.load(f)
+    self.assertEqual(status['stages']['uploaded']['p50'], 290)
+    self.assertIsNone(status['objective'])
+
+  def test_pipeline_milestones(self):
+    ended = datetime.datetime(2018, 1, 1, 2)
+    path = os.path.join(self.folder.name, 'recording.mp4')
+    open(path, 'wb').close()
+    zoom_conn = MagicMock()
+    zoom_conn.account = 'default'
+    zoom_conn.pull_file_from_zoom.return_value = {
+      'success': True, 'date': datetime.datetime(2018, 1, 1, 1), 'end': ended,
+      'filename': path, 'trash': [], 'id': 'recording'}
+
+    started = time.time()
+    meeting = MeetingRecord('meeting', 'Standup', 'folder', 'channel')
+    with patch.object(latency, 'TRACKER', self.tracker):
+      file = pipeline.download_meeting(zoom_conn, meeting, True,
+                                       recording={'discovered': started - 5})
+      with self.assertLogs(logger='app', level='INFO'):
+        pipeline.upload_and_notify([file], MagicMock(), MagicMock())
+
+    since_end = started - ended.replace(tzinfo=datetime.timezone.utc).timestamp()
+    stages = self.tracker.summary()['stages']
+    self.assertAlmostEqual(stages['discovered']['p50'], since_end - 5, delta=1)
+    self.assertAlmostEqual(stages['notified']['p50'], since_end, delta=5)
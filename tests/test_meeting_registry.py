@@ -0,0 +1,147 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import os
+import tempfile
+import unittest
+
+import yaml
+
+from zoom_drive_connector import configuration
+
+
+def meeting(i, **kwargs):
+  result = {'id': f'id-{i}', 'name': f'Meeting {i}', 'folder_id': f'folder-{i}',
+            'slack_channel': 'channel'}
+  result.update(kwargs)
+  return result
+
+
+class TestMeetingRegistry(unittest.TestCase):
+  def test_lookup(self):
+    meetings = [meeting(i) for i in range(3000)]
+    meetings.append(meeting(3000, uuid='abc=='))
+    registry = configuration.MeetingRegistry(meetings)
+
+    self.assertEqual(len(registry), 3001)
+    self.assertFalse(registry.errors)
+    self.assertEqual(registry.get('id-1234'),
+                     configuration.MeetingRecord('id-1234', 'Meeting 1234', 'folder-1234',
+                                                 'channel'))
+    self.assertEqual(registry.lookup('abc==').id, 'id-3000')
+    self.assertIn('id-0', registry)
+    self.assertNotIn('id-5000', registry)
+    self.assertEqual([r.id for r in registry][:2], ['id-0', 'id-1'])
+
+  def test_priority(self):
+    registry = configuration.MeetingRegistry([meeting(1, priority='2'), meeting(2),
+                                              meeting(3, priority='high')])
+    self.assertEqual(registry.get('id-1').priority, 2)
+    self.assertEqual(registry.get('id-2').priority, 0)
+    self.assertNotIn('id-3', registry)
+    self.assertEqual(len(registry.errors), 1)
+
+  def test_folder(self):
+    registry = configuration.MeetingRegistry([
+      meeting(1, name='Team/Standup', folder='Recordings/{meeting}/{yyyy}/{mm}'),
+      meeting(2),
+      meeting(3, folder='{year}'),
+      meeting(4, folder='{meeting'),
+      meeting(5, folder=['Recordings'])
+    ])
+    date = datetime.datetime(2018, 6, 1, 9, 30)
+    self.assertEqual(registry.get('id-1').folder_path(date), 'Recordings/Team-Standup/2018/06')
+    self.assertIsNone(registry.get('id-2').folder_path(date))
+    self.assertEqual([r.id for r in registry], ['id-1', 'id-2'])
+    self.assertEqual(len(registry.errors), 3)
+    self.assertIn('unknown fields year', registry.errors[0])
+
+  def test_problems(self):
+    registry = configuration.MeetingRegistry([
+      meeting(1, uuid='u1'),
+      meeting(1),
+      meeting(2, uuid='u1'),
+      meeting(3, name='Meeting 4', folder_id='folder-4'),
+      meeting(4),
+      {'id': 'id-5'},
+      'id-6'
+    ])
+
+    self.assertEqual(len(registry.errors), 4)
+    self.assertIn('Duplicate meeting ID id-1.', registry.errors)
+    self.assertEqual(len(registry.warnings), 1)
+    self.assertEqual([r.id for r in registry], ['id-1', 'id-3', 'id-4'])
+
+
+class TestIncludes(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    os.makedirs(os.path.join(self.folder.name, 'rooms'))
+    secrets_file = os.path.join(self.folder.name, 'client_secrets.json')
+    open(secrets_file, 'w', encoding='utf-8').close()
+
+    self.write('rooms/a.yaml', [meeting(1), meeting(2)])
+    self.write('rooms/b.yaml', {'meetings': [meeting(3)]})
+    self.config_file = self.write('config.yaml', {
+      'zoom': {'account_id': 'account', 'client_id': 'client', 'client_secret': 'secret',
+               'delete': True, 'meetings': [meeting(0)], 'include': ['rooms/*.yaml']},
+      'slack': {'key': 'slack_key'},
+      'drive': {'credentials_json': os.path.join(self.folder.name, 'credentials.json'),
+                'client_secret_json': secrets_file},
+      'internals': {'target_folder': self.folder.name}
+    })
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def write(self, name, document):
+    path = os.path.join(self.folder.name, name)
+    with open(path, 'w', encoding='utf-8') as f:
+      yaml.safe_dump(document, f)
+    return path
+
+  def test_include(self):
+    config = configuration.ConfigInterface(self.config_file)
+
+    self.assertEqual([r.id for r in config.zoom.registry], ['id-0', 'id-1', 'id-2', 'id-3'])
+    self.assertEqual(len(config.files), 3)
+
+  def test_duplicate_across_shards(self):
+    self.write('rooms/c.yaml', [meeting(1)])
+    with self.assertLogs(logger='app', level='ERROR') as logger:
+      with self.assertRaises(RuntimeError):
+        configuration.ConfigInterface(self.config_file)
+    self.assertRegex(logger.output[0], 'Duplicate meeting ID id-1')
+
+  def test_missing_include(self):
+    os.remove(os.path.join(self.folder.name, 'rooms', 'a.yaml'))
+    os.remove(os.path.join(self.folder.name, 'rooms', 'b.yaml'))
+    with self.assertRaises(RuntimeError):
+      configuration.ConfigInterface(self.config_file)
+
+  def test_watcher_sees_shard_changes(self):
+    config = configuration.ConfigInterface(self.config_file)
+    watcher = configuration.ConfigWatcher(config)
+    registry = config.zoom.registry
+
+    path = self.write('rooms/b.yaml', {'meetings': [meeting(3), meeting(4)]})
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    self.assertTrue(watcher.check())
+    self.assertIsNot(config.zoom.registry, registry)
+    self.assertIn('id-4', config.zoom.registry)
@@ -0,0 +1,112 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import time
+import unittest
+import urllib.request
+import urllib.error
+
+from zoom_drive_connector import monitoring
+from zoom_drive_connector.monitoring import metrics
+
+
+class TestMetrics(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.registry = monitoring.MetricsRegistry()
+
+  def test_counter(self):
+    counter = monitoring.Counter('requests', 'Requests.', ('api', 'status'), registry=self.registry)
+    counter.labels('zoom', 429).inc()
+    counter.labels('zoom', 429).inc(2)
+
+    self.assertEqual(counter.labels('zoom', '429').value, 3)
+    self.assertIn('requests_total{api="zoom",status="429"} 3', self.registry.render())
+
+    with self.assertRaises(ValueError):
+      counter.labels('zoom').inc()
+    with self.assertRaises(ValueError):
+      counter.labels('zoom', 500).inc(-1)
+
+  def test_gauge(self):
+    gauge = monitoring.Gauge('depth', 'Depth.', registry=self.registry)
+    gauge.set(4)
+    gauge.dec()
+    self.assertEqual(gauge.value, 3)
+
+    with gauge.track_inprogress():
+      self.assertEqual(gauge.value, 4)
+    self.assertEqual(gauge.value, 3)
+
+    gauge.set_function(lambda: 42)
+    self.assertIn('depth 42', self.registry.render())
+
+  def test_histogram(self):
+    histogram = monitoring.Histogram('latency', 'Latency.', ('stage',), buckets=(1, 10),
+                                     registry=self.registry)
+    histogram.labels('upload').observe(0.5)
+    histogram.labels('upload').observe(5)
+    histogram.labels('upload').observe(50)
+
+    output = self.registry.render()
+    self.assertIn('latency_bucket{stage="upload",le="1"} 1', output)
+    self.assertIn('latency_bucket{stage="upload",le="10"} 2', output)
+    self.assertIn('latency_bucket{stage="upload",le="+Inf"} 3', output)
+    self.assertIn('latency_sum{stage="upload"} 55.5', output)
+    self.assertIn('latency_count{stage="upload"} 3', output)
+
+  def test_duplicate_registration(self):
+    monitoring.Counter('dup', 'Duplicate.', registry=self.registry)
+    with self.assertRaises(ValueError):
+      monitoring.Counter('dup', 'Duplicate.', registry=self.registry)
+
+  def test_recording_ages(self):
+    ages = metrics.RecordingAges()
+    self.assertEqual(ages.oldest_age(), 0)
+
+    ages.add('old', time.time() - 100)
+    ages.add('new', time.time())
+    self.assertGreaterEqual(ages.oldest_age(), 100)
+
+    ages.remove('old')
+    self.assertLess(ages.oldest_age(), 100)
+
+
+class TestMetricsServer(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.registry = monitoring.MetricsRegistry()
+    monitoring.Gauge('up', 'Up.', registry=self.registry).set(1)
+    self.server = monitoring.MetricsServer(0, address='127.0.0.1', registry=self.registry)
+    self.server.start()
+    self.url = f'http://127.0.0.1:{self.server.port}'
+
+  def tearDown(self):
+    self.server.stop()
+
+  def test_metrics_endpoint(self):
+    with urllib.request.urlopen(f'{self.url}/metrics') as response:
+      self.assertEqual(response.status, 200)
+      self.assertIn('up 1', response.read().decode('utf-8'))
+
+  def test_unknown_path(self):
+    with self.assertRaises(urllib.error.HTTPError) as context:
+      urllib.request.urlopen(f'{self.url}/unknown')
+    self.assertEqual(context.exception.code, 404)
+
+  def test_custom_route(self):
+    self.server.add_route('/ping', lambda: (200, 'text/plain', 'pong'))
+    with urllib.request.urlopen(f'{self.url}/ping') as response:
+      self.assertEqual(response.read(), b'pong')
@@ -0,0 +1,97 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import hashlib
+import os
+import tempfile
+import unittest
+
+from zoom_drive_connector import configuration as config, drive
+from zoom_drive_connector.drive.mmap_upload import MmapMediaUpload
+
+from benchmarks.bench_pipeline import build_configs
+from benchmarks.fake_servers import StandInServer, StandInState
+
+MB = 1024 * 1024
+
+
+class TestMmapMediaUpload(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.folder.name, 'recording.mp4')
+    self.data = os.urandom(2 * MB + 1234)
+    with open(self.path, 'wb') as f:
+      f.write(self.data)
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def test_slices(self):
+    with MmapMediaUpload(self.path) as media:
+      self.assertEqual(media.size(), len(self.data))
+      self.assertEqual(media.chunksize(), MB)
+      self.assertEqual(media.mimetype(), 'video/mp4')
+      self.assertTrue(media.resumable())
+      self.assertFalse(media.has_stream())
+
+      chunk = media.getbytes(0, MB)
+      self.assertIsInstance(chunk, memoryview)
+      self.assertEqual(chunk, self.data[:MB])
+      # Retrying a chunk returns the same bytes.
+      self.assertEqual(media.getbytes(0, MB), chunk)
+      # Pages before the current chunk are released but can still be read.
+      self.assertEqual(media.getbytes(MB, MB), self.data[MB:2 * MB])
+      self.assertEqual(media.getbytes(0, 10), self.data[:10])
+      self.assertEqual(media.getbytes(2 * MB, MB), self.data[2 * MB:])
+      del chunk
+
+  def test_empty_file(self):
+    open(self.path, 'wb').close()
+    with MmapMediaUpload(self.path) as media:
+      self.assertEqual(media.size(), 0)
+      self.assertEqual(len(media.getbytes(0, MB)), 0)
+
+  def test_close_with_slice_in_use(self):
+    media = MmapMediaUpload(self.path)
+    chunk = media.getbytes(0, 10)
+    media.close()
+    self.assertEqual(bytes(chunk), self.data[:10])
+
+  def test_drive_upload(self):
+    state = StandInState(meetings=0, file_size=0)
+    server = StandInServer(state)
+    server.start()
+    self.addCleanup(server.stop)
+    sys_config, drive_config, _, _ = build_configs(server.url, self.folder.name, 0)
+
+    for mmap_upload in (True, False):
+      settings = dict(drive_config.settings_dict, mmap_upload=mmap_upload)
+      drive_api = drive.DriveAPI(config.DriveConfig(settings), sys_config)
+      link = drive_api.upload_file(self.path, f'{mmap_upload}.mp4', 'folder')
+      self.assertTrue(link.startswith(f'{server.url}/drive/files/'))
+
+    sessions = [s for s, name in state.upload_names.items() if name.endswith('.mp4')]
+    self.assertEqual(len(sessions), 2)
+    for session in sessions:
+      self.assertEqual(state.uploaded[session], len(self.data))
+      self.assertEqual(state.upload_digests[session].hexdigest(),
+                       hashlib.sha256(self.data).hexdigest())
+    # One request per chunk and no request after the last one.
+    self.assertEqual(state.calls['drive.upload_chunk'], 2 * 3)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,162 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from zoom_drive_connector import pipeline
+from zoom_drive_connector.configuration import MeetingRecord, SystemConfig, ZoomConfig
+from zoom_drive_connector.monitoring import metrics
+
+GB = 1024 ** 3
+START = datetime.datetime(2018, 1, 1, 12)
+
+
+def record(name, priority=0):
+  return MeetingRecord(name, name, 'folder', 'channel', None, priority)
+
+
+def recording(minutes=0, size=None, duration=30):
+  date = START + datetime.timedelta(minutes=minutes)
+  return {'date': date, 'end': date + datetime.timedelta(minutes=duration), 'size': size}
+
+
+def drain(queue):
+  names = []
+  job = queue.get()
+  while job:
+    names.append(job.meeting.name)
+    job = queue.get()
+  return names
+
+
+class TestJobQueue(unittest.TestCase):
+  def test_oldest_first(self):
+    queue = pipeline.JobQueue()
+    queue.put(record('late'), recording(minutes=30))
+    queue.put(record('early'), recording(minutes=0))
+    self.assertEqual(len(queue), 2)
+    self.assertEqual(drain(queue), ['early', 'late'])
+    self.assertIsNone(queue.get())
+
+  def test_priority(self):
+    queue = pipeline.JobQueue()
+    queue.put(record('standup'), recording(minutes=0))
+    queue.put(record('urgent', priority=1), recording(minutes=30))
+    # A recording that started more than an hour earlier still goes first.
+    queue.put(record('old'), recording(minutes=-90))
+    self.assertEqual(drain(queue), ['old', 'urgent', 'standup'])
+
+  def test_shortest_first_with_aging(self):
+    queue = pipeline.JobQueue(shortest_first=True, throughput=GB / 600)
+    queue.put(record('all-hands'), recording(minutes=0, size=4 * GB))
+    queue.put(record('standup'), recording(minutes=5, size=GB // 10))
+    # The all-hands transfer takes 40 minutes, so a standup that started 50 minutes later is
+    # not allowed to overtake it.
+    queue.put(record('later'), recording(minutes=50, size=GB // 10))
+    self.assertEqual(drain(queue), ['standup', 'all-hands', 'later'])
+
+    # Without shortest-job-first the size is ignored.
+    queue = pipeline.JobQueue(throughput=GB / 600)
+    queue.put(record('all-hands'), recording(minutes=0, size=4 * GB))
+    queue.put(record('standup'), recording(minutes=5, size=GB // 10))
+    self.assertEqual(drain(queue), ['all-hands', 'standup'])
+
+  def test_aging_starts_when_recording_ended(self):
+    # An all-hands that started an hour before the standups ends at the same time as they do,
+    # so it has not waited longer and its transfer time lets the standups go first.
+    queue = pipeline.JobQueue(shortest_first=True)
+    queue.put(record('all-hands'), recording(minutes=0, size=4 * GB, duration=75))
+    queue.put(record('standup'), recording(minutes=60, size=GB // 100, duration=15))
+    queue.put(record('retro'), recording(minutes=60, size=GB // 100, duration=15))
+    self.assertEqual(drain(queue), ['standup', 'retro', 'all-hands'])
+
+  def test_clear(self):
+    depth = metrics.QUEUE_DEPTH.labels('transfer')
+    before = depth.value
+    queue = pipeline.JobQueue()
+    queue.put(record('first'), recording(minutes=0))
+    queue.put(record('second'), recording(minutes=5))
+    self.assertEqual(depth.value, before + 2)
+    self.assertEqual(queue.clear(), 2)
+    self.assertEqual(len(queue), 0)
+    self.assertEqual(depth.value, before)
+
+  def test_pending_recordings(self):
+    with patch.object(metrics, 'PENDING_RECORDINGS', metrics.RecordingAges()) as pending:
+      queue = pipeline.JobQueue()
+      queue.put(record('first'), dict(recording(minutes=0), id='first'))
+      queue.put(record('second'), dict(recording(minutes=5), id='second'))
+      # Recordings count from their end, not from their start.
+      ended = (START + datetime.timedelta(minutes=30)).replace(
+          tzinfo=datetime.timezone.utc).timestamp()
+      self.assertAlmostEqual(pending.oldest_age(), time.time() - ended, delta=5)
+
+      queue.abandon(queue.get())
+      self.assertLess(pending.oldest_age(), time.time() - ended)
+      queue.clear()
+      self.assertEqual(pending.oldest_age(), 0)
+
+  def test_deadline(self):
+    queue = pipeline.JobQueue(notify_slo=600)
+    queue.put(record('meeting'), recording(minutes=0, duration=30))
+    job = queue.get()
+    ended = (START + datetime.timedelta(minutes=30)).replace(
+        tzinfo=datetime.timezone.utc).timestamp()
+    self.assertEqual(job.deadline, ended + 600)
+
+    self.assertFalse(queue.finished(job, now=ended + 300))
+    with self.assertLogs(logger='app', level='WARNING'):
+      self.assertTrue(queue.finished(job, now=ended + 900))
+
+    # Without an SLO there is no deadline.
+    queue = pipeline.JobQueue()
+    queue.put(record('meeting'), recording())
+    self.assertFalse(queue.finished(queue.get(), now=ended + 10 ** 6))
+
+  def test_from_config(self):
+    queue = pipeline.JobQueue.from_config(ZoomConfig({
+      'account_id': 'account', 'shortest_job_first': True, 'priority_aging': 2,
+      'notify_slo': 3600}))
+    self.assertEqual(queue.account, 'account')
+    self.assertTrue(queue.shortest_first)
+    self.assertEqual(queue.aging, 2.0)
+    self.assertEqual(queue.notify_slo, 3600.0)
+
+
+class TestScheduledOrder(unittest.TestCase):
+  @patch('zoom_drive_connector.pipeline.scheduler.process_meeting', return_value=True)
+  @patch('zoom_drive_connector.pipeline.scheduler.discover_recording')
+  def test_run_once_in_priority_order(self, discover_recording, process_meeting):
+    meetings = [{'id': name, 'name': name, 'folder_id': 'folder', 'slack_channel': 'c'}
+                for name in ('weekly', 'standup', 'board')]
+    meetings[2]['priority'] = 2
+    discover_recording.side_effect = lambda zoom_conn, meeting: recording(
+        minutes={'weekly': 0, 'standup': 10, 'board': 20}[meeting.id])
+    scheduler = pipeline.Scheduler(ZoomConfig({'account_id': 'account', 'trash_rate': 0,
+                                               'meetings': meetings}),
+                                   SystemConfig({'target_folder': '/tmp'}), MagicMock(),
+                                   MagicMock())
+    try:
+      self.assertEqual(scheduler.run_once(), {'transferred': 3, 'failed': 0})
+    finally:
+      scheduler.close(timeout=1)
+
+    order = [c[0][2].id for c in process_meeting.call_args_list]
+    self.assertEqual(order, ['board', 'weekly', 'standup'])
+    first = process_meeting.call_args_list[0][0][7]
+    self.assertEqual(first['date'], START + datetime.timedelta(minutes=20))
@@ -0,0 +1,92 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import concurrent.futures
+import glob
+import os
+import pstats
+import tempfile
+import time
+import tracemalloc
+import unittest
+
+from zoom_drive_connector.monitoring import CycleProfiler
+from zoom_drive_connector.monitoring.profiling import ENV_VARIABLE
+
+
+def worker_job():
+  return [bytes(1024) for _ in range(100)]
+
+
+class TestCycleProfiler(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.profiler = CycleProfiler()
+    self.profiler.configure(os.path.join(self.folder.name, 'profiles'), snapshot_interval=0.05)
+    self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+  def tearDown(self):
+    self.executor.shutdown()
+    self.folder.cleanup()
+
+  def run_cycle(self):
+    future = self.executor.submit(self.profiler.task(worker_job))
+    time.sleep(0.2)
+    return len(future.result())
+
+  def test_disabled(self):
+    cycle = self.profiler.cycle(self.run_cycle)
+    self.assertIs(self.profiler.task(worker_job), worker_job)
+    self.assertEqual(cycle(), 100)
+    self.assertFalse(os.path.exists(self.profiler.directory))
+    self.assertFalse(tracemalloc.is_tracing())
+
+  def test_arm_from_environment(self):
+    self.profiler.configure(self.profiler.directory, cycles=3)
+    self.profiler.arm_from_environment({})
+    self.assertEqual(self.profiler._remaining, 0)  # pylint: disable=protected-access
+
+    with self.assertLogs(logger='app', level='INFO'):
+      self.profiler.arm_from_environment({ENV_VARIABLE: '2'})
+    self.assertEqual(self.profiler._remaining, 2)  # pylint: disable=protected-access
+
+    for value in ('yes', '0', '-1'):
+      with self.assertLogs(logger='app', level='WARNING'):
+        self.profiler.arm_from_environment({ENV_VARIABLE: value})
+      self.assertEqual(self.profiler._remaining, 3)  # pylint: disable=protected-access
+
+  def test_armed(self):
+    cycle = self.profiler.cycle(self.run_cycle)
+    with self.assertLogs(logger='app', level='INFO'):
+      self.profiler.arm()
+      self.assertEqual(cycle(), 100)
+    self.assertFalse(tracemalloc.is_tracing())
+
+    profiles = glob.glob(os.path.join(self.profiler.directory, 'cycle-*.prof'))
+    self.assertEqual(len(profiles), 1)
+    functions = {key[2] for key in pstats.Stats(profiles[0]).stats}
+    # The work done in the worker thread is part of the profile.
+    self.assertIn('worker_job', functions)
+    self.assertIn('run_cycle', functions)
+
+    snapshots = glob.glob(os.path.join(self.profiler.directory, 'cycle-*-alloc*.txt'))
+    self.assertGreater(len(snapshots), 1)
+    with open(profiles[0][:-len('.prof')] + '-alloc.txt', encoding='utf-8') as f:
+      self.assertTrue(f.readline().startswith('traced memory'))
+
+    # Only the armed number of cycles is profiled.
+    cycle()
+    self.assertEqual(len(glob.glob(os.path.join(self.profiler.directory, '*.prof'))), 1)
@@ -0,0 +1,149 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from zoom_drive_connector import drive
+from zoom_drive_connector.monitoring import metrics, progress
+from zoom_drive_connector.zoom import CopyEngine
+
+from benchmarks.bench_pipeline import build_configs
+from benchmarks.fake_servers import StandInServer, StandInState
+
+
+class TestProgressReporter(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.reporter = progress.ProgressReporter(interval=3600)
+    self.events = []
+    self.reporter.subscribe(self.events.append)
+
+  def test_rate_limited_per_transfer(self):
+    with self.reporter.track('a.mp4', 'download', 'zoom', 1000) as transfer:
+      for done in range(0, 1001, 10):
+        transfer.update(done)
+    # Only the final event gets through within the interval.
+    self.assertEqual(len(self.events), 1)
+    event = self.events[0]
+    self.assertTrue(event.finished)
+    self.assertEqual((event.job, event.direction, event.target, event.done, event.total),
+                     ('a.mp4', 'download', 'zoom', 1000, 1000))
+
+  def test_events_carry_rate_and_eta(self):
+    self.reporter.configure(0)
+    with self.reporter.track('a.mp4', 'upload', 'drive', 1000, offset=200) as transfer:
+      transfer.update(600)
+    self.assertEqual(len(self.events), 2)
+    event = self.events[0]
+    self.assertFalse(event.finished)
+    self.assertEqual(event.done, 600)
+    self.assertGreater(event.rate, 0)
+    # 400 bytes left at the rate of the 400 bytes sent in this attempt.
+    self.assertAlmostEqual(event.eta, 400 / event.rate)
+
+  def test_active_transfers(self):
+    upload = self.reporter.track('b.mp4', 'upload', 'drive', 500)
+    with self.reporter.track('a.mp4', 'download', 'zoom', 1000) as download, upload:
+      download.update(250)
+      self.assertEqual(sorted(e.job for e in self.reporter.active()), ['a.mp4', 'b.mp4'])
+      self.assertEqual(self.reporter.remaining('download'), 750)
+      self.assertEqual(self.reporter.remaining('upload'), 500)
+      status, content_type, body = self.reporter.route()
+      self.assertEqual((status, content_type), (200, 'application/json'))
+      self.assertEqual(len(json.loads(body)['transfers']), 2)
+    self.assertEqual(self.reporter.active(), [])
+    self.assertEqual(self.reporter.remaining('download'), 0)
+
+  def test_failing_listener(self):
+    def fail(_):
+      raise RuntimeError('broken')
+
+    self.reporter.subscribe(fail)
+    with self.assertLogs(logger='app', level='WARNING'):
+      with self.reporter.track('a.mp4', 'download', 'zoom'):
+        pass
+    self.assertEqual(len(self.events), 1)
+
+    self.reporter.unsubscribe(fail)
+    with self.reporter.track('a.mp4', 'download', 'zoom'):
+      pass
+    self.assertEqual(len(self.events), 2)
+
+  def test_log_progress(self):
+    event = progress.ProgressEvent('a.mp4', 'upload', 'drive', 512 * 1024 * 1024,
+                                   1024 * 1024 * 1024, 8 * 1024 * 1024, 64.0, False)
+    with self.assertLogs(logger='app', level='INFO') as logs:
+      progress.log_progress(event)
+      progress.log_progress(event._replace(finished=True))
+    self.assertEqual(len(logs.output), 1)
+    self.assertIn('Uploading a.mp4 (drive): 50% of 1024.0 MB at 8.0 MB/s, ETA 0:01:04.',
+                  logs.output[0])
+
+  def test_remaining_bytes_metric(self):
+    gauge = metrics.TRANSFER_REMAINING.labels('download')
+    with progress.track('a.mp4', 'download', 'zoom', 1000) as transfer:
+      transfer.update(100)
+      self.assertEqual(gauge.value, 900)
+    self.assertEqual(gauge.value, 0)
+
+
+class TestTransferProgress(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.events = []
+    self.interval = progress.PROGRESS.interval
+    progress.PROGRESS.configure(0)
+    progress.PROGRESS.subscribe(self.events.append)
+    self.folder = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    progress.PROGRESS.unsubscribe(self.events.append)
+    progress.PROGRESS.configure(self.interval)
+    self.folder.cleanup()
+
+  def test_copy_progress(self):
+    reported = []
+    engine = CopyEngine(block_size=4096)
+    engine.copy(io.BytesIO(b'x' * 10000), os.path.join(self.folder.name, 'copy'), 10000,
+                progress=lambda done, total: reported.append((done, total)))
+    self.assertEqual(reported, [(4096, 10000), (8192, 10000), (10000, 10000)])
+
+  def test_drive_upload(self):
+    server = StandInServer(StandInState(meetings=0, file_size=0))
+    server.start()
+    self.addCleanup(server.stop)
+    sys_config, drive_config, _, _ = build_configs(server.url, self.folder.name, 0)
+    drive_api = drive.DriveAPI(drive_config, sys_config)
+
+    path = os.path.join(self.folder.name, 'recording.mp4')
+    size = 5 * 1024 * 1024 + 100
+    with open(path, 'wb') as f:
+      f.write(os.urandom(size))
+    drive_api.upload_file(path, 'recording.mp4', 'folder')
+
+    events = [e for e in self.events if e.job == 'recording.mp4']
+    self.assertEqual([e.target for e in events], ['drive'] * len(events))
+    self.assertEqual([e.done for e in events if not e.finished],
+                     [n * 1024 * 1024 for n in range(1, 6)] + [size])
+    self.assertTrue(events[-1].finished)
+    self.assertEqual(events[-1].done, size)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,125 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from zoom_drive_connector import pipeline
+from zoom_drive_connector.configuration import MeetingRecord, SystemConfig, ZoomConfig
+
+CONTENT = b'recording' * 1000
+
+
+class TestRecovery(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.manifest = os.path.join(self.folder.name, 'orphans.json')
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def download(self, name, account='default'):
+    """Runs `download_meeting` against a fake Zoom client that writes `CONTENT`."""
+    path = os.path.join(self.folder.name, name + '.mp4')
+    with open(path, 'wb') as f:
+      f.write(CONTENT)
+
+    zoom_conn = MagicMock()
+    zoom_conn.account = account
+    zoom_conn.pull_file_from_zoom.return_value = {
+      'success': True, 'date': datetime.datetime(2018, 6, 1, 12), 'filename': path,
+      'trash': [{'meeting_id': 'uuid', 'id': name}], 'id': name, 'size': len(CONTENT),
+      'sha256': hashlib.sha256(CONTENT).hexdigest()}
+    meeting = MeetingRecord('meeting', 'Meeting', 'folder', 'channel')
+    file = pipeline.download_meeting(zoom_conn, meeting, True)
+    file['span'].finish()
+    return file
+
+  def test_sidecar_written(self):
+    file = self.download('first')
+    with open(file['file'] + '.json', encoding='utf-8') as f:
+      sidecar = json.load(f)
+    self.assertEqual(sidecar['name'], '20180601-Meeting.mp4')
+    self.assertEqual(sidecar['recording_id'], 'first')
+    self.assertEqual(sidecar['size'], len(CONTENT))
+
+  def test_recovered(self):
+    file = self.download('first')
+    result = pipeline.recover_downloads(self.folder.name)
+
+    self.assertEqual(result.orphans, [])
+    self.assertEqual(len(result.files), 1)
+    recovered = result.files[0]
+    for key in ('meeting', 'file', 'name', 'folder_id', 'slack_channel', 'date', 'unix', 'trash'):
+      self.assertEqual(recovered[key], file[key])
+    self.assertFalse(os.path.exists(self.manifest))
+
+  def test_orphans_reported(self):
+    truncated = self.download('truncated')['file']
+    with open(truncated, 'r+b') as f:
+      f.truncate(10)
+    corrupt = self.download('corrupt')['file']
+    with open(corrupt, 'r+b') as f:
+      f.write(b'X')
+    unknown = os.path.join(self.folder.name, 'unknown.mp4')
+    open(unknown, 'wb').close()
+    # Sidecars of recordings that were already removed are cleaned up.
+    stray = os.path.join(self.folder.name, 'gone.mp4.json')
+    open(stray, 'w', encoding='utf-8').close()
+
+    with self.assertLogs(logger='app', level='WARNING'):
+      result = pipeline.recover_downloads(self.folder.name)
+
+    self.assertEqual(result.files, [])
+    reasons = {o['file']: o['reason'] for o in result.orphans}
+    self.assertTrue(reasons[truncated].startswith('size mismatch'))
+    self.assertEqual(reasons[corrupt], 'checksum mismatch')
+    self.assertEqual(reasons[unknown], 'no metadata')
+    with open(self.manifest, encoding='utf-8') as f:
+      self.assertEqual(json.load(f), result.orphans)
+    self.assertFalse(os.path.exists(stray))
+
+    # The manifest goes away once the files are dealt with.
+    for path in (truncated, corrupt, unknown):
+      os.remove(path)
+    pipeline.recover_downloads(self.folder.name)
+    self.assertFalse(os.path.exists(self.manifest))
+
+  def test_scheduler_uploads(self):
+    file = self.download('first', account='north')
+    zoom_config = ZoomConfig({'client_id': 'client', 'client_secret': 'secret', 'trash_rate': 0,
+                              'accounts': [{'name': 'north', 'account_id': 'a1', 'meetings': []}]})
+    drive_conn = MagicMock()
+    drive_conn.upload_file.return_value = 'https://drive/file'
+    scheduler = pipeline.Scheduler(zoom_config, SystemConfig({'target_folder': self.folder.name}),
+                                   drive_conn, MagicMock())
+    trash_queue = scheduler.accounts['north'].trash_queue
+    trash_queue.put = MagicMock()
+    try:
+      result = scheduler.recover(self.folder.name)
+    finally:
+      scheduler.close(timeout=1)
+
+    self.assertEqual(result, {'recovered': 1, 'orphaned': 0, 'failed': 0})
+    drive_conn.upload_file.assert_called_once_with(file['file'], file['name'], 'folder',
+                                                   session={})
+    trash_queue.put.assert_called_once_with('uuid', 'first')
+    self.assertEqual(os.listdir(self.folder.name), [])
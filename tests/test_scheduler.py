@@ -0,0 +1,171 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import copy
+import datetime
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from zoom_drive_connector import pipeline, zoom
+from zoom_drive_connector.configuration import SystemConfig, ZoomConfig
+
+
+def meeting(i):
+  return {'id': f'id-{i}', 'name': f'Meeting {i}', 'folder_id': 'folder', 'slack_channel': 'c'}
+
+
+class TestZoomAccounts(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.settings = {
+      'client_id': 'shared_client', 'client_secret': 'shared_secret', 'delete': True,
+      'accounts': [
+        {'name': 'north', 'account_id': 'a1', 'meetings': [meeting(1), meeting(2)]},
+        {'name': 'south', 'account_id': 'a2', 'client_id': 'own_client', 'workers': 2,
+         'meetings': [meeting(3)]}
+      ]}
+
+  def test_defaults(self):
+    accounts = ZoomConfig(self.settings).accounts
+
+    self.assertEqual([a.account_name for a in accounts], ['north', 'south'])
+    self.assertEqual(accounts[0].client_id, 'shared_client')
+    self.assertEqual(accounts[1].client_id, 'own_client')
+    self.assertEqual(len(accounts[0].registry), 2)
+
+  def test_single_account(self):
+    config = ZoomConfig({'account_id': 'a1', 'meetings': []})
+    self.assertEqual(config.accounts, [config])
+    self.assertEqual(config.account_name, 'a1')
+
+  def test_validation(self):
+    self.assertTrue(ZoomConfig(self.settings).validate())
+
+    settings = copy.deepcopy(self.settings)
+    settings['accounts'][1]['meetings'].append(meeting(1))
+    with self.assertLogs(logger='app', level='ERROR'):
+      self.assertFalse(ZoomConfig(settings).validate())
+
+    settings = copy.deepcopy(self.settings)
+    settings['accounts'][1]['name'] = 'north'
+    with self.assertLogs(logger='app', level='ERROR'):
+      self.assertFalse(ZoomConfig(settings).validate())
+
+    settings = copy.deepcopy(self.settings)
+    del settings['accounts'][0]['account_id']
+    self.assertFalse(ZoomConfig(settings).validate())
+
+
+class TestScheduler(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.settings = {
+      'client_id': 'client', 'client_secret': 'secret', 'delete': True, 'trash_rate': 0,
+      'accounts': [
+        {'name': 'north', 'account_id': 'a1', 'meetings': [meeting(1), meeting(2)]},
+        {'name': 'south', 'account_id': 'a2', 'workers': 2, 'meetings': [meeting(3)]}
+      ]}
+    self.zoom_config = ZoomConfig(self.settings)
+    self.scheduler = pipeline.Scheduler(self.zoom_config, SystemConfig({'target_folder': '/tmp'}),
+                                        MagicMock(), MagicMock())
+
+  def tearDown(self):
+    self.scheduler.close(timeout=1)
+
+  def test_accounts(self):
+    accounts = self.scheduler.accounts
+    self.assertEqual(sorted(accounts), ['north', 'south'])
+    self.assertIsNot(accounts['north'].zoom_api, accounts['south'].zoom_api)
+    self.assertIsNot(accounts['north'].trash_queue, accounts['south'].trash_queue)
+    self.assertEqual(accounts['south'].workers, 2)
+
+  @patch('zoom_drive_connector.pipeline.scheduler.discover_recording',
+         return_value={'date': datetime.datetime(2018, 1, 1)})
+  @patch('zoom_drive_connector.pipeline.scheduler.process_meeting')
+  def test_run_once(self, process_meeting, _):
+    calls = []
+
+    def process(zoom_conn, zoom_conf, record, *_):
+      calls.append((zoom_conn.account, record.id, threading.current_thread().name))
+      if record.id == 'id-2':
+        raise RuntimeError('upload failed')
+      return True
+
+    process_meeting.side_effect = process
+    with self.assertLogs(logger='app', level='ERROR'):
+      result = self.scheduler.run_once()
+
+    self.assertEqual(result, {'transferred': 2, 'failed': 1})
+    self.assertEqual(sorted(c[1] for c in calls), ['id-1', 'id-2', 'id-3'])
+    for account, _, thread in calls:
+      self.assertTrue(thread.startswith(f'account-{account}'))
+
+  @patch('zoom_drive_connector.pipeline.scheduler.discover_recording')
+  @patch('zoom_drive_connector.pipeline.scheduler.process_meeting', return_value=True)
+  def test_skips_stored_recordings(self, process_meeting, discover_recording):
+    discover_recording.side_effect = lambda zoom_conn, record: {
+      'id': f'rec-{record.id}', 'date': datetime.datetime(2018, 1, 1)}
+    with tempfile.TemporaryDirectory() as folder:
+      journal = zoom.TrashJournal(os.path.join(folder, 'trash.sqlite'))
+      # A previous run stored the recording of the first meeting but could not trash it.
+      journal.add('north', 'uuid', 'rec-id-1')
+      journal.fail('rec-id-1')
+      # The reloaded trash request is not sent.
+      with patch.object(zoom.TrashQueue, 'start'):
+        scheduler = pipeline.Scheduler(self.zoom_config, SystemConfig({'target_folder': folder}),
+                                       MagicMock(), MagicMock(), trash_journal=journal)
+      self.assertEqual(scheduler.accounts['north'].trash_queue.depth, 1)
+      try:
+        with self.assertLogs(logger='app', level='INFO') as logs:
+          result = scheduler.run_once()
+      finally:
+        scheduler.close(timeout=1)
+
+    self.assertEqual(result, {'transferred': 2, 'failed': 0})
+    self.assertEqual(sorted(c[0][2].id for c in process_meeting.call_args_list), ['id-2', 'id-3'])
+    self.assertTrue(any('rec-id-1' in line and 'already stored' in line for line in logs.output))
+
+  def test_reconcile(self):
+    north = self.scheduler.accounts['north']
+    south = self.scheduler.accounts['south']
+    north_api, south_api = north.zoom_api, south.zoom_api
+
+    settings = copy.deepcopy(self.settings)
+    settings['accounts'][0]['meetings'].append(meeting(4))
+    settings['accounts'][1]['client_secret'] = 'rotated'
+    settings['accounts'].append({'name': 'east', 'account_id': 'a3', 'meetings': []})
+    self.zoom_config.settings_dict = settings
+    self.scheduler.reconcile()
+
+    self.assertIs(north.zoom_api, north_api)
+    self.assertEqual(len(north.config.registry), 3)
+    self.assertIsNot(south.zoom_api, south_api)
+    self.assertIs(south.trash_queue.zoom_conn, south.zoom_api)
+    self.assertIn('east', self.scheduler.accounts)
+
+    # Removed accounts are closed at the start of the next run.
+    settings = copy.deepcopy(settings)
+    del settings['accounts'][0]
+    self.zoom_config.settings_dict = settings
+    north.close = MagicMock()
+    self.scheduler.reconcile()
+    self.assertNotIn('north', self.scheduler.accounts)
+    north.close.assert_not_called()
+    with patch('zoom_drive_connector.pipeline.scheduler.discover_recording', return_value=None):
+      self.scheduler.run_once()
+    north.close.assert_called_once()
@@ -0,0 +1,130 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import collections
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from zoom_drive_connector import pipeline
+from zoom_drive_connector.configuration import MeetingRecord, ZoomConfig
+
+
+class TestHashRing(unittest.TestCase):
+  def test_balanced_and_stable(self):
+    keys = [f'meeting-{i}' for i in range(3000)]
+    ring = pipeline.HashRing(['a', 'b', 'c'])
+    owners = {key: ring.owner(key) for key in keys}
+
+    counts = collections.Counter(owners.values())
+    self.assertEqual(set(counts), {'a', 'b', 'c'})
+    self.assertGreater(min(counts.values()), 600)
+
+    # Removing a replica only moves the keys it owned.
+    smaller = pipeline.HashRing(['a', 'c'])
+    for key in keys:
+      if owners[key] != 'b':
+        self.assertEqual(smaller.owner(key), owners[key])
+
+  def test_empty(self):
+    self.assertIsNone(pipeline.HashRing([]).owner('meeting'))
+
+
+class TestLeaseStore(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.store = pipeline.LeaseStore(os.path.join(self.folder.name, 'leases.db'))
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def test_acquire(self):
+    self.assertTrue(self.store.acquire('rec', 'a', 60))
+    self.assertFalse(self.store.acquire('rec', 'b', 60))
+    self.assertTrue(self.store.acquire('rec', 'a', 60))
+
+  def test_expired_lease_reclaimed(self):
+    self.assertTrue(self.store.acquire('rec', 'a', 0.05))
+    time.sleep(0.1)
+    self.assertTrue(self.store.acquire('rec', 'b', 60))
+    self.assertEqual(self.store.renew(['rec'], 'a', 60), ['rec'])
+    self.assertEqual(self.store.renew(['rec'], 'b', 60), [])
+
+  def test_complete_and_release(self):
+    self.store.acquire('done', 'a', 60)
+    self.store.complete('done', 'a', 60)
+    self.assertFalse(self.store.acquire('done', 'a', 60))
+    self.assertFalse(self.store.acquire('done', 'b', 60))
+
+    self.store.acquire('failed', 'a', 60)
+    self.store.release('failed', 'a')
+    self.assertTrue(self.store.acquire('failed', 'b', 60))
+
+  def test_members(self):
+    self.store.heartbeat('a')
+    self.store.heartbeat('b')
+    self.assertEqual(self.store.members(60), ['a', 'b'])
+    time.sleep(0.1)
+    self.store.heartbeat('b')
+    self.assertEqual(self.store.members(0.05), ['b'])
+
+
+class TestShardCoordinator(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    path = os.path.join(self.folder.name, 'leases.db')
+    self.first = pipeline.ShardCoordinator(pipeline.LeaseStore(path), 'first')
+    self.second = pipeline.ShardCoordinator(pipeline.LeaseStore(path), 'second')
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def test_meetings_split(self):
+    self.first.refresh()
+    self.second.refresh()
+    self.first.refresh()
+
+    keys = [f'meeting-{i}' for i in range(100)]
+    first = {k for k in keys if self.first.owns(k)}
+    second = {k for k in keys if self.second.owns(k)}
+    self.assertEqual(first | second, set(keys))
+    self.assertFalse(first & second)
+
+  def test_process_meeting_claims_recording(self):
+    zoom_conn = MagicMock()
+    zoom_conn.account = 'account'
+
+    def pull(meeting_id, rm, claim, recording=None):
+      if not claim({'id': 'recording', 'meeting_id': meeting_id}):
+        return {'success': False, 'date': None, 'filename': None, 'skipped': True}
+      return {'success': False, 'date': None, 'filename': None}
+
+    zoom_conn.pull_file_from_zoom.side_effect = pull
+    meeting = MeetingRecord('meeting', 'Meeting', 'folder', 'channel')
+    zoom_config = ZoomConfig({'delete': True})
+
+    self.assertTrue(self.second.claim('recording'))
+    self.assertFalse(pipeline.process_meeting(zoom_conn, zoom_config, meeting, MagicMock(),
+                                              MagicMock(), None, self.first))
+    self.second.release('recording')
+
+    # A failed download releases the lease again.
+    self.assertFalse(pipeline.process_meeting(zoom_conn, zoom_config, meeting, MagicMock(),
+                                              MagicMock(), None, self.first))
+    self.assertTrue(self.second.claim('recording'))
@@ -0,0 +1,224 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import responses
+
+from zoom_drive_connector import pipeline, zoom
+from zoom_drive_connector.configuration import MeetingRecord, SystemConfig, ZoomConfig
+
+DATA = os.urandom(40000)
+
+
+class _CancellingStream(io.BytesIO):
+  """Stream that sets `cancel` after the first block was read."""
+
+  def __init__(self, data: bytes, cancel: threading.Event):
+    super(_CancellingStream, self).__init__(data)
+    self.cancel = cancel
+
+  def readinto(self, buffer):
+    count = super(_CancellingStream, self).readinto(buffer)
+    self.cancel.set()
+    return count
+
+
+class TestInterruptedDownload(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.url = 'https://mindsai.zoom.us/recording/share/random-uid'
+    self.outfile = os.path.join(self.folder.name, 'random-uid.mp4')
+    self.partial = self.outfile + zoom.zoom_api.PARTIAL_SUFFIX
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def test_copy_resumes(self):
+    engine = zoom.CopyEngine(block_size=4096, hash_factory=hashlib.sha256)
+    with self.assertRaises(InterruptedError):
+      engine.copy(_CancellingStream(DATA, engine.cancel), self.partial, len(DATA))
+    self.assertEqual(os.path.getsize(self.partial), 4096)
+
+    engine.cancel.clear()
+    result = engine.copy(io.BytesIO(DATA[4096:]), self.partial, len(DATA), offset=4096)
+    self.assertEqual(result, zoom.CopyResult(len(DATA), hashlib.sha256(DATA).hexdigest()))
+    with open(self.partial, 'rb') as f:
+      self.assertEqual(f.read(), DATA)
+
+  def interrupted_download(self, api: zoom.ZoomAPI):
+    responses.add(responses.GET, self.url, body=DATA, status=200, stream=True)
+    api.copy_engine.progress = lambda *_: api.copy_engine.cancel.set()
+    with self.assertRaises(InterruptedError):
+      api.fetch_recording(self.url, 'token')
+    api.copy_engine.progress = None
+    api.copy_engine.cancel.clear()
+    responses.reset()
+
+    self.assertFalse(os.path.exists(self.outfile))
+    with open(self.partial + '.json', encoding='utf-8') as f:
+      checkpoint = json.load(f)
+    self.assertEqual(checkpoint['offset'], 8192)
+    return checkpoint
+
+  @responses.activate
+  def test_range_request(self):
+    api = zoom.ZoomAPI(ZoomConfig({}), SystemConfig({'target_folder': self.folder.name,
+                                                     'download_block_size': 8192}))
+    self.interrupted_download(api)
+
+    def ranged(request):
+      self.assertEqual(request.headers['range'], 'bytes=8192-')
+      return 206, {'content-range': f'bytes 8192-{len(DATA) - 1}/{len(DATA)}'}, DATA[8192:]
+
+    responses.add_callback(responses.GET, self.url, callback=ranged)
+    outfile, result = api.fetch_recording(self.url, 'token')
+
+    self.assertEqual(outfile, self.outfile)
+    self.assertEqual(result.digest, hashlib.sha256(DATA).hexdigest())
+    self.assertEqual(sorted(os.listdir(self.folder.name)), ['random-uid.mp4'])
+
+  @responses.activate
+  def test_range_ignored(self):
+    api = zoom.ZoomAPI(ZoomConfig({}), SystemConfig({'target_folder': self.folder.name,
+                                                     'download_block_size': 8192}))
+    self.interrupted_download(api)
+
+    responses.add(responses.GET, self.url, body=DATA, status=200, stream=True)
+    _, result = api.fetch_recording(self.url, 'token')
+    self.assertEqual(result, zoom.CopyResult(len(DATA), hashlib.sha256(DATA).hexdigest()))
+
+  def test_pull_reports_interruption(self):
+    api = zoom.ZoomAPI(ZoomConfig({}), SystemConfig({'target_folder': self.folder.name}))
+    api.generate_server_to_server_oath_token = MagicMock(return_value='token')
+    api.fetch_recording = MagicMock(side_effect=InterruptedError)
+
+    result = api.pull_file_from_zoom('meeting', recording={'id': 'r', 'url': self.url})
+    self.assertTrue(result['interrupted'])
+    self.assertFalse(result['success'])
+
+
+class TestInterruptedUpload(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    path = os.path.join(self.folder.name, 'first.mp4')
+    with open(path, 'wb') as f:
+      f.write(DATA)
+    zoom_conn = MagicMock()
+    zoom_conn.account = 'default'
+    zoom_conn.pull_file_from_zoom.return_value = {
+      'success': True, 'date': datetime.datetime(2018, 6, 1, 12), 'filename': path,
+      'trash': [{'meeting_id': 'uuid', 'id': 'first'}], 'id': 'first', 'size': len(DATA),
+      'sha256': hashlib.sha256(DATA).hexdigest()}
+    meeting = MeetingRecord('meeting', 'Meeting', 'folder', 'channel')
+    self.file = pipeline.download_meeting(zoom_conn, meeting, True)
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def test_session_checkpointed(self):
+    def upload(*_, session):
+      session.update(uri='https://upload/session', progress=1024)
+      raise InterruptedError
+
+    drive_conn = MagicMock()
+    drive_conn.upload_file.side_effect = upload
+    trash_queue = MagicMock()
+    with self.assertRaises(InterruptedError):
+      pipeline.upload_and_notify([self.file], drive_conn, MagicMock(), trash_queue)
+
+    # Nothing is trashed before the recording is in Google Drive.
+    trash_queue.put.assert_not_called()
+    self.assertTrue(os.path.exists(self.file['file']))
+
+    # The recovered file continues the same session.
+    recovered = pipeline.recover_downloads(self.folder.name).files
+    self.assertEqual(len(recovered), 1)
+    self.assertEqual(recovered[0]['upload_sessions'],
+                     {'drive': {'uri': 'https://upload/session', 'progress': 1024}})
+    drive_conn.upload_file.side_effect = None
+    drive_conn.upload_file.return_value = 'https://drive/file'
+    pipeline.upload_and_notify(recovered, drive_conn, MagicMock(), trash_queue)
+    self.assertEqual(drive_conn.upload_file.call_args[1]['session']['uri'],
+                     'https://upload/session')
+    trash_queue.put.assert_called_once_with('uuid', 'first')
+
+
+class TestSchedulerStop(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    zoom_config = ZoomConfig({
+      'client_id': 'client', 'client_secret': 'secret', 'trash_rate': 0,
+      'accounts': [{'name': 'north', 'account_id': 'a1', 'meetings': [
+        {'id': f'id-{i}', 'name': f'Meeting {i}', 'folder_id': 'f', 'slack_channel': 'c'}
+        for i in range(3)]}]})
+    self.drive_conn = MagicMock()
+    self.scheduler = pipeline.Scheduler(zoom_config, SystemConfig({'target_folder': '/tmp'}),
+                                        self.drive_conn, MagicMock())
+
+  def tearDown(self):
+    self.scheduler.close(timeout=1)
+
+  @patch('zoom_drive_connector.pipeline.scheduler.discover_recording',
+         return_value={'date': datetime.datetime(2018, 1, 1)})
+  @patch('zoom_drive_connector.pipeline.scheduler.process_meeting')
+  def test_no_new_jobs(self, process_meeting, _):
+    def process(*_):
+      self.scheduler.stop(grace=60)
+      return True
+
+    process_meeting.side_effect = process
+    result = self.scheduler.run_once()
+
+    # The running job finishes, the other two are left for the next run.
+    self.assertEqual(result, {'transferred': 1, 'failed': 0})
+    self.assertFalse(self.scheduler.interrupted.is_set())
+    self.assertEqual(self.scheduler.run_once(), {'transferred': 0, 'failed': 0})
+    self.assertEqual(process_meeting.call_count, 1)
+
+  def test_grace_period(self):
+    zoom_api = self.scheduler.accounts['north'].zoom_api
+    self.scheduler.stop(grace=0.05)
+    self.assertTrue(self.scheduler.interrupted.wait(5))
+    self.assertTrue(zoom_api.copy_engine.cancel.is_set())
+    self.drive_conn.cancel.set.assert_called_once()
+    self.assertEqual(self.scheduler.grace_remaining, 0)
+
+  def test_second_stop_interrupts(self):
+    self.scheduler.stop(grace=60)
+    self.assertFalse(self.scheduler.interrupted.is_set())
+    self.scheduler.stop(grace=60)
+    self.assertTrue(self.scheduler.interrupted.is_set())
+
+  @patch('zoom_drive_connector.pipeline.scheduler.discover_recording',
+         return_value={'date': datetime.datetime(2018, 1, 1)})
+  @patch('zoom_drive_connector.pipeline.scheduler.process_meeting',
+         side_effect=InterruptedError)
+  def test_interrupted_jobs_not_failed(self, *_):
+    self.assertEqual(self.scheduler.run_once(), {'transferred': 0, 'failed': 0})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,51 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import json
+import subprocess
+import sys
+import unittest
+
+from zoom_drive_connector import monitoring
+from zoom_drive_connector.drive.drive_api import load_discovery_document
+
+
+class TestStartupProfile(unittest.TestCase):
+  def test_phases(self):
+    profile = monitoring.StartupProfile()
+    with profile.phase('second'):
+      pass
+    profile.record('first', profile.started - 1, profile.started)
+
+    self.assertEqual([p[0] for p in profile.phases], ['second', 'first'])
+    report = profile.report().splitlines()
+    self.assertTrue(report[1].startswith('first'))
+    self.assertTrue(report[2].startswith('second'))
+    self.assertTrue(report[-1].startswith('total'))
+
+  def test_lazy_import(self):
+    self.assertIs(monitoring.lazy_import('json'), json)
+
+  def test_heavy_imports_deferred(self):
+    code = ('import sys, zoom_drive_connector.__main__; '
+            'print(",".join(m for m in ("googleapiclient", "google_auth_oauthlib", "slackclient", '
+            '"aiohttp") if m in sys.modules))')
+    output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True)
+    self.assertEqual(output.stdout.decode().strip(), '')
+
+  def test_discovery_document(self):
+    document = json.loads(load_discovery_document())
+    self.assertEqual(document['name'], 'drive')
+    self.assertIs(load_discovery_document(), load_discovery_document())
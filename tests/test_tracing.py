@@ -0,0 +1,91 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import json
+import os
+import tempfile
+import unittest
+
+from zoom_drive_connector.monitoring import tracing
+
+
+class TestTracing(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.trace_file = os.path.join(self.folder.name, 'trace.jsonl')
+    self.tracer = tracing.Tracer()
+
+  def tearDown(self):
+    self.tracer.disable()
+    self.folder.cleanup()
+
+  def read_spans(self):
+    with open(self.trace_file, encoding='utf-8') as f:
+      return [json.loads(line) for line in f]
+
+  def test_disabled(self):
+    with self.tracer.span('noop') as span:
+      self.assertIs(span, tracing.NOOP_SPAN)
+      span.set_tag('ignored', True)
+    self.assertFalse(os.path.exists(self.trace_file))
+
+  def test_parent_child(self):
+    self.tracer.configure(self.trace_file)
+
+    with self.tracer.span('parent', meeting='standup'):
+      with self.tracer.span('child'):
+        pass
+
+    child, parent = self.read_spans()
+    self.assertEqual(child['name'], 'child')
+    self.assertEqual(child['traceId'], parent['traceId'])
+    self.assertEqual(child['parentId'], parent['id'])
+    self.assertNotIn('parentId', parent)
+    self.assertEqual(parent['tags'], {'meeting': 'standup'})
+    self.assertEqual(len(parent['traceId']), 32)
+
+  def test_activate(self):
+    self.tracer.configure(self.trace_file)
+
+    job = self.tracer.start_span('job')
+    with self.tracer.activate(job):
+      with self.tracer.span('upload'):
+        pass
+    with self.tracer.span('unrelated'):
+      pass
+    job.finish()
+
+    upload, unrelated, root = self.read_spans()
+    self.assertEqual(upload['parentId'], root['id'])
+    self.assertNotEqual(unrelated['traceId'], root['traceId'])
+
+  def test_error_tag(self):
+    self.tracer.configure(self.trace_file)
+
+    with self.assertRaises(RuntimeError):
+      with self.tracer.span('failing'):
+        raise RuntimeError('boom')
+
+    self.assertIn('boom', self.read_spans()[0]['tags']['error'])
+
+  def test_rotation(self):
+    self.tracer.configure(self.trace_file, max_bytes=512, backups=2)
+    for _ in range(20):
+      with self.tracer.span('span'):
+        pass
+
+    self.assertTrue(os.path.exists(self.trace_file + '.1'))
+    self.assertFalse(os.path.exists(self.trace_file + '.3'))
@@ -0,0 +1,185 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from zoom_drive_connector import zoom
+
+
+class TestTrashQueue(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.zoom_conn = MagicMock()
+    self.zoom_conn.generate_server_to_server_oath_token.return_value = 'token'
+    self.queue = zoom.TrashQueue(self.zoom_conn, max_retries=2, rate=0, backoff=0.01)
+    self.queue.start()
+
+  def tearDown(self):
+    self.queue.stop(timeout=2)
+
+  def test_trash_batch(self):
+    self.queue.put('uuid', 'first')
+    self.queue.put('uuid', 'second')
+
+    self.assertTrue(self.queue.join(timeout=2))
+    self.zoom_conn.delete_recording.assert_any_call('uuid', 'first', 'token')
+    self.zoom_conn.delete_recording.assert_any_call('uuid', 'second', 'token')
+    self.assertEqual(self.queue.stats['trashed'], 2)
+    self.assertEqual(self.queue.depth, 0)
+
+  def test_already_trashed(self):
+    self.zoom_conn.delete_recording.side_effect = zoom.ZoomAPIException(404, 'Not Found', None, '')
+    self.queue.put('uuid', 'rid')
+
+    self.assertTrue(self.queue.join(timeout=2))
+    self.assertEqual(self.queue.stats['trashed'], 1)
+    self.assertEqual(self.queue.stats['retried'], 0)
+
+  def test_retry_then_succeed(self):
+    self.zoom_conn.delete_recording.side_effect = [
+        zoom.ZoomAPIException(503, 'Unavailable', None, ''), None]
+    self.queue.put('uuid', 'rid')
+
+    self.assertTrue(self.queue.join(timeout=2))
+    self.assertEqual(self.queue.stats['retried'], 1)
+    self.assertEqual(self.queue.stats['trashed'], 1)
+
+  def test_give_up(self):
+    self.zoom_conn.delete_recording.side_effect = zoom.ZoomAPIException(429, 'Too Many', None, '')
+    self.queue.put('uuid', 'rid')
+
+    self.assertTrue(self.queue.join(timeout=2))
+    self.assertEqual(self.zoom_conn.delete_recording.call_count, 3)
+    self.assertEqual(self.queue.stats['failed'], 1)
+
+  def test_client_error_not_retried(self):
+    self.zoom_conn.delete_recording.side_effect = zoom.ZoomAPIException(400, 'Bad', None, '')
+    self.queue.put('uuid', 'rid')
+
+    self.assertTrue(self.queue.join(timeout=2))
+    self.assertEqual(self.zoom_conn.delete_recording.call_count, 1)
+    self.assertEqual(self.queue.stats['failed'], 1)
+
+  def test_token_failure_retried(self):
+    self.zoom_conn.generate_server_to_server_oath_token.side_effect = [ValueError('auth'), 'token']
+    self.queue.put('uuid', 'rid')
+
+    self.assertTrue(self.queue.join(timeout=2))
+    self.assertEqual(self.queue.stats['trashed'], 1)
+
+  def test_unexpected_token_error_retried(self):
+    self.zoom_conn.generate_server_to_server_oath_token.side_effect = [KeyError('access_token'),
+                                                                       'token']
+    self.queue.put('uuid', 'rid')
+
+    self.assertTrue(self.queue.join(timeout=2))
+    self.assertEqual(self.queue.stats['retried'], 1)
+    self.assertEqual(self.queue.stats['trashed'], 1)
+
+  def test_unexpected_delete_error_retried(self):
+    self.zoom_conn.delete_recording.side_effect = [TypeError('bad answer'), None]
+    self.queue.put('uuid', 'rid')
+
+    self.assertTrue(self.queue.join(timeout=2))
+    self.assertEqual(self.queue.stats['retried'], 1)
+    self.assertEqual(self.queue.stats['trashed'], 1)
+
+
+class TestTrashJournal(unittest.TestCase):
+  # pylint: disable=invalid-name
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.journal = zoom.TrashJournal(os.path.join(self.folder.name, 'trash.sqlite'))
+    self.zoom_conn = MagicMock()
+    self.zoom_conn.generate_server_to_server_oath_token.return_value = 'token'
+
+  def tearDown(self):
+    self.journal.close()
+    self.folder.cleanup()
+
+  def test_trashed_items_are_removed(self):
+    queue = zoom.TrashQueue(self.zoom_conn, rate=0, journal=self.journal, account='north')
+    queue.start()
+    try:
+      queue.put('uuid', 'rid')
+      self.assertTrue(queue.stored('rid'))
+      self.assertTrue(queue.join(timeout=2))
+    finally:
+      queue.stop(timeout=2)
+    self.assertFalse(queue.stored('rid'))
+    self.assertEqual(self.journal.items('north'), [])
+
+  def test_failed_items_are_kept(self):
+    self.zoom_conn.delete_recording.side_effect = zoom.ZoomAPIException(400, 'Bad', None, '')
+    queue = zoom.TrashQueue(self.zoom_conn, rate=0, journal=self.journal, account='north')
+    queue.start()
+    try:
+      queue.put('uuid', 'rid')
+      self.assertTrue(queue.join(timeout=2))
+    finally:
+      queue.stop(timeout=2)
+    self.assertEqual(queue.stats['failed'], 1)
+    self.assertTrue(queue.stored('rid'))
+    self.assertEqual(self.journal.items('north'), [('uuid', 'rid', 'failed')])
+
+  def test_pending_items_are_reloaded(self):
+    # The first process stops before it trashed anything.
+    queue = zoom.TrashQueue(self.zoom_conn, rate=0, journal=self.journal, account='north')
+    queue.put('uuid', 'first')
+    queue.put('uuid', 'second')
+    zoom.TrashQueue(self.zoom_conn, rate=0, journal=self.journal, account='south').put('uuid',
+                                                                                       'other')
+
+    restarted = zoom.TrashQueue(self.zoom_conn, rate=0, journal=self.journal, account='north')
+    self.assertEqual(restarted.load(), 2)
+    restarted.start()
+    try:
+      self.assertTrue(restarted.join(timeout=2))
+    finally:
+      restarted.stop(timeout=2)
+    self.zoom_conn.delete_recording.assert_any_call('uuid', 'first', 'token')
+    self.zoom_conn.delete_recording.assert_any_call('uuid', 'second', 'token')
+    self.assertEqual(self.zoom_conn.delete_recording.call_count, 2)
+    self.assertEqual(self.journal.items('north'), [])
+    self.assertTrue(restarted.stored('other'))
+
+  def test_without_journal(self):
+    queue = zoom.TrashQueue(self.zoom_conn, rate=0)
+    queue.put('uuid', 'rid')
+    self.assertFalse(queue.stored('rid'))
+    self.assertEqual(queue.load(), 0)
+
+
+class TestRateLimiter(unittest.TestCase):
+  def test_burst(self):
+    limiter = zoom.RateLimiter(rate=1, burst=2)
+    self.assertTrue(limiter.try_acquire())
+    self.assertTrue(limiter.try_acquire())
+    self.assertFalse(limiter.try_acquire())
+
+  def test_disabled(self):
+    limiter = zoom.RateLimiter(rate=0)
+    for _ in range(100):
+      self.assertTrue(limiter.try_acquire())
+
+  def test_reserve(self):
+    limiter = zoom.RateLimiter(rate=10, burst=1)
+    self.assertEqual(limiter.reserve(), 0.0)
+    self.assertAlmostEqual(limiter.reserve(), 0.1, delta=0.01)
+    self.assertAlmostEqual(limiter.reserve(), 0.2, delta=0.01)
+    self.assertEqual(zoom.RateLimiter(rate=0).reserve(), 0.0)
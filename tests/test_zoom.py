@@ -101,6 +101,26 @@ class TestZoom(TestSettingsBase):
             'url': self.single_recording_download
         })
 
+  @responses.activate
+  def test_get_url_defers_trash(self):
+    responses.add(
+        responses.GET,
+        self.single_meeting_recording_info_url,
+        status=200,
+        json={'recording_files': [
+            {'file_type': 'CHAT', 'meeting_id': 'uuid', 'id': 'chat-id'},
+            {'file_type': 'TRANSCRIPT', 'meeting_id': 'uuid', 'id': 'transcript-id'},
+            {'file_type': 'MP4', 'meeting_id': 'uuid', 'id': 'some-recording-id',
+             'recording_start': '2018-01-01T01:01:01Z',
+             'download_url': self.single_recording_download}]})
+
+    res = self.api.get_recording_url('some-meeting-id', 'token')
+
+    # Discovery must be read-only: no DELETE calls are made.
+    self.assertEqual(len(responses.calls), 1)
+    self.assertEqual(res['trash'], [{'meeting_id': 'uuid', 'id': 'chat-id'},
+                                    {'meeting_id': 'uuid', 'id': 'transcript-id'}])
+
   @responses.activate
   def test_get_recording_url_fail(self):
     responses.add(responses.GET, self.single_meeting_recording_info_url, status=404)
@@ -185,9 +205,29 @@ class TestZoom(TestSettingsBase):
         status=200,
         json=self.recording_return_payload)
 
-    self.api.download_recording = MagicMock(side_effect=OSError('Could not write file!'))
+    self.api.fetch_recording = MagicMock(side_effect=OSError('Could not write file!'))
     self.assertEqual(
         self.api.pull_file_from_zoom('some-meeting-id', True),
         {'success': False,
          'date': None,
          'filename': None})
+
+  @responses.activate
+  def test_token_cached(self):
+    self.api = zoom.ZoomAPI(ZoomConfig({'account_id': 'account', 'client_id': 'client',
+                                        'client_secret': 'secret'}), self.sys_object)
+    token_url = 'https://zoom.us/oauth/token'
+    responses.add(responses.POST, token_url, status=200,
+                  json={'access_token': 'first', 'expires_in': 3600})
+    responses.add(responses.POST, token_url, status=200,
+                  json={'access_token': 'second', 'expires_in': 3600})
+
+    self.assertEqual(self.api.generate_server_to_server_oath_token(), 'first')
+    self.assertEqual(self.api.generate_server_to_server_oath_token(), 'first')
+    self.assertEqual(len(responses.calls), 1)
+
+    # A rejected token is requested again.
+    responses.add(responses.DELETE, self.single_recording_url, status=401)
+    with self.assertRaises(zoom.ZoomAPIException):
+      self.api.delete_recording('some-meeting-id', 'rid', 'first')
+    self.assertEqual(self.api.generate_server_to_server_oath_token(), 'second')
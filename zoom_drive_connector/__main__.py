@@ -13,102 +13,275 @@
 # limitations under the License.
 # ==============================================================================
 
+import argparse
+import concurrent.futures
 import datetime
+import importlib.util
+import json
 import logging
 import os
-import time
-from typing import TypeVar, cast, Dict, List
+import signal
+import socket
+import sqlite3
+from typing import Any, Dict, TypeVar, List, Optional
 
 import schedule
 
 from zoom_drive_connector import (
   configuration as config,
+  destinations,
   drive,
+  monitoring,
   slack,
   zoom
 )
+from zoom_drive_connector.monitoring import latency, metrics, profiling, progress, tracing
+from zoom_drive_connector.monitoring.startup import PROFILE
+# The pipeline steps used to live in this module.
+# pylint: disable=unused-import
+from zoom_drive_connector.pipeline import (
+  AsyncScheduler,
+  Backfill,
+  BackfillCheckpoint,
+  BackfillProgress,
+  LeaseStore,
+  Scheduler,
+  ShardCoordinator,
+  all_steps,
+  download,
+  upload_and_notify
+)
 
 S = TypeVar("S", bound=config.APIConfigBase)
 
+# Schedulers selectable with `internals.engine`.
+ENGINES = {'threads': Scheduler, 'asyncio': AsyncScheduler}
+
 
-def download(zoom_conn: zoom.ZoomAPI, zoom_conf: config.ZoomConfig) -> List[Dict[str, str]]:
-  """Downloads all available recordings from Zoom and returns a list of dicts with all relevant
-  information about the recording.
+def warm_up_zoom(zoom_conn: zoom.ZoomAPI):
+  """Fetches the first Zoom OAuth token so the first download does not have to wait for it.
+  Failures are only logged; the token is requested again when it is needed.
 
   :param zoom_conn: API object instance for Zoom.
-  :param zoom_conf: configuration instance containing all Zoom API settings.
-  :return: list of dictionaries containing meeting recording information.
   """
-  result = []
+  log = logging.getLogger('app')
+  try:
+    with PROFILE.phase('zoom.token'):
+      zoom_conn.generate_server_to_server_oath_token()
+  except Exception as e:  # pylint: disable=broad-except
+    log.log(logging.WARNING, f'Zoom token warm-up failed: {e}')
 
-  # Note, need type: ignore here as the return Union contains items without iterator
-  meeting = {}  # type: Dict
-  for meeting in zoom_conf.meetings:  # type: ignore
-    meeting = cast(Dict, meeting)
-    res = zoom_conn.pull_file_from_zoom(meeting['id'], rm=bool(zoom_conf.delete))
-    if (res['success']) and (res['filename']):
-      name = f'{res["date"].strftime("%Y%m%d")}-{meeting["name"]}.mp4'
 
-      result.append({'meeting': meeting['name'],
-                     'file': res['filename'],
-                     'name': name,
-                     'folder_id': meeting['folder_id'],
-                     'slack_channel': meeting['slack_channel'],
-                     'date': res['date'].strftime('%B %d, %Y at %H:%M'),
-                     'unix': int(res['date'].replace(tzinfo=datetime.timezone.utc).timestamp())})
+def setup_drive(drive_config: S, sys_config: S) -> drive.DriveAPI:
+  """Creates the Google Drive API object, recording the time it takes in the startup profile.
 
-  return result
+  :param drive_config: configuration class containing all parameters needed for Google Drive.
+  :param sys_config: configuration class containing all system related parameters.
+  :return: API instance for Google Drive.
+  """
+  with PROFILE.phase('drive.setup'):
+    return drive.DriveAPI(drive_config, sys_config)  # This should open a prompt.
 
 
-def upload_and_notify(files: List, drive_conn: drive.DriveAPI, slack_conn: slack.SlackAPI):
-  """Uploads a list of files from the local filesystem to Google Drive.
+def validate_folders(scheduler: Scheduler, drive_config: config.DriveConfig):
+  """Checks the Google Drive folders of all meetings with one batched request, so a wrong folder
+  ID stops the connector before anything is downloaded. Disabled with `validate_folders: false`.
 
-  :param files: list of dictionaries containing file information.
-  :param drive_conn: API instance for Google Drive.
-  :param slack_conn: API instance for Slack.
+  :param scheduler: scheduler with the configured accounts and a Drive connection.
+  :param drive_config: configuration class containing all parameters needed for Google Drive.
+  :raises SystemExit: if a folder does not exist, is in the trash, or cannot be accessed.
   """
-  for file in files:
-    try:
-      # Get url from upload function.
-      file_url = drive_conn.upload_file(file['file'], file['name'], file['folder_id'])
+  folder_ids = scheduler.drive_folders()
+  drive_conn = scheduler.drive_conn
+  if not folder_ids or drive_conn is None or not drive_config.get('validate_folders', True):
+    return
+  try:
+    with PROFILE.phase('drive.validate_folders'):
+      drive_conn.folders.validate(folder_ids)
+  except drive.DriveAPIException as e:
+    logging.getLogger('app').error(f'Google Drive folders are not usable: {e.reason}')
+    raise SystemExit(1)
 
-      # The formatted date/time string to be used for older Slack clients
-      fall_back = f"{file['date']} UTC"
 
-      # Only post message if the upload worked.
-      message = (f'The recording of _{file["meeting"]}_ on '
-                 "_<!date^" + str(file['unix']) + "^{date} at {time}|" + fall_back + ">_"
-                 f' is <{file_url}| now available>.')
+def _date(value: str) -> datetime.date:
+  try:
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+  except ValueError:
+    raise argparse.ArgumentTypeError(f'{value} is not a date in the form YYYY-MM-DD.')
 
-      slack_conn.post_message(message, file['slack_channel'])
-    except drive.DriveAPIException as e:
-      raise e
-    # Remove the file after uploading so we do not run out of disk space in our container.
-    os.remove(file['file'])
 
+def history_file(internals: config.SystemConfig) -> Optional[str]:
+  """Returns the path of the transfer history database, or None if `history_file` is disabled.
 
-def all_steps(zoom_conn: zoom.ZoomAPI,
-              slack_conn: slack.SlackAPI,
-              drive_conn: drive.DriveAPI,
-              zoom_config: S):
-  """Primary function dispatcher that calls functions which download files and then upload them and
-  notifies people in Slack that they are on Google Drive.
+  :param internals: system settings.
+  """
+  path = internals.get('history_file', os.path.join(str(internals.target_folder),
+                                                    'history.sqlite'))
+  return str(path) if path else None
 
-  :param zoom_conn: API object instance for Zoom.
-  :param slack_conn: API object instance for Slack.
-  :param drive_conn: API object instance for Google Drive.
-  :param zoom_config: configuration instance containing all Zoom API settings.
+
+def start_history(internals: config.SystemConfig) -> Optional[monitoring.TransferHistory]:
+  """Starts recording one row per transfer, see `monitoring.TransferHistory`.
+
+  :param internals: system settings.
+  :return: the history, or None if it is disabled or cannot be opened.
   """
-  downloaded_files = download(zoom_conn, cast(config.ZoomConfig, zoom_config))
-  upload_and_notify(downloaded_files, drive_conn, slack_conn)
+  path = history_file(internals)
+  if not path:
+    return None
+  try:
+    history = monitoring.TransferHistory(
+        path, retention_days=float(internals.get('history_retention_days', 90)))
+    history.start()
+  except sqlite3.Error as e:
+    logging.getLogger('app').warning(f'Transfer history {path} is not available: {e}')
+    return None
+  return history
+
+
+def open_trash_journal(internals: config.SystemConfig) -> Optional[zoom.TrashJournal]:
+  """Opens the journal of the recordings that are stored but not trashed on Zoom yet, see
+  `zoom.TrashJournal`. The daemon and the `backfill` command share it.
+
+  :param internals: system settings.
+  :return: the journal, or None if `trash_journal` is disabled or cannot be opened.
+  """
+  path = internals.get('trash_journal', os.path.join(str(internals.target_folder),
+                                                    'trash.sqlite'))
+  if not path:
+    return None
+  try:
+    return zoom.TrashJournal(str(path))
+  except sqlite3.Error as e:
+    logging.getLogger('app').warning(f'Trash journal {path} is not available: {e}')
+    return None
+
+
+def stats(app_config: config.ConfigInterface, args: argparse.Namespace) -> Dict[str, Any]:
+  """Prints throughput, stage times, the slowest meetings, and failure hot spots from the
+  transfer history.
+
+  :param app_config: the loaded configuration.
+  :param args: parsed arguments of the `stats` command.
+  :return: the report.
+  """
+  path = args.db or history_file(app_config.internals)
+  if not path or not os.path.exists(path):
+    raise SystemExit(f'No transfer history found at {path}.')
+  history = monitoring.TransferHistory(path)
+  start = datetime.datetime.combine(args.start, datetime.time(), datetime.timezone.utc)
+  end = datetime.datetime.combine(args.end + datetime.timedelta(days=1), datetime.time(),
+                                  datetime.timezone.utc)
+  try:
+    report = history.report(start.timestamp(), end.timestamp(), period=args.by, top=args.top)
+  finally:
+    history.close()
+  print(json.dumps(report, indent=2) if args.json else monitoring.format_report(report))
+  return report
+
+
+def backfill(app_config: config.ConfigInterface, args: argparse.Namespace) -> Dict[str, Any]:
+  """Transfers the existing recordings of the configured meetings between two dates, see
+  `pipeline.Backfill`. Recordings are downloaded to their own folder, so a daemon can keep running
+  next to the backfill. Ctrl-C or SIGTERM stops the backfill; running it again with the same state
+  file continues where it stopped.
+
+  :param app_config: the loaded configuration.
+  :param args: parsed arguments of the `backfill` command.
+  :return: the final progress summary.
+  """
+  log = logging.getLogger('app')
+  internals = app_config.internals
+  folder = args.target_folder or os.path.join(str(internals.target_folder), 'backfill')
+  os.makedirs(folder, exist_ok=True)
+  sys_config = config.SystemConfig({**internals.settings_dict, 'target_folder': folder})
+
+  slack_api = slack.SlackAPI(app_config.slack) if args.notify else None
+  scheduler = Scheduler(app_config.zoom, sys_config, setup_drive(app_config.drive, sys_config),
+                        slack_api, trash_journal=open_trash_journal(internals))
+  validate_folders(scheduler, app_config.drive)
+  destinations.FAN_OUT.configure(int(internals.get('destination_workers', 4)))
+  destinations_config = app_config.configuration_dict.get('destinations')
+  if destinations_config:
+    scheduler.destinations = destinations.create_destinations(destinations_config.settings_dict,
+                                                              scheduler.interrupted)
+
+  grace_period = float(internals.get('shutdown_grace_period', 25))
+
+  def terminate(signum, _):
+    log.info(f'Received {signal.Signals(signum).name}, stopping the backfill.')
+    scheduler.stop(grace_period)
+
+  signal.signal(signal.SIGTERM, terminate)
+  signal.signal(signal.SIGINT, terminate)
+  history = start_history(internals)
+
+  # Finish the uploads an interrupted backfill left behind.
+  scheduler.recover(folder)
+
+  checkpoint = BackfillCheckpoint(args.state or os.path.join(folder, 'backfill-state.json'))
+  job = Backfill(scheduler, args.start, args.end, checkpoint, workers=args.workers,
+                 notify=args.notify, progress=BackfillProgress(interval=args.progress_interval))
+  log.info(f'Backfilling recordings from {args.start} to {args.end} with {args.workers} '
+           'workers.')
+  summary = job.run()
 
+  # Give the trash queues time to drain, but not more than the grace period after a signal.
+  stopped = scheduler.stopping.is_set()
+  scheduler.close(timeout=max(1.0, scheduler.grace_remaining) if stopped else 60.0)
+  if history:
+    history.stop()
+    history.close()
+  log.info('Backfill stopped.' if stopped else 'Backfill finished.')
+  return summary
 
-def main():
+
+def main(argv: Optional[List[str]] = None):
   """Application entrypoint function. Configures logging, parses configuration file, and sets up
   proper container classes.
+
+  :param argv: command line arguments, defaults to `sys.argv`.
   """
+  parser = argparse.ArgumentParser(prog='zoom_drive_connector')
+  parser.add_argument('--startup-profile', action='store_true',
+                      help='log the duration of imports and initialization steps')
+  commands = parser.add_subparsers(dest='command')
+  backfill_parser = commands.add_parser(
+      'backfill', help='transfer existing recordings between two dates and exit')
+  backfill_parser.add_argument('--from', dest='start', type=_date, required=True,
+                               help='first day, YYYY-MM-DD')
+  backfill_parser.add_argument('--to', dest='end', type=_date, default=datetime.date.today(),
+                               help='last day, YYYY-MM-DD (default: today)')
+  backfill_parser.add_argument('--workers', type=int, default=8,
+                               help='number of recordings transferred at the same time')
+  backfill_parser.add_argument('--state',
+                               help='checkpoint file (default: backfill-state.json in the '
+                                    'download folder)')
+  backfill_parser.add_argument('--target-folder',
+                               help='download folder (default: <target_folder>/backfill)')
+  backfill_parser.add_argument('--notify', action='store_true',
+                               help='announce the recordings in Slack')
+  backfill_parser.add_argument('--progress-interval', type=float, default=10,
+                               help='seconds between progress lines')
+  stats_parser = commands.add_parser(
+      'stats', help='report throughput, stage times, and failures from the transfer history')
+  stats_parser.add_argument('--from', dest='start', type=_date,
+                            default=datetime.date.today() - datetime.timedelta(days=6),
+                            help='first day, YYYY-MM-DD (default: 6 days ago)')
+  stats_parser.add_argument('--to', dest='end', type=_date, default=datetime.date.today(),
+                            help='last day, YYYY-MM-DD (default: today)')
+  stats_parser.add_argument('--by', choices=sorted(monitoring.history.PERIODS), default='day',
+                            help='length of the periods of the throughput trend')
+  stats_parser.add_argument('--top', type=int, default=10,
+                            help='number of meetings and errors listed')
+  stats_parser.add_argument('--db', help='history database (default: history_file)')
+  stats_parser.add_argument('--json', action='store_true', help='print the report as JSON')
+  # Unknown arguments such as `--noauth_local_webserver` from older deployments are ignored.
+  args, _ = parser.parse_known_args(argv)
+
   # App configuration.
-  app_config = config.ConfigInterface(os.getenv('CONFIG', '/conf/config.yaml'))
+  with PROFILE.phase('config'):
+    app_config = config.ConfigInterface(os.getenv('CONFIG', '/conf/config.yaml'))
 
   # Configure the logger interface to print to console with level INFO
   log = logging.getLogger('app')
@@ -117,19 +290,162 @@ def main():
   ch.setFormatter(logging.Formatter('%(asctime)s %(module)s:%(levelname)s %(message)s'))
   log.addHandler(ch)
 
+  if args.command == 'backfill':
+    backfill(app_config, args)
+    return
+  if args.command == 'stats':
+    stats(app_config, args)
+    return
+
   log.info('Application starting up.')
 
-  # Configure each API service module.
-  zoom_api = zoom.ZoomAPI(app_config.zoom, app_config.internals)
+  # Configure each API service module. Every Zoom account gets its own client, token cache, trash
+  # queue, and worker pool; the Slack and Drive clients are shared. The Zoom tokens and the Drive
+  # credentials are all network bound, so they are set up in parallel.
   slack_api = slack.SlackAPI(app_config.slack)
-  drive_api = drive.DriveAPI(app_config.drive, app_config.internals)  # This should open a prompt.
+
+  # With a shared lease store, several replicas split the meetings between them.
+  shard = None
+  shard_store = app_config.internals.get('shard_store')
+  if shard_store:
+    shard = ShardCoordinator(LeaseStore(shard_store),
+                             str(app_config.internals.get('replica_id') or socket.gethostname()),
+                             lease_ttl=float(app_config.internals.get('lease_ttl', 600)),
+                             member_ttl=float(app_config.internals.get('member_ttl', 60)))
+    shard.start()
+
+  # The asyncio engine runs all transfers on one event loop instead of a thread per transfer.
+  engine = str(app_config.internals.get('engine', 'threads'))
+  if engine not in ENGINES:
+    log.error(f'Unknown engine {engine}, expected one of {", ".join(sorted(ENGINES))}.')
+    raise SystemExit(1)
+  if engine == 'asyncio' and importlib.util.find_spec('aiohttp') is None:
+    log.error('The asyncio engine requires aiohttp, install it with '
+              '`pip install zoom-drive-connector[asyncio]`.')
+    raise SystemExit(1)
+  scheduler = ENGINES[engine](app_config.zoom, app_config.internals, None, slack_api, shard,
+                              open_trash_journal(app_config.internals))
+  with concurrent.futures.ThreadPoolExecutor(max_workers=len(scheduler.accounts) + 1,
+                                             thread_name_prefix='startup') as pool:
+    for account in scheduler.accounts.values():
+      pool.submit(warm_up_zoom, account.zoom_api)
+    scheduler.drive_conn = pool.submit(setup_drive, app_config.drive,
+                                       app_config.internals).result()
+  validate_folders(scheduler, app_config.drive)
+
+  # Recordings can be copied to other destinations besides Google Drive; each recording is
+  # downloaded once and copied to all destinations of its meeting in parallel.
+  destinations.FAN_OUT.configure(int(app_config.internals.get('destination_workers', 4)))
+  destinations_config = app_config.configuration_dict.get('destinations')
+  if destinations_config:
+    scheduler.destinations = destinations.create_destinations(destinations_config.settings_dict,
+                                                              scheduler.interrupted)
+
+  if args.startup_profile:
+    log.info('Startup profile:\n' + PROFILE.report())
+
+  metrics.QUEUE_DEPTH.labels('trash').set_function(lambda: scheduler.trash_depth)
+
+  # Write per-recording traces if a trace file has been configured.
+  trace_file = app_config.internals.get('trace_file')
+  if trace_file:
+    tracing.TRACER.configure(trace_file,
+                             max_bytes=int(app_config.internals.get('trace_max_bytes', 10485760)),
+                             backups=int(app_config.internals.get('trace_backups', 5)))
+
+  # Record anonymized call timings for capacity planning (see `benchmarks/replay.py`).
+  capture_file = app_config.internals.get('capture_file')
+  if capture_file:
+    monitoring.TrafficCapture(capture_file).start()
+
+  # Keep one row per transfer for the `stats` command.
+  history = start_history(app_config.internals)
+
+  # Track the time from the end of each recording until it is announced in Slack.
+  notify_slo = app_config.zoom.get('notify_slo')
+  latency.TRACKER.configure(window=int(app_config.internals.get('latency_window', 1000)),
+                            objective=float(notify_slo) if notify_slo is not None else None,
+                            status_file=app_config.internals.get('status_file'))
+
+  # Log the progress of long transfers every `progress_interval` seconds.
+  progress.PROGRESS.configure(float(app_config.internals.get('progress_interval', 30)))
+  progress.PROGRESS.subscribe(progress.log_progress)
+
+  # Expose pipeline metrics on `/metrics`, the latency summary on `/healthz`, and the running
+  # transfers on `/progress` if a port has been configured.
+  metrics_port = app_config.internals.get('metrics_port')
+  if metrics_port is not None:
+    server = monitoring.MetricsServer(int(metrics_port))
+    server.add_route('/healthz', latency.TRACKER.route)
+    server.add_route('/progress', progress.PROGRESS.route)
+    server.start()
+
+  # The scheduler looks the clients up for every run so the config watcher can replace them. A
+  # run that is in progress keeps using the clients it started with.
+  def rebuild_slack(slack_config: config.SlackConfig, _):
+    scheduler.slack_conn = slack.SlackAPI(slack_config)
+
+  def rebuild_drive(drive_config: config.DriveConfig, _):
+    scheduler.drive_conn = setup_drive(drive_config, app_config.internals)
+
+  def rebuild_destinations(destinations_config: config.DestinationsConfig, _):
+    scheduler.destinations = destinations.create_destinations(destinations_config.settings_dict,
+                                                              scheduler.interrupted)
+
+  reload_interval = float(app_config.internals.get('config_reload_interval', 30))
+  if reload_interval > 0:
+    watcher = config.ConfigWatcher(app_config, interval=reload_interval)
+    watcher.subscribe('zoom', lambda *_: scheduler.reconcile())
+    watcher.subscribe('internals', lambda *_: scheduler.reconcile(rebuild=True))
+    watcher.subscribe('slack', rebuild_slack)
+    watcher.subscribe('drive', rebuild_drive)
+    watcher.subscribe('destinations', rebuild_destinations)
+    watcher.start()
+
+  # On SIGTERM (e.g. from Kubernetes) or Ctrl-C, stop starting new jobs and give running transfers
+  # the grace period to finish; after that they are checkpointed and resumed after the restart.
+  grace_period = float(app_config.internals.get('shutdown_grace_period', 25))
+
+  def terminate(signum, _):
+    log.info(f'Received {signal.Signals(signum).name}.')
+    scheduler.stop(grace_period)
+
+  signal.signal(signal.SIGTERM, terminate)
+  signal.signal(signal.SIGINT, terminate)
+
+  # Finish the uploads a previous run was interrupted in before downloading anything new.
+  scheduler.recover(str(app_config.internals.target_folder))
+
+  # Cycles are profiled on demand: set the environment variable to profile the first cycles after
+  # startup, or send SIGUSR2 to profile the next ones.
+  internals = app_config.internals
+  profiler = profiling.PROFILER
+  profiler.configure(
+      str(internals.get('profile_dir', os.path.join(str(internals.target_folder), 'profiles'))),
+      cycles=int(internals.get('profile_cycles', 1)),
+      snapshot_interval=float(internals.get('profile_snapshot_interval', 60)))
+  profiler.arm_from_environment()
+  profiler.install()
+  run_cycle = profiler.cycle(scheduler.run_once)
+
+  def run_once():
+    run_cycle()
+    latency.TRACKER.log_summary()
 
   # Run the application on a 10 minute schedule.
-  all_steps(zoom_api, slack_api, drive_api, app_config.zoom)
-  schedule.every(10).minutes.do(all_steps, zoom_api, slack_api, drive_api, app_config.zoom)
-  while True:
+  run_once()
+  schedule.every(10).minutes.do(run_once)
+  while not scheduler.stopping.wait(1):
     schedule.run_pending()
-    time.sleep(1)
+
+  # Recordings that are already in Google Drive are still trashed if the grace period allows.
+  scheduler.close(timeout=max(1.0, scheduler.grace_remaining))
+  if shard:
+    shard.stop()
+  if history:
+    history.stop()
+    history.close()
+  log.info('Application stopped.')
 
 
 if __name__ == '__main__':
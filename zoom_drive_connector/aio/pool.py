@@ -0,0 +1,221 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import asyncio
+import contextlib
+import json
+import ssl
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Union
+
+from zoom_drive_connector.monitoring.startup import lazy_import
+
+Body = Union[bytes, bytearray, memoryview]
+
+MAX_REDIRECTS = 5
+
+
+class ProtocolError(ConnectionError):
+  """The server closed the connection early or sent an answer that is not valid HTTP."""
+
+
+class HTTPStatusError(Exception):
+  def __init__(self, status: int, reason: str, body: bytes = b''):
+    """Initializes container for an error answer of a server.
+
+    :param status: HTTP status code.
+    :param reason: HTTP status name.
+    :param body: body of the answer, e.g. the error message of the API.
+    """
+    super(HTTPStatusError, self).__init__()
+    self.status = status
+    self.reason = reason
+    self.body = body
+
+  def __str__(self) -> str:
+    """Returns formatted message containing the status and the start of the body.
+
+    :return: String with exception contents.
+    """
+    return f'HTTP_STATUS: {self.status}-{self.reason}, {self.body[:200]!r}'
+
+  def __repr__(self) -> str:
+    """Returns name of exception class.
+
+    :return: name of exception class.
+    """
+    return 'HTTPStatusError()'
+
+
+@contextlib.contextmanager
+def _client_errors(timeout: float) -> Iterator[None]:
+  """Raises the errors of `aiohttp` as the built-in exceptions the clients handle.
+
+  :param timeout: timeout of the pool, used in the message of a `TimeoutError`.
+  """
+  aiohttp = lazy_import('aiohttp')
+  try:
+    yield
+  except asyncio.TimeoutError as e:
+    raise TimeoutError(f'No answer within {timeout:.0f} seconds.') from e
+  except aiohttp.ClientError as e:
+    if isinstance(e, OSError):
+      raise
+    raise ProtocolError(str(e) or repr(e)) from e
+
+
+class Response:
+  def __init__(self, response: Any, timeout: float):
+    """Answer of a server whose body has not been read yet. The connection goes back to the pool
+    once the body was read to the end; a response that is closed before that closes its
+    connection.
+
+    :param response: the `aiohttp.ClientResponse`.
+    :param timeout: timeout of the pool, used in error messages.
+    """
+    self.status = response.status  # type: int
+    self.reason = response.reason or ''  # type: str
+    # Case-insensitive, e.g. `headers.get('content-length')`.
+    self.headers = response.headers
+    self._response = response
+    self._timeout = timeout
+
+  async def read_some(self, size: int = 65536) -> bytes:
+    """Reads the next part of the body.
+
+    :param size: maximum number of bytes to return.
+    :return: up to `size` bytes, or an empty string once the body was read.
+    :raises ProtocolError: if the connection closed before the end of the body.
+    """
+    with _client_errors(self._timeout):
+      return await self._response.content.read(size)
+
+  async def iter_chunks(self, size: int = 65536) -> AsyncIterator[bytes]:
+    """Yields the body in parts of at most `size` bytes.
+
+    :param size: maximum number of bytes per part.
+    """
+    while True:
+      data = await self.read_some(size)
+      if not data:
+        return
+      yield data
+
+  async def read(self) -> bytes:
+    """Reads the rest of the body."""
+    parts = []  # type: List[bytes]
+    async for data in self.iter_chunks():
+      parts.append(data)
+    return b''.join(parts)
+
+  async def json(self) -> Any:
+    """Reads the rest of the body and parses it as JSON; an empty body is an empty dictionary."""
+    body = await self.read()
+    return json.loads(body.decode('utf-8')) if body.strip() else {}
+
+  async def raise_for_status(self):
+    """Raises `HTTPStatusError` with the body of the answer for 4xx and 5xx statuses."""
+    if self.status >= 400:
+      raise HTTPStatusError(self.status, self.reason, await self.read())
+
+  def close(self):
+    """Gives up on the rest of the body. The connection is closed unless the body was read."""
+    self._response.release()
+
+  async def __aenter__(self) -> 'Response':
+    return self
+
+  async def __aexit__(self, *exc_info):
+    self.close()
+
+
+class ConnectionPool:
+  def __init__(self,
+               limit: int = 100,
+               limit_per_host: int = 0,
+               timeout: float = 60.0,
+               keep_alive: float = 30.0,
+               ssl_context: Optional[ssl.SSLContext] = None):
+    """One `aiohttp` session shared by the Zoom, Drive, and Slack clients of the asyncio engine,
+    so that they reuse the same keep-alive connections. A request holds a connection until its
+    response body was read; at most `limit` connections, and `limit_per_host` connections to the
+    same host, are open at the same time and the other requests wait for a free one. Answers are
+    requested without compression. GET and HEAD requests follow redirects. Errors of `aiohttp`
+    are raised as `TimeoutError`, `ConnectionError`, or `ProtocolError`.
+
+    :param limit: number of connections open at the same time.
+    :param limit_per_host: number of connections to the same host, 0 for no separate limit.
+    :param timeout: seconds to wait for a connection to be established, or for each read.
+    :param keep_alive: seconds an idle connection is kept for reuse.
+    :param ssl_context: TLS settings for `https` URLs; the system defaults if not given.
+    """
+    self.limit = max(1, int(limit))
+    self.limit_per_host = max(0, int(limit_per_host))
+    self.timeout = float(timeout)
+    self.keep_alive = float(keep_alive)
+    self._ssl_context = ssl_context
+    self._session = None  # type: Any
+    # Number of connections opened, e.g. to check that connections are reused.
+    self.opened = 0
+
+  async def _connection_opened(self, *_):
+    self.opened += 1
+
+  def session(self) -> Any:
+    """Returns the `aiohttp.ClientSession`, created on first use in the running event loop."""
+    if self._session is None:
+      aiohttp = lazy_import('aiohttp')
+      trace = aiohttp.TraceConfig()
+      trace.on_connection_create_end.append(self._connection_opened)
+      extra = {'ssl': self._ssl_context} if self._ssl_context is not None else {}
+      connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                       keepalive_timeout=self.keep_alive, **extra)
+      # Waiting for a free connection is not limited; transfers may hold them for long.
+      timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout,
+                                      sock_read=self.timeout)
+      self._session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                            trace_configs=[trace])
+    return self._session
+
+  async def request(self,
+                    method: str,
+                    url: str,
+                    headers: Optional[Dict[str, str]] = None,
+                    body: Optional[Body] = None,
+                    params: Optional[Dict[str, Any]] = None) -> Response:
+    """Sends a request and returns the answer once its headers arrived. The caller has to read
+    the body or close the response to give the connection back, e.g. with `async with`.
+
+    :param method: HTTP method.
+    :param url: absolute `http` or `https` URL.
+    :param headers: request headers.
+    :param body: request body.
+    :param params: query parameters added to the URL.
+    :return: the answer.
+    :raises TimeoutError: if the server did not answer in time.
+    :raises ConnectionError: if the connection failed or broke.
+    """
+    headers = {'accept-encoding': 'identity', **(headers or {})}
+    with _client_errors(self.timeout):
+      response = await self.session().request(method, url, headers=headers, data=body,
+                                              params=params,
+                                              allow_redirects=method in ('GET', 'HEAD'),
+                                              max_redirects=MAX_REDIRECTS)
+    return Response(response, self.timeout)
+
+  async def close(self):
+    """Closes the session and its connections."""
+    if self._session is not None:
+      session, self._session = self._session, None
+      await session.close()
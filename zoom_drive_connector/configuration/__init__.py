@@ -18,6 +18,9 @@ from .configuration_interfaces import (
   SlackConfig,
   ZoomConfig,
   DriveConfig,
+  DestinationsConfig,
   SystemConfig,
   ConfigInterface
 )
+from .config_watcher import ConfigWatcher
+from .meeting_registry import MeetingRecord, MeetingRegistry
@@ -0,0 +1,163 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import hashlib
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from .configuration_interfaces import APIConfigBase, ConfigInterface
+
+log = logging.getLogger('app')
+
+Listener = Callable[[APIConfigBase, Set[str]], None]
+
+
+class ConfigWatcher:
+  def __init__(self, config: ConfigInterface, interval: float = 30.0):
+    """Watches the configuration file of `config` and the files it includes and applies changes
+    while the program runs.
+
+    Changed files are parsed and validated in a background thread. If the new file is valid, the
+    settings of every changed section are swapped into the existing section objects with a single
+    assignment, so code holding a reference to e.g. the `ZoomConfig` sees the new meetings on its
+    next access while running jobs continue with the values they already read. Listeners
+    subscribed to a section are then called so they can rebuild API clients if needed.
+
+    :param config: configuration loaded at startup; updated in place.
+    :param interval: number of seconds between checks of the file.
+    """
+    self.config = config
+    self.interval = interval
+    self._listeners = {}  # type: Dict[str, List[Listener]]
+    self._stat = self._file_stat()
+    self._digest = self._file_digest()
+    self._stop = threading.Event()
+    self._thread = None  # type: Optional[threading.Thread]
+
+  def subscribe(self, section: str, listener: Listener):
+    """Registers a function called after `section` changed.
+
+    :param section: top-level key in the configuration file, e.g. `zoom`.
+    :param listener: callable receiving the updated section and the names of the changed keys.
+    """
+    self._listeners.setdefault(section, []).append(listener)
+
+  def _file_stat(self) -> Tuple:
+    """Returns the modification time and size of the configuration file and its includes. Missing
+    files are recorded as None so that removing an include is noticed as well.
+    """
+    stats = []  # type: List[Optional[Tuple[int, int]]]
+    for path in self.config.files:
+      try:
+        stat = os.stat(path)
+        stats.append((stat.st_mtime_ns, stat.st_size))
+      except OSError:
+        stats.append(None)
+    return tuple(stats)
+
+  def _file_digest(self) -> str:
+    """Returns a hash over the content of the configuration file and its includes."""
+    digest = hashlib.sha256()
+    for path in self.config.files:
+      try:
+        with open(path, 'rb') as f:
+          digest.update(f.read())
+      except OSError:
+        digest.update(b'\0missing\0')
+    return digest.hexdigest()
+
+  def check(self) -> bool:
+    """Checks the files once and applies them if their content changed.
+
+    :return: True if a new configuration was applied.
+    """
+    stat = self._file_stat()
+    if stat == self._stat:
+      return False
+    self._stat = stat
+
+    # Editors and `touch` change the modification time without changing the content.
+    digest = self._file_digest()
+    if digest == self._digest:
+      return False
+
+    try:
+      new_config = ConfigInterface(self.config.file)
+    except (SystemExit, RuntimeError, KeyError, TypeError, AttributeError, OSError) as e:
+      # Keep the old digest so the file is parsed again once it has been fixed.
+      log.log(logging.ERROR, f'Ignoring invalid configuration file {self.config.file}: {e!r}')
+      return False
+
+    self._apply(new_config)
+    # The list of included files may have changed as well.
+    self.config.files = new_config.files
+    self._stat = self._file_stat()
+    self._digest = self._file_digest()
+    return True
+
+  def _apply(self, new_config: ConfigInterface):
+    """Swaps the settings of changed sections into the current configuration and notifies
+    listeners.
+
+    :param new_config: validated configuration read from the file.
+    """
+    changes = []  # type: List[Tuple[str, APIConfigBase, Set[str]]]
+    for section, new_value in new_config.configuration_dict.items():
+      current = self.config.configuration_dict.get(section)
+      if current is None:
+        self.config.configuration_dict[section] = new_value
+        changes.append((section, new_value, set(new_value.settings_dict)))
+        continue
+
+      old_settings, new_settings = current.settings_dict, new_value.settings_dict
+      changed = {k for k in set(old_settings) | set(new_settings)
+                 if old_settings.get(k) != new_settings.get(k)}
+      if changed:
+        current.settings_dict = new_settings
+        changes.append((section, current, changed))
+
+    for section in set(self.config.configuration_dict) - set(new_config.configuration_dict):
+      log.log(logging.WARNING, f'Section {section} was removed from the configuration file; '
+                               'keeping the previous settings until restart.')
+
+    for section, value, changed in changes:
+      keys = ', '.join(sorted(changed))
+      log.log(logging.INFO, f'Configuration section {section} changed: {keys}')
+      for listener in self._listeners.get(section, []):
+        try:
+          listener(value, changed)
+        except Exception as e:  # pylint: disable=broad-except
+          log.log(logging.ERROR, f'Failed to apply changes to section {section}: {e!r}')
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      self.check()
+
+  def start(self):
+    """Starts checking the file in a background thread."""
+    self._stop.clear()
+    self._thread = threading.Thread(target=self._run, name='config-watcher', daemon=True)
+    self._thread.start()
+
+  def stop(self, timeout: Optional[float] = None):
+    """Stops the background thread.
+
+    :param timeout: number of seconds to wait for the thread to finish.
+    """
+    self._stop.set()
+    if self._thread:
+      self._thread.join(timeout)
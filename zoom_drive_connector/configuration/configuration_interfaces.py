@@ -14,12 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
-from typing import Dict, Union, Any
+from typing import Dict, List, Union, Any
 
 import logging
 import os
 import yaml
 
+from .meeting_registry import MeetingRegistry, expand_includes
+
 log = logging.getLogger('app')
 
 
@@ -46,6 +48,16 @@ class APIConfigBase:
     """
     return self.settings_dict[item]
 
+  def get(self, item: str, default: Any = None) -> Any:
+    """Returns an optional setting from `settings_dict`, falling back to `default` when the key is
+    not present in the configuration file.
+
+    :param item: name of attribute to return from `settings_dict`.
+    :param default: value to return if `item` is not configured.
+    :return: value of attribute in dictionary or `default`.
+    """
+    return self.settings_dict.get(item, default)
+
   @classmethod
   def factory_registrar(cls, name):
     """Returns true if the current class is the proper registrar for the corresponding config class.
@@ -65,21 +77,83 @@ class ZoomConfig(APIConfigBase):
 
   def validate(self) -> bool:
     """Checks to see if all Zoom configuration parameters are valid.
-    This includes checking the 4 items that should be configured per meeting
+    This includes checking the 4 items that should be configured per meeting, and that meeting IDs
+    are unique. With several accounts, every account is checked.
 
     :return: Checks to make sure that the meetings have all required properties
     """
+    if 'accounts' in self.settings_dict:
+      return self.__validate_accounts()
+
     if not all(
       k in self.settings_dict for k in (
         'account_id', 'client_id', 'client_secret', 'delete', 'meetings')
       ):
       return False
 
-    for meeting in self.settings_dict['meetings']:
-      if not all(k in meeting for k in ('id', 'folder_id', 'name', 'slack_channel')):
-        return False
+    registry = self.registry
+    for warning in registry.warnings:
+      log.log(logging.WARNING, warning)
+    for error in registry.errors:
+      log.log(logging.ERROR, error)
 
-    return True
+    return not registry.errors
+
+  def __validate_accounts(self) -> bool:
+    """Validates every account and checks that account names and meeting IDs are unique across
+    accounts.
+    """
+    accounts = self.accounts
+    if not accounts or len(accounts) != len(self.settings_dict['accounts']):
+      log.log(logging.ERROR, 'zoom.accounts must be a non-empty list of mappings.')
+      return False
+    if not all(account.validate() for account in accounts):
+      return False
+
+    names = [account.account_name for account in accounts]
+    duplicates = {name for name in names if names.count(name) > 1}
+    for name in sorted(duplicates):
+      log.log(logging.ERROR, f'Duplicate Zoom account name {name}.')
+
+    combined = MeetingRegistry([m for account in accounts for m in account.meetings])
+    for error in combined.errors:
+      log.log(logging.ERROR, error)
+    return not duplicates and not combined.errors
+
+  @property
+  def account_name(self) -> str:
+    """Name of the account used in logs and thread names; defaults to the account ID."""
+    return str(self.settings_dict.get('name') or self.settings_dict.get('account_id', 'default'))
+
+  @property
+  def accounts(self) -> List['ZoomConfig']:
+    """Configuration of every Zoom account. Settings listed directly in the `zoom` section are
+    defaults for all entries of `accounts`. Without `accounts`, this section is the only account.
+    """
+    cached = self.__dict__.get('_accounts')
+    if cached is None or cached[0] is not self.settings_dict:
+      entries = self.settings_dict.get('accounts')
+      if entries:
+        defaults = {k: v for k, v in self.settings_dict.items()
+                    if k not in ('accounts', 'meetings', 'include', 'name')}
+        accounts = [ZoomConfig({**defaults, **entry}) for entry in entries
+                    if isinstance(entry, dict)]
+      else:
+        accounts = [self]
+      cached = (self.settings_dict, accounts)
+      self.__dict__['_accounts'] = cached
+    return cached[1]
+
+  @property
+  def registry(self) -> MeetingRegistry:
+    """Meetings compiled into a `MeetingRegistry`. The registry is rebuilt when the settings are
+    replaced, e.g. by the configuration watcher.
+    """
+    cached = self.__dict__.get('_registry')
+    if cached is None or cached[0] is not self.settings_dict:
+      cached = (self.settings_dict, MeetingRegistry(self.settings_dict.get('meetings') or []))
+      self.__dict__['_registry'] = cached
+    return cached[1]
 
 
 class DriveConfig(APIConfigBase):
@@ -94,6 +168,34 @@ class DriveConfig(APIConfigBase):
     return files_exist
 
 
+class DestinationsConfig(APIConfigBase):
+  _classname = 'destinations'
+  # Settings every destination type needs.
+  required_keys = {'local': ('path',), 's3': ('endpoint', 'bucket', 'access_key', 'secret_key')}
+
+  def validate(self) -> bool:
+    """Checks that every destination has a known type and the settings that type needs. The name
+    `drive` is reserved for Google Drive.
+
+    :return: true if all destinations are valid.
+    """
+    valid = True
+    for name, settings in self.settings_dict.items():
+      if name == 'drive':
+        log.log(logging.ERROR, 'The destination name drive is reserved for Google Drive.')
+        valid = False
+      elif not isinstance(settings, dict) or settings.get('type') not in self.required_keys:
+        log.log(logging.ERROR, f'Destination {name} must have a type out of '
+                               f'{", ".join(sorted(self.required_keys))}.')
+        valid = False
+      else:
+        missing = [k for k in self.required_keys[settings['type']] if k not in settings]
+        if missing:
+          log.log(logging.ERROR, f'Destination {name} is missing {", ".join(missing)}.')
+          valid = False
+    return valid
+
+
 class SystemConfig(APIConfigBase):
   _classname = 'internals'
 
@@ -110,6 +212,7 @@ class ConfigInterface:
     """Initializes and loads configuration file to Python object.
     """
     self.file = file
+    self.files: List[str] = [file]
     self.configuration_dict: Dict = dict()
 
     # Load configuration
@@ -139,6 +242,16 @@ class ConfigInterface:
     """
     dict_from_yaml = self.__load_config()
 
+    # Meetings can be split across several files that are listed under `include` in the Zoom
+    # section or in one of its accounts.
+    zoom_settings = dict_from_yaml.get('zoom')
+    if isinstance(zoom_settings, dict):
+      base_dir = os.path.dirname(os.path.abspath(self.file))
+      self.files.extend(expand_includes(zoom_settings, base_dir))
+      for account in zoom_settings.get('accounts') or []:
+        if isinstance(account, dict):
+          self.files.extend(expand_includes(account, base_dir))
+
     # Iterate through all keys and their corresponding values.
     for key, value in dict_from_yaml.items():
       # Iterator for subclasses of `APIConfigBase`.
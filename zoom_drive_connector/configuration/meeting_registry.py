@@ -0,0 +1,204 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import glob
+import os
+import string
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import yaml
+
+REQUIRED_KEYS = ('id', 'folder_id', 'name', 'slack_channel')
+# Fields that can be used in the `folder` path of a meeting.
+FOLDER_FIELDS = ('meeting', 'yyyy', 'mm', 'dd')
+
+
+class MeetingRecord(NamedTuple):
+  id: str
+  name: str
+  folder_id: str
+  slack_channel: str
+  uuid: Optional[str] = None
+  priority: int = 0
+  destinations: Tuple[str, ...] = ('drive',)
+  folder: Optional[str] = None
+
+  def folder_path(self, date: datetime.datetime) -> Optional[str]:
+    """Returns the folder path of a recording below `folder_id`, e.g. `Recordings/Standup/2018/06`
+    for the template `Recordings/{meeting}/{yyyy}/{mm}`.
+
+    :param date: start of the recording.
+    :return: the path, or None if the meeting has no `folder` template.
+    """
+    if not self.folder:
+      return None
+    return self.folder.format(meeting=self.name.replace('/', '-'), yyyy=f'{date.year:04d}',
+                              mm=f'{date.month:02d}', dd=f'{date.day:02d}')
+
+
+def _template_error(template) -> Optional[str]:
+  """Returns why a `folder` template is invalid, or None if it is valid."""
+  if not isinstance(template, str):
+    return 'is not a string'
+  try:
+    fields = [field for _, field, _, _ in string.Formatter().parse(template) if field is not None]
+  except ValueError as e:
+    return f'cannot be parsed ({e})'
+  unknown = [field for field in fields if field not in FOLDER_FIELDS]
+  if unknown:
+    return f'uses unknown fields {", ".join(unknown)} (allowed: {", ".join(FOLDER_FIELDS)})'
+  return None
+
+
+class MeetingRegistry:
+  __slots__ = ('records', 'errors', 'warnings', '_by_id', '_by_uuid')
+
+  def __init__(self, meetings: List[Dict]):
+    """Compiles the meeting entries of the configuration file into typed records indexed by
+    meeting ID and UUID. Problems are collected instead of raised so they can all be reported
+    at once: duplicate IDs and UUIDs are `errors`, meetings with the same name uploading to the same
+    folder (whose recordings would get the same file name) are `warnings`.
+
+    :param meetings: list of meeting dictionaries, each containing at least `REQUIRED_KEYS`.
+    """
+    self.records = []  # type: List[MeetingRecord]
+    self.errors = []  # type: List[str]
+    self.warnings = []  # type: List[str]
+    self._by_id = {}  # type: Dict[str, MeetingRecord]
+    self._by_uuid = {}  # type: Dict[str, MeetingRecord]
+
+    destinations = {}  # type: Dict[Tuple[str, str], str]
+    for meeting in meetings:
+      if not isinstance(meeting, dict):
+        self.errors.append(f'Meeting entry {meeting!r} is not a mapping.')
+        continue
+      missing = [k for k in REQUIRED_KEYS if k not in meeting]
+      if missing:
+        self.errors.append(f'Meeting {meeting.get("id", meeting)} is missing {", ".join(missing)}.')
+        continue
+
+      uuid = meeting.get('uuid')
+      try:
+        priority = int(meeting.get('priority', 0))
+      except (TypeError, ValueError):
+        self.errors.append(f'Meeting {meeting["id"]} has a priority that is not an integer.')
+        continue
+      targets = meeting.get('destinations', ['drive'])
+      if isinstance(targets, str):
+        targets = [targets]
+      names = isinstance(targets, list) and all(isinstance(t, str) for t in targets)
+      if not names or not targets:
+        self.errors.append(f'Meeting {meeting["id"]} has destinations that are not a list of '
+                           'names.')
+        continue
+      folder = meeting.get('folder') or None
+      problem = _template_error(folder) if folder is not None else None
+      if problem:
+        self.errors.append(f'Meeting {meeting["id"]} has a folder path that {problem}.')
+        continue
+      record = MeetingRecord(str(meeting['id']), str(meeting['name']), str(meeting['folder_id']),
+                             str(meeting['slack_channel']), str(uuid) if uuid else None, priority,
+                             tuple(targets), folder)
+      if record.id in self._by_id:
+        self.errors.append(f'Duplicate meeting ID {record.id}.')
+        continue
+      if record.uuid and record.uuid in self._by_uuid:
+        self.errors.append(f'Duplicate meeting UUID {record.uuid} (meetings '
+                           f'{self._by_uuid[record.uuid].id} and {record.id}).')
+        continue
+
+      destination = (record.folder_id, record.name)
+      if destination in destinations:
+        self.warnings.append(f'Meetings {destinations[destination]} and {record.id} are both '
+                             f'named "{record.name}" and upload to folder {record.folder_id}.')
+      else:
+        destinations[destination] = record.id
+
+      self.records.append(record)
+      self._by_id[record.id] = record
+      if record.uuid:
+        self._by_uuid[record.uuid] = record
+
+  def get(self, meeting_id: str) -> Optional[MeetingRecord]:
+    """Returns the meeting with the given ID.
+
+    :param meeting_id: meeting ID as written in the configuration file.
+    :return: the meeting or None if it is not configured.
+    """
+    return self._by_id.get(meeting_id)
+
+  def lookup(self, key: str) -> Optional[MeetingRecord]:
+    """Returns the meeting with the given ID or UUID, e.g. for a recording returned by Zoom.
+
+    :param key: meeting ID or UUID.
+    :return: the meeting or None if it is not configured.
+    """
+    return self._by_id.get(key) or self._by_uuid.get(key)
+
+  def __contains__(self, key: str) -> bool:
+    return self.lookup(key) is not None
+
+  def __iter__(self) -> Iterator[MeetingRecord]:
+    return iter(self.records)
+
+  def __len__(self) -> int:
+    return len(self.records)
+
+
+def load_includes(patterns: Union[str, List[str]], base_dir: str) -> Tuple[List[Dict], List[str]]:
+  """Reads meetings from the YAML shards listed under `include:`. A shard contains either a list
+  of meetings or a mapping with a `meetings` key.
+
+  :param patterns: file names or glob patterns, relative to `base_dir` unless absolute.
+  :param base_dir: directory of the main configuration file.
+  :return: tuple of the meetings of all shards in order and the paths of the files read.
+  """
+  if isinstance(patterns, str):
+    patterns = [patterns]
+
+  meetings = []  # type: List[Dict]
+  files = []  # type: List[str]
+  for pattern in patterns:
+    pattern = os.path.join(base_dir, os.path.expanduser(str(pattern)))
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+      raise RuntimeError(f'Included configuration file {pattern} not found.')
+
+    for path in paths:
+      with open(path, 'r', encoding='utf-8') as f:
+        shard = yaml.safe_load(f) or []
+      if isinstance(shard, dict):
+        shard = shard.get('meetings') or []
+      if not isinstance(shard, list):
+        raise RuntimeError(f'Included configuration file {path} does not contain a meeting list.')
+      meetings.extend(shard)
+      files.append(path)
+
+  return meetings, files
+
+
+def expand_includes(settings: Dict, base_dir: str) -> List[str]:
+  """Appends the meetings of the shards listed under `include` in `settings` to its `meetings`.
+
+  :param settings: settings of a Zoom section or account; modified in place.
+  :param base_dir: directory of the main configuration file.
+  :return: paths of the files read.
+  """
+  if not settings.get('include'):
+    return []
+  meetings, files = load_includes(settings['include'], base_dir)
+  settings['meetings'] = list(settings.get('meetings') or []) + meetings
+  return files
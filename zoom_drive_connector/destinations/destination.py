@@ -0,0 +1,163 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from zoom_drive_connector import drive
+from zoom_drive_connector.monitoring import metrics, progress, tracing
+from zoom_drive_connector.zoom import CopyEngine
+
+log = logging.getLogger('app')
+
+
+class DestinationException(Exception):
+  def __init__(self, name: str, reason: str, status: Optional[int] = None):
+    """Initializes object for containing information about a failed copy to a destination.
+
+    :param name: Name of the destination.
+    :param reason: Reason for error.
+    :param status: HTTP status code, if the destination is reached over HTTP.
+    """
+    super(DestinationException, self).__init__()
+    self.name = name
+    self.reason = reason
+    self.status = status
+
+  def __str__(self) -> str:
+    """Returns formatted message containing information about the exception.
+
+    :return: String with exception contents.
+    """
+    return f'DESTINATION_FAILURE: {self.name}, {self.reason}'
+
+  def __repr__(self) -> str:
+    """Returns name of exception class.
+
+    :return: name of exception class.
+    """
+    return 'DestinationException()'
+
+
+class Destination:
+  kind = ''
+
+  def __init__(self, name: str, cancel: Optional[threading.Event] = None):
+    """A place recordings are copied to after they were downloaded from Zoom.
+
+    :param name: name of the destination in the configuration file.
+    :param cancel: event that interrupts running copies, e.g. on shutdown.
+    """
+    self.name = name
+    self.cancel = cancel or threading.Event()
+
+  def store(self,
+            path: str,
+            name: str,
+            folder_id: str,
+            session: Dict[str, Any],
+            folder: Optional[str] = None) -> str:
+    """Copies a recording to the destination.
+
+    :param path: local file of the recording.
+    :param name: file name at the destination.
+    :param folder_id: Google Drive folder of the meeting.
+    :param session: state of the transfer, updated while it runs so that an interrupted transfer
+      can be resumed; empty for a new transfer.
+    :param folder: folder path of the recording relative to where the destination keeps the
+      recordings of the meeting, e.g. `Recordings/Standup/2018/06`.
+    :return: link to the copy.
+    :raises InterruptedError: if `cancel` was set before the copy was complete.
+    """
+    raise NotImplementedError
+
+
+class DriveDestination(Destination):
+  kind = 'drive'
+
+  def __init__(self, drive_conn: Optional[drive.DriveAPI], name: str = 'drive'):
+    """Uploads recordings to the Google Drive folder of their meeting.
+
+    :param drive_conn: API object instance for Google Drive, or None if it is not set up; storing
+      a recording fails then.
+    :param name: name of the destination.
+    """
+    super(DriveDestination, self).__init__(name, getattr(drive_conn, 'cancel', None))
+    self.drive_conn = drive_conn
+
+  def store(self,
+            path: str,
+            name: str,
+            folder_id: str,
+            session: Dict[str, Any],
+            folder: Optional[str] = None) -> str:
+    if self.drive_conn is None:
+      raise DestinationException(self.name, 'Google Drive is not set up')
+    if folder:
+      return self.drive_conn.upload_file(path, name, folder_id, session=session, folder=folder)
+    return self.drive_conn.upload_file(path, name, folder_id, session=session)
+
+
+class LocalDestination(Destination):
+  kind = 'local'
+
+  def __init__(self,
+               name: str,
+               path: str,
+               block_size: int = 8 * 1024 * 1024,
+               cancel: Optional[threading.Event] = None):
+    """Copies recordings into a folder, e.g. a NAS mount. A copy is written under a temporary
+    name, flushed to disk, and renamed, so the folder never contains a partial recording.
+
+    :param name: name of the destination.
+    :param path: folder the recordings are copied to; created if needed.
+    :param block_size: number of bytes copied at a time.
+    :param cancel: event that interrupts running copies.
+    """
+    super(LocalDestination, self).__init__(name, cancel)
+    self.path = path
+    self.engine = CopyEngine(block_size=block_size, cancel=self.cancel)
+
+  def store(self,
+            path: str,
+            name: str,
+            folder_id: str,
+            session: Dict[str, Any],
+            folder: Optional[str] = None) -> str:
+    directory = os.path.join(self.path, *drive.split_path(folder)) if folder else self.path
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, name)
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+    tracked = progress.track(name, 'upload', self.name, size)
+    with tracing.span('local.store', file=name, bytes=size), tracked as transfer:
+      try:
+        with open(path, 'rb') as source:
+          self.engine.copy(source, target + '.part', size, progress=transfer.update)
+        with open(target + '.part', 'rb') as f:
+          os.fsync(f.fileno())
+      except InterruptedError:
+        raise
+      except OSError as e:
+        raise DestinationException(self.name, f'Copy to {target} failed: {e}')
+      os.replace(target + '.part', target)
+
+    elapsed = time.perf_counter() - start
+    metrics.STAGE_SECONDS.labels(f'store_{self.kind}').observe(elapsed)
+    log.log(logging.INFO, f'File {path} copied to {target}')
+    return target
@@ -0,0 +1,137 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import concurrent.futures
+import logging
+import threading
+from typing import cast, Any, Dict, List, Optional, Tuple
+
+from zoom_drive_connector.monitoring import tracing
+
+from .destination import Destination, LocalDestination
+from .s3_destination import DEFAULT_PART_SIZE, S3Destination
+
+log = logging.getLogger('app')
+
+
+def create_destinations(settings: Dict[str, Dict[str, Any]],
+                        cancel: Optional[threading.Event] = None) -> Dict[str, Destination]:
+  """Creates the destinations of the `destinations` section of the configuration file. Google
+  Drive is always available as `drive` and is not part of the section.
+
+  :param settings: mapping of destination names to their settings.
+  :param cancel: event that interrupts the copies of all destinations.
+  :return: destinations by name.
+  """
+  destinations = {}  # type: Dict[str, Destination]
+  for name, options in (settings or {}).items():
+    if options['type'] == 'local':
+      destinations[name] = LocalDestination(name, str(options['path']), cancel=cancel)
+    elif options['type'] == 's3':
+      destinations[name] = S3Destination(
+          name, str(options['endpoint']), str(options['bucket']), str(options['access_key']),
+          str(options['secret_key']), region=str(options.get('region', 'us-east-1')),
+          prefix=str(options.get('prefix', '')),
+          part_size=int(options.get('part_size', DEFAULT_PART_SIZE)), cancel=cancel)
+    else:
+      raise ValueError(f'Destination {name} has unknown type {options["type"]!r}.')
+  return destinations
+
+
+class FanOut:
+  def __init__(self, workers: int = 4):
+    """Copies one downloaded recording to several destinations in parallel. The first
+    destination is handled by the calling thread and the others by a shared pool, so a meeting
+    with a single destination does not involve another thread.
+
+    :param workers: number of threads serving the additional destinations.
+    """
+    self.workers = max(1, workers)
+    self._executor = None  # type: Optional[concurrent.futures.ThreadPoolExecutor]
+    self._lock = threading.Lock()
+
+  def configure(self, workers: int):
+    """Changes the number of threads. Copies that are running are not affected.
+
+    :param workers: number of threads serving the additional destinations.
+    """
+    with self._lock:
+      self.workers = max(1, workers)
+      if self._executor is not None:
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+  def _pool(self) -> concurrent.futures.ThreadPoolExecutor:
+    with self._lock:
+      if self._executor is None:
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='destination')
+      return self._executor
+
+  @staticmethod
+  def _store(destination: Destination,
+             file: Dict[str, Any],
+             session: Dict[str, Any],
+             span: tracing.Span) -> Tuple[Optional[str], Optional[BaseException]]:
+    try:
+      # Only recordings of meetings with a `folder` path pass one on.
+      extra = {'folder': file['folder']} if file.get('folder') else {}
+      with tracing.activate(span):
+        return destination.store(file['file'], file['name'], file['folder_id'], session,
+                                 **extra), None
+    except Exception as e:  # pylint: disable=broad-except
+      return None, e
+
+  def store(self, file: Dict[str, Any], destinations: List[Destination]) -> Dict[str, str]:
+    """Copies a recording to every destination it has not been copied to yet. The links of the
+    copies are added to `file['stored']` and the state of unfinished transfers is kept in
+    `file['upload_sessions']`, so a retry only repeats what did not complete.
+
+    :param file: file dictionary as returned by `download_meeting`.
+    :param destinations: destinations of the meeting.
+    :return: links to the copies by destination name.
+    :raises InterruptedError: if a copy was interrupted.
+    :raises Exception: the error of the first destination that failed, after the others finished.
+    """
+    stored = file.setdefault('stored', {})  # type: Dict[str, str]
+    sessions = file.setdefault('upload_sessions', {})  # type: Dict[str, Dict[str, Any]]
+    pending = [d for d in destinations if d.name not in stored]
+    if not pending:
+      return stored
+
+    span = file.get('span', tracing.NOOP_SPAN)
+    futures = [(d, self._pool().submit(self._store, d, file, sessions.setdefault(d.name, {}),
+                                       span)) for d in pending[1:]]
+    results = [(pending[0], self._store(pending[0], file, sessions.setdefault(pending[0].name, {}),
+                                        span))]
+    results.extend((d, future.result()) for d, future in futures)
+
+    errors = []  # type: List[BaseException]
+    for destination, (link, error) in results:
+      if error is None:
+        stored[destination.name] = cast(str, link)
+        sessions.pop(destination.name, None)
+      elif not isinstance(error, InterruptedError):
+        if len(results) > 1:
+          log.log(logging.ERROR, f'Copying {file["file"]} to {destination.name} failed: {error}')
+        errors.append(error)
+      else:
+        errors.insert(0, error)
+    if errors:
+      raise errors[0]
+    return stored
+
+
+FAN_OUT = FanOut()
@@ -0,0 +1,233 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import hashlib
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+import urllib.parse
+from typing import Any, Dict, Optional
+
+import requests
+
+from zoom_drive_connector import drive
+from zoom_drive_connector.monitoring import metrics, progress, tracing
+
+from .destination import Destination, DestinationException
+
+log = logging.getLogger('app')
+
+# S3 requires every part of a multipart upload except the last to be at least 5 MiB.
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 16 * 1024 * 1024
+
+
+def _quote(value: str, safe: str = '') -> str:
+  return urllib.parse.quote(value, safe='-_.~' + safe)
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+  return hmac.new(key, message.encode('utf-8'), hashlib.sha256).digest()
+
+
+class S3Destination(Destination):
+  kind = 's3'
+
+  def __init__(self,
+               name: str,
+               endpoint: str,
+               bucket: str,
+               access_key: str,
+               secret_key: str,
+               region: str = 'us-east-1',
+               prefix: str = '',
+               part_size: int = DEFAULT_PART_SIZE,
+               timeout: float = 300.0,
+               cancel: Optional[threading.Event] = None):
+    """Uploads recordings to a bucket of an S3-compatible object store such as AWS S3 or MinIO.
+    Requests are signed with AWS Signature Version 4 and use path-style URLs, which every
+    S3-compatible store supports. Recordings larger than `part_size` are sent as a multipart
+    upload whose ID and finished parts are kept in the transfer session, so an interrupted upload
+    only sends the missing parts.
+
+    :param name: name of the destination.
+    :param endpoint: base URL of the store, e.g. `https://s3.eu-west-1.amazonaws.com`.
+    :param bucket: bucket the recordings are stored in.
+    :param access_key: access key ID.
+    :param secret_key: secret access key.
+    :param region: region used in the signature; MinIO accepts the default.
+    :param prefix: prepended to the file name to form the object key, e.g. `zoom/`.
+    :param part_size: size of the parts of a multipart upload in bytes.
+    :param timeout: number of seconds to wait for a response.
+    :param cancel: event that interrupts running uploads after the current part.
+    """
+    super(S3Destination, self).__init__(name, cancel)
+    parsed = urllib.parse.urlsplit(endpoint)
+    self.origin = f'{parsed.scheme}://{parsed.netloc}'
+    self.host = parsed.netloc
+    self.base_path = parsed.path.rstrip('/')
+    self.bucket = bucket
+    self.access_key = access_key
+    self.secret_key = secret_key
+    self.region = region
+    self.prefix = prefix
+    self.part_size = max(MIN_PART_SIZE, int(part_size))
+    self.timeout = timeout
+    self._local = threading.local()
+
+  def _session(self) -> requests.Session:
+    session = getattr(self._local, 'session', None)
+    if session is None:
+      session = requests.Session()
+      self._local.session = session
+    return session
+
+  def _sign(self, method: str, path: str, query: str, payload_hash: str) -> Dict[str, str]:
+    """Returns the headers of a request signed with AWS Signature Version 4.
+
+    :param method: HTTP method.
+    :param path: URL-encoded path of the request.
+    :param query: canonical query string.
+    :param payload_hash: hex SHA-256 digest of the request body.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+    scope = f'{now.strftime("%Y%m%d")}/{self.region}/s3/aws4_request'
+    headers = {'host': self.host, 'x-amz-content-sha256': payload_hash, 'x-amz-date': amz_date}
+    signed_headers = ';'.join(sorted(headers))
+    canonical_request = '\n'.join([
+        method, path, query, ''.join(f'{k}:{headers[k]}\n' for k in sorted(headers)),
+        signed_headers, payload_hash])
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256', amz_date, scope,
+        hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()])
+
+    key = ('AWS4' + self.secret_key).encode('utf-8')
+    for part in scope.split('/'):
+      key = _hmac(key, part)
+    signature = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    del headers['host']
+    headers['authorization'] = (f'AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, '
+                                f'SignedHeaders={signed_headers}, Signature={signature}')
+    return headers
+
+  def _request(self,
+               method: str,
+               key: str,
+               query: Optional[Dict[str, str]] = None,
+               data: bytes = b'') -> requests.Response:
+    """Sends a signed request for an object of the bucket.
+
+    :param method: HTTP method.
+    :param key: object key.
+    :param query: query parameters.
+    :param data: request body.
+    :return: the response.
+    :raises DestinationException: if the store answers with an error.
+    """
+    path = f'{self.base_path}/{_quote(self.bucket)}/{_quote(key, "/")}'
+    query_string = '&'.join(f'{_quote(k)}={_quote(v)}' for k, v in sorted((query or {}).items()))
+    headers = self._sign(method, path, query_string, hashlib.sha256(data).hexdigest())
+    url = self.origin + path + ('?' + query_string if query_string else '')
+    response = self._session().request(method, url, data=data, headers=headers,
+                                       timeout=self.timeout)
+    # Completing a multipart upload can fail after the store answered with 200.
+    if response.status_code >= 300 or (method == 'POST' and b'<Error>' in response.content):
+      metrics.API_ERRORS.labels('s3', str(response.status_code)).inc()
+      code = re.search(r'<Code>([^<]*)</Code>', response.text)
+      raise DestinationException(self.name, f'{method} {key} failed with status '
+                                            f'{response.status_code}'
+                                            f'{" (" + code.group(1) + ")" if code else ""}.',
+                                 response.status_code)
+    return response
+
+  def _multipart(self,
+                 path: str,
+                 key: str,
+                 size: int,
+                 session: Dict[str, Any],
+                 transfer: progress.TransferProgress):
+    """Uploads a file in parts, skipping the parts listed in `session`."""
+    if not session.get('upload_id'):
+      response = self._request('POST', key, {'uploads': ''})
+      match = re.search(r'<UploadId>([^<]+)</UploadId>', response.text)
+      if not match:
+        raise DestinationException(self.name, f'No upload ID returned for {key}.')
+      session.update(upload_id=match.group(1), parts={})
+    upload_id = session['upload_id']
+    parts = session.setdefault('parts', {})  # type: Dict[str, str]
+
+    count = -(-size // self.part_size)
+    with open(path, 'rb') as f:
+      for number in range(1, count + 1):
+        if str(number) in parts:
+          continue
+        if self.cancel.is_set():
+          raise InterruptedError(f'Upload of {path} to {self.name} interrupted after '
+                                 f'{len(parts)} of {count} parts.')
+        f.seek((number - 1) * self.part_size)
+        with tracing.span('s3.upload_part'):
+          response = self._request('PUT', key, {'partNumber': str(number), 'uploadId': upload_id},
+                                   f.read(self.part_size))
+        parts[str(number)] = response.headers.get('ETag', '')
+        transfer.update(min(size, len(parts) * self.part_size))
+
+    body = ''.join(f'<Part><PartNumber>{n}</PartNumber><ETag>{parts[str(n)]}</ETag></Part>'
+                   for n in range(1, count + 1))
+    self._request('POST', key, {'uploadId': upload_id},
+                  f'<CompleteMultipartUpload>{body}</CompleteMultipartUpload>'.encode('utf-8'))
+
+  def store(self,
+            path: str,
+            name: str,
+            folder_id: str,
+            session: Dict[str, Any],
+            folder: Optional[str] = None) -> str:
+    key = self.prefix + ''.join(f'{part}/' for part in drive.split_path(folder or '')) + name
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+    # Parts finished before an interruption do not count towards the rate.
+    offset = min(size, len(session.get('parts') or {}) * self.part_size)
+    tracked = progress.track(name, 'upload', self.name, size, offset)
+    with tracing.span('s3.upload', file=name, bytes=size), tracked as transfer:
+      if size <= self.part_size:
+        if self.cancel.is_set():
+          raise InterruptedError(f'Upload of {path} to {self.name} interrupted.')
+        with open(path, 'rb') as f:
+          self._request('PUT', key, data=f.read())
+        transfer.update(size)
+      else:
+        resumed = bool(session.get('upload_id'))
+        try:
+          self._multipart(path, key, size, session, transfer)
+        except DestinationException as e:
+          if e.status != 404 or not resumed:
+            raise
+          # The store dropped the multipart upload, e.g. because it expired.
+          log.log(logging.WARNING, f'Multipart upload of {path} to {self.name} expired, '
+                                   'starting over.')
+          session.clear()
+          self._multipart(path, key, size, session, transfer)
+      session.clear()
+
+    elapsed = time.perf_counter() - start
+    metrics.STAGE_SECONDS.labels(f'store_{self.kind}').observe(elapsed)
+    log.log(logging.INFO, f'File {path} uploaded to {self.name} as {key}')
+    return f'{self.origin}{self.base_path}/{_quote(self.bucket)}/{_quote(key, "/")}'
@@ -15,3 +15,5 @@
 
 from .drive_api import DriveAPI
 from .drive_api_exception import DriveAPIException
+from .folder_resolver import FolderResolver, split_path
+from .async_drive_api import AsyncDriveAPI
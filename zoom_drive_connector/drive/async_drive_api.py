@@ -0,0 +1,183 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Union
+
+from zoom_drive_connector.aio import ConnectionPool, HTTPStatusError, Response
+from zoom_drive_connector.monitoring import metrics, progress, tracing
+from zoom_drive_connector.monitoring.startup import lazy_import
+
+from .drive_api import DriveAPI
+from .drive_api_exception import DriveAPIException
+
+log = logging.getLogger('app')
+
+API_ROOT = 'https://www.googleapis.com'
+# Drive expects chunks of resumable uploads in multiples of 256 KiB.
+CHUNK_ALIGNMENT = 256 * 1024
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class AsyncDriveAPI:
+  def __init__(self, drive_api: DriveAPI, pool: ConnectionPool):
+    """Asyncio counterpart of `DriveAPI.upload_file` for the asyncio engine. Recordings are sent
+    with Drive's resumable upload protocol over `pool`, in chunks of `upload_chunk_size` bytes
+    that are read from disk in the executor. It shares the credentials, the folder resolver, the
+    cancel event, and the format of the upload sessions with `drive_api`, so an upload that was
+    interrupted in one engine is resumed by the other.
+
+    :param drive_api: blocking client, set up with `setup()`.
+    :param pool: connection pool shared by all asyncio clients.
+    """
+    self.drive_api = drive_api
+    self.pool = pool
+    self.api_root = str(drive_api.drive_config.get('api_root') or API_ROOT).rstrip('/')
+    chunk_size = int(drive_api.drive_config.get('upload_chunk_size', DEFAULT_CHUNK_SIZE))
+    self.chunk_size = max(1, chunk_size // CHUNK_ALIGNMENT) * CHUNK_ALIGNMENT
+    self._token_lock = asyncio.Lock()
+
+  async def _executor(self, fn: Callable, *args) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+  async def token(self) -> str:
+    """Returns the OAuth access token, refreshing the credentials in the executor once they
+    expired.
+    """
+    credentials = self.drive_api.credentials
+    if credentials is None:
+      raise DriveAPIException(name='Service error', reason='setup() method not called.')
+    async with self._token_lock:
+      if not credentials.valid:
+        request = lazy_import('google.auth.transport.requests').Request()
+        await self._executor(credentials.refresh, request)
+    return credentials.token
+
+  async def _error(self, res: Response) -> HTTPStatusError:
+    metrics.API_ERRORS.labels('drive', str(res.status)).inc()
+    return HTTPStatusError(res.status, res.reason, await res.read())
+
+  async def _create_session(self, name: str, parent_id: str, size: int) -> str:
+    metadata = json.dumps({'name': name, 'parents': [parent_id]}).encode('utf-8')
+    with tracing.span('drive.create_session'):
+      async with await self.pool.request(
+          'POST', f'{self.api_root}/upload/drive/v3/files',
+          headers={'authorization': 'Bearer ' + await self.token(),
+                   'content-type': 'application/json; charset=UTF-8',
+                   'x-upload-content-type': 'video/mp4',
+                   'x-upload-content-length': str(size)},
+          body=metadata,
+          params={'uploadType': 'resumable', 'supportsTeamDrives': 'true',
+                  'fields': 'webViewLink'}) as res:
+        if res.status >= 300 or not res.headers.get('location'):
+          raise await self._error(res)
+        await res.read()
+        return res.headers['location']
+
+  async def _put(self, uri: str, content_range: str, body: bytes) -> Union[int, str]:
+    """Sends one chunk, or asks for the progress of the session if `body` is empty.
+
+    :return: the link of the file once Drive has all of it, otherwise the number of bytes Drive
+      received.
+    """
+    async with await self.pool.request(
+        'PUT', uri, headers={'authorization': 'Bearer ' + await self.token(),
+                             'content-range': content_range}, body=body) as res:
+      if res.status in (200, 201):
+        # The last chunk is answered with the metadata of the file.
+        return (await res.json()).get('webViewLink') or ''
+      if res.status != 308:
+        raise await self._error(res)
+      await res.read()
+      received = res.headers.get('range', '')
+      return int(received.rsplit('-', 1)[-1]) + 1 if received else 0
+
+  @staticmethod
+  def _read_chunk(f, offset: int, length: int) -> bytes:
+    f.seek(offset)
+    return f.read(length)
+
+  async def upload_file(self,
+                        file_path: str,
+                        name: str,
+                        folder_id: str,
+                        session: Optional[Dict[str, Any]] = None,
+                        folder: Optional[str] = None) -> str:
+    """Same as `DriveAPI.upload_file`.
+
+    :param file_path: Path to file to upload to Google Drive.
+    :param name: Final name of the file
+    :param folder_id: The Google Drive folder to upload the file to
+    :param session: resumable upload session, updated after every chunk with the session `uri`
+      and the number of bytes Drive confirmed (`progress`).
+    :param folder: path of a folder below `folder_id` to upload to instead; missing folders are
+      created.
+    :return: The url of the file in Google Drive.
+    :raises InterruptedError: if `cancel` was set before the upload finished.
+    :raises HTTPStatusError: if Drive answered with an error.
+    """
+    if not file_path or not os.path.exists(file_path):
+      raise DriveAPIException(name='File error', reason=f'{file_path} could not be found.')
+
+    session = session if session is not None else {}
+    parent_id = folder_id
+    if folder:
+      parent_id = await self._executor(self.drive_api.folders.resolve, folder_id, folder)
+    size = os.path.getsize(file_path)
+    cancel = self.drive_api.cancel
+
+    offset = 0  # type: Union[int, str]
+    if session.get('uri'):
+      # Ask Drive how much of the file it received before sending the next chunk.
+      log.log(logging.INFO, f'Resuming upload of {file_path}.')
+      try:
+        offset = await self._put(session['uri'], f'bytes */{size}', b'')
+      except HTTPStatusError as e:
+        if e.status not in (404, 410):
+          raise
+        log.log(logging.WARNING, f'Upload session of {file_path} expired, starting over.')
+        session.clear()
+    if not session.get('uri'):
+      session.update(uri=await self._create_session(name, parent_id, size), progress=0)
+
+    start = time.perf_counter()
+    f = await self._executor(open, file_path, 'rb')
+    tracked = progress.track(name, 'upload', 'drive', size,
+                             offset if isinstance(offset, int) else size)
+    try:
+      with tracing.span('drive.upload', file=name, bytes=size), tracked as transfer:
+        while not isinstance(offset, str):
+          if cancel.is_set():
+            raise InterruptedError(f'Upload of {file_path} interrupted after {offset} bytes.')
+          chunk = await self._executor(self._read_chunk, f, offset, self.chunk_size)
+          end = offset + len(chunk)
+          content_range = f'bytes {offset}-{end - 1}/{size}' if chunk else f'bytes */{size}'
+          with tracing.span('drive.upload_chunk'):
+            offset = await self._put(session['uri'], content_range, chunk)
+          if isinstance(offset, int):
+            session.update(progress=offset)
+          transfer.update(size if isinstance(offset, str) else offset)
+    finally:
+      f.close()
+
+    elapsed = time.perf_counter() - start
+    metrics.STAGE_SECONDS.labels('upload').observe(elapsed)
+    metrics.observe_transfer('upload', size, elapsed)
+    log.log(logging.INFO, f'File {file_path} uploaded to Google Drive')
+    return offset
@@ -13,36 +13,60 @@
 # limitations under the License.
 # ==============================================================================
 
+import functools
+import json
 import os
 import logging
-from typing import TypeVar, cast
-
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+import threading
+import time
+from typing import Any, Dict, Optional, TypeVar, cast
 
 from zoom_drive_connector.configuration import DriveConfig, SystemConfig, APIConfigBase
+from zoom_drive_connector.monitoring import metrics, progress, tracing
+from zoom_drive_connector.monitoring.startup import lazy_import
 
 from .drive_api_exception import DriveAPIException
+from .folder_resolver import FolderResolver
 
 log = logging.getLogger('app')
 S = TypeVar("S", bound=APIConfigBase)
 
 
+@functools.lru_cache(maxsize=None)
+def load_discovery_document(path: Optional[str] = None) -> Optional[str]:
+  """Returns the Drive v3 discovery document without a network request. The document is read
+  once per process, either from `path` or from the copy bundled with `google-api-python-client`.
+
+  :param path: local copy of the discovery document.
+  :return: the discovery document as a JSON string, or None if no local copy is available.
+  """
+  if path and os.path.exists(path):
+    with open(path, 'r', encoding='utf-8') as f:
+      return f.read()
+  discovery_cache = lazy_import('googleapiclient.discovery_cache')
+  return discovery_cache.get_static_doc('drive', 'v3')
+
+
 class DriveAPI:
-  def __init__(self, drive_config: S, sys_config: S):
+  def __init__(self, drive_config: S, sys_config: S, cancel: Optional[threading.Event] = None):
     """Initializes instance of DriveAPI class.
 
     :param drive_config: configuration class containing all parameters needed for Google Drive.
     :param sys_config: configuration class containing all system related parameters.
+    :param cancel: event that interrupts running uploads after the current chunk, e.g. on
+      shutdown.
     """
     self.drive_config = cast(DriveConfig, drive_config)
     self.sys_config = cast(SystemConfig, sys_config)
 
     self._scopes = ['https://www.googleapis.com/auth/drive.file']
     self._service = None
+    self._build_service = None
+    self._local = threading.local()
+    self._folders = None  # type: Optional[FolderResolver]
+    # OAuth credentials of the service, e.g. for `AsyncDriveAPI`.
+    self.credentials = None
+    self.cancel = cancel or threading.Event()
 
     self.setup()
 
@@ -50,33 +74,115 @@ class DriveAPI:
     """Triggers the OAuth2 setup flow for Google API endpoints. Requires the ability to open
     a link within a web browser in order to work.
     """
+    # The Google client libraries take a large part of the startup time, so they are only
+    # imported once Drive is set up.
+    credentials = lazy_import('google.oauth2.credentials')
+    discovery = lazy_import('googleapiclient.discovery')
+
     creds = None
     if os.path.exists(self.drive_config.credentials_json):
-        creds = Credentials.from_authorized_user_file(
+        creds = credentials.Credentials.from_authorized_user_file(
           self.drive_config.credentials_json, self._scopes
         )
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+            creds.refresh(lazy_import('google.auth.transport.requests').Request())
         else:
-            flow = InstalledAppFlow.from_client_secrets_file(
+            oauth_flow = lazy_import('google_auth_oauthlib.flow')
+            flow = oauth_flow.InstalledAppFlow.from_client_secrets_file(
                 self.drive_config.client_secret_json, self._scopes
             )
             creds = flow.run_local_server(port=0)
         with open(self.drive_config.credentials_json, 'w') as token:
             token.write(creds.to_json())
 
-    self._service = build('drive', 'v3', credentials=creds)
+    self.credentials = creds
+    document = load_discovery_document(self.drive_config.get('discovery_document'))
+    if document is None:
+      # No local copy, fetch the document from Google.
+      self._build_service = functools.partial(discovery.build, 'drive', 'v3', credentials=creds)
+    else:
+      parsed = json.loads(document)  # type: Dict
+      api_root = self.drive_config.get('api_root')
+      if api_root:
+        # Both metadata and media upload URLs are derived from `rootUrl`, so rewriting it in the
+        # discovery document points all requests to a different server (e.g. a local stand-in).
+        parsed['rootUrl'] = api_root.rstrip('/') + '/'
+      self._build_service = functools.partial(discovery.build_from_document, parsed,
+                                              credentials=creds)
+    self._service = self.service()
 
     log.log(logging.INFO, 'Drive connection established.')
 
-  def upload_file(self, file_path: str, name: str, folder_id: str) -> str:
+  def service(self):
+    """Returns the Drive service object of the calling thread. The HTTP connection used by the
+    Google client is not thread-safe, so every thread that uploads gets its own service object.
+    All of them share the same credentials.
+
+    :return: Drive v3 service, or None if `setup()` has not been run.
+    """
+    if self._build_service is None:
+      return None
+    service = getattr(self._local, 'service', None)
+    if service is None:
+      service = self._build_service()
+      self._local.service = service
+    return service
+
+  @property
+  def folders(self) -> FolderResolver:
+    """Resolver for the folder paths of meetings. The folder IDs are cached in `folder_cache`,
+    by default `drive_folders.json` in the download folder, and checked again after
+    `folder_cache_ttl` seconds.
+    """
+    if self._folders is None:
+      cache_file = self.drive_config.get(
+          'folder_cache', os.path.join(str(self.sys_config.target_folder), 'drive_folders.json'))
+      self._folders = FolderResolver(self, cache_file,
+                                     float(self.drive_config.get('folder_cache_ttl', 86400)))
+    return self._folders
+
+  def find_file(self, name: str, folder_id: str) -> Optional[str]:
+    """Looks up a file by name in a Google Drive folder, e.g. to skip recordings that were
+    uploaded before.
+
+    :param name: exact name of the file.
+    :param folder_id: the Google Drive folder to search.
+    :return: the url of the first matching file, or None if there is none.
+    """
+    if self._service is None:
+      raise DriveAPIException(name='Service error', reason='setup() method not called.')
+
+    escaped = name.replace('\\', '\\\\').replace("'", "\\'")
+    query = f"name = '{escaped}' and '{folder_id}' in parents and trashed = false"
+    # pylint: disable=no-member
+    with tracing.span('drive.find_file', file=name):
+      response = self.service().files().list(q=query,
+                                             fields='files(id, webViewLink)',
+                                             pageSize=1,
+                                             supportsTeamDrives=True,
+                                             includeTeamDriveItems=True).execute()
+    files = response.get('files', [])
+    return files[0].get('webViewLink') if files else None
+
+  def upload_file(self,
+                  file_path: str,
+                  name: str,
+                  folder_id: str,
+                  session: Optional[Dict[str, Any]] = None,
+                  folder: Optional[str] = None) -> str:
     """Uploads the given file to the specified folder id in Google Drive.
 
     :param file_path: Path to file to upload to Google Drive.
     :param name: Final name of the file
     :param folder_id: The Google Drive folder to upload the file to
+    :param session: resumable upload session, updated after every chunk with the session `uri`
+      and the number of bytes Drive confirmed (`progress`). If it already holds a session, e.g.
+      from an interrupted upload, the upload continues where Drive stopped receiving.
+    :param folder: path of a folder below `folder_id` to upload to instead, e.g.
+      `Recordings/Standup/2018/06`; missing folders are created.
     :return: The url of the file in Google Drive.
+    :raises InterruptedError: if `cancel` was set before the upload finished.
     """
 
     if self._service is None:
@@ -89,28 +195,69 @@ class DriveAPI:
           name='File error', reason=f'{file_path} could not be found.')
 
     # Google Drive file metadata
-    metadata = {'name': name, 'parents': [folder_id]}
+    parent_id = self.folders.resolve(folder_id, folder) if folder else folder_id
+    metadata = {'name': name, 'parents': [parent_id]}
 
-    # Create a new upload of the recording and execute it.
-    media = MediaFileUpload(file_path,
-      mimetype='video/mp4',
-      chunksize=1024*1024,
-      resumable=True
-    )
+    errors = lazy_import('googleapiclient.errors')
+
+    # Create a new upload of the recording and execute it. By default the recording is
+    # memory-mapped and sent without copying its chunks.
+    if self.drive_config.get('mmap_upload', True):
+      media = lazy_import('zoom_drive_connector.drive.mmap_upload').MmapMediaUpload(
+          file_path, mimetype='video/mp4', chunksize=1024 * 1024)
+    else:
+      media = lazy_import('googleapiclient.http').MediaFileUpload(file_path,
+        mimetype='video/mp4',
+        chunksize=1024*1024,
+        resumable=True
+      )
 
     # pylint: disable=no-member
-    request =  self._service.files().create(body=metadata,
+    request =  self.service().files().create(body=metadata,
       media_body=media,
       fields='webViewLink',
      supportsTeamDrives=True
     )
-    response = None
-    while response is None:
-      status, response = request.next_chunk()
-      if status:
-        print(f"Uploaded {int(status.progress() * 100)}%")
-    uploaded_file = request.execute()
+    resumed = bool(session and session.get('uri'))
+    if resumed:
+      # Ask Drive how much of the file it received before sending the next chunk. Sessions are
+      # valid for a week.
+      request.resumable_uri = session['uri']
+      request.resumable_progress = int(session.get('progress', 0))
+      request._in_error_state = True  # pylint: disable=protected-access
+      log.log(logging.INFO, f'Resuming upload of {file_path}.')
+    size = os.path.getsize(file_path)
+    start = time.perf_counter()
+    tracked = progress.track(name, 'upload', 'drive', size, request.resumable_progress)
+    try:
+      with tracing.span('drive.upload', file=name, bytes=size), tracked as transfer:
+        response = None
+        while response is None:
+          if self.cancel.is_set():
+            raise InterruptedError(f'Upload of {file_path} interrupted after '
+                                   f'{request.resumable_progress} bytes.')
+          with tracing.span('drive.upload_chunk'):
+            _, response = request.next_chunk()
+          if session is not None and request.resumable_uri:
+            session.update(uri=request.resumable_uri, progress=request.resumable_progress)
+          transfer.update(size if response is not None else request.resumable_progress)
+        # The last chunk is answered with the metadata of the file.
+        uploaded_file = response
+    except errors.HttpError as e:
+      metrics.API_ERRORS.labels('drive', str(e.resp.status)).inc()
+      if resumed and e.resp.status in (404, 410):
+        log.log(logging.WARNING, f'Upload session of {file_path} expired, starting over.')
+        session.clear()
+        return self.upload_file(file_path, name, folder_id, session, folder)
+      raise
+    finally:
+      # Unmap the recording now rather than when the request is garbage collected.
+      if hasattr(media, 'close'):
+        media.close()
 
+    elapsed = time.perf_counter() - start
+    metrics.STAGE_SECONDS.labels('upload').observe(elapsed)
+    metrics.observe_transfer('upload', size, elapsed)
     log.log(logging.INFO, f'File {file_path} uploaded to Google Drive')
 
     # Return the url to the file that was just uploaded.
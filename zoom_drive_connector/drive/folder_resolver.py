@@ -0,0 +1,217 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from zoom_drive_connector.monitoring import tracing
+from zoom_drive_connector.monitoring.startup import lazy_import
+
+from .drive_api_exception import DriveAPIException
+
+log = logging.getLogger('app')
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+# Drive rejects batches of more than 100 requests.
+BATCH_LIMIT = 100
+
+
+def _escape(name: str) -> str:
+  return name.replace('\\', '\\\\').replace("'", "\\'")
+
+
+def split_path(path: str) -> List[str]:
+  """Splits a folder path such as `Recordings/Standup/2018/06` into its folder names. Empty names,
+  e.g. from leading or doubled slashes, are dropped.
+
+  :param path: folder path separated by slashes.
+  """
+  return [name.strip() for name in path.split('/') if name.strip()]
+
+
+class FolderResolver:
+  def __init__(self, drive_conn: Any, cache_file: Optional[str] = None, ttl: float = 86400.0):
+    """Maps folder paths below a Google Drive folder to folder IDs, creating the folders that do
+    not exist yet. Every folder is looked up once by name and parent; the ID is kept in memory
+    and in `cache_file`, so a restart does not repeat the lookups. An ID that is older than `ttl`
+    seconds is checked again before it is used, in case the folder was moved to the trash.
+    Lookups and creations are serialized, so two workers never create the same folder twice.
+
+    :param drive_conn: `DriveAPI` instance whose service is used for the requests.
+    :param cache_file: JSON file the IDs are kept in; memory only if not given.
+    :param ttl: seconds after which a cached ID is checked again.
+    """
+    self.drive_conn = drive_conn
+    self.cache_file = cache_file
+    self.ttl = ttl
+    self._folders = {}  # type: Dict[str, Tuple[str, float]]
+    self._lock = threading.Lock()
+    self._create_lock = threading.Lock()
+    self._load()
+
+  def _load(self):
+    if not self.cache_file or not os.path.exists(self.cache_file):
+      return
+    try:
+      with open(self.cache_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+      self._folders = {key: (str(entry['id']), float(entry['checked']))
+                       for key, entry in data.get('folders', {}).items()}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+      log.log(logging.WARNING, f'Ignoring folder cache {self.cache_file}: {e}')
+
+  def _save(self):
+    if not self.cache_file:
+      return
+    data = {'folders': {key: {'id': folder_id, 'checked': checked}
+                        for key, (folder_id, checked) in self._folders.items()}}
+    try:
+      with open(self.cache_file + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+      os.replace(self.cache_file + '.tmp', self.cache_file)
+    except OSError as e:
+      log.log(logging.WARNING, f'Could not write folder cache {self.cache_file}: {e}')
+
+  def _cached(self, key: str, fresh: bool = True) -> Optional[str]:
+    with self._lock:
+      entry = self._folders.get(key)
+    if entry is None or (fresh and time.time() - entry[1] >= self.ttl):
+      return None
+    return entry[0]
+
+  def _remember(self, key: str, folder_id: Optional[str]):
+    with self._lock:
+      if folder_id is None:
+        self._folders.pop(key, None)
+      else:
+        self._folders[key] = (folder_id, time.time())
+      self._save()
+
+  def resolve(self, parent_id: str, path: str, create: bool = True) -> Optional[str]:
+    """Returns the ID of the folder at `path` below `parent_id`.
+
+    :param parent_id: ID of the Google Drive folder the path starts at.
+    :param path: folder path separated by slashes, e.g. `Recordings/Standup/2018/06`.
+    :param create: create the folders that do not exist.
+    :return: the folder ID, `parent_id` itself for an empty path, or None if a folder does not
+      exist and `create` is false.
+    """
+    current = parent_id
+    for name in split_path(path):
+      child = self._child(current, name, create)
+      if child is None:
+        return None
+      current = child
+    return current
+
+  def _child(self, parent_id: str, name: str, create: bool) -> Optional[str]:
+    key = f'{parent_id}/{name}'
+    folder_id = self._cached(key)
+    if folder_id is not None:
+      return folder_id
+
+    with self._create_lock:
+      # Another worker may have resolved the folder while this one waited.
+      folder_id = self._cached(key)
+      if folder_id is not None:
+        return folder_id
+      stale = self._cached(key, fresh=False)
+      if stale is not None and self._exists(stale):
+        folder_id = stale
+      else:
+        folder_id = self._find(parent_id, name)
+        if folder_id is None and create:
+          folder_id = self._create(parent_id, name)
+      self._remember(key, folder_id)
+      return folder_id
+
+  def _exists(self, folder_id: str) -> bool:
+    errors = lazy_import('googleapiclient.errors')
+    # pylint: disable=no-member
+    try:
+      with tracing.span('drive.get_folder'):
+        response = self.drive_conn.service().files().get(fileId=folder_id,
+                                                         fields='id, trashed',
+                                                         supportsTeamDrives=True).execute()
+    except errors.HttpError as e:
+      if e.resp.status == 404:
+        return False
+      raise
+    return not response.get('trashed')
+
+  def _find(self, parent_id: str, name: str) -> Optional[str]:
+    query = (f"name = '{_escape(name)}' and '{parent_id}' in parents and "
+             f"mimeType = '{FOLDER_MIME_TYPE}' and trashed = false")
+    # pylint: disable=no-member
+    with tracing.span('drive.find_folder'):
+      response = self.drive_conn.service().files().list(q=query,
+                                                        fields='files(id)',
+                                                        pageSize=1,
+                                                        supportsTeamDrives=True,
+                                                        includeTeamDriveItems=True).execute()
+    files = response.get('files', [])
+    return files[0]['id'] if files else None
+
+  def _create(self, parent_id: str, name: str) -> str:
+    metadata = {'name': name, 'mimeType': FOLDER_MIME_TYPE, 'parents': [parent_id]}
+    # pylint: disable=no-member
+    with tracing.span('drive.create_folder'):
+      response = self.drive_conn.service().files().create(body=metadata,
+                                                          fields='id',
+                                                          supportsTeamDrives=True).execute()
+    log.log(logging.INFO, f'Created Google Drive folder {name} in {parent_id}.')
+    return response['id']
+
+  def validate(self, folder_ids: Iterable[str]):
+    """Checks that every ID belongs to a folder that exists, is not in the trash, and can be
+    accessed, e.g. the folders of all configured meetings at startup. The folders are fetched in
+    batches of up to `BATCH_LIMIT`, so a typical configuration takes a single request.
+
+    :param folder_ids: IDs of Google Drive folders.
+    :raises DriveAPIException: listing every folder that failed the check.
+    """
+    ids = sorted(set(folder_ids))
+    problems = {}  # type: Dict[str, str]
+
+    def check(request_id: str, response: Optional[Dict[str, Any]], exception: Optional[Exception]):
+      folder_id = ids[int(request_id)]
+      response = response or {}
+      if exception is not None:
+        status = getattr(getattr(exception, 'resp', None), 'status', None)
+        problems[folder_id] = ('does not exist' if status == 404 else
+                               f'cannot be read ({exception})')
+      elif response.get('trashed'):
+        problems[folder_id] = 'is in the trash'
+      elif response.get('mimeType') != FOLDER_MIME_TYPE:
+        problems[folder_id] = 'is not a folder'
+
+    service = self.drive_conn.service()
+    for start in range(0, len(ids), BATCH_LIMIT):
+      batch = service.new_batch_http_request(callback=check)
+      for index in range(start, min(start + BATCH_LIMIT, len(ids))):
+        # pylint: disable=no-member
+        batch.add(service.files().get(fileId=ids[index], fields='id, mimeType, trashed',
+                                      supportsTeamDrives=True), request_id=str(index))
+      with tracing.span('drive.validate_folders', folders=min(BATCH_LIMIT, len(ids) - start)):
+        batch.execute()
+
+    if problems:
+      raise DriveAPIException(name='Folder error', reason='; '.join(
+          f'{folder_id} {reason}' for folder_id, reason in sorted(problems.items())))
+    log.log(logging.INFO, f'Checked {len(ids)} Google Drive folders.')
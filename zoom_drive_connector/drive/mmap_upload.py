@@ -0,0 +1,115 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import logging
+import mmap
+import os
+
+from googleapiclient import http
+
+log = logging.getLogger('app')
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+class MmapMediaUpload(http.MediaUpload):
+  def __init__(self,
+               filename: str,
+               mimetype: str = 'video/mp4',
+               chunksize: int = DEFAULT_CHUNK_SIZE):
+    """Resumable upload of a file that is memory-mapped instead of read. Every chunk is a
+    `memoryview` slice of the mapping that is handed to the socket without being copied, so
+    uploading a recording of several GB does not allocate a new buffer per chunk, and retrying a
+    chunk sends the same slice again. Pages of chunks that Drive has confirmed are released from
+    the mapping as the upload moves on, so the resident memory stays around one chunk. Close the
+    upload when it is done; it cannot be serialized with `to_json`.
+
+    :param filename: path of the file to upload.
+    :param mimetype: MIME type of the file.
+    :param chunksize: number of bytes sent per request; must be a multiple of 256 KiB.
+    """
+    super(MmapMediaUpload, self).__init__()
+    self._filename = filename
+    self._mimetype = mimetype
+    self._chunksize = chunksize
+    self._file = open(filename, 'rb')
+    self._size = os.fstat(self._file.fileno()).st_size
+    self._map = None
+    # Empty files cannot be mapped.
+    self._view = memoryview(b'')
+    if self._size:
+      self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+      if hasattr(self._map, 'madvise'):
+        self._map.madvise(mmap.MADV_SEQUENTIAL)
+      self._view = memoryview(self._map)
+    self._released = 0
+
+  def chunksize(self) -> int:
+    return self._chunksize
+
+  def mimetype(self) -> str:
+    return self._mimetype
+
+  def size(self) -> int:
+    return self._size
+
+  def resumable(self) -> bool:
+    return True
+
+  def has_stream(self) -> bool:
+    # Without a stream the client asks for every chunk with `getbytes`.
+    return False
+
+  def stream(self) -> None:
+    """The upload has no stream, see `has_stream`; its chunks are slices of the mapping."""
+    return None
+
+  def getbytes(self, begin: int, length: int) -> memoryview:
+    """Returns a slice of the file without copying it.
+
+    :param begin: offset of the first byte.
+    :param length: number of bytes; fewer are returned at the end of the file.
+    :return: view of the requested bytes.
+    """
+    self._release(begin)
+    return self._view[begin:begin + length]
+
+  def _release(self, offset: int):
+    """Drops the pages before `offset` from the mapping. Drive has received them; they are read
+    from the file again should they ever be needed.
+    """
+    end = offset - offset % mmap.PAGESIZE
+    if self._map is None or end <= self._released or not hasattr(self._map, 'madvise'):
+      return
+    self._map.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+    self._released = end
+
+  def close(self):
+    """Unmaps and closes the file."""
+    self._view.release()
+    if self._map is not None:
+      try:
+        self._map.close()
+      except BufferError:
+        # A slice is still referenced, e.g. by a traceback; the mapping is closed once it is
+        # garbage collected.
+        log.log(logging.DEBUG, f'Mapping of {self._filename} still in use.')
+    self._file.close()
+
+  def __enter__(self) -> 'MmapMediaUpload':
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
@@ -0,0 +1,29 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from .capture import TrafficCapture
+from .history import TransferHistory, format_report
+from .metrics import (
+  Counter,
+  Gauge,
+  Histogram,
+  MetricsRegistry,
+  REGISTRY
+)
+from .metrics_server import MetricsServer
+from .profiling import CycleProfiler
+from .progress import PROGRESS, ProgressEvent, ProgressReporter, TransferProgress, log_progress
+from .startup import PROFILE, StartupProfile, lazy_import
+from .tracing import TRACER, Tracer
@@ -0,0 +1,112 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from . import tracing
+
+# Tags copied into the capture as they are. Everything else (meeting names, channels, file names,
+# URLs) is dropped.
+_KEPT_TAGS = {'http.status_code': 'status', 'bytes': 'bytes', 'ok': 'ok', 'status': 'outcome',
+              'recovered': 'recovered'}
+
+
+class TrafficCapture:
+  def __init__(self, path: str, tracer: Optional[tracing.Tracer] = None):
+    """Records the timing, size, and status of every Zoom, Drive, and Slack call the connector
+    makes, without any payloads, so the traffic of a production deployment can be replayed
+    against local stand-ins (see `benchmarks/replay.py`). Calls are taken from the tracing spans.
+    Meeting IDs and trace IDs are replaced by salted hashes; the salt is never written, so the
+    capture cannot be linked back to the meetings.
+
+    :param path: JSON-lines file the capture is appended to.
+    :param tracer: tracer to listen to; defaults to the global tracer.
+    """
+    self.path = path
+    self.tracer = tracer or tracing.TRACER
+    self._salt = os.urandom(16)
+    self._started = time.time()
+    self._file = None
+    self._lock = threading.Lock()
+
+  def _anonymize(self, value: Any) -> str:
+    return hashlib.sha256(self._salt + str(value).encode('utf-8')).hexdigest()[:16]
+
+  def record(self, span: tracing.Span, duration: float) -> Dict[str, Any]:
+    """Converts a finished span into a capture record.
+
+    :param span: finished span.
+    :param duration: duration of the span in seconds.
+    :return: the anonymized record.
+    """
+    record = {'t': round(span.timestamp - self._started, 6), 'span': span.name,
+              'duration': round(duration, 6), 'trace': self._anonymize(span.trace_id)}
+    if 'meeting_id' in span.tags:
+      record['job'] = self._anonymize(span.tags['meeting_id'])
+    for tag, key in _KEPT_TAGS.items():
+      if tag in span.tags:
+        record[key] = span.tags[tag]
+    if 'error' in span.tags:
+      record['error'] = True
+    return record
+
+  def _listen(self, span: tracing.Span, duration: float):
+    line = json.dumps(self.record(span, duration), separators=(',', ':'), default=str)
+    with self._lock:
+      if self._file:
+        self._file.write(line + '\n')
+
+  def start(self):
+    """Starts recording."""
+    self._file = open(self.path, 'a', buffering=1, encoding='utf-8')
+    self._started = time.time()
+    self.tracer.add_listener(self._listen)
+
+  def stop(self):
+    """Stops recording and closes the file."""
+    self.tracer.remove_listener(self._listen)
+    with self._lock:
+      self._file.close()
+      self._file = None
+
+
+def load_capture(path: str) -> Iterator[Dict[str, Any]]:
+  """Reads the records of a capture file.
+
+  :param path: file written by `TrafficCapture`.
+  """
+  with open(path, 'r', encoding='utf-8') as f:
+    for line in f:
+      if line.strip():
+        yield json.loads(line)
+
+
+def percentiles(values: List[float], points=(50, 95, 99)) -> Dict[str, float]:
+  """Computes nearest-rank percentiles.
+
+  :param values: observations.
+  :param points: percentiles to compute.
+  :return: dictionary mapping e.g. `p95` to the value, empty if there are no values.
+  """
+  if not values:
+    return {}
+  ordered = sorted(values)
+  return {f'p{p}': ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))]
+          for p in points}
@@ -0,0 +1,365 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import tracing
+
+log = logging.getLogger('app')
+
+# Spans whose durations make up the stages of a transfer.
+STAGES = {'zoom.download': 'download', 'drive.upload': 'upload', 's3.upload': 'store',
+          'local.store': 'store', 'slack.post_message': 'notify'}
+# The throughput is rolled up per hour; everything else per day and meeting, stage, or error.
+HOUR = 3600
+DAY = 86400
+PERIODS = {'hour': HOUR, 'day': DAY}
+# Stage times are counted in logarithmic bins, four per doubling from 10 ms, so percentiles can be
+# read from the rollups within about 19%.
+_BIN_BASE = 0.01
+_BINS_PER_DOUBLING = 4
+_PENDING_TTL = 86400.0
+_HTTP_ERROR = re.compile(r'HttpError (\d{3})')
+
+_SCHEMA = (
+  'CREATE TABLE IF NOT EXISTS transfers ('
+  'id INTEGER PRIMARY KEY, finished REAL NOT NULL, account TEXT, meeting TEXT NOT NULL, '
+  'status TEXT NOT NULL, bytes INTEGER NOT NULL, total_s REAL NOT NULL, download_s REAL, '
+  'upload_s REAL, store_s REAL, notify_s REAL, retries INTEGER NOT NULL, codes TEXT, '
+  'recovered INTEGER NOT NULL DEFAULT 0)',
+  'CREATE INDEX IF NOT EXISTS transfers_finished ON transfers (finished)',
+  'CREATE INDEX IF NOT EXISTS transfers_status ON transfers (status, finished)',
+  'CREATE INDEX IF NOT EXISTS transfers_meeting ON transfers (meeting, finished)',
+  'CREATE TABLE IF NOT EXISTS hourly ('
+  'hour INTEGER NOT NULL, status TEXT NOT NULL, transfers INTEGER NOT NULL, '
+  'bytes INTEGER NOT NULL, transfer_s REAL NOT NULL, '
+  'PRIMARY KEY (hour, status)) WITHOUT ROWID',
+  'CREATE TABLE IF NOT EXISTS meetings ('
+  'day INTEGER NOT NULL, meeting TEXT NOT NULL, status TEXT NOT NULL, '
+  'transfers INTEGER NOT NULL, bytes INTEGER NOT NULL, total_s REAL NOT NULL, '
+  'max_s REAL NOT NULL, retries INTEGER NOT NULL, '
+  'PRIMARY KEY (day, meeting, status)) WITHOUT ROWID',
+  'CREATE TABLE IF NOT EXISTS stage_bins ('
+  'day INTEGER NOT NULL, stage TEXT NOT NULL, bin INTEGER NOT NULL, count INTEGER NOT NULL, '
+  'PRIMARY KEY (day, stage, bin)) WITHOUT ROWID',
+  'CREATE TABLE IF NOT EXISTS errors ('
+  'day INTEGER NOT NULL, span TEXT NOT NULL, code TEXT NOT NULL, count INTEGER NOT NULL, '
+  'PRIMARY KEY (day, span, code)) WITHOUT ROWID',
+)
+
+
+def _bin(seconds: float) -> int:
+  if seconds <= _BIN_BASE:
+    return 0
+  return math.ceil(_BINS_PER_DOUBLING * math.log2(seconds / _BIN_BASE))
+
+
+def _bin_limit(index: int) -> float:
+  """Returns the upper limit of a bin in seconds."""
+  return _BIN_BASE * 2 ** (index / _BINS_PER_DOUBLING)
+
+
+def _histogram_percentile(bins: List[Tuple[int, int]], p: float) -> Optional[float]:
+  """Returns the upper limit of the bin holding the `p`th percentile.
+
+  :param bins: bin indices and counts, ordered by index.
+  :param p: percentile between 0 and 100.
+  """
+  total = sum(count for _, count in bins)
+  if not total:
+    return None
+  rank = max(1, math.ceil(p * total / 100))
+  seen = 0
+  for index, count in bins:
+    seen += count
+    if seen >= rank:
+      return round(_bin_limit(index), 3)
+  return round(_bin_limit(bins[-1][0]), 3)
+
+
+class _Pending:
+  __slots__ = ('started', 'stages', 'attempts', 'bytes', 'codes')
+
+  def __init__(self):
+    self.started = time.time()
+    self.stages = {}  # type: Dict[str, float]
+    self.attempts = {}  # type: Dict[str, int]
+    self.bytes = 0
+    self.codes = []  # type: List[str]
+
+
+class TransferHistory:
+  def __init__(self,
+               path: str,
+               retention_days: float = 90.0,
+               tracer: Optional[tracing.Tracer] = None):
+    """Keeps one row per transfer in an SQLite database: its size, the time spent in each stage,
+    the number of retried stages, and the HTTP error codes it ran into. Transfers are taken from
+    the tracing spans; a row is written when the `recording` span of a job finishes. In the same
+    transaction the rollups are updated: the throughput per hour, and per day the transfers of
+    every meeting, a histogram of the time of every stage, and the error counts of every call.
+    `report` only reads the rollups, so it stays fast with millions of transfers. Rows older
+    than `retention_days` are deleted on `start`; their rollups are kept.
+
+    :param path: path of the database file; created if it does not exist.
+    :param retention_days: number of days the rows are kept.
+    :param tracer: tracer to listen to; defaults to the global tracer.
+    """
+    self.path = path
+    self.retention_days = retention_days
+    self.tracer = tracer or tracing.TRACER
+    self._pending = {}  # type: Dict[str, _Pending]
+    self._lock = threading.Lock()
+    self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    self._db.execute('PRAGMA journal_mode=WAL')
+    self._db.execute('PRAGMA synchronous=NORMAL')
+    for statement in _SCHEMA:
+      self._db.execute(statement)
+
+  def _listen(self, span: tracing.Span, duration: float):
+    if span.parent_id is not None:
+      with self._lock:
+        pending = self._pending.get(span.trace_id)
+        if pending is None:
+          pending = self._pending[span.trace_id] = _Pending()
+        stage = STAGES.get(span.name)
+        if stage:
+          pending.stages[stage] = pending.stages.get(stage, 0.0) + duration
+          pending.attempts[span.name] = pending.attempts.get(span.name, 0) + 1
+          pending.bytes = max(pending.bytes, int(span.tags.get('bytes') or 0))
+        status = span.tags.get('http.status_code')
+        if status is None and 'error' in span.tags:
+          match = _HTTP_ERROR.search(str(span.tags['error']))
+          status = match.group(1) if match else None
+        if status is not None and int(status) >= 400:
+          pending.codes.append(f'{span.name}:{status}')
+      return
+
+    with self._lock:
+      pending = self._pending.pop(span.trace_id, None)
+      now = time.time()
+      for trace_id in [t for t, p in self._pending.items() if now - p.started > _PENDING_TTL]:
+        del self._pending[trace_id]
+    if span.name != 'recording' or pending is None:
+      return
+    if 'download' not in pending.stages and not span.tags.get('recovered'):
+      # Not a transfer, e.g. a lookup that found no new recording.
+      return
+
+    if 'error' in span.tags:
+      status = 'failed'
+    elif span.tags.get('status') in ('interrupted', 'skipped', 'no_recording'):
+      status = 'interrupted' if span.tags['status'] == 'interrupted' else 'failed'
+    else:
+      status = 'ok'
+    try:
+      self.add(time.time(), str(span.tags.get('meeting', '')), status, pending.bytes, duration,
+               pending.stages, sum(n - 1 for n in pending.attempts.values()), pending.codes,
+               account=span.tags.get('account'), recovered=bool(span.tags.get('recovered')))
+    except sqlite3.Error as e:
+      log.log(logging.WARNING, f'Could not record transfer in {self.path}: {e}')
+
+  def add(self,
+          finished: float,
+          meeting: str,
+          status: str,
+          size: int,
+          total: float,
+          stages: Dict[str, float],
+          retries: int = 0,
+          codes: Optional[List[str]] = None,
+          account: Optional[str] = None,
+          recovered: bool = False):
+    """Stores a transfer and updates the rollups.
+
+    :param finished: UNIX time at which the transfer ended.
+    :param meeting: name of the meeting.
+    :param status: `ok`, `failed`, or `interrupted`.
+    :param size: size of the recording in bytes.
+    :param total: seconds from the start of the download until the end of the transfer.
+    :param stages: seconds spent per stage, keyed by the values of `STAGES`.
+    :param retries: number of stages that were repeated.
+    :param codes: HTTP error codes as `<span>:<code>`, e.g. `drive.upload:503`.
+    :param account: name of the Zoom account.
+    :param recovered: whether the recording was recovered after a restart.
+    """
+    codes = codes or []
+    hour = int(finished // HOUR * HOUR)
+    day = int(finished // DAY * DAY)
+    moved = sum(stages.get(stage, 0.0) for stage in ('download', 'upload', 'store'))
+    with self._lock:
+      self._db.execute('BEGIN IMMEDIATE')
+      try:
+        self._db.execute(
+            'INSERT INTO transfers (finished, account, meeting, status, bytes, total_s, '
+            'download_s, upload_s, store_s, notify_s, retries, codes, recovered) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (finished, account, meeting, status, size, total, stages.get('download'),
+             stages.get('upload'), stages.get('store'), stages.get('notify'), retries,
+             ','.join(codes) or None, int(recovered)))
+        self._db.execute(
+            'INSERT INTO hourly (hour, status, transfers, bytes, transfer_s) '
+            'VALUES (?, ?, 1, ?, ?) ON CONFLICT (hour, status) DO UPDATE SET '
+            'transfers = transfers + 1, bytes = bytes + excluded.bytes, '
+            'transfer_s = transfer_s + excluded.transfer_s', (hour, status, size, moved))
+        self._db.execute(
+            'INSERT INTO meetings (day, meeting, status, transfers, bytes, total_s, max_s, '
+            'retries) VALUES (?, ?, ?, 1, ?, ?, ?, ?) '
+            'ON CONFLICT (day, meeting, status) DO UPDATE SET '
+            'transfers = transfers + 1, bytes = bytes + excluded.bytes, '
+            'total_s = total_s + excluded.total_s, max_s = MAX(max_s, excluded.max_s), '
+            'retries = retries + excluded.retries',
+            (day, meeting, status, size, total, total, retries))
+        if status == 'ok':
+          self._db.executemany(
+              'INSERT INTO stage_bins (day, stage, bin, count) VALUES (?, ?, ?, 1) '
+              'ON CONFLICT (day, stage, bin) DO UPDATE SET count = count + 1',
+              [(day, stage, _bin(seconds)) for stage, seconds in
+               sorted({**stages, 'total': total}.items())])
+        self._db.executemany(
+            'INSERT INTO errors (day, span, code, count) VALUES (?, ?, ?, 1) '
+            'ON CONFLICT (day, span, code) DO UPDATE SET count = count + 1',
+            [(day,) + tuple(code.rsplit(':', 1)) for code in codes])
+        self._db.execute('COMMIT')
+      except BaseException:
+        self._db.execute('ROLLBACK')
+        raise
+
+  def prune(self, before: float) -> int:
+    """Deletes the rows of transfers that finished before `before`. The rollups are kept.
+
+    :param before: UNIX time.
+    :return: number of deleted rows.
+    """
+    with self._lock:
+      return self._db.execute('DELETE FROM transfers WHERE finished < ?', (before,)).rowcount
+
+  def report(self,
+             start: float,
+             end: float,
+             period: str = 'day',
+             top: int = 10) -> Dict[str, Any]:
+    """Summarizes the transfers that finished in a time range. The range covers whole UTC days.
+
+    :param start: UNIX time of the start of the range; rounded down to the start of its day.
+    :param end: UNIX time of the end of the range; rounded up to the end of its day.
+    :param period: `hour` or `day`, the length of the periods of the throughput trend.
+    :param top: number of meetings and errors listed.
+    :return: dictionary with the totals, the throughput per period, the slowest meetings, the
+      p50 and p95 time of each stage, and the meetings and calls that failed most often.
+    """
+    length = PERIODS[period]
+    bounds = (int(start // DAY * DAY), int(-(-end // DAY) * DAY))
+    with self._lock:
+      db = self._db
+      trend = db.execute(
+          'SELECT hour / ? * ?, SUM(transfers), SUM(bytes), SUM(transfer_s), '
+          "SUM(CASE WHEN status != 'ok' THEN transfers ELSE 0 END) "
+          'FROM hourly WHERE hour >= ? AND hour < ? GROUP BY 1 ORDER BY 1',
+          (length, length) + bounds).fetchall()
+      slowest = db.execute(
+          'SELECT meeting, SUM(transfers), SUM(total_s) / SUM(transfers), MAX(max_s), '
+          'SUM(bytes) FROM meetings '
+          "WHERE day >= ? AND day < ? AND status = 'ok' GROUP BY meeting "
+          'ORDER BY 3 DESC LIMIT ?', bounds + (top,)).fetchall()
+      bins = db.execute(
+          'SELECT stage, bin, SUM(count) FROM stage_bins WHERE day >= ? AND day < ? '
+          'GROUP BY stage, bin ORDER BY stage, bin', bounds).fetchall()
+      failing = db.execute(
+          "SELECT meeting, SUM(CASE WHEN status != 'ok' THEN transfers ELSE 0 END) AS failed, "
+          'SUM(transfers), SUM(retries) FROM meetings WHERE day >= ? AND day < ? '
+          'GROUP BY meeting HAVING failed > 0 ORDER BY failed DESC, meeting LIMIT ?',
+          bounds + (top,)).fetchall()
+      errors = db.execute(
+          'SELECT span, code, SUM(count) FROM errors WHERE day >= ? AND day < ? '
+          'GROUP BY span, code ORDER BY 3 DESC, span, code LIMIT ?', bounds + (top,)).fetchall()
+
+    stages = {}  # type: Dict[str, List[Tuple[int, int]]]
+    for stage, index, count in bins:
+      stages.setdefault(stage, []).append((index, count))
+
+    def label(bucket: int, fmt: str = '%Y-%m-%d %H:00' if period == 'hour' else '%Y-%m-%d'):
+      return datetime.datetime.fromtimestamp(bucket, datetime.timezone.utc).strftime(fmt)
+
+    return {
+      'from': label(bounds[0], '%Y-%m-%d'), 'to': label(bounds[1] - DAY, '%Y-%m-%d'),
+      'transfers': sum(row[1] for row in trend),
+      'failed': sum(row[4] for row in trend),
+      'bytes': sum(row[2] for row in trend),
+      'throughput': [{'period': label(bucket), 'transfers': transfers, 'failed': failed,
+                      'bytes': size, 'mb_s': round(size / seconds / 1024 ** 2, 3) if seconds
+                      else None} for bucket, transfers, size, seconds, failed in trend],
+      'slowest': [{'meeting': meeting, 'transfers': transfers, 'mean_s': round(mean, 3),
+                   'max_s': round(longest, 3), 'bytes': size}
+                  for meeting, transfers, mean, longest, size in slowest],
+      'stages': {stage: {'p50': _histogram_percentile(values, 50),
+                         'p95': _histogram_percentile(values, 95)}
+                 for stage, values in sorted(stages.items())},
+      'failures': [{'meeting': meeting, 'failed': failed, 'transfers': transfers,
+                    'retries': retries} for meeting, failed, transfers, retries in failing],
+      'errors': [{'span': span, 'code': code, 'count': count} for span, code, count in errors],
+    }
+
+  def start(self):
+    """Starts recording transfers and deletes the rows that are older than the retention."""
+    pruned = self.prune(time.time() - self.retention_days * 86400)
+    if pruned:
+      log.log(logging.INFO, f'Deleted {pruned} transfers older than {self.retention_days:g} days '
+                            f'from {self.path}.')
+    self.tracer.add_listener(self._listen)
+
+  def stop(self):
+    """Stops recording transfers."""
+    self.tracer.remove_listener(self._listen)
+
+  def close(self):
+    """Closes the database."""
+    with self._lock:
+      self._db.close()
+
+
+def format_report(report: Dict[str, Any]) -> str:
+  """Formats the result of `TransferHistory.report` as plain text.
+
+  :param report: dictionary returned by `report`.
+  """
+  lines = [f'Transfers from {report["from"]} to {report["to"]}: {report["transfers"]} '
+           f'({report["failed"]} failed, {report["bytes"] / 1024 ** 3:.2f} GB)', '',
+           'Throughput:']
+  for row in report['throughput']:
+    rate = f'{row["mb_s"]:.2f} MB/s' if row['mb_s'] is not None else '-'
+    lines.append(f'  {row["period"]:<16} {row["transfers"]:>7} transfers {row["failed"]:>5} '
+                 f'failed {rate:>12}')
+  lines += ['', 'Stage times (p50 / p95):']
+  for stage, values in report['stages'].items():
+    lines.append(f'  {stage:<10} {values["p50"]:>9.1f}s / {values["p95"]:.1f}s')
+  lines += ['', 'Slowest meetings (mean / max):']
+  for row in report['slowest']:
+    lines.append(f'  {row["meeting"]:<32} {row["mean_s"]:>9.1f}s / {row["max_s"]:.1f}s '
+                 f'({row["transfers"]} transfers)')
+  lines += ['', 'Failure hot spots:']
+  for row in report['failures']:
+    lines.append(f'  {row["meeting"]:<32} {row["failed"]:>5} of {row["transfers"]} failed, '
+                 f'{row["retries"]} retries')
+  for row in report['errors']:
+    lines.append(f'  {row["span"]:<32} HTTP {row["code"]} x{row["count"]}')
+  return '\n'.join(lines)
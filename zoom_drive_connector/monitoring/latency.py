@@ -0,0 +1,143 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from . import metrics
+from .capture import percentiles
+
+log = logging.getLogger('app')
+
+# Milestones of a recording, measured from the end of the recording.
+STAGES = ('discovered', 'downloaded', 'uploaded', 'notified')
+# The objective applies to this percentile of the time until the Slack notification.
+OBJECTIVE_PERCENTILE = 'p95'
+
+
+class LatencyTracker:
+  def __init__(self, window: int = 1000, objective: Optional[float] = None):
+    """Keeps the time from the end of each recording until it was discovered, downloaded,
+    uploaded, and announced in Slack for the last `window` recordings, and reports the p50, p95,
+    and p99 of every stage.
+
+    :param window: number of recordings the percentiles are computed over.
+    :param objective: p95 of the time until the notification, in seconds, that is considered
+      healthy; no objective if not given.
+    """
+    self.objective = objective
+    self.status_file = None  # type: Optional[str]
+    self._samples = {stage: collections.deque(maxlen=window)
+                     for stage in STAGES}  # type: Dict[str, Deque[float]]
+    self._count = 0
+    self._lock = threading.Lock()
+
+  def configure(self,
+                window: int = 1000,
+                objective: Optional[float] = None,
+                status_file: Optional[str] = None):
+    """Changes the settings. Samples that are already collected are kept.
+
+    :param window: number of recordings the percentiles are computed over.
+    :param objective: p95 of the time until the notification, in seconds, that is healthy.
+    :param status_file: JSON file the summary is written to after every recording.
+    """
+    with self._lock:
+      self._samples = {stage: collections.deque(self._samples[stage], maxlen=window)
+                       for stage in STAGES}
+    self.objective = objective
+    self.status_file = status_file
+
+  def observe(self, meeting: str, milestones: Dict[str, float]):
+    """Records the milestones of a recording that was announced.
+
+    :param meeting: name of the meeting, used in the log message.
+    :param milestones: UNIX timestamps keyed by `ended` and the names in `STAGES`.
+    """
+    ended = milestones['ended']
+    delays = {stage: max(0.0, milestones[stage] - ended) for stage in STAGES
+              if stage in milestones}
+    with self._lock:
+      self._count += 1
+      for stage, delay in delays.items():
+        self._samples[stage].append(delay)
+    for stage, delay in delays.items():
+      metrics.RECORDING_LATENCY.labels(stage).observe(delay)
+
+    steps = ', '.join(f'{stage} after {delay:.0f}s' for stage, delay in delays.items()
+                      if stage != 'notified')
+    log.log(logging.INFO, f'The recording of {meeting} was announced '
+                          f'{delays.get("notified", 0):.0f}s after it ended ({steps}).')
+    if self.status_file:
+      self.write_status()
+
+  def summary(self) -> Dict[str, Any]:
+    """Returns the percentiles of every stage and whether the objective is met."""
+    with self._lock:
+      stages = {stage: {k: round(v, 3) for k, v in percentiles(list(samples)).items()}
+                for stage, samples in self._samples.items()}
+      count = self._count
+    return {'recordings': count, 'stages': stages, 'objective': self.objective,
+            'healthy': self._healthy(stages), 'updated': time.time()}
+
+  def _healthy(self, stages: Dict[str, Dict[str, float]]) -> bool:
+    value = stages['notified'].get(OBJECTIVE_PERCENTILE)
+    return self.objective is None or value is None or value <= self.objective
+
+  def healthy(self) -> bool:
+    """Returns false if the p95 time until the notification exceeds the objective."""
+    return self.summary()['healthy']
+
+  def write_status(self):
+    """Writes the summary to the status file. The file is replaced atomically."""
+    if not self.status_file:
+      return
+    try:
+      with open(self.status_file + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(self.summary(), f, indent=2)
+      os.replace(self.status_file + '.tmp', self.status_file)
+    except OSError as e:
+      log.log(logging.WARNING, f'Could not write status file {self.status_file}: {e}')
+
+  def log_summary(self):
+    """Logs the percentiles of every stage, if there are any samples."""
+    summary = self.summary()
+    if not summary['recordings']:
+      return
+    parts = []
+    for stage in STAGES:
+      values = summary['stages'][stage]
+      if values:
+        parts.append(f'{stage} ' + '/'.join(f'{v:.0f}s' for v in values.values()))
+    if summary['healthy']:
+      log.log(logging.INFO, f'Recording latency p50/p95/p99: {", ".join(parts)}')
+    else:
+      log.log(logging.WARNING, f'Recording latency p50/p95/p99: {", ".join(parts)} '
+                               f'(objective {self.objective:.0f}s missed)')
+
+  def route(self) -> Tuple[int, str, str]:
+    """Route for `MetricsServer` answering 503 while the objective is missed, e.g. for a
+    readiness probe.
+    """
+    summary = self.summary()
+    return (200 if summary['healthy'] else 503), 'application/json', json.dumps(summary)
+
+
+TRACKER = LatencyTracker()
@@ -0,0 +1,394 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import contextlib
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+PREFIX = 'zoom_drive_connector'
+
+# Buckets (in seconds) covering everything from a token request to a multi-GB upload.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600,
+                   1800, 3600)
+
+M = TypeVar('M', bound='_Metric')
+
+
+def _escape(value: str) -> str:
+  """Escapes a label value for the Prometheus text exposition format.
+
+  :param value: raw label value.
+  :return: escaped label value.
+  """
+  return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+  """Formats a sample value for the Prometheus text exposition format.
+
+  :param value: sample value.
+  :return: string representation of the value.
+  """
+  if math.isinf(value):
+    return '+Inf' if value > 0 else '-Inf'
+  if value == int(value):
+    return str(int(value))
+  return repr(value)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+  """Formats a label set as `{name="value",...}`.
+
+  :param names: label names.
+  :param values: label values, in the same order as `names`.
+  :return: formatted label set or an empty string when there are no labels.
+  """
+  if not names:
+    return ''
+  pairs = ','.join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+  return '{' + pairs + '}'
+
+
+class MetricsRegistry:
+  def __init__(self):
+    """Collection of metrics that are rendered together on the `/metrics` endpoint."""
+    self._metrics = []  # type: List[_Metric]
+    self._lock = threading.Lock()
+
+  def register(self, metric: '_Metric'):
+    """Adds a metric to the registry.
+
+    :param metric: metric instance.
+    """
+    with self._lock:
+      if any(m.name == metric.name for m in self._metrics):
+        raise ValueError(f'Metric {metric.name} is already registered.')
+      self._metrics.append(metric)
+
+  def get(self, name: str) -> Optional['_Metric']:
+    """Looks up a metric by its full name.
+
+    :param name: name of the metric.
+    :return: metric instance or None if it is not registered.
+    """
+    with self._lock:
+      return next((m for m in self._metrics if m.name == name), None)
+
+  def render(self) -> str:
+    """Renders all registered metrics in the Prometheus text exposition format.
+
+    :return: text document.
+    """
+    with self._lock:
+      metrics = list(self._metrics)
+    return ''.join(m.render() for m in metrics)
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _Metric:
+  _type = 'untyped'
+
+  def __init__(self,
+               name: str,
+               documentation: str,
+               labelnames: Sequence[str] = (),
+               registry: Optional[MetricsRegistry] = REGISTRY):
+    """Base class for metrics holding one child per label value combination.
+
+    :param name: full name of the metric.
+    :param documentation: help text shown on the `/metrics` endpoint.
+    :param labelnames: names of the labels that distinguish children.
+    :param registry: registry to add the metric to. Pass None to leave it unregistered.
+    """
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._children = {}  # type: Dict[Tuple[str, ...], Any]
+    self._lock = threading.Lock()
+    if registry is not None:
+      registry.register(self)
+
+  def _new_child(self: M) -> M:
+    """Creates an unregistered, unlabelled instance of the same metric type."""
+    return self.__class__(self.name, self.documentation, registry=None)
+
+  def labels(self: M, *values: str) -> M:
+    """Returns the child metric for the given label values, creating it if needed.
+
+    :param values: label values, in the same order as `labelnames`.
+    :return: child metric of the same type.
+    """
+    if len(values) != len(self.labelnames):
+      raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}.')
+    key = tuple(str(v) for v in values)
+    with self._lock:
+      if key not in self._children:
+        self._children[key] = self._new_child()
+      return self._children[key]
+
+  def _samples(self) -> Iterator[Tuple[str, Sequence[str], Sequence[str], float]]:
+    """Yields (suffix, label names, label values, value) tuples for this unlabelled metric."""
+    raise NotImplementedError
+
+  def render(self) -> str:
+    """Renders the metric and all of its children.
+
+    :return: text exposition of this metric.
+    """
+    lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self._type}']
+    if self.labelnames:
+      with self._lock:
+        children = sorted(self._children.items())
+    else:
+      children = [((), self)]
+
+    for label_values, child in children:
+      # pylint: disable=protected-access
+      for suffix, names, values, value in child._samples():
+        label_set = _format_labels(self.labelnames + tuple(names), label_values + tuple(values))
+        lines.append(f'{self.name}{suffix}{label_set} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class Counter(_Metric):
+  _type = 'counter'
+
+  def __init__(self, *args, **kwargs):
+    """Monotonically increasing value."""
+    self._value = 0.0
+    super(Counter, self).__init__(*args, **kwargs)
+
+  def inc(self, amount: float = 1):
+    """Increments the counter.
+
+    :param amount: non-negative amount to add.
+    """
+    if amount < 0:
+      raise ValueError('Counters can only be incremented.')
+    with self._lock:
+      self._value += amount
+
+  @property
+  def value(self) -> float:
+    """Current value of the counter."""
+    return self._value
+
+  def _samples(self):
+    yield '_total' if not self.name.endswith('_total') else '', (), (), self._value
+
+
+class Gauge(_Metric):
+  _type = 'gauge'
+
+  def __init__(self, *args, **kwargs):
+    """Value that can go up and down, or be computed by a callback at render time."""
+    self._value = 0.0
+    self._function = None  # type: Optional[Callable[[], float]]
+    super(Gauge, self).__init__(*args, **kwargs)
+
+  def set(self, value: float):
+    """Sets the gauge to the given value.
+
+    :param value: new value.
+    """
+    with self._lock:
+      self._value = float(value)
+
+  def inc(self, amount: float = 1):
+    """Increments the gauge.
+
+    :param amount: amount to add.
+    """
+    with self._lock:
+      self._value += amount
+
+  def dec(self, amount: float = 1):
+    """Decrements the gauge.
+
+    :param amount: amount to subtract.
+    """
+    with self._lock:
+      self._value -= amount
+
+  def set_function(self, function: Callable[[], float]):
+    """Computes the value of the gauge by calling `function` whenever it is read.
+
+    :param function: callable returning the current value.
+    """
+    self._function = function
+
+  @contextlib.contextmanager
+  def track_inprogress(self):
+    """Context manager incrementing the gauge on entry and decrementing it on exit."""
+    self.inc()
+    try:
+      yield
+    finally:
+      self.dec()
+
+  @property
+  def value(self) -> float:
+    """Current value of the gauge."""
+    if self._function is not None:
+      return float(self._function())
+    return self._value
+
+  def _samples(self):
+    yield '', (), (), self.value
+
+
+class Histogram(_Metric):
+  _type = 'histogram'
+
+  def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+    """Distribution of observed values, counted in cumulative buckets.
+
+    :param buckets: upper bounds of the buckets. `+Inf` is added automatically.
+    """
+    self.buckets = tuple(sorted(buckets)) + (math.inf,)
+    self._counts = [0] * len(self.buckets)
+    self._sum = 0.0
+    self._count = 0
+    super(Histogram, self).__init__(*args, **kwargs)
+
+  def _new_child(self) -> 'Histogram':
+    return Histogram(self.name, self.documentation, buckets=self.buckets[:-1], registry=None)
+
+  def observe(self, value: float):
+    """Records one observation.
+
+    :param value: observed value.
+    """
+    with self._lock:
+      self._sum += value
+      self._count += 1
+      for i, bound in enumerate(self.buckets):
+        if value <= bound:
+          self._counts[i] += 1
+          break
+
+  @contextlib.contextmanager
+  def time(self):
+    """Context manager observing the number of seconds spent inside the block."""
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.observe(time.perf_counter() - start)
+
+  @property
+  def count(self) -> int:
+    """Number of observations."""
+    return self._count
+
+  @property
+  def sum(self) -> float:
+    """Sum of all observations."""
+    return self._sum
+
+  def _samples(self):
+    with self._lock:
+      counts = list(self._counts)
+      total, count = self._sum, self._count
+    cumulative = 0
+    for bound, bucket_count in zip(self.buckets, counts):
+      cumulative += bucket_count
+      yield '_bucket', ('le',), (_format_value(bound),), cumulative
+    yield '_sum', (), (), total
+    yield '_count', (), (), count
+
+
+class RecordingAges:
+  def __init__(self):
+    """Tracks when the recordings that have been discovered but not yet processed became
+    available."""
+    self._pending = {}  # type: Dict[str, float]
+    self._lock = threading.Lock()
+
+  def add(self, key: str, timestamp: float):
+    """Marks a recording as unprocessed.
+
+    :param key: unique key of the recording.
+    :param timestamp: UNIX timestamp of the recording.
+    """
+    with self._lock:
+      self._pending[key] = timestamp
+
+  def remove(self, key: str):
+    """Marks a recording as processed.
+
+    :param key: unique key of the recording.
+    """
+    with self._lock:
+      self._pending.pop(key, None)
+
+  def oldest_age(self) -> float:
+    """Returns the age in seconds of the oldest unprocessed recording, or 0 if there is none."""
+    with self._lock:
+      if not self._pending:
+        return 0.0
+      return max(0.0, time.time() - min(self._pending.values()))
+
+
+# Metrics describing the transfer pipeline.
+STAGE_SECONDS = Histogram(f'{PREFIX}_stage_duration_seconds',
+                          'Time spent in each pipeline stage.', ('stage',))
+TRANSFER_BYTES = Counter(f'{PREFIX}_transfer_bytes_total',
+                         'Number of bytes transferred per direction.', ('direction',))
+TRANSFER_RATE = Gauge(f'{PREFIX}_transfer_rate_bytes_per_second',
+                      'Throughput of the most recent transfer per direction.', ('direction',))
+QUEUE_DEPTH = Gauge(f'{PREFIX}_queue_depth', 'Number of items waiting in each queue.', ('queue',))
+IN_FLIGHT = Gauge(f'{PREFIX}_jobs_in_flight', 'Number of downloads and uploads in progress.')
+TRANSFER_REMAINING = Gauge(f'{PREFIX}_transfer_remaining_bytes',
+                           'Bytes left of the running downloads and uploads per direction.',
+                           ('direction',))
+API_ERRORS = Counter(f'{PREFIX}_api_errors_total', 'Number of failed API calls.',
+                     ('api', 'status'))
+TRASH_RESULTS = Counter(f'{PREFIX}_trash_total', 'Outcome of trash requests sent to Zoom.',
+                        ('outcome',))
+RECORDING_LATENCY = Histogram(f'{PREFIX}_recording_latency_seconds',
+                              'Time from the end of a recording until it was discovered, '
+                              'downloaded, uploaded, and announced.', ('stage',),
+                              buckets=(60, 300, 600, 1800, 3600, 7200, 14400, 43200, 86400))
+DEADLINE_MISSES = Counter(f'{PREFIX}_notification_deadline_misses_total',
+                          'Number of recordings announced after their notification deadline.',
+                          ('account',))
+CONCURRENCY_LIMIT = Gauge(f'{PREFIX}_concurrency_limit',
+                          'Number of transfers each adaptive limiter lets run at the same time.',
+                          ('limiter',))
+CONCURRENCY_ADJUSTMENTS = Counter(f'{PREFIX}_concurrency_adjustments_total',
+                                  'Number of changes of the adaptive concurrency limits.',
+                                  ('limiter', 'direction', 'reason'))
+
+PENDING_RECORDINGS = RecordingAges()
+OLDEST_PENDING = Gauge(f'{PREFIX}_oldest_unprocessed_recording_age_seconds',
+                       'Age of the oldest recording that has not been uploaded yet.')
+OLDEST_PENDING.set_function(PENDING_RECORDINGS.oldest_age)
+
+
+def observe_transfer(direction: str, num_bytes: int, seconds: float):
+  """Records the size and throughput of a completed transfer.
+
+  :param direction: either `download` or `upload`.
+  :param num_bytes: number of bytes transferred.
+  :param seconds: wall time of the transfer.
+  """
+  TRANSFER_BYTES.labels(direction).inc(num_bytes)
+  if seconds > 0:
+    TRANSFER_RATE.labels(direction).set(num_bytes / seconds)
@@ -0,0 +1,91 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+
+from .metrics import MetricsRegistry, REGISTRY
+
+log = logging.getLogger('app')
+
+# A route returns the HTTP status code, the content type, and the response body.
+Route = Callable[[], Tuple[int, str, str]]
+
+
+class MetricsServer:
+  def __init__(self, port: int, address: str = '', registry: MetricsRegistry = REGISTRY):
+    """Small in-process HTTP server exposing the metrics registry on `/metrics`.
+
+    :param port: TCP port to listen on. Port 0 picks a free port.
+    :param address: address to bind to. Defaults to all interfaces.
+    :param registry: registry rendered on the `/metrics` endpoint.
+    """
+    self.registry = registry
+    self.routes = {'/metrics': self._metrics}  # type: Dict[str, Route]
+
+    routes = self.routes
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):  # pylint: disable=invalid-name
+        route = routes.get(self.path.split('?', 1)[0])
+        if route is None:
+          status, content_type, body = 404, 'text/plain', 'Not found\n'
+        else:
+          status, content_type, body = route()
+
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+      def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        log.log(logging.DEBUG, format % args)
+
+    self._server = ThreadingHTTPServer((address, port), Handler)
+    self._server.daemon_threads = True
+    self._thread = None  # type: Optional[threading.Thread]
+
+  @property
+  def port(self) -> int:
+    """Port the server is listening on."""
+    return self._server.server_address[1]
+
+  def add_route(self, path: str, route: Route):
+    """Serves the result of `route` on `path`.
+
+    :param path: URL path, e.g. `/healthz`.
+    :param route: callable returning (status code, content type, body).
+    """
+    self.routes[path] = route
+
+  def _metrics(self) -> Tuple[int, str, str]:
+    """Route rendering the metrics registry."""
+    return 200, 'text/plain; version=0.0.4; charset=utf-8', self.registry.render()
+
+  def start(self):
+    """Starts serving requests in a background thread."""
+    self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-server',
+                                    daemon=True)
+    self._thread.start()
+    log.log(logging.INFO, f'Metrics available on port {self.port}.')
+
+  def stop(self):
+    """Stops the server and releases the port."""
+    self._server.shutdown()
+    self._server.server_close()
@@ -0,0 +1,192 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import cProfile
+import datetime
+import functools
+import logging
+import os
+import pstats
+import signal
+import threading
+import tracemalloc
+from typing import Any, Callable, List, Mapping, Optional, TypeVar
+
+log = logging.getLogger('app')
+F = TypeVar('F', bound=Callable[..., Any])
+
+# Environment variable holding the number of cycles to profile right after startup.
+ENV_VARIABLE = 'ZOOM_DRIVE_CONNECTOR_PROFILE'
+
+
+class CycleProfiler:
+  def __init__(self):
+    """Profiles whole pipeline cycles on demand. While armed, a cycle runs under cProfile and
+    tracemalloc; the CPU profile is written as a `.prof` file that can be loaded with `pstats` or
+    `snakeviz`, and the top allocations are written as text snapshots, periodically during the
+    cycle and once at its end. Work that the cycle hands to worker threads is profiled if it is
+    wrapped with `task`. When the profiler is not armed, `cycle` and `task` call straight through.
+    """
+    self.directory = 'profiles'
+    self.cycles = 1
+    self.snapshot_interval = 60.0
+    self.top = 25
+    self._remaining = 0
+    self._profiles = None  # type: Optional[List[cProfile.Profile]]
+    self._lock = threading.Lock()
+
+  def configure(self,
+                directory: str,
+                cycles: int = 1,
+                snapshot_interval: float = 60.0,
+                top: int = 25):
+    """Sets where and how much to profile.
+
+    :param directory: folder the profiles and snapshots are written to; created if needed.
+    :param cycles: number of cycles profiled each time the profiler is armed.
+    :param snapshot_interval: seconds between allocation snapshots during a cycle.
+    :param top: number of allocation sites listed in a snapshot.
+    """
+    self.directory = directory
+    self.cycles = max(1, cycles)
+    self.snapshot_interval = snapshot_interval
+    self.top = top
+
+  def arm(self, cycles: Optional[int] = None):
+    """Profiles the next cycles. Safe to call from a signal handler.
+
+    :param cycles: number of cycles; defaults to the configured number.
+    """
+    self._remaining = cycles or self.cycles
+    log.log(logging.INFO, f'Profiling the next {self._remaining} cycles.')
+
+  def arm_from_environment(self, environ: Optional[Mapping[str, str]] = None):
+    """Profiles the first cycles if `ENV_VARIABLE` is set to their number. A value that is not a
+    positive integer is logged, and the configured number of cycles is profiled instead.
+
+    :param environ: environment to read; defaults to `os.environ`.
+    """
+    value = (os.environ if environ is None else environ).get(ENV_VARIABLE)
+    if not value:
+      return
+    try:
+      cycles = int(value)
+    except ValueError:
+      cycles = 0
+    if cycles < 1:
+      log.log(logging.WARNING, f'{ENV_VARIABLE}={value!r} is not a number of cycles, profiling '
+                               f'{self.cycles} cycles.')
+      cycles = self.cycles
+    self.arm(cycles)
+
+  def install(self, signum: Optional[int] = getattr(signal, 'SIGUSR2', None)):
+    """Arms the profiler whenever the process receives `signum`. Must be called from the main
+    thread.
+
+    :param signum: signal number; defaults to SIGUSR2.
+    """
+    if signum is not None:
+      signal.signal(signum, lambda *_: self.arm())
+
+  def cycle(self, fn: F) -> F:
+    """Wraps one cycle of the pipeline, e.g. `Scheduler.run_once`.
+
+    :param fn: the function running a cycle.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+      if not self._remaining:
+        return fn(*args, **kwargs)
+      self._remaining -= 1
+      return self._run(fn, args, kwargs)
+    return wrapper  # type: ignore
+
+  def task(self, fn: F) -> F:
+    """Wraps work that a cycle runs in another thread, since cProfile only sees the thread that
+    enabled it. Returns `fn` itself unless a cycle is being profiled.
+
+    :param fn: function to run in a worker thread.
+    """
+    if self._profiles is None:
+      return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+      profile = cProfile.Profile()
+      profile.enable()
+      try:
+        return fn(*args, **kwargs)
+      finally:
+        profile.disable()
+        with self._lock:
+          if self._profiles is not None:
+            self._profiles.append(profile)
+    return wrapper  # type: ignore
+
+  def _snapshot(self, path: str):
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>')))
+    current, peak = tracemalloc.get_traced_memory()
+    with open(path, 'w', encoding='utf-8') as f:
+      f.write(f'traced memory: current {current} bytes, peak {peak} bytes\n')
+      for stat in snapshot.statistics('lineno')[:self.top]:
+        f.write(f'{stat}\n')
+
+  def _run(self, fn: Callable, args, kwargs):
+    os.makedirs(self.directory, exist_ok=True)
+    prefix = os.path.join(self.directory,
+                          datetime.datetime.now().strftime('cycle-%Y%m%d-%H%M%S'))
+    stop = threading.Event()
+
+    def snapshots():
+      count = 0
+      while not stop.wait(self.snapshot_interval):
+        count += 1
+        self._snapshot(f'{prefix}-alloc-{count:03d}.txt')
+
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+      tracemalloc.start(10)
+    with self._lock:
+      self._profiles = []
+    thread = threading.Thread(target=snapshots, name='profile-snapshots', daemon=True)
+    thread.start()
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+      return fn(*args, **kwargs)
+    finally:
+      profile.disable()
+      stop.set()
+      thread.join()
+      with self._lock:
+        profiles, self._profiles = self._profiles, None
+      try:
+        stats = pstats.Stats(profile)
+        for worker in profiles:
+          stats.add(worker)
+        stats.dump_stats(f'{prefix}.prof')
+        self._snapshot(f'{prefix}-alloc.txt')
+        log.log(logging.INFO, f'Wrote profile of the cycle to {prefix}.prof.')
+      except OSError as e:
+        log.log(logging.ERROR, f'Could not write profile: {e}')
+      finally:
+        if started_tracemalloc:
+          tracemalloc.stop()
+
+
+PROFILER = CycleProfiler()
@@ -0,0 +1,218 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import contextlib
+import datetime
+import functools
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from . import metrics
+
+log = logging.getLogger('app')
+MB = 1024 * 1024
+DIRECTIONS = ('download', 'upload')
+
+
+class ProgressEvent(NamedTuple):
+  job: str
+  direction: str
+  target: str
+  done: int
+  total: Optional[int]
+  rate: float
+  eta: Optional[float]
+  finished: bool
+
+
+class TransferProgress:
+  def __init__(self,
+               reporter: 'ProgressReporter',
+               job: str,
+               direction: str,
+               target: str,
+               total: Optional[int] = None,
+               offset: int = 0):
+    """Progress of one running download or upload. `update` is cheap enough to be called for
+    every block; events are only passed on to the listeners every `interval` seconds of the
+    reporter.
+
+    :param reporter: reporter the events are sent to.
+    :param job: name of the transferred file.
+    :param direction: `download` or `upload`.
+    :param target: service on the other end, e.g. `zoom`, `drive`, or the name of a destination.
+    :param total: size of the file in bytes, if known.
+    :param offset: bytes already transferred before, e.g. by an interrupted transfer; they do not
+      count towards the rate.
+    """
+    self.reporter = reporter
+    self.job = job
+    self.direction = direction
+    self.target = target
+    self.total = total
+    self.offset = offset
+    self.done = offset
+    self._started = time.monotonic()
+    self._emitted = self._started
+
+  def update(self, done: int, total: Optional[int] = None):
+    """Records the number of bytes transferred so far.
+
+    :param done: bytes transferred, including the offset.
+    :param total: size of the file, if it became known.
+    """
+    self.done = done
+    if total is not None:
+      self.total = total
+    now = time.monotonic()
+    if now - self._emitted >= self.reporter.interval:
+      self._emitted = now
+      self.reporter.emit(self.event())
+
+  def event(self, finished: bool = False) -> ProgressEvent:
+    """Returns the current state as an event.
+
+    :param finished: whether the transfer is over, successful or not.
+    """
+    elapsed = time.monotonic() - self._started
+    rate = (self.done - self.offset) / elapsed if elapsed > 0 else 0.0
+    eta = None
+    if self.total is not None and rate > 0:
+      eta = max(0.0, self.total - self.done) / rate
+    return ProgressEvent(self.job, self.direction, self.target, self.done, self.total, rate, eta,
+                         finished)
+
+
+class ProgressReporter:
+  def __init__(self, interval: float = 30.0):
+    """Collects the progress of running downloads and uploads and passes it to listeners, at most
+    once every `interval` seconds per transfer and once when the transfer ends. The transfers that
+    are running can be inspected with `active`, e.g. on a status endpoint.
+
+    :param interval: minimum number of seconds between two events of the same transfer.
+    """
+    self.interval = interval
+    self._listeners = []  # type: List[Callable[[ProgressEvent], None]]
+    self._active = {}  # type: Dict[int, TransferProgress]
+    self._lock = threading.Lock()
+
+  def configure(self, interval: float):
+    """Changes the minimum number of seconds between two events of a transfer."""
+    self.interval = interval
+
+  def subscribe(self, listener: Callable[[ProgressEvent], None]):
+    """Calls `listener` with every event.
+
+    :param listener: callable receiving a `ProgressEvent`.
+    """
+    with self._lock:
+      self._listeners.append(listener)
+
+  def unsubscribe(self, listener: Callable[[ProgressEvent], None]):
+    """Stops calling `listener`."""
+    with self._lock:
+      if listener in self._listeners:
+        self._listeners.remove(listener)
+
+  def emit(self, event: ProgressEvent):
+    """Passes an event to all listeners. Failing listeners are logged and do not affect the
+    transfer.
+
+    :param event: the event.
+    """
+    with self._lock:
+      listeners = tuple(self._listeners)
+    for listener in listeners:
+      try:
+        listener(event)
+      except Exception as e:  # pylint: disable=broad-except
+        log.log(logging.WARNING, f'Progress listener {listener!r} failed: {e!r}')
+
+  @contextlib.contextmanager
+  def track(self,
+            job: str,
+            direction: str,
+            target: str,
+            total: Optional[int] = None,
+            offset: int = 0) -> Iterator[TransferProgress]:
+    """Context manager tracking one transfer; the final event is sent when the block exits.
+
+    :param job: name of the transferred file.
+    :param direction: `download` or `upload`.
+    :param target: service on the other end.
+    :param total: size of the file in bytes, if known.
+    :param offset: bytes already transferred before.
+    :return: the progress object to `update`.
+    """
+    progress = TransferProgress(self, job, direction, target, total, offset)
+    with self._lock:
+      self._active[id(progress)] = progress
+    try:
+      yield progress
+    finally:
+      with self._lock:
+        del self._active[id(progress)]
+      self.emit(progress.event(finished=True))
+
+  def active(self) -> List[ProgressEvent]:
+    """Returns the current state of all running transfers."""
+    with self._lock:
+      running = list(self._active.values())
+    return [progress.event() for progress in running]
+
+  def remaining(self, direction: str) -> float:
+    """Returns the number of bytes left of the running transfers of known size.
+
+    :param direction: `download` or `upload`.
+    """
+    return float(sum(max(0, event.total - event.done) for event in self.active()
+                     if event.direction == direction and event.total is not None))
+
+  def route(self) -> Tuple[int, str, str]:
+    """Route for `MetricsServer` listing the running transfers as JSON."""
+    transfers = [{key: (round(value, 1) if isinstance(value, float) else value)
+                  for key, value in event._asdict().items() if key != 'finished'}
+                 for event in self.active()]
+    return 200, 'application/json', json.dumps({'transfers': transfers})
+
+
+def log_progress(event: ProgressEvent):
+  """Listener logging the progress of running transfers. The end of a transfer is not logged,
+  since the pipeline logs finished downloads and uploads itself.
+
+  :param event: the event.
+  """
+  if event.finished:
+    return
+  share = (f'{100 * event.done / event.total:.0f}% of {event.total / MB:.1f} MB'
+           if event.total else f'{event.done / MB:.1f} MB')
+  eta = str(datetime.timedelta(seconds=round(event.eta))) if event.eta is not None else 'unknown'
+  verb = 'Downloading' if event.direction == 'download' else 'Uploading'
+  log.log(logging.INFO, f'{verb} {event.job} ({event.target}): {share} at '
+                        f'{event.rate / MB:.1f} MB/s, ETA {eta}.')
+
+
+PROGRESS = ProgressReporter()
+for _direction in DIRECTIONS:
+  metrics.TRANSFER_REMAINING.labels(_direction).set_function(
+      functools.partial(PROGRESS.remaining, _direction))
+
+
+def track(job: str, direction: str, target: str, total: Optional[int] = None, offset: int = 0):
+  """Shortcut for `PROGRESS.track`."""
+  return PROGRESS.track(job, direction, target, total, offset)
@@ -0,0 +1,85 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import contextlib
+import importlib
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Iterator, List, Tuple
+
+
+class StartupProfile:
+  def __init__(self):
+    """Collects the duration of imports and initialization phases during startup. Phases may run
+    in parallel threads, so every phase is stored with its start offset.
+    """
+    self.started = time.perf_counter()
+    self.phases = []  # type: List[Tuple[str, str, float, float]]
+    self._lock = threading.Lock()
+
+  def record(self, name: str, start: float, end: float):
+    """Stores a finished phase.
+
+    :param name: name of the phase.
+    :param start: value of `time.perf_counter()` when the phase started.
+    :param end: value of `time.perf_counter()` when the phase ended.
+    """
+    with self._lock:
+      self.phases.append((name, threading.current_thread().name, start - self.started,
+                          end - start))
+
+  @contextlib.contextmanager
+  def phase(self, name: str) -> Iterator[None]:
+    """Measures the duration of the enclosed block.
+
+    :param name: name of the phase.
+    """
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.record(name, start, time.perf_counter())
+
+  def report(self) -> str:
+    """Formats all phases ordered by start time, followed by the total time since the profile
+    was created.
+    """
+    with self._lock:
+      phases = sorted(self.phases, key=lambda p: p[2])
+    lines = [f'{"phase":<36} {"thread":<24} {"start ms":>10} {"duration ms":>12}']
+    for name, thread, offset, duration in phases:
+      lines.append(f'{name:<36} {thread:<24} {offset * 1000:>10.1f} {duration * 1000:>12.1f}')
+    lines.append(f'{"total":<36} {"":<24} {"":>10} '
+                 f'{(time.perf_counter() - self.started) * 1000:>12.1f}')
+    return '\n'.join(lines)
+
+
+PROFILE = StartupProfile()
+
+
+def lazy_import(name: str) -> ModuleType:
+  """Imports a module on first use and records the time of the first import in `PROFILE`.
+  Used for heavy client libraries that are not needed until a service is set up.
+
+  :param name: absolute module name.
+  :return: the module.
+  """
+  module = sys.modules.get(name)
+  if module is not None:
+    return module
+  with PROFILE.phase(f'import {name}'):
+    return importlib.import_module(name)
@@ -0,0 +1,240 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+SERVICE_NAME = 'zoom-drive-connector'
+
+_current = contextvars.ContextVar('current_span', default=None)  # type: contextvars.ContextVar
+
+
+class _NoopSpan:
+  trace_id = None
+  span_id = None
+
+  def set_tag(self, key: str, value: Any):
+    """Ignores the tag."""
+
+  def finish(self):
+    """Does nothing."""
+
+  def __enter__(self) -> '_NoopSpan':
+    return self
+
+  def __exit__(self, *exc_info):
+    return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+  __slots__ = ('tracer', 'trace_id', 'span_id', 'parent_id', 'name', 'timestamp', 'tags',
+               '_start', '_token')
+
+  def __init__(self, tracer: 'Tracer', name: str, trace_id: str, parent_id: Optional[str],
+               tags: Dict[str, Any]):
+    """Timed operation that belongs to a trace.
+
+    :param tracer: tracer the span is exported by.
+    :param name: name of the operation.
+    :param trace_id: 128-bit hex ID shared by all spans of one job.
+    :param parent_id: span ID of the parent span, None for the root span.
+    :param tags: key/value annotations.
+    """
+    self.tracer = tracer
+    self.trace_id = trace_id
+    self.span_id = os.urandom(8).hex()
+    self.parent_id = parent_id
+    self.name = name
+    self.timestamp = time.time()
+    self.tags = tags
+    self._start = time.perf_counter()
+    self._token = None  # type: Optional[contextvars.Token]
+
+  def set_tag(self, key: str, value: Any):
+    """Annotates the span.
+
+    :param key: name of the tag.
+    :param value: value of the tag. Converted to a string on export.
+    """
+    self.tags[key] = value
+
+  def finish(self):
+    """Records the duration of the span and exports it."""
+    self.tracer.export(self, time.perf_counter() - self._start)
+
+  def __enter__(self) -> 'Span':
+    self._token = _current.set(self)
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    _current.reset(self._token)
+    if exc_type is not None:
+      self.tags['error'] = repr(exc_value)
+    self.finish()
+    return False
+
+
+class Tracer:
+  def __init__(self):
+    """Creates spans and writes finished spans to a rotating JSON-lines file. Spans are written as
+    Zipkin v2 JSON objects so they can be loaded into Zipkin, Jaeger, or any other viewer that
+    understands the Zipkin format. Finished spans are also passed to the listeners added with
+    `add_listener`. Until `configure` is called or a listener is added every span is a shared
+    no-op span.
+    """
+    self.enabled = False
+    self._listeners = []  # type: List[Callable[[Span, float], None]]
+    self._writing = False
+    self._logger = logging.getLogger('app.trace')
+    self._logger.propagate = False
+
+  def configure(self, path: str, max_bytes: int = 10 * 1024 * 1024, backups: int = 5):
+    """Enables tracing and writes spans to `path`.
+
+    :param path: JSON-lines file spans are appended to.
+    :param max_bytes: size at which the file is rotated.
+    :param backups: number of rotated files to keep.
+    """
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    self._logger.handlers = [handler]
+    self._logger.setLevel(logging.INFO)
+    self._writing = True
+    self.enabled = True
+
+  def disable(self):
+    """Closes the span file. Tracing stays on while listeners are registered."""
+    for handler in self._logger.handlers:
+      handler.close()
+    self._logger.handlers = []
+    self._writing = False
+    self.enabled = bool(self._listeners)
+
+  def add_listener(self, listener: Callable[['Span', float], None]):
+    """Enables tracing and calls `listener` with every finished span and its duration in seconds.
+    Listeners are called from the thread that finished the span and must be thread-safe.
+
+    :param listener: callable receiving the span and its duration.
+    """
+    self._listeners.append(listener)
+    self.enabled = True
+
+  def remove_listener(self, listener: Callable[['Span', float], None]):
+    """Stops passing spans to `listener`.
+
+    :param listener: a listener added with `add_listener`.
+    """
+    self._listeners.remove(listener)
+    self.enabled = bool(self._listeners) or self._writing
+
+  def start_span(self, name: str, parent: Optional[Span] = None, **tags):
+    """Creates a span without making it current. The caller is responsible for calling `finish`.
+
+    :param name: name of the operation.
+    :param parent: parent span. Defaults to the current span; a new trace is started if neither
+      exists.
+    :param tags: key/value annotations.
+    :return: new span, or the no-op span when tracing is disabled.
+    """
+    if not self.enabled:
+      return NOOP_SPAN
+
+    parent = parent or _current.get()
+    if parent is None or parent is NOOP_SPAN:
+      return Span(self, name, os.urandom(16).hex(), None, tags)
+    return Span(self, name, parent.trace_id, parent.span_id, tags)
+
+  def span(self, name: str, parent: Optional[Span] = None, **tags):
+    """Creates a span that is current for the duration of a `with` block.
+
+    :param name: name of the operation.
+    :param parent: parent span. Defaults to the current span.
+    :param tags: key/value annotations.
+    :return: span usable as a context manager.
+    """
+    return self.start_span(name, parent, **tags)
+
+  @contextlib.contextmanager
+  def activate(self, current) -> Iterator:
+    """Makes `current` the parent of spans created inside the block without finishing it.
+
+    :param current: span to activate.
+    """
+    if current is NOOP_SPAN or current is None:
+      yield current
+      return
+
+    token = _current.set(current)
+    try:
+      yield current
+    finally:
+      _current.reset(token)
+
+  def export(self, finished: Span, duration: float):
+    """Writes a finished span to the trace file in the Zipkin v2 format and passes it to the
+    listeners.
+
+    :param finished: finished span.
+    :param duration: duration of the span in seconds.
+    """
+    for listener in tuple(self._listeners):
+      listener(finished, duration)
+    if not self._writing:
+      return
+
+    record = {
+      'traceId': finished.trace_id,
+      'id': finished.span_id,
+      'name': finished.name,
+      'timestamp': int(finished.timestamp * 1e6),
+      'duration': max(1, int(duration * 1e6)),
+      'localEndpoint': {'serviceName': SERVICE_NAME},
+      'tags': {k: str(v) for k, v in finished.tags.items()}
+    }
+    if finished.parent_id:
+      record['parentId'] = finished.parent_id
+    self._logger.info(json.dumps(record, separators=(',', ':')))
+
+
+TRACER = Tracer()
+
+
+def span(name: str, parent: Optional[Span] = None, **tags):
+  """Shortcut for `TRACER.span`."""
+  return TRACER.span(name, parent, **tags)
+
+
+def start_span(name: str, parent: Optional[Span] = None, **tags):
+  """Shortcut for `TRACER.start_span`."""
+  return TRACER.start_span(name, parent, **tags)
+
+
+def activate(current):
+  """Shortcut for `TRACER.activate`."""
+  return TRACER.activate(current)
+
+
+def current_span():
+  """Returns the span that is currently active, or the no-op span."""
+  return _current.get() or NOOP_SPAN
@@ -0,0 +1,27 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+from .async_engine import AsyncScheduler
+from .backfill import Backfill, BackfillCheckpoint, BackfillProgress, date_windows
+from .concurrency import AIMDLimiter, Transfer, TransferLimits, failure_status, is_congestion
+from .priority import Job, JobQueue
+from .recovery import RecoveryResult, recover_downloads
+from .scheduler import Account, Scheduler
+from .sharding import HashRing, LeaseStore, ShardCoordinator
+from .steps import (all_steps, check_destinations, claimer, discover_recording, download,
+                    download_meeting, drive_file_name, finish_download, mark_notified,
+                    mark_stored, notification, process_meeting, recording_file,
+                    remove_local_copy, save_progress, settle_claims, upload_and_notify,
+                    upload_limited, upload_step)
@@ -0,0 +1,290 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import asyncio
+import concurrent.futures
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from zoom_drive_connector import configuration as config, destinations, drive, slack, zoom
+from zoom_drive_connector.aio import ConnectionPool
+from zoom_drive_connector.monitoring import metrics, tracing
+
+from .priority import JobQueue, Job
+from .scheduler import Account, Scheduler
+from .sharding import ShardCoordinator
+from .steps import (check_destinations, claimer, finish_download, mark_notified, mark_stored,
+                    notification, remove_local_copy, settle_claims, upload_step)
+
+log = logging.getLogger('app')
+
+DEFAULT_CONNECTIONS = 100
+DEFAULT_METADATA_CALLS = 1000
+DEFAULT_TRANSFERS = 32
+
+
+class AsyncScheduler(Scheduler):
+  def __init__(self,
+               zoom_config: config.ZoomConfig,
+               sys_config: config.SystemConfig,
+               drive_conn: Optional[drive.DriveAPI],
+               slack_conn: Optional[slack.SlackAPI],
+               shard: Optional[ShardCoordinator] = None,
+               trash_journal: Optional[zoom.TrashJournal] = None):
+    """Runs the same pipeline as `Scheduler`, but the lookups, downloads, uploads, and Slack
+    notifications of a run are coroutines on one event loop instead of jobs in the thread pools
+    of the accounts, so a running transfer costs a socket and a buffer rather than a thread. The
+    Zoom, Drive, and Slack clients share one `ConnectionPool` of `async_connections`
+    connections. Up to `async_metadata_calls` lookups and `async_transfers` transfers run at the
+    same time, and at most `workers` transfers of the same account; each account's transfers are
+    started in the order of its `JobQueue`. Disk writes, folder lookups, credential refreshes,
+    lease updates, and copies to destinations other than Google Drive run in the default
+    executor of the loop. Trashing, recovery, and shutdown work as in `Scheduler`; adaptive
+    concurrency only applies to the threaded engine.
+
+    :param zoom_config: Zoom section of the configuration file.
+    :param sys_config: configuration class containing all system related parameters.
+    :param drive_conn: API object instance for Google Drive. May be set after construction, but
+      before the first run.
+    :param slack_conn: API object instance for Slack.
+    :param shard: coordinator splitting the meetings between replicas, if several run.
+    :param trash_journal: journal of the recordings that are not trashed yet.
+    """
+    super(AsyncScheduler, self).__init__(zoom_config, sys_config, drive_conn, slack_conn, shard,
+                                         trash_journal)
+    self.metadata_calls = max(1, int(sys_config.get('async_metadata_calls',
+                                                    DEFAULT_METADATA_CALLS)))
+    self.transfers = max(1, int(sys_config.get('async_transfers', DEFAULT_TRANSFERS)))
+    self.pool = ConnectionPool(
+        limit=int(sys_config.get('async_connections', DEFAULT_CONNECTIONS)),
+        limit_per_host=int(sys_config.get('async_connections_per_host', 0)),
+        timeout=float(sys_config.get('http_timeout', 60)))
+    self.executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix='async-engine')
+    self.loop = asyncio.new_event_loop()
+    self.loop.set_default_executor(self.executor)
+
+  def run_once(self) -> Dict[str, int]:
+    """Processes every meeting of every account once on the event loop and waits until all of
+    them are done, see `Scheduler.run_once`.
+
+    :return: number of transferred recordings and failed meetings.
+    """
+    result = {'transferred': 0, 'failed': 0}
+    if not self._prepare_run():
+      return result
+    return self.loop.run_until_complete(self._run(result))
+
+  async def _run(self, result: Dict[str, int]) -> Dict[str, int]:
+    metadata = asyncio.Semaphore(self.metadata_calls)
+    transfers = asyncio.Semaphore(self.transfers)
+    # The clients are looked up for every run so the config watcher can replace them.
+    drive_conn = drive.AsyncDriveAPI(self.drive_conn, self.pool) if self.drive_conn else None
+    slack_conn = slack.AsyncSlackAPI(self.slack_conn, self.pool) if self.slack_conn else None
+    with self._lock:
+      meetings = []  # type: List[Tuple[Account, zoom.AsyncZoomAPI, config.MeetingRecord]]
+      for account in self.accounts.values():
+        zoom_conn = zoom.AsyncZoomAPI(account.zoom_api, self.pool)
+        meetings.extend((account, zoom_conn, meeting) for meeting in account.config.registry
+                        if not self.shard or self.shard.owns(meeting.id))
+
+    async def lookup(zoom_conn: zoom.AsyncZoomAPI, meeting: config.MeetingRecord):
+      async with metadata:
+        return await self._discover(zoom_conn, meeting)
+
+    lookups = await asyncio.gather(*(lookup(zoom_conn, meeting) for _, zoom_conn, meeting in
+                                     meetings), return_exceptions=True)
+
+    queues = {}  # type: Dict[str, Tuple[Account, zoom.AsyncZoomAPI, JobQueue]]
+    for (account, zoom_conn, meeting), recording in zip(meetings, lookups):
+      if isinstance(recording, BaseException):
+        result['failed'] += 1
+        log.log(logging.ERROR, f'Looking up meeting {meeting.id} of account {account.name} '
+                               f'failed: {recording!r}')
+        continue
+      if recording and not account.stored(meeting, recording):
+        if account.name not in queues:
+          queues[account.name] = (account, zoom_conn, JobQueue.from_config(account.config))
+        queues[account.name][2].put(meeting, recording)
+
+    workers = [self._work_async(account, zoom_conn, queue, transfers, drive_conn, slack_conn)
+               for account, zoom_conn, queue in
+               (queues.values() if not self.stopping.is_set() else [])
+               for _ in range(min(account.workers, len(queue)))]
+    for transferred, failed in await asyncio.gather(*workers):
+      result['transferred'] += transferred
+      result['failed'] += failed
+    # Jobs left when the scheduler is stopping are found again by the next run.
+    for _, _, queue in queues.values():
+      queue.clear()
+    return result
+
+  @staticmethod
+  async def _discover(zoom_conn: zoom.AsyncZoomAPI,
+                      meeting: config.MeetingRecord) -> Optional[Dict[str, Any]]:
+    """Same as `discover_recording`."""
+    try:
+      recording = await zoom_conn.get_recording_url(
+          meeting.id, await zoom_conn.generate_server_to_server_oath_token())
+      recording['discovered'] = time.time()
+      return recording
+    except zoom.ZoomAPIException as e:
+      if e.status_code != 404:
+        log.log(logging.ERROR, e)
+      return None
+
+  async def _work_async(self,
+                        account: Account,
+                        zoom_conn: zoom.AsyncZoomAPI,
+                        queue: JobQueue,
+                        transfers: asyncio.Semaphore,
+                        drive_conn: Optional[drive.AsyncDriveAPI],
+                        slack_conn: Optional[slack.AsyncSlackAPI]) -> Tuple[int, int]:
+    """Same as `Scheduler._work`, with a slot of `transfers` for every job."""
+    transferred = failed = 0
+    while not self.stopping.is_set():
+      async with transfers:
+        job = queue.get() if not self.stopping.is_set() else None
+        if not job:
+          break
+        done = False
+        try:
+          done = await self._process(account, zoom_conn, job, drive_conn, slack_conn)
+        except InterruptedError:
+          # The upload session is checkpointed, the recording is finished after the restart.
+          pass
+        except Exception as e:  # pylint: disable=broad-except
+          failed += 1
+          log.log(logging.ERROR, f'Processing meeting {job.meeting.id} of account {account.name} '
+                                 f'failed: {e!r}')
+        if done:
+          transferred += 1
+          queue.finished(job)
+        else:
+          queue.abandon(job)
+    return transferred, failed
+
+  async def _process(self,
+                     account: Account,
+                     zoom_conn: zoom.AsyncZoomAPI,
+                     job: Job,
+                     drive_conn: Optional[drive.AsyncDriveAPI],
+                     slack_conn: Optional[slack.AsyncSlackAPI]) -> bool:
+    """Same as `process_meeting`.
+
+    :return: true if a recording was transferred.
+    """
+    claimed = []  # type: List[str]
+    shard = self.shard
+    claim = claimer(shard, claimed) if shard is not None else None
+    loop = asyncio.get_running_loop()
+    try:
+      file = await self._download(zoom_conn, job.meeting, bool(account.config.delete), claim,
+                                  job.recording)
+      if file:
+        await self._upload(file, drive_conn, slack_conn, account.trash_queue)
+    except BaseException:
+      if shard is not None and claimed:
+        await loop.run_in_executor(None, settle_claims, shard, claimed, False)
+      raise
+
+    if shard is not None and claimed:
+      await loop.run_in_executor(None, settle_claims, shard, claimed, bool(file))
+    return bool(file)
+
+  @staticmethod
+  async def _download(zoom_conn: zoom.AsyncZoomAPI,
+                      meeting: config.MeetingRecord,
+                      delete: bool,
+                      claim: Optional[Callable[[Dict[str, Any]], bool]],
+                      recording: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Same as `download_meeting`."""
+    job = tracing.start_span('recording', meeting=meeting.name, meeting_id=meeting.id,
+                             account=zoom_conn.account)
+    discovered = (recording or {}).get('discovered') or time.time()
+    with metrics.IN_FLIGHT.track_inprogress(), tracing.activate(job):
+      res = await zoom_conn.pull_file_from_zoom(meeting.id, rm=delete, claim=claim,
+                                                recording=recording)
+    return finish_download(meeting, res, job, discovered, zoom_conn.account)
+
+  async def _store(self,
+                   file: Dict[str, Any],
+                   names: List[str],
+                   drive_conn: Optional[drive.AsyncDriveAPI]) -> Dict[str, str]:
+    """Copies a recording to Google Drive with the asyncio client and, at the same time, to the
+    other destinations of its meeting with `FAN_OUT` in the executor. Like `FanOut.store`, the
+    links are added to `file['stored']` and unfinished Drive uploads are kept in
+    `file['upload_sessions']`.
+
+    :return: links to the copies by destination name.
+    """
+    stored = file.setdefault('stored', {})  # type: Dict[str, str]
+    sessions = file.setdefault('upload_sessions', {})  # type: Dict[str, Dict[str, Any]]
+    others = [self.destinations[name] for name in names if name != 'drive']
+    upload_to_drive = 'drive' in names and 'drive' not in stored
+
+    tasks = []  # type: List[Awaitable[Any]]
+    if upload_to_drive:
+      if drive_conn is None:
+        raise destinations.DestinationException('drive', 'Google Drive is not set up')
+      # Only recordings of meetings with a `folder` path pass one on.
+      extra = {'folder': file['folder']} if file.get('folder') else {}
+      tasks.append(drive_conn.upload_file(file['file'], file['name'], file['folder_id'],
+                                          sessions.setdefault('drive', {}), **extra))
+    if others:
+      tasks.append(asyncio.get_running_loop().run_in_executor(
+          None, destinations.FAN_OUT.store, file, others))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    if upload_to_drive and not isinstance(results[0], BaseException):
+      stored['drive'] = results[0]
+      sessions.pop('drive', None)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    errors.sort(key=lambda e: not isinstance(e, InterruptedError))
+    if errors:
+      raise errors[0]
+    return stored
+
+  async def _upload(self,
+                    file: Dict[str, Any],
+                    drive_conn: Optional[drive.AsyncDriveAPI],
+                    slack_conn: Optional[slack.AsyncSlackAPI],
+                    trash_queue: Optional[zoom.TrashQueue]):
+    """Same as `upload_and_notify` for a single file."""
+    names = file.get('destinations') or ['drive']
+    metrics.QUEUE_DEPTH.labels('upload').inc()
+    with upload_step(file):
+      check_destinations(names, ['drive', *self.destinations])
+
+      # Get the url of the first destination to announce it.
+      with metrics.IN_FLIGHT.track_inprogress():
+        links = await self._store(file, names, drive_conn)
+      mark_stored(file, trash_queue)
+
+      if slack_conn is not None:
+        await slack_conn.post_message(notification(file, links[names[0]]), file['slack_channel'])
+        mark_notified(file)
+    remove_local_copy(file)
+
+  def close(self, timeout: float = 60.0):
+    """Closes all accounts, the connections, the executor, and the event loop.
+
+    :param timeout: number of seconds to wait for each trash queue to drain.
+    """
+    super(AsyncScheduler, self).close(timeout)
+    if not self.loop.is_closed():
+      self.loop.run_until_complete(self.pool.close())
+      self.executor.shutdown(wait=True)
+      self.loop.close()
@@ -0,0 +1,406 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import concurrent.futures
+import datetime
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, IO, List, Optional, Set, Tuple
+
+from zoom_drive_connector import configuration as config, zoom
+
+from .concurrency import TransferLimits
+from .scheduler import Account, Scheduler
+from .steps import drive_file_name, process_meeting
+
+log = logging.getLogger('app')
+
+# Zoom lists the recordings of at most one month per request.
+WINDOW_DAYS = 30
+MB = 1024 * 1024
+
+
+def date_windows(start: datetime.date,
+                 end: datetime.date,
+                 days: int = WINDOW_DAYS) -> List[Tuple[datetime.date, datetime.date]]:
+  """Splits a range of days into consecutive windows that Zoom can list in one go.
+
+  :param start: first day.
+  :param end: last day, inclusive.
+  :param days: maximum number of days per window.
+  :return: list of (first day, last day) tuples, both inclusive.
+  """
+  windows = []
+  while start <= end:
+    last = min(end, start + datetime.timedelta(days=days - 1))
+    windows.append((start, last))
+    start = last + datetime.timedelta(days=1)
+  return windows
+
+
+class BackfillCheckpoint:
+  def __init__(self, path: str):
+    """Remembers which recordings a backfill transferred and which date windows it finished, so
+    an interrupted backfill continues where it stopped. Every transferred recording is appended
+    to a log next to the state file (`<path>.log`), so recording a transfer does not depend on
+    the number of recordings already done. When a window is finished, the log is compacted into
+    the JSON state file, which is replaced atomically.
+
+    :param path: JSON file holding the state; created if it does not exist.
+    """
+    self.path = path
+    self.log_path = path + '.log'
+    self.done = set()  # type: Set[str]
+    self.windows = set()  # type: Set[str]
+    self._dirty = False
+    self._lock = threading.Lock()
+    if os.path.exists(path):
+      with open(path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+      self.done = set(state.get('done', []))
+      self.windows = set(state.get('windows', []))
+    if os.path.exists(self.log_path):
+      with open(self.log_path, 'r', encoding='utf-8') as f:
+        # A line without a newline was cut off by a crash, that recording is done again.
+        self.done.update(line[:-1] for line in f if line.endswith('\n'))
+
+  @staticmethod
+  def window_key(account: str, window: Tuple[datetime.date, datetime.date]) -> str:
+    """Returns the key a window of an account is stored under."""
+    return f'{account}:{window[0].isoformat()}:{window[1].isoformat()}'
+
+  def is_done(self, recording_id: str) -> bool:
+    """Returns true if the recording was transferred by an earlier backfill."""
+    with self._lock:
+      return recording_id in self.done
+
+  def mark_done(self, recording_id: str):
+    """Records that a recording was transferred by appending it to the log.
+
+    :param recording_id: ID of the recording on Zoom.
+    """
+    with self._lock:
+      self.done.add(recording_id)
+      self._dirty = True
+      try:
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+          f.write(recording_id + '\n')
+      except OSError as e:
+        log.log(logging.WARNING, f'Could not write backfill log {self.log_path}: {e}')
+
+  def window_done(self, key: str) -> bool:
+    """Returns true if every recording of the window was transferred by an earlier backfill."""
+    with self._lock:
+      return key in self.windows
+
+  def complete_window(self, key: str):
+    """Records that every recording of a window was transferred, so it is not listed again.
+
+    :param key: key returned by `window_key`.
+    """
+    with self._lock:
+      self.windows.add(key)
+      self._dirty = True
+    self.save()
+
+  def save(self):
+    """Compacts the log into the state file if anything changed since the last compaction."""
+    with self._lock:
+      if not self._dirty:
+        return
+      state = {'done': sorted(self.done), 'windows': sorted(self.windows)}
+      try:
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+          json.dump(state, f)
+        os.replace(self.path + '.tmp', self.path)
+        # Everything in the log is in the state file now.
+        with open(self.log_path, 'w', encoding='utf-8'):
+          pass
+        self._dirty = False
+      except OSError as e:
+        log.log(logging.WARNING, f'Could not write backfill state {self.path}: {e}')
+
+
+class BackfillProgress:
+  def __init__(self, stream: Optional[IO[str]] = None, interval: float = 10.0):
+    """Counts the recordings of a backfill and prints the throughput and the estimated time until
+    the recordings listed so far are transferred, every `interval` seconds.
+
+    :param stream: where the progress is printed; defaults to standard output.
+    :param interval: seconds between two progress lines, 0 to only print the final one.
+    """
+    self.stream = stream or sys.stdout
+    self.interval = interval
+    self.listed = 0
+    self.listed_bytes = 0
+    self.transferred = 0
+    self.transferred_bytes = 0
+    self.skipped = 0
+    self.skipped_bytes = 0
+    self.failed = 0
+    self.failed_bytes = 0
+    self.listing = True
+    self._started = time.monotonic()
+    self._stop = threading.Event()
+    self._thread = None  # type: Optional[threading.Thread]
+    self._lock = threading.Lock()
+
+  def add(self, size: int):
+    """Counts a recording that was listed.
+
+    :param size: size of the recording in bytes, 0 if unknown.
+    """
+    with self._lock:
+      self.listed += 1
+      self.listed_bytes += size
+
+  def finish(self, outcome: str, size: int):
+    """Counts a recording that was processed.
+
+    :param outcome: `transferred`, `skipped`, or `failed`.
+    :param size: size of the recording in bytes, 0 if unknown.
+    """
+    with self._lock:
+      setattr(self, outcome, getattr(self, outcome) + 1)
+      setattr(self, f'{outcome}_bytes', getattr(self, f'{outcome}_bytes') + size)
+
+  def summary(self) -> Dict[str, Any]:
+    """Returns the counters, the throughput in MB/s, and the estimated remaining seconds."""
+    elapsed = max(1e-6, time.monotonic() - self._started)
+    with self._lock:
+      rate = self.transferred_bytes / elapsed
+      processed = self.transferred_bytes + self.skipped_bytes + self.failed_bytes
+      remaining = max(0, self.listed_bytes - processed)
+      return {'listed': self.listed, 'transferred': self.transferred, 'skipped': self.skipped,
+              'failed': self.failed, 'transferred_mb': round(self.transferred_bytes / MB, 1),
+              'mb_per_s': round(rate / MB, 2), 'elapsed_s': round(elapsed, 1),
+              'eta_s': round(remaining / rate) if rate else None}
+
+  def line(self) -> str:
+    """Returns the progress as one line of text."""
+    s = self.summary()
+    processed = s['transferred'] + s['skipped'] + s['failed']
+    eta = str(datetime.timedelta(seconds=s['eta_s'])) if s['eta_s'] is not None else 'unknown'
+    return (f'{processed}/{s["listed"]}{"+" if self.listing else ""} recordings '
+            f'({s["transferred"]} transferred, {s["skipped"]} skipped, {s["failed"]} failed), '
+            f'{s["transferred_mb"]:.1f} MB at {s["mb_per_s"]:.2f} MB/s, ETA {eta}')
+
+  def _report(self):
+    while not self._stop.wait(self.interval):
+      self.report()
+
+  def report(self):
+    """Prints the current progress line."""
+    self.stream.write(self.line() + '\n')
+    self.stream.flush()
+
+  def start(self):
+    """Starts printing the progress periodically."""
+    self._started = time.monotonic()
+    if self.interval > 0:
+      self._thread = threading.Thread(target=self._report, name='backfill-progress', daemon=True)
+      self._thread.start()
+
+  def stop(self):
+    """Stops printing and prints the final progress line."""
+    self._stop.set()
+    if self._thread:
+      self._thread.join()
+    self.listing = False
+    self.report()
+
+
+class _Window:
+  def __init__(self, key: str):
+    """Bookkeeping of one listed date window; it is complete once it is listed and all of its
+    recordings are done.
+    """
+    self.key = key
+    self.pending = 0
+    self.listed = False
+    self.failed = False
+
+
+class Backfill:
+  def __init__(self,
+               scheduler: Scheduler,
+               start: datetime.date,
+               end: datetime.date,
+               checkpoint: BackfillCheckpoint,
+               workers: int = 8,
+               notify: bool = False,
+               page_size: int = 300,
+               progress: Optional[BackfillProgress] = None):
+    """Transfers the existing cloud recordings of the configured meetings between two dates. The
+    recordings of every account are listed by date window with `ZoomAPI.list_recordings`, and
+    transferred by `workers` threads with the same steps, destinations, and limits as the daemon.
+    Listing stays a few recordings ahead of the workers. Recordings in the checkpoint, and those
+    already in the Drive folder of their meeting, are skipped. The account settings decide whether
+    the recordings are trashed on Zoom; `backfill_user` of an account sets whose recordings are
+    listed, the owner of the app (`me`) by default.
+
+    :param scheduler: scheduler providing the accounts, the Drive client, and the destinations;
+      the backfill stops listing once it is `stopping`.
+    :param start: first day to transfer recordings of.
+    :param end: last day to transfer recordings of, inclusive.
+    :param checkpoint: state of earlier attempts of the same backfill.
+    :param workers: number of recordings transferred at the same time.
+    :param notify: announce the recordings in Slack, like the daemon does.
+    :param page_size: number of meetings Zoom returns per page.
+    :param progress: progress counters; a new one is created if not given.
+    """
+    self.scheduler = scheduler
+    self.start = start
+    self.end = end
+    self.checkpoint = checkpoint
+    self.workers = max(1, workers)
+    self.notify = notify
+    self.page_size = page_size
+    self.progress = progress or BackfillProgress()
+    # Bounds the recordings that are listed but not yet transferred.
+    self._slots = threading.BoundedSemaphore(2 * self.workers)
+    self._lock = threading.Lock()
+
+  def run(self) -> Dict[str, Any]:
+    """Runs the backfill until every window is processed or the scheduler is stopping.
+
+    :return: the final progress summary.
+    """
+    self.progress.start()
+    try:
+      with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers,
+                                                 thread_name_prefix='backfill') as executor:
+        for account in list(self.scheduler.accounts.values()):
+          for window in date_windows(self.start, self.end):
+            if self.scheduler.stopping.is_set():
+              break
+            self._list_window(executor, account, window)
+        self.progress.listing = False
+    finally:
+      self.checkpoint.save()
+      self.progress.stop()
+    return self.progress.summary()
+
+  def _list_window(self,
+                   executor: concurrent.futures.Executor,
+                   account: Account,
+                   window: Tuple[datetime.date, datetime.date]):
+    state = _Window(BackfillCheckpoint.window_key(account.name, window))
+    if self.checkpoint.window_done(state.key):
+      return
+
+    user = str(account.config.get('backfill_user', 'me'))
+    try:
+      for recording in account.zoom_api.list_recordings(user, window[0], window[1],
+                                                        self.page_size):
+        lookup = account.config.registry.lookup
+        meeting = lookup(recording['meeting']) or lookup(str(recording.get('uuid')))
+        if meeting is None:
+          continue
+        size = int(recording.get('size') or 0)
+        self.progress.add(size)
+        if self.checkpoint.is_done(recording['id']):
+          self.progress.finish('skipped', size)
+          continue
+
+        self._slots.acquire()
+        if self.scheduler.stopping.is_set():
+          self._slots.release()
+          state.failed = True
+          break
+        with self._lock:
+          state.pending += 1
+        future = executor.submit(self._transfer, account, meeting, recording)
+        future.add_done_callback(functools.partial(self._job_done, state))
+    except (zoom.ZoomAPIException, OSError) as e:
+      log.log(logging.ERROR, f'Listing the recordings of account {account.name} from '
+                             f'{window[0]} to {window[1]} failed: {e}')
+      state.failed = True
+
+    with self._lock:
+      state.listed = True
+      finished = not state.pending
+    if finished:
+      self._close_window(state)
+
+  def _job_done(self, state: _Window, future: concurrent.futures.Future):
+    self._slots.release()
+    with self._lock:
+      state.pending -= 1
+      if future.exception() is not None or not future.result():
+        state.failed = True
+      finished = state.listed and not state.pending
+    if finished:
+      self._close_window(state)
+
+  def _close_window(self, state: _Window):
+    if not state.failed:
+      self.checkpoint.complete_window(state.key)
+
+  def _already_uploaded(self, meeting: config.MeetingRecord, recording: Dict[str, Any]) -> bool:
+    if 'drive' not in (meeting.destinations or ['drive']):
+      return False
+    drive_conn = self.scheduler.drive_conn
+    if drive_conn is None:
+      return False
+    folder_id = meeting.folder_id
+    folder = meeting.folder_path(recording['date'])
+    if folder:
+      # A recording cannot be in a folder that does not exist, so none is created here.
+      resolved = drive_conn.folders.resolve(meeting.folder_id, folder, create=False)
+      if resolved is None:
+        return False
+      folder_id = resolved
+    name = drive_file_name(recording['date'], meeting.name)
+    return drive_conn.find_file(name, folder_id) is not None
+
+  def _transfer(self,
+                account: Account,
+                meeting: config.MeetingRecord,
+                recording: Dict[str, Any]) -> bool:
+    """Transfers one recording unless it is in Google Drive already.
+
+    :return: true if the recording is done, false if it has to be tried again.
+    """
+    size = int(recording.get('size') or 0)
+    if self.scheduler.stopping.is_set():
+      return False
+    try:
+      if self._already_uploaded(meeting, recording):
+        log.log(logging.INFO, f'Recording {recording["id"]} of {meeting.name} is in Google '
+                              'Drive already.')
+        self.progress.finish('skipped', size)
+      elif process_meeting(account.zoom_api, account.config, meeting, self.scheduler.drive_conn,
+                           self.scheduler.slack_conn if self.notify else None,
+                           account.trash_queue, None, recording, self.scheduler.destinations,
+                           TransferLimits(account.download_limit, self.scheduler.upload_limit)):
+        self.progress.finish('transferred', size)
+      else:
+        self.progress.finish('failed', size)
+        return False
+    except InterruptedError:
+      return False
+    except Exception as e:  # pylint: disable=broad-except
+      self.progress.finish('failed', size)
+      log.log(logging.ERROR, f'Backfilling recording {recording["id"]} of {meeting.name} '
+                             f'failed: {e!r}')
+      return False
+    self.checkpoint.mark_done(recording['id'])
+    return True
@@ -0,0 +1,258 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import contextlib
+import logging
+import threading
+import time
+from typing import ContextManager, Iterator, NamedTuple, Optional, Union
+
+import requests
+import urllib3
+
+from zoom_drive_connector import configuration as config
+from zoom_drive_connector.monitoring import metrics
+
+log = logging.getLogger('app')
+
+DEFAULT_MAX_CONCURRENCY = 8
+# A window whose throughput is this much lower than the one before the last increase undoes it.
+THROUGHPUT_DROP = 0.1
+# Factor the latency baseline rises by per window, so it follows lasting changes of the network.
+BASELINE_DRIFT = 1.05
+
+Status = Union[int, str, None]
+
+
+class Transfer:
+  def __init__(self):
+    """Outcome of one transfer, filled in by the code running in a slot of `AIMDLimiter`."""
+    self.size = 0
+    self.status = None  # type: Status
+
+
+def failure_status(e: BaseException) -> Status:
+  """Returns the HTTP status of a failed API call, `timeout` or `connection` for network errors,
+  and None for everything else.
+
+  :param e: exception raised by a transfer.
+  """
+  for attribute in ('status_code', 'status'):
+    value = getattr(e, attribute, None)
+    if isinstance(value, int):
+      return value
+  # googleapiclient.errors.HttpError keeps the status in the response.
+  value = getattr(getattr(e, 'resp', None), 'status', None)
+  if isinstance(value, int):
+    return value
+  if isinstance(e, (requests.exceptions.Timeout, urllib3.exceptions.TimeoutError, TimeoutError)):
+    return 'timeout'
+  if isinstance(e, (requests.exceptions.ConnectionError, urllib3.exceptions.ProtocolError,
+                    ConnectionError)):
+    return 'connection'
+  return None
+
+
+def is_congestion(status: Status) -> bool:
+  """Returns true for statuses that mean the remote side is overloaded: 429, 5xx, timeouts, and
+  dropped connections.
+  """
+  if isinstance(status, int):
+    return status == 429 or status >= 500
+  return status in ('timeout', 'connection')
+
+
+class AIMDLimiter:
+  def __init__(self,
+               name: str,
+               minimum: int = 1,
+               maximum: int = DEFAULT_MAX_CONCURRENCY,
+               initial: Optional[int] = None,
+               increase: float = 1.0,
+               decrease: float = 0.5,
+               latency_tolerance: float = 2.0):
+    """Limits the number of transfers of one stage that run at the same time and adapts the limit
+    with additive increase and multiplicative decrease. Results are evaluated in windows of as
+    many completed transfers as the limit allows. After a window in which the limit was reached,
+    it grows by `increase`. A 429 or 5xx answer, a timeout, or a window whose mean time per byte
+    is more than `latency_tolerance` times the best one seen shrinks it by the factor `decrease`.
+    Failures of transfers that started before the last decrease are ignored, so a burst of errors
+    only halves the limit once. If the throughput of a window drops after an increase, the
+    increase is undone. Every change is logged and counted in `CONCURRENCY_ADJUSTMENTS`.
+
+    :param name: name of the limiter, used in logs and as metric label.
+    :param minimum: lowest limit.
+    :param maximum: highest limit.
+    :param initial: limit to start with; defaults to `minimum`.
+    :param increase: number of transfers added after a good window.
+    :param decrease: factor applied to the limit on congestion.
+    :param latency_tolerance: factor by which the time per byte may exceed the baseline.
+    """
+    self.name = name
+    self.increase = increase
+    self.decrease = decrease
+    self.latency_tolerance = latency_tolerance
+    self.minimum = max(1, minimum)
+    self.maximum = max(self.minimum, maximum)
+    self._limit = float(min(self.maximum, max(self.minimum, initial or self.minimum)))
+    self._active = 0
+    self._peak = 0
+    self._busy = 0.0
+    self._busy_since = 0.0
+    self._decreased = float('-inf')
+    self._increased = False
+    self._baseline = None  # type: Optional[float]
+    self._previous = None  # type: Optional[float]
+    self._cond = threading.Condition()
+    self._reset_window()
+    metrics.CONCURRENCY_LIMIT.labels(name).set(self.limit)
+
+  @classmethod
+  def from_config(cls, name: str, zoom_config: config.ZoomConfig) -> Optional['AIMDLimiter']:
+    """Creates a limiter with the settings of a Zoom account, or returns None if
+    `adaptive_concurrency` is not enabled. The account's `workers` is the initial limit.
+
+    :param name: name of the limiter.
+    :param zoom_config: configuration of the account.
+    """
+    if not zoom_config.get('adaptive_concurrency', False):
+      return None
+    minimum = max(1, int(zoom_config.get('min_concurrency', 1)))
+    return cls(name, minimum, int(zoom_config.get('max_concurrency', DEFAULT_MAX_CONCURRENCY)),
+               initial=int(zoom_config.get('workers', 1)))
+
+  @property
+  def limit(self) -> int:
+    """Number of transfers that may run at the same time."""
+    return int(self._limit)
+
+  def configure(self, minimum: int, maximum: int):
+    """Changes the bounds, keeping the current limit if it is within them.
+
+    :param minimum: lowest limit.
+    :param maximum: highest limit.
+    """
+    with self._cond:
+      self.minimum = max(1, minimum)
+      self.maximum = max(self.minimum, maximum)
+      self._limit = min(float(self.maximum), max(float(self.minimum), self._limit))
+      self._cond.notify_all()
+    metrics.CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+
+  @contextlib.contextmanager
+  def slot(self) -> Iterator[Transfer]:
+    """Waits until fewer transfers than the limit are running and runs one. The caller sets the
+    size of the transfer and, if it failed without raising, its status on the returned
+    `Transfer`; the status of exceptions is taken from `failure_status`.
+    """
+    with self._cond:
+      while self._active >= self.limit:
+        self._cond.wait()
+      if not self._active:
+        self._busy_since = time.monotonic()
+      self._active += 1
+      self._peak = max(self._peak, self._active)
+
+    transfer = Transfer()
+    started = time.monotonic()
+    try:
+      yield transfer
+    except Exception as e:
+      if transfer.status is None:
+        transfer.status = failure_status(e)
+      raise
+    finally:
+      with self._cond:
+        now = time.monotonic()
+        self._active -= 1
+        if not self._active:
+          self._busy += now - self._busy_since
+        self._observe(transfer, started, now)
+        self._cond.notify_all()
+
+  def _reset_window(self):
+    self._count = 0
+    self._bytes = 0
+    self._seconds = 0.0
+    self._busy = 0.0
+    self._busy_since = time.monotonic()
+    self._peak = self._active
+
+  def _observe(self, transfer: Transfer, started: float, now: float):
+    if is_congestion(transfer.status):
+      if started >= self._decreased:
+        self._adjust(self._limit * self.decrease, 'down', f'status {transfer.status}')
+      return
+    if not transfer.size or transfer.status is not None:
+      return
+
+    self._count += 1
+    self._bytes += transfer.size
+    self._seconds += now - started
+    if self._count < self.limit:
+      return
+
+    busy = self._busy + (now - self._busy_since if self._active else 0.0)
+    throughput = self._bytes / busy if busy > 0 else 0.0
+    latency = self._seconds / self._bytes
+    baseline = self._baseline
+    self._baseline = latency if baseline is None else min(baseline * BASELINE_DRIFT, latency)
+    previous, self._previous = self._previous, throughput
+
+    if baseline is not None and latency > baseline * self.latency_tolerance:
+      self._adjust(self._limit * self.decrease, 'down', 'latency')
+    elif self._increased and previous and throughput < previous * (1 - THROUGHPUT_DROP):
+      self._adjust(self._limit - self.increase, 'down', 'throughput')
+    elif self._peak >= self.limit:
+      self._adjust(self._limit + self.increase, 'up', 'probe')
+    else:
+      # Fewer transfers were waiting than the limit allows, so a higher limit would not be tested.
+      self._increased = False
+      self._reset_window()
+
+  def _adjust(self, limit: float, direction: str, reason: str):
+    old = self.limit
+    self._limit = min(float(self.maximum), max(float(self.minimum), limit))
+    self._increased = direction == 'up'
+    if direction == 'down':
+      self._decreased = time.monotonic()
+    self._reset_window()
+    if self.limit == old:
+      return
+
+    metrics.CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+    metrics.CONCURRENCY_ADJUSTMENTS.labels(self.name, direction, reason.split()[0]).inc()
+    log.log(logging.INFO, f'Concurrency of {self.name} changed from {old} to {self.limit} '
+                          f'({reason}).')
+
+
+class TransferLimits(NamedTuple):
+  download: Optional[AIMDLimiter] = None
+  upload: Optional[AIMDLimiter] = None
+
+
+def slot(limiter: Optional[AIMDLimiter]) -> ContextManager[Transfer]:
+  """Returns `limiter.slot()`, or a slot that does not wait if there is no limiter.
+
+  :param limiter: limiter of the stage, if adaptive concurrency is enabled.
+  """
+  if limiter is None:
+    return _unlimited()
+  return limiter.slot()
+
+
+@contextlib.contextmanager
+def _unlimited() -> Iterator[Transfer]:
+  yield Transfer()
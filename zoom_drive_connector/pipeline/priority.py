@@ -0,0 +1,171 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from zoom_drive_connector import configuration as config
+from zoom_drive_connector.monitoring import metrics
+
+log = logging.getLogger('app')
+
+# One priority level is worth as much as an hour of waiting.
+PRIORITY_STEP = 3600.0
+DEFAULT_THROUGHPUT = 10 * 1024 * 1024
+
+
+def _timestamp(value: Optional[datetime.datetime]) -> Optional[float]:
+  if value is None:
+    return None
+  # Zoom reports times in UTC.
+  return value.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+class Job(NamedTuple):
+  meeting: config.MeetingRecord
+  recording: Dict[str, Any]
+  key: float
+  deadline: Optional[float]
+  ended: float
+
+
+class JobQueue:
+  def __init__(self,
+               account: str = 'default',
+               shortest_first: bool = False,
+               throughput: float = DEFAULT_THROUGHPUT,
+               aging: float = 1.0,
+               notify_slo: Optional[float] = None):
+    """Orders the recordings found in a run so that the most urgent ones are transferred first.
+    Every job earns credit for its configured priority (`PRIORITY_STEP` seconds per level) and
+    for every second since its recording ended, i.e. became available, multiplied by `aging`.
+    With `shortest_first`, the estimated transfer time of the recording is subtracted, so short
+    recordings overtake long ones until the long ones have waited about as long as their transfer
+    takes. Because all jobs earn credit at the same rate, their order never changes while they
+    wait, and a plain heap is enough.
+
+    :param account: name of the Zoom account, used to label deadline misses.
+    :param shortest_first: prefer small recordings.
+    :param throughput: expected transfer rate in bytes per second, used to convert the size of a
+      recording into a transfer time.
+    :param aging: credit earned per second since the recording ended.
+    :param notify_slo: number of seconds after the end of a recording by which the Slack
+      notification should be posted; deadlines are not tracked if not given.
+    """
+    self.account = account
+    self.shortest_first = shortest_first
+    self.throughput = max(1.0, float(throughput))
+    self.aging = float(aging)
+    self.notify_slo = notify_slo
+    self._heap = []  # type: List[Tuple[float, int, Job]]
+    self._counter = itertools.count()
+    self._lock = threading.Lock()
+
+  @classmethod
+  def from_config(cls, zoom_config: config.ZoomConfig) -> 'JobQueue':
+    """Creates a queue with the settings of a Zoom account.
+
+    :param zoom_config: configuration of the account.
+    """
+    slo = zoom_config.get('notify_slo')
+    return cls(zoom_config.account_name,
+               shortest_first=bool(zoom_config.get('shortest_job_first', False)),
+               throughput=float(zoom_config.get('expected_throughput', DEFAULT_THROUGHPUT)),
+               aging=float(zoom_config.get('priority_aging', 1.0)),
+               notify_slo=float(slo) if slo is not None else None)
+
+  def put(self, meeting: config.MeetingRecord, recording: Dict[str, Any]) -> Job:
+    """Adds the recording of a meeting to the queue.
+
+    :param meeting: the meeting the recording belongs to.
+    :param recording: recording information as returned by `ZoomAPI.get_recording_url`.
+    :return: the queued job.
+    """
+    now = time.time()
+    started = _timestamp(recording.get('date')) or now
+    ended = _timestamp(recording.get('end')) or started
+    # Aging starts when the recording became available; a long recording that started earlier
+    # has not waited any longer than the short ones that ended at the same time.
+    key = -meeting.priority * PRIORITY_STEP + self.aging * ended
+    if self.shortest_first and recording.get('size'):
+      key += recording['size'] / self.throughput
+    deadline = ended + self.notify_slo if self.notify_slo is not None else None
+
+    job = Job(meeting, recording, key, deadline, ended)
+    with self._lock:
+      heapq.heappush(self._heap, (key, next(self._counter), job))
+    metrics.QUEUE_DEPTH.labels('transfer').inc()
+    if recording.get('id'):
+      # The recording counts as unprocessed until it is uploaded or dropped from the run.
+      available = _timestamp(recording.get('end')) or recording.get('discovered') or now
+      metrics.PENDING_RECORDINGS.add(recording['id'], available)
+    return job
+
+  def get(self) -> Optional[Job]:
+    """Removes and returns the most urgent job, or None if the queue is empty."""
+    with self._lock:
+      if not self._heap:
+        return None
+      job = heapq.heappop(self._heap)[2]
+    metrics.QUEUE_DEPTH.labels('transfer').dec()
+    return job
+
+  def finished(self, job: Job, now: Optional[float] = None) -> bool:
+    """Records that the Slack notification for a job was posted.
+
+    :param job: the job returned by `get`.
+    :param now: time of the notification; defaults to the current time.
+    :return: true if the notification missed its deadline.
+    """
+    now = time.time() if now is None else now
+    if job.deadline is None or now <= job.deadline:
+      return False
+
+    metrics.DEADLINE_MISSES.labels(self.account).inc()
+    log.log(logging.WARNING, f'The recording of {job.meeting.name} was announced '
+                             f'{int(now - job.deadline)} seconds after its deadline.')
+    return True
+
+  def clear(self) -> int:
+    """Removes the jobs that were not started, e.g. because the scheduler is stopping. They are
+    found again by the next run.
+
+    :return: number of removed jobs.
+    """
+    with self._lock:
+      jobs, self._heap = [entry[2] for entry in self._heap], []
+    metrics.QUEUE_DEPTH.labels('transfer').dec(len(jobs))
+    for job in jobs:
+      self.abandon(job)
+    return len(jobs)
+
+  def abandon(self, job: Job):
+    """Records that the recording of a job was not transferred in this run, e.g. because the
+    download failed or another replica took it. It no longer counts as unprocessed until it is
+    found again.
+
+    :param job: the job returned by `get` or removed by `clear`.
+    """
+    if job.recording.get('id'):
+      metrics.PENDING_RECORDINGS.remove(job.recording['id'])
+
+  def __len__(self) -> int:
+    with self._lock:
+      return len(self._heap)
@@ -0,0 +1,171 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from zoom_drive_connector.monitoring import metrics, tracing
+
+log = logging.getLogger('app')
+
+SIDECAR_SUFFIX = '.json'
+MANIFEST_NAME = 'orphans.json'
+
+# Fields of the file dictionary passed to `upload_and_notify` that are kept in the sidecar.
+_FILE_KEYS = ('meeting', 'file', 'name', 'folder_id', 'slack_channel', 'date', 'unix', 'trash')
+# Fields that are kept if present; recordings downloaded by older versions go to Drive only.
+_OPTIONAL_KEYS = ('destinations', 'folder')
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class RecoveryResult(NamedTuple):
+  files: List[Dict[str, Any]]
+  orphans: List[Dict[str, Any]]
+
+
+def sidecar_path(path: str) -> str:
+  """Returns the path of the metadata file that belongs to a downloaded recording.
+
+  :param path: path of the recording.
+  """
+  return path + SIDECAR_SUFFIX
+
+
+def write_sidecar(file: Dict[str, Any], **extra: Any):
+  """Stores the information needed to upload a downloaded recording next to it, so the upload
+  can be resumed after a restart without downloading the recording again. The file is written
+  to a temporary name first so a crash never leaves a truncated sidecar behind.
+
+  :param file: file dictionary as returned by `download_meeting`.
+  :param extra: additional fields, e.g. the size and digest of the recording.
+  """
+  data = {k: file[k] for k in _FILE_KEYS + _OPTIONAL_KEYS if k in file}
+  data.update(extra)
+  path = sidecar_path(file['file'])
+  with open(path + '.tmp', 'w', encoding='utf-8') as f:
+    json.dump(data, f, default=str)
+  os.replace(path + '.tmp', path)
+
+
+def update_sidecar(path: str, **fields: Any):
+  """Adds fields to the metadata file of a recording, e.g. the session of an interrupted upload.
+  The file is written if it does not exist yet.
+
+  :param path: path of the recording.
+  :param fields: fields to set.
+  """
+  try:
+    with open(sidecar_path(path), 'r', encoding='utf-8') as f:
+      data = json.load(f)
+  except (OSError, ValueError):
+    data = {}
+  data.update(fields)
+  with open(sidecar_path(path) + '.tmp', 'w', encoding='utf-8') as f:
+    json.dump(data, f, default=str)
+  os.replace(sidecar_path(path) + '.tmp', sidecar_path(path))
+
+
+def remove_sidecar(path: str):
+  """Removes the metadata file of a recording, if there is one.
+
+  :param path: path of the recording.
+  """
+  try:
+    os.remove(sidecar_path(path))
+  except FileNotFoundError:
+    pass
+
+
+def _sha256(path: str) -> str:
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b''):
+      digest.update(block)
+  return digest.hexdigest()
+
+
+def _check(path: str) -> Dict[str, Any]:
+  """Loads and verifies the sidecar of a recording; raises ValueError if it does not match."""
+  try:
+    with open(sidecar_path(path), 'r', encoding='utf-8') as f:
+      data = json.load(f)
+  except FileNotFoundError:
+    raise ValueError('no metadata')
+  except ValueError:
+    raise ValueError('unreadable metadata')
+
+  if not isinstance(data, dict) or any(k not in data for k in _FILE_KEYS):
+    raise ValueError('incomplete metadata')
+  if data.get('size') is not None and os.path.getsize(path) != data['size']:
+    raise ValueError(f'size mismatch (expected {data["size"]} bytes)')
+  if data.get('sha256') and _sha256(path) != data['sha256']:
+    raise ValueError('checksum mismatch')
+  return data
+
+
+def recover_downloads(target_folder: str, manifest: Optional[str] = None) -> RecoveryResult:
+  """Looks for recordings left in the download folder by a previous run that stopped before
+  uploading them. Recordings whose sidecar matches their size and checksum are returned ready to
+  be passed to `upload_and_notify`. All other recordings are left in place and listed in a JSON
+  manifest so they can be inspected by hand; the manifest is removed when there are none.
+
+  :param target_folder: folder the recordings are downloaded to.
+  :param manifest: path of the manifest; defaults to `orphans.json` in `target_folder`.
+  :return: recovered file dictionaries and the entries of the manifest.
+  """
+  manifest = manifest or os.path.join(target_folder, MANIFEST_NAME)
+  files = []  # type: List[Dict[str, Any]]
+  orphans = []  # type: List[Dict[str, Any]]
+
+  for path in sorted(glob.glob(os.path.join(target_folder, '*.mp4'))):
+    try:
+      data = _check(path)
+    except ValueError as e:
+      stat = os.stat(path)
+      orphans.append({'file': path, 'size': stat.st_size, 'reason': str(e),
+                      'modified': datetime.datetime.fromtimestamp(
+                          stat.st_mtime, datetime.timezone.utc).isoformat()})
+      log.log(logging.WARNING, f'Cannot recover {path}: {e}.')
+      continue
+    except OSError as e:
+      log.log(logging.ERROR, f'Cannot read {path}: {e}')
+      continue
+
+    # The file may have been moved together with its folder.
+    data['file'] = path
+    data['span'] = tracing.start_span('recording', meeting=data['meeting'], recovered=True,
+                                      account=data.get('account'))
+    metrics.PENDING_RECORDINGS.add(data.get('recording_id') or path, data['unix'])
+    files.append(data)
+    log.log(logging.INFO, f'Recovered {path}, resuming its upload.')
+
+  for path in sorted(glob.glob(os.path.join(target_folder, '*.mp4' + SIDECAR_SUFFIX))):
+    if not os.path.exists(path[:-len(SIDECAR_SUFFIX)]):
+      # The recording was removed after the upload, but the process stopped before its sidecar.
+      os.remove(path)
+
+  if orphans:
+    with open(manifest, 'w', encoding='utf-8') as f:
+      json.dump(orphans, f, indent=2)
+    log.log(logging.WARNING, f'{len(orphans)} recordings could not be recovered, see {manifest}.')
+  elif os.path.exists(manifest):
+    os.remove(manifest)
+
+  return RecoveryResult(files, orphans)
@@ -0,0 +1,436 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import concurrent.futures
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from zoom_drive_connector import configuration as config, destinations, drive, slack, zoom
+from zoom_drive_connector.monitoring import profiling
+
+from . import recovery
+from .concurrency import AIMDLimiter, TransferLimits
+from .priority import JobQueue
+from .sharding import ShardCoordinator
+from .steps import discover_recording, process_meeting, upload_limited
+
+log = logging.getLogger('app')
+
+# Settings that can change without creating a new API client for the account.
+_MEETING_KEYS = ('meetings', 'include')
+
+
+class Account:
+  def __init__(self,
+               zoom_config: config.ZoomConfig,
+               sys_config: config.SystemConfig,
+               cancel: Optional[threading.Event] = None,
+               trash_journal: Optional[zoom.TrashJournal] = None):
+    """Everything that belongs to one Zoom account: the API client with its token cache and rate
+    limit, the trash queue, and a pool of `workers` threads that process its meetings. With
+    `adaptive_concurrency`, the pool has `max_concurrency` threads and the number of downloads
+    running at the same time is set by `download_limit`, starting at `workers`. Recordings that
+    an earlier process stored but did not trash are taken from the trash journal and trashed
+    again.
+
+    :param zoom_config: configuration of the account.
+    :param sys_config: configuration class containing all system related parameters.
+    :param cancel: event that interrupts the downloads of the account, see `Scheduler.stop`.
+    :param trash_journal: journal of the recordings that are not trashed yet.
+    """
+    self.name = zoom_config.account_name
+    self.config = zoom_config
+    self.sys_config = sys_config
+    self.cancel = cancel
+    self.zoom_api = zoom.ZoomAPI(zoom_config, sys_config, cancel)
+    self.trash_queue = zoom.TrashQueue(self.zoom_api,
+                                       max_retries=int(zoom_config.get('trash_retries', 5)),
+                                       rate=float(zoom_config.get('trash_rate', 5)),
+                                       backoff=float(zoom_config.get('trash_backoff', 2)),
+                                       name=f'zoom-trash-{self.name}',
+                                       journal=trash_journal,
+                                       account=self.name)
+    self.trash_queue.load()
+    self.download_limit = AIMDLimiter.from_config(f'download-{self.name}', zoom_config)
+    self.workers = self._pool_size()
+    self.executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=self.workers, thread_name_prefix=f'account-{self.name}')
+    self._settings = dict(zoom_config.settings_dict)
+
+  def _pool_size(self) -> int:
+    if self.download_limit:
+      return self.download_limit.maximum
+    return max(1, int(self.config.get('workers', 1)))
+
+  def start(self):
+    """Starts the background trash queue of the account."""
+    self.trash_queue.start()
+
+  def stored(self, meeting: config.MeetingRecord, recording: Dict[str, Any]) -> bool:
+    """Returns true if a recording was already stored and only waits to be trashed on Zoom, so
+    it must not be transferred again.
+
+    :param meeting: the meeting the recording belongs to.
+    :param recording: recording information from `discover_recording`.
+    """
+    if not self.trash_queue.stored(recording.get('id')):
+      return False
+    log.log(logging.INFO, f'Recording {recording["id"]} of meeting {meeting.id} was already '
+                          'stored, it is waiting to be trashed on Zoom.')
+    return True
+
+  def update(self, zoom_config: config.ZoomConfig, rebuild: bool = False):
+    """Applies a new configuration. The API client is only replaced if settings other than the
+    meetings changed. Jobs that are running keep the objects they started with.
+
+    :param zoom_config: new configuration of the account.
+    :param rebuild: replace the API client even if the account settings did not change.
+    """
+    new = dict(zoom_config.settings_dict)
+    changed = {k for k in set(self._settings) | set(new)
+               if k not in _MEETING_KEYS and self._settings.get(k) != new.get(k)}
+    self.config = zoom_config
+    self._settings = new
+    if not changed and not rebuild:
+      return
+
+    log.log(logging.INFO, f'Reconfiguring Zoom account {self.name}.')
+    self.zoom_api = zoom.ZoomAPI(zoom_config, self.sys_config, self.cancel)
+    self.trash_queue.zoom_conn = self.zoom_api
+    self.trash_queue.max_retries = int(zoom_config.get('trash_retries', 5))
+    self.trash_queue.limiter = zoom.RateLimiter(float(zoom_config.get('trash_rate', 5)))
+    self.trash_queue.backoff = float(zoom_config.get('trash_backoff', 2))
+
+    if self.download_limit and zoom_config.get('adaptive_concurrency', False):
+      # Keep the limit that was learned so far.
+      self.download_limit.configure(int(zoom_config.get('min_concurrency', 1)),
+                                    int(zoom_config.get('max_concurrency',
+                                                        self.download_limit.maximum)))
+    else:
+      self.download_limit = AIMDLimiter.from_config(f'download-{self.name}', zoom_config)
+    workers = self._pool_size()
+    if workers != self.workers:
+      old_executor = self.executor
+      self.workers = workers
+      self.executor = concurrent.futures.ThreadPoolExecutor(
+          max_workers=workers, thread_name_prefix=f'account-{self.name}')
+      old_executor.shutdown(wait=False)
+
+  def close(self, timeout: float = 60.0):
+    """Waits for outstanding trash requests and stops the account's threads. Requests that are
+    still outstanding stay in the trash journal for the next start.
+
+    :param timeout: number of seconds to wait for the trash queue to drain.
+    """
+    self.trash_queue.join(timeout)
+    self.trash_queue.stop()
+    self.executor.shutdown(wait=False)
+
+
+class Scheduler:
+  def __init__(self,
+               zoom_config: config.ZoomConfig,
+               sys_config: config.SystemConfig,
+               drive_conn: Optional[drive.DriveAPI],
+               slack_conn: Optional[slack.SlackAPI],
+               shard: Optional[ShardCoordinator] = None,
+               trash_journal: Optional[zoom.TrashJournal] = None):
+    """Runs the pipeline for every configured Zoom account in one process. Each account uses its
+    own credentials, token cache, rate limits, and worker pool; the Drive and Slack clients are
+    shared. With a trash journal, recordings that were stored but not trashed on Zoom are trashed
+    after a restart and are not transferred again.
+
+    :param zoom_config: Zoom section of the configuration file.
+    :param sys_config: configuration class containing all system related parameters.
+    :param drive_conn: API object instance for Google Drive. May be set after construction, but
+      before the first run.
+    :param slack_conn: API object instance for Slack.
+    :param shard: coordinator splitting the meetings between replicas, if several run.
+    :param trash_journal: journal of the recordings that are not trashed yet; closed by `close`.
+    """
+    self.zoom_config = zoom_config
+    self.sys_config = sys_config
+    self.drive_conn = drive_conn
+    self.slack_conn = slack_conn
+    self.shard = shard
+    self.trash_journal = trash_journal
+    # Set once the process is asked to stop; no new jobs are started after that.
+    self.stopping = threading.Event()
+    # Set when the grace period is over; running transfers stop after their current chunk.
+    self.interrupted = threading.Event()
+    self._grace_deadline = None  # type: Optional[float]
+    # Destinations other than Google Drive, see `destinations.create_destinations`. Create them
+    # with `interrupted` as their cancel event.
+    self.destinations = {}  # type: Dict[str, destinations.Destination]
+    # Limits the uploads of all accounts together if `adaptive_concurrency` is enabled.
+    self.upload_limit = None  # type: Optional[AIMDLimiter]
+    self.accounts = {}  # type: Dict[str, Account]
+    self._retired = []  # type: List[Account]
+    self._lock = threading.Lock()
+    self.reconcile()
+
+  def reconcile(self, rebuild: bool = False):
+    """Creates, updates, or retires accounts to match the current configuration. Retired accounts
+    are closed at the start of the next run so their running jobs can finish.
+
+    :param rebuild: replace the API clients of all accounts, e.g. after system settings changed.
+    """
+    with self._lock:
+      if self.upload_limit and self.zoom_config.get('adaptive_concurrency', False):
+        self.upload_limit.configure(
+            int(self.zoom_config.get('min_concurrency', 1)),
+            int(self.zoom_config.get('max_concurrency', self.upload_limit.maximum)))
+      else:
+        self.upload_limit = AIMDLimiter.from_config('upload', self.zoom_config)
+
+      accounts = {}  # type: Dict[str, Account]
+      for account_config in self.zoom_config.accounts:
+        account = self.accounts.get(account_config.account_name)
+        if account is None:
+          account = Account(account_config, self.sys_config, self.interrupted,
+                            self.trash_journal)
+          account.start()
+        else:
+          account.update(account_config, rebuild)
+        accounts[account.name] = account
+
+      self._retired.extend(a for name, a in self.accounts.items() if name not in accounts)
+      self.accounts = accounts
+
+  def drive_folders(self) -> Set[str]:
+    """Returns the Google Drive folders of all meetings that are uploaded to Drive, e.g. to
+    check them with `FolderResolver.validate` before the first run.
+    """
+    with self._lock:
+      return {meeting.folder_id for account in self.accounts.values()
+              for meeting in account.config.registry if 'drive' in meeting.destinations}
+
+  def _prepare_run(self) -> bool:
+    """Closes retired accounts and refreshes the shard assignment before a run.
+
+    :return: false if the run should be skipped.
+    """
+    with self._lock:
+      retired, self._retired = self._retired, []
+    for account in retired:
+      account.close()
+
+    if self.stopping.is_set():
+      return False
+    if self.shard:
+      try:
+        self.shard.refresh()
+      except sqlite3.Error as e:
+        # Without the lease store there is no way to tell which replica handles a meeting.
+        log.log(logging.ERROR, f'Skipping run, the lease store is not available: {e}')
+        return False
+    return True
+
+  def run_once(self) -> Dict[str, int]:
+    """Processes every meeting of every account once and waits until all of them are done.
+    First all meetings are looked up, then the recordings found are transferred by the workers of
+    each account in the order of its `JobQueue`. With sharding, only the meetings assigned to this
+    replica are processed. Failures of individual meetings are logged and do not stop the other
+    meetings.
+
+    :return: number of transferred recordings and failed meetings.
+    """
+    result = {'transferred': 0, 'failed': 0}
+    if not self._prepare_run():
+      return result
+
+    lookups = []  # type: List[Tuple[Account, config.MeetingRecord, concurrent.futures.Future]]
+    with self._lock:
+      # Reconfiguring an account may replace its executor, so jobs are submitted under the lock.
+      for account in self.accounts.values():
+        for meeting in account.config.registry:
+          if self.shard and not self.shard.owns(meeting.id):
+            continue
+          future = account.executor.submit(profiling.PROFILER.task(discover_recording),
+                                           account.zoom_api, meeting)
+          lookups.append((account, meeting, future))
+
+    queues = {}  # type: Dict[str, Tuple[Account, JobQueue]]
+    for account, meeting, future in lookups:
+      try:
+        recording = future.result()
+      except Exception as e:  # pylint: disable=broad-except
+        result['failed'] += 1
+        log.log(logging.ERROR, f'Looking up meeting {meeting.id} of account {account.name} '
+                               f'failed: {e!r}')
+        continue
+      if recording and not account.stored(meeting, recording):
+        if account.name not in queues:
+          queues[account.name] = (account, JobQueue.from_config(account.config))
+        queues[account.name][1].put(meeting, recording)
+
+    futures = []  # type: List[concurrent.futures.Future]
+    with self._lock:
+      for account, queue in (queues.values() if not self.stopping.is_set() else []):
+        for _ in range(min(account.workers, len(queue))):
+          futures.append(account.executor.submit(profiling.PROFILER.task(self._work), account,
+                                                 queue))
+
+    for worker in futures:
+      transferred, failed = worker.result()
+      result['transferred'] += transferred
+      result['failed'] += failed
+    # Jobs left when the scheduler is stopping are found again by the next run.
+    for _, queue in queues.values():
+      queue.clear()
+    return result
+
+  def _work(self, account: Account, queue: JobQueue) -> Tuple[int, int]:
+    """Transfers jobs from the queue until it is empty or the scheduler is stopping. Jobs left
+    in the queue are found again by the next run.
+
+    :return: number of transferred recordings and failed meetings.
+    """
+    transferred = failed = 0
+    while not self.stopping.is_set():
+      job = queue.get()
+      if not job:
+        break
+      done = False
+      try:
+        done = process_meeting(account.zoom_api, account.config, job.meeting, self.drive_conn,
+                               self.slack_conn, account.trash_queue, self.shard, job.recording,
+                               self.destinations,
+                               TransferLimits(account.download_limit, self.upload_limit))
+      except InterruptedError:
+        # The upload session is checkpointed, the recording is finished after the restart.
+        pass
+      except Exception as e:  # pylint: disable=broad-except
+        failed += 1
+        log.log(logging.ERROR, f'Processing meeting {job.meeting.id} of account {account.name} '
+                               f'failed: {e!r}')
+      if done:
+        transferred += 1
+        queue.finished(job)
+      else:
+        queue.abandon(job)
+    return transferred, failed
+
+  def _upload_recovered(self, file: Dict[str, Any], account: Optional[Account]) -> bool:
+    key = file.get('recording_id')
+    if self.shard and key and not self.shard.claim(key):
+      # Another replica downloaded the recording again after this one stopped.
+      log.log(logging.INFO, f'Recording {key} was taken over by another replica, removing '
+                            f'{file["file"]}.')
+      file['span'].finish()
+      os.remove(file['file'])
+      recovery.remove_sidecar(file['file'])
+      return False
+    try:
+      upload_limited(self.upload_limit, file, self.drive_conn, self.slack_conn,
+                     account.trash_queue if account else None, self.destinations)
+    except BaseException:
+      if self.shard and key:
+        self.shard.release(key)
+      raise
+    if self.shard and key:
+      self.shard.complete(key)
+    return True
+
+  def recover(self, target_folder: str) -> Dict[str, int]:
+    """Uploads the recordings a previous run downloaded but did not upload, see
+    `recover_downloads`. Recordings of accounts that are no longer configured are uploaded but not
+    trashed on Zoom.
+
+    :param target_folder: folder the recordings are downloaded to.
+    :return: number of recovered and orphaned recordings and of failed uploads.
+    """
+    found = recovery.recover_downloads(target_folder)
+    futures = []  # type: List[Tuple[Dict[str, Any], concurrent.futures.Future]]
+    with self._lock:
+      for file in found.files:
+        account = self.accounts.get(file.get('account', ''))
+        if account is None:
+          log.log(logging.WARNING, f'Account {file.get("account")} of {file["file"]} is not '
+                                   'configured; the recording will not be trashed on Zoom.')
+        executor = (account or next(iter(self.accounts.values()))).executor
+        futures.append((file, executor.submit(self._upload_recovered, file, account)))
+
+    result = {'recovered': 0, 'orphaned': len(found.orphans), 'failed': 0}
+    for file, future in futures:
+      try:
+        if future.result():
+          result['recovered'] += 1
+      except InterruptedError:
+        pass
+      except Exception as e:  # pylint: disable=broad-except
+        result['failed'] += 1
+        log.log(logging.ERROR, f'Uploading recovered recording {file["file"]} failed: {e!r}')
+    return result
+
+  @property
+  def trash_depth(self) -> int:
+    """Number of recordings waiting to be trashed across all accounts."""
+    return sum(account.trash_queue.depth for account in self.accounts.values())
+
+  def stop(self, grace: float = 30.0):
+    """Starts a graceful shutdown: no new jobs are started, and transfers that are running get
+    `grace` seconds to finish. After that they are interrupted at the next chunk; downloads
+    checkpoint their offset and uploads their Drive session so they are resumed after a restart.
+    Recordings are only trashed on Zoom once they are in Google Drive, so an interrupted transfer
+    never loses a recording. Calling `stop` again interrupts the transfers right away. Safe to call
+    from a signal handler.
+
+    :param grace: number of seconds running transfers may take to finish.
+    """
+    if self.stopping.is_set():
+      self.interrupt()
+      return
+    self._grace_deadline = time.monotonic() + grace
+    self.stopping.set()
+    log.log(logging.INFO, f'Stopping, waiting up to {grace:.0f} seconds for running transfers.')
+    timer = threading.Timer(grace, self.interrupt)
+    timer.daemon = True
+    timer.start()
+
+  def interrupt(self):
+    """Interrupts all running transfers after their current chunk."""
+    if self.interrupted.is_set():
+      return
+    self.stopping.set()
+    self.interrupted.set()
+    drive_conn = self.drive_conn
+    if drive_conn is not None:
+      drive_conn.cancel.set()
+    log.log(logging.INFO, 'Interrupting running transfers.')
+
+  @property
+  def grace_remaining(self) -> float:
+    """Number of seconds left of the grace period, 0 if the scheduler is not stopping."""
+    if self._grace_deadline is None:
+      return 0.0
+    return max(0.0, self._grace_deadline - time.monotonic())
+
+  def close(self, timeout: float = 60.0):
+    """Closes all accounts and the trash journal.
+
+    :param timeout: number of seconds to wait for each trash queue to drain.
+    """
+    for account in list(self.accounts.values()) + self._retired:
+      account.close(timeout)
+    self.accounts = {}
+    self._retired = []
+    if self.trash_journal:
+      self.trash_journal.close()
+      self.trash_journal = None
@@ -0,0 +1,267 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import bisect
+import contextlib
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+log = logging.getLogger('app')
+
+
+def _hash(value: str) -> int:
+  return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+  def __init__(self, replicas: Iterable[str], vnodes: int = 64):
+    """Consistent hash ring assigning keys to replicas. Every replica is placed on the ring
+    `vnodes` times, so adding or removing a replica only moves about 1/N of the keys.
+
+    :param replicas: names of the replicas.
+    :param vnodes: number of points per replica on the ring.
+    """
+    self.replicas = sorted(set(replicas))
+    points = sorted((_hash(f'{replica}#{i}'), replica)
+                    for replica in self.replicas for i in range(vnodes))
+    self._hashes = [p[0] for p in points]
+    self._owners = [p[1] for p in points]
+
+  def owner(self, key: str) -> Optional[str]:
+    """Returns the replica responsible for `key`.
+
+    :param key: e.g. a meeting ID.
+    :return: name of the replica, or None if the ring is empty.
+    """
+    if not self._hashes:
+      return None
+    index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+    return self._owners[index]
+
+
+class LeaseStore:
+  def __init__(self, path: str):
+    """Leases and replica heartbeats in an SQLite database that all replicas can reach, e.g. on a
+    shared volume. Every operation runs in its own short `BEGIN IMMEDIATE` transaction, so it is
+    safe to use from several threads and processes.
+
+    :param path: path of the database file; created if it does not exist.
+    """
+    self.path = path
+    with self._transaction() as db:
+      db.execute('CREATE TABLE IF NOT EXISTS leases '
+                 '(key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL, '
+                 'done INTEGER NOT NULL DEFAULT 0)')
+      db.execute('CREATE TABLE IF NOT EXISTS members '
+                 '(replica TEXT PRIMARY KEY, seen REAL NOT NULL)')
+
+  @contextlib.contextmanager
+  def _transaction(self) -> Iterator[sqlite3.Connection]:
+    db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+    try:
+      db.execute('BEGIN IMMEDIATE')
+      try:
+        yield db
+        db.execute('COMMIT')
+      except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    finally:
+      db.close()
+
+  def acquire(self, key: str, owner: str, ttl: float) -> bool:
+    """Claims `key` for `owner` unless another owner holds an unexpired lease on it. Expired
+    leases, including those of replicas that died, are taken over.
+
+    :param key: name of the leased item, e.g. a recording ID.
+    :param owner: name of the replica claiming the item.
+    :param ttl: number of seconds the lease is valid without renewal.
+    :return: true if `owner` now holds the lease.
+    """
+    now = time.time()
+    with self._transaction() as db:
+      row = db.execute('SELECT owner, expires, done FROM leases WHERE key = ?', (key,)).fetchone()
+      if row and row[1] > now and (row[0] != owner or row[2]):
+        return False
+      db.execute('INSERT OR REPLACE INTO leases (key, owner, expires, done) VALUES (?, ?, ?, 0)',
+                 (key, owner, now + ttl))
+      return True
+
+  def renew(self, keys: Iterable[str], owner: str, ttl: float) -> List[str]:
+    """Extends the leases `owner` still holds.
+
+    :param keys: names of the leased items.
+    :param owner: name of the replica holding the leases.
+    :param ttl: number of seconds the leases are valid from now on.
+    :return: the keys that could not be renewed because the lease was lost.
+    """
+    lost = []
+    expires = time.time() + ttl
+    with self._transaction() as db:
+      for key in keys:
+        cursor = db.execute('UPDATE leases SET expires = ? '
+                            'WHERE key = ? AND owner = ? AND done = 0', (expires, key, owner))
+        if cursor.rowcount == 0:
+          lost.append(key)
+    return lost
+
+  def complete(self, key: str, owner: str, ttl: float):
+    """Marks the item as done so no replica claims it again for `ttl` seconds.
+
+    :param key: name of the leased item.
+    :param owner: name of the replica holding the lease.
+    :param ttl: number of seconds the item stays marked as done.
+    """
+    with self._transaction() as db:
+      db.execute('UPDATE leases SET expires = ?, done = 1 WHERE key = ? AND owner = ?',
+                 (time.time() + ttl, key, owner))
+
+  def release(self, key: str, owner: str):
+    """Gives up a lease so another replica can retry the item right away.
+
+    :param key: name of the leased item.
+    :param owner: name of the replica holding the lease.
+    """
+    with self._transaction() as db:
+      db.execute('DELETE FROM leases WHERE key = ? AND owner = ? AND done = 0', (key, owner))
+
+  def heartbeat(self, replica: str):
+    """Records that `replica` is alive.
+
+    :param replica: name of the replica.
+    """
+    now = time.time()
+    with self._transaction() as db:
+      db.execute('INSERT OR REPLACE INTO members (replica, seen) VALUES (?, ?)', (replica, now))
+      # Leases that expired long ago only take up space.
+      db.execute('DELETE FROM leases WHERE expires < ?', (now - 86400,))
+
+  def members(self, ttl: float) -> List[str]:
+    """Returns the replicas that sent a heartbeat in the last `ttl` seconds.
+
+    :param ttl: maximum age of the last heartbeat in seconds.
+    """
+    with self._transaction() as db:
+      rows = db.execute('SELECT replica FROM members WHERE seen >= ? ORDER BY replica',
+                        (time.time() - ttl,)).fetchall()
+    return [row[0] for row in rows]
+
+
+class ShardCoordinator:
+  def __init__(self,
+               store: LeaseStore,
+               replica: str,
+               lease_ttl: float = 600.0,
+               member_ttl: float = 60.0,
+               done_ttl: float = 86400.0):
+    """Splits meetings between replicas and makes sure every recording is processed by only one
+    of them. Meetings are assigned with a `HashRing` over the replicas that sent a heartbeat
+    recently; because the ring can change between runs, every recording is additionally claimed
+    with a lease before it is downloaded. A background thread sends heartbeats and renews the
+    leases of running transfers.
+
+    :param store: shared lease store.
+    :param replica: unique name of this replica.
+    :param lease_ttl: number of seconds a lease stays valid if the replica stops renewing it.
+    :param member_ttl: number of seconds after the last heartbeat a replica counts as gone.
+    :param done_ttl: number of seconds a finished recording is not processed again.
+    """
+    self.store = store
+    self.replica = replica
+    self.lease_ttl = lease_ttl
+    self.member_ttl = member_ttl
+    self.done_ttl = done_ttl
+    self.ring = HashRing([replica])
+
+    self._held = {}  # type: Dict[str, float]
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._thread = None  # type: Optional[threading.Thread]
+
+  def refresh(self):
+    """Sends a heartbeat and rebuilds the ring from the live replicas."""
+    self.store.heartbeat(self.replica)
+    members = self.store.members(self.member_ttl)
+    if members != self.ring.replicas:
+      log.log(logging.INFO, f'Sharding meetings across replicas: {", ".join(members)}')
+      self.ring = HashRing(members)
+
+  def owns(self, meeting_id: str) -> bool:
+    """Returns true if this replica is responsible for the meeting.
+
+    :param meeting_id: meeting ID from the configuration file.
+    """
+    return self.ring.owner(meeting_id) in (self.replica, None)
+
+  def claim(self, key: str) -> bool:
+    """Takes the lease on a recording before any work on it starts.
+
+    :param key: recording ID.
+    :return: true if this replica may process the recording.
+    """
+    if not self.store.acquire(key, self.replica, self.lease_ttl):
+      return False
+    with self._lock:
+      self._held[key] = time.monotonic()
+    return True
+
+  def complete(self, key: str):
+    """Marks a recording as done after it was uploaded.
+
+    :param key: recording ID.
+    """
+    with self._lock:
+      self._held.pop(key, None)
+    self.store.complete(key, self.replica, self.done_ttl)
+
+  def release(self, key: str):
+    """Gives up the lease on a recording after a failure so it is retried.
+
+    :param key: recording ID.
+    """
+    with self._lock:
+      self._held.pop(key, None)
+    self.store.release(key, self.replica)
+
+  def _run(self):
+    while not self._stop.wait(min(self.member_ttl, self.lease_ttl) / 3):
+      try:
+        self.store.heartbeat(self.replica)
+        with self._lock:
+          held = list(self._held)
+        for key in self.store.renew(held, self.replica, self.lease_ttl):
+          log.log(logging.WARNING, f'Lease on recording {key} was lost to another replica.')
+      except sqlite3.Error as e:
+        log.log(logging.ERROR, f'Could not reach the lease store: {e}')
+
+  def start(self):
+    """Starts sending heartbeats and renewing leases in a background thread."""
+    self.refresh()
+    self._stop.clear()
+    self._thread = threading.Thread(target=self._run, name='shard-heartbeat', daemon=True)
+    self._thread.start()
+
+  def stop(self, timeout: Optional[float] = None):
+    """Stops the background thread.
+
+    :param timeout: number of seconds to wait for the thread to finish.
+    """
+    self._stop.set()
+    if self._thread:
+      self._thread.join(timeout)
@@ -0,0 +1,439 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import contextlib
+import datetime
+import logging
+import os
+import time
+from typing import TypeVar, cast, Any, Callable, Container, Dict, Iterator, List, Optional
+
+from zoom_drive_connector import configuration as config, destinations, drive, slack, zoom
+from zoom_drive_connector.monitoring import latency, metrics, tracing
+
+from . import recovery
+from .concurrency import AIMDLimiter, Transfer, TransferLimits, slot
+from .sharding import ShardCoordinator
+
+log = logging.getLogger('app')
+S = TypeVar("S", bound=config.APIConfigBase)
+
+
+def drive_file_name(date: datetime.datetime, meeting_name: str) -> str:
+  """Returns the name a recording gets in Google Drive.
+
+  :param date: start of the recording.
+  :param meeting_name: name of the meeting as configured.
+  """
+  return f'{date.strftime("%Y%m%d")}-{meeting_name}.mp4'
+
+
+def discover_recording(zoom_conn: zoom.ZoomAPI,
+                       meeting: config.MeetingRecord) -> Optional[Dict[str, Any]]:
+  """Looks up the latest recording of one meeting without downloading it.
+
+  :param zoom_conn: API object instance for Zoom.
+  :param meeting: the meeting to look up.
+  :return: recording information as returned by `ZoomAPI.get_recording_url` plus the time it was
+    `discovered`, or None if there is no recording or the lookup failed.
+  """
+  try:
+    recording = zoom_conn.get_recording_url(meeting.id,
+                                            zoom_conn.generate_server_to_server_oath_token())
+    recording['discovered'] = time.time()
+    return recording
+  except zoom.ZoomAPIException as e:
+    if e.status_code != 404:
+      log.log(logging.ERROR, e)
+    return None
+
+
+def recording_file(meeting: config.MeetingRecord,
+                   res: Dict[str, Any],
+                   job: tracing.Span,
+                   discovered: float,
+                   account: str) -> Dict[str, Any]:
+  """Builds the file dictionary of a downloaded recording and writes its sidecar.
+
+  :param meeting: the meeting the recording belongs to.
+  :param res: successful result of `ZoomAPI.pull_file_from_zoom`.
+  :param job: root span of the recording, finished once the file was uploaded.
+  :param discovered: time the recording was found.
+  :param account: name of the Zoom account.
+  :return: dictionary containing the recording information.
+  """
+  name = drive_file_name(res['date'], meeting.name)
+  unix = int(res['date'].replace(tzinfo=datetime.timezone.utc).timestamp())
+  ended = unix
+  if res.get('end'):
+    ended = int(res['end'].replace(tzinfo=datetime.timezone.utc).timestamp())
+
+  file = {'meeting': meeting.name,
+          'file': res['filename'],
+          'name': name,
+          'folder_id': meeting.folder_id,
+          'slack_channel': meeting.slack_channel,
+          'date': res['date'].strftime('%B %d, %Y at %H:%M'),
+          'unix': unix,
+          'recording_id': res.get('id'),
+          'trash': res['trash'],
+          'destinations': list(meeting.destinations),
+          'span': job,
+          'milestones': {'ended': ended, 'discovered': discovered, 'downloaded': time.time()}}
+  folder = meeting.folder_path(res['date'])
+  if folder:
+    file['folder'] = folder
+  try:
+    # Lets the upload be resumed after a restart without downloading the recording again.
+    recovery.write_sidecar(file, account=account, meeting_id=meeting.id,
+                           recording_id=res.get('id'), size=res.get('size'),
+                           sha256=res.get('sha256'))
+  except OSError as e:
+    log.log(logging.WARNING, f'Could not write metadata for {res["filename"]}: {e}')
+  return file
+
+
+def download_meeting(zoom_conn: zoom.ZoomAPI,
+                     meeting: config.MeetingRecord,
+                     delete: bool,
+                     claim: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                     recording: Optional[Dict[str, Any]] = None,
+                     transfer: Optional[Transfer] = None) -> Optional[Dict[str, Any]]:
+  """Downloads the latest recording of one meeting from Zoom.
+
+  :param zoom_conn: API object instance for Zoom.
+  :param meeting: the meeting to download the recording of.
+  :param delete: whether the video itself should be trashed on Zoom after the upload.
+  :param claim: called with the recording information before the download; the recording is
+    skipped if it returns false.
+  :param recording: recording information from `discover_recording`, if the meeting was already
+    looked up.
+  :param transfer: receives the size of the download, or the status if it failed, for the
+    concurrency limiter.
+  :return: dictionary containing the recording information, or None if there is no recording.
+  """
+  # Every recording gets its own trace; the span is finished once the job is done.
+  job = tracing.start_span('recording', meeting=meeting.name, meeting_id=meeting.id,
+                           account=zoom_conn.account)
+  discovered = (recording or {}).get('discovered') or time.time()
+  with metrics.IN_FLIGHT.track_inprogress(), tracing.activate(job):
+    res = zoom_conn.pull_file_from_zoom(meeting.id, rm=delete, claim=claim, recording=recording)
+  if transfer is not None:
+    transfer.size = res.get('size') or 0
+    transfer.status = res.get('status')
+  return finish_download(meeting, res, job, discovered, zoom_conn.account)
+
+
+def finish_download(meeting: config.MeetingRecord,
+                    res: Dict[str, Any],
+                    job: tracing.Span,
+                    discovered: float,
+                    account: str) -> Optional[Dict[str, Any]]:
+  """Turns the result of `pull_file_from_zoom` into the file dictionary of the recording, see
+  `recording_file`. If nothing was downloaded, the span of the recording is finished with the
+  reason.
+
+  :param meeting: the meeting the recording belongs to.
+  :param res: result of `ZoomAPI.pull_file_from_zoom`.
+  :param job: root span of the recording.
+  :param discovered: time the recording was found.
+  :param account: name of the Zoom account.
+  :return: dictionary containing the recording information, or None if there is no recording.
+  """
+  if (res['success']) and (res['filename']):
+    return recording_file(meeting, res, job, discovered, account)
+
+  job.set_tag('status', 'skipped' if res.get('skipped') else
+              'interrupted' if res.get('interrupted') else 'no_recording')
+  job.finish()
+  return None
+
+
+def download(zoom_conn: zoom.ZoomAPI, zoom_conf: config.ZoomConfig) -> List[Dict[str, Any]]:
+  """Downloads all available recordings from Zoom and returns a list of dicts with all relevant
+  information about the recording.
+
+  :param zoom_conn: API object instance for Zoom.
+  :param zoom_conf: configuration instance containing all Zoom API settings.
+  :return: list of dictionaries containing meeting recording information.
+  """
+  result = []
+
+  for meeting in zoom_conf.registry:
+    file = download_meeting(zoom_conn, meeting, bool(zoom_conf.delete))
+    if file:
+      result.append(file)
+
+  return result
+
+
+def upload_and_notify(files: List,
+                      drive_conn: Optional[drive.DriveAPI],
+                      slack_conn: Optional[slack.SlackAPI],
+                      trash_queue: Optional[zoom.TrashQueue] = None,
+                      targets: Optional[Dict[str, destinations.Destination]] = None):
+  """Copies a list of files from the local filesystem to the destinations of their meetings,
+  Google Drive unless configured otherwise. A file with several destinations is copied to all of
+  them in parallel. Once a file is stored at every destination, the corresponding recordings are
+  handed to the trash queue and the local file is removed. If a copy fails or is interrupted,
+  the destinations that succeeded and the state of the unfinished transfers are saved in the
+  sidecar of the file, so a recovered file resumes where it stopped and nothing is trashed.
+
+  :param files: list of dictionaries containing file information.
+  :param drive_conn: API instance for Google Drive, or None if it is not set up.
+  :param slack_conn: API instance for Slack, or None to store the files without announcing them.
+  :param trash_queue: background queue that trashes uploaded recordings on Zoom.
+  :param targets: destinations other than Google Drive by name, see `create_destinations`.
+  """
+  available = dict(targets or {})
+  available['drive'] = destinations.DriveDestination(drive_conn)
+  metrics.QUEUE_DEPTH.labels('upload').inc(len(files))
+  for file in files:
+    names = file.get('destinations') or ['drive']
+    with upload_step(file):
+      check_destinations(names, available)
+
+      # Get the url of the first destination to announce it.
+      with metrics.IN_FLIGHT.track_inprogress():
+        links = destinations.FAN_OUT.store(file, [available[name] for name in names])
+      mark_stored(file, trash_queue)
+
+      # Backfills store old recordings without announcing them. Only post message if the
+      # upload worked.
+      if slack_conn is not None:
+        slack_conn.post_message(notification(file, links[names[0]]), file['slack_channel'])
+        mark_notified(file)
+    remove_local_copy(file)
+
+
+def check_destinations(names: List[str], available: Container[str]):
+  """Raises `DestinationException` if a recording should go to a destination that is not
+  configured.
+
+  :param names: destinations of the recording.
+  :param available: names of the configured destinations.
+  """
+  unknown = [name for name in names if name not in available]
+  if unknown:
+    raise destinations.DestinationException(', '.join(unknown), 'destination not configured')
+
+
+@contextlib.contextmanager
+def upload_step(file: Dict[str, Any]) -> Iterator[tracing.Span]:
+  """Runs the upload of one file in the span of its recording and finishes the span afterwards.
+  If the upload fails or is interrupted, the state of its transfers is saved in the sidecar, see
+  `save_progress`. The file is taken off the upload queue depth either way.
+
+  :param file: dictionary containing file information.
+  :return: the span of the recording.
+  """
+  job = file.get('span', tracing.NOOP_SPAN)
+  try:
+    with tracing.activate(job):
+      yield job
+  except InterruptedError:
+    job.set_tag('status', 'interrupted')
+    save_progress(file)
+    log.log(logging.INFO, f'Upload of {file["file"]} interrupted, saved its upload sessions.')
+    raise
+  except Exception as e:
+    job.set_tag('error', repr(e))
+    save_progress(file)
+    raise
+  finally:
+    job.finish()
+    metrics.QUEUE_DEPTH.labels('upload').dec()
+
+
+def mark_stored(file: Dict[str, Any], trash_queue: Optional[zoom.TrashQueue]):
+  """Records that a file was stored at all its destinations and, since it is safe now, hands its
+  recordings to the trash queue.
+
+  :param file: dictionary containing file information.
+  :param trash_queue: background queue that trashes uploaded recordings on Zoom.
+  """
+  milestones = file.get('milestones')
+  if milestones:
+    milestones['uploaded'] = time.time()
+  if trash_queue:
+    for item in file.get('trash', []):
+      trash_queue.put(item['meeting_id'], item['id'])
+
+
+def mark_notified(file: Dict[str, Any]):
+  """Records that the Slack notification of a file was posted and observes its latency.
+
+  :param file: dictionary containing file information.
+  """
+  milestones = file.get('milestones')
+  if milestones:
+    milestones['notified'] = time.time()
+    latency.TRACKER.observe(file['meeting'], milestones)
+
+
+def notification(file: Dict[str, Any], file_url: str) -> str:
+  """Returns the Slack message announcing an uploaded recording.
+
+  :param file: dictionary containing file information.
+  :param file_url: link to the recording.
+  """
+  # The formatted date/time string to be used for older Slack clients
+  fall_back = f"{file['date']} UTC"
+  return (f'The recording of _{file["meeting"]}_ on '
+          "_<!date^" + str(file['unix']) + "^{date} at {time}|" + fall_back + ">_"
+          f' is <{file_url}| now available>.')
+
+
+def remove_local_copy(file: Dict[str, Any]):
+  """Removes an uploaded recording and its sidecar so we do not run out of disk space in our
+  container.
+
+  :param file: dictionary containing file information.
+  """
+  os.remove(file['file'])
+  recovery.remove_sidecar(file['file'])
+  metrics.PENDING_RECORDINGS.remove(file.get('recording_id') or file['file'])
+
+
+def upload_limited(limiter: Optional[AIMDLimiter],
+                   file: Dict[str, Any],
+                   drive_conn: Optional[drive.DriveAPI],
+                   slack_conn: Optional[slack.SlackAPI],
+                   trash_queue: Optional[zoom.TrashQueue] = None,
+                   targets: Optional[Dict[str, destinations.Destination]] = None):
+  """Runs `upload_and_notify` for one file in a slot of the upload limiter.
+
+  :param limiter: adaptive limiter of the uploads, or None to upload right away.
+  :param file: dictionary containing file information.
+  :param drive_conn: API instance for Google Drive, or None if it is not set up.
+  :param slack_conn: API instance for Slack, or None to not announce the file.
+  :param trash_queue: background queue that trashes uploaded recordings on Zoom.
+  :param targets: destinations other than Google Drive by name.
+  """
+  with slot(limiter) as transfer:
+    try:
+      transfer.size = os.path.getsize(file['file'])
+    except OSError:
+      pass
+    upload_and_notify([file], drive_conn, slack_conn, trash_queue, targets)
+
+
+def save_progress(file: Dict[str, Any]):
+  """Stores the destinations a file reached and its unfinished transfers in its sidecar."""
+  if 'stored' not in file and 'upload_sessions' not in file:
+    return
+  try:
+    recovery.update_sidecar(file['file'], stored=file.get('stored', {}),
+                            upload_sessions=file.get('upload_sessions', {}))
+  except OSError as e:
+    log.log(logging.WARNING, f'Could not save the upload state of {file["file"]}: {e}')
+
+
+def all_steps(zoom_conn: zoom.ZoomAPI,
+              slack_conn: slack.SlackAPI,
+              drive_conn: drive.DriveAPI,
+              zoom_config: S,
+              trash_queue: Optional[zoom.TrashQueue] = None):
+  """Primary function dispatcher that calls functions which download files and then upload them and
+  notifies people in Slack that they are on Google Drive.
+
+  :param zoom_conn: API object instance for Zoom.
+  :param slack_conn: API object instance for Slack.
+  :param drive_conn: API object instance for Google Drive.
+  :param zoom_config: configuration instance containing all Zoom API settings.
+  :param trash_queue: background queue that trashes uploaded recordings on Zoom.
+  """
+  downloaded_files = download(zoom_conn, cast(config.ZoomConfig, zoom_config))
+  upload_and_notify(downloaded_files, drive_conn, slack_conn, trash_queue)
+
+
+def process_meeting(zoom_conn: zoom.ZoomAPI,
+                    zoom_conf: config.ZoomConfig,
+                    meeting: config.MeetingRecord,
+                    drive_conn: Optional[drive.DriveAPI],
+                    slack_conn: Optional[slack.SlackAPI],
+                    trash_queue: Optional[zoom.TrashQueue] = None,
+                    shard: Optional[ShardCoordinator] = None,
+                    recording: Optional[Dict[str, Any]] = None,
+                    targets: Optional[Dict[str, destinations.Destination]] = None,
+                    limits: Optional[TransferLimits] = None) -> bool:
+  """Runs all steps for a single meeting: download, upload, notification, and trashing.
+
+  :param zoom_conn: API object instance for Zoom.
+  :param zoom_conf: configuration of the account the meeting belongs to.
+  :param meeting: the meeting to process.
+  :param drive_conn: API object instance for Google Drive, or None if it is not set up.
+  :param slack_conn: API object instance for Slack, or None to not announce the recording.
+  :param trash_queue: background queue that trashes uploaded recordings on Zoom.
+  :param shard: when several replicas run, used to claim the recording before downloading it.
+  :param recording: recording information from `discover_recording`, if the meeting was already
+    looked up.
+  :param targets: destinations other than Google Drive by name.
+  :param limits: adaptive limiters the download and the upload wait for, if enabled.
+  :return: true if a recording was transferred.
+  """
+  limits = limits or TransferLimits()
+  if shard is None:
+    with slot(limits.download) as transfer:
+      file = download_meeting(zoom_conn, meeting, bool(zoom_conf.delete), recording=recording,
+                              transfer=transfer)
+    if not file:
+      return False
+    upload_limited(limits.upload, file, drive_conn, slack_conn, trash_queue, targets)
+    return True
+
+  claimed = []  # type: List[str]
+  try:
+    with slot(limits.download) as transfer:
+      file = download_meeting(zoom_conn, meeting, bool(zoom_conf.delete),
+                              claimer(shard, claimed), recording, transfer)
+    if file:
+      upload_limited(limits.upload, file, drive_conn, slack_conn, trash_queue, targets)
+  except BaseException:
+    settle_claims(shard, claimed, False)
+    raise
+
+  settle_claims(shard, claimed, bool(file))
+  return bool(file)
+
+
+def claimer(shard: ShardCoordinator, claimed: List[str]) -> Callable[[Dict[str, Any]], bool]:
+  """Returns the `claim` callback of `pull_file_from_zoom` for a replica.
+
+  :param shard: coordinator the recordings are claimed on.
+  :param claimed: receives the IDs of the recordings that were claimed.
+  """
+  def claim(recording: Dict[str, Any]) -> bool:
+    if shard.claim(recording['id']):
+      claimed.append(recording['id'])
+      return True
+    return False
+
+  return claim
+
+
+def settle_claims(shard: ShardCoordinator, claimed: List[str], transferred: bool):
+  """Completes the claimed recordings once they were transferred. Otherwise they are released
+  so that they are retried, possibly by another replica.
+
+  :param shard: coordinator the recordings were claimed on.
+  :param claimed: IDs of the claimed recordings.
+  :param transferred: whether the recordings were transferred.
+  """
+  for key in claimed:
+    if transferred:
+      shard.complete(key)
+    else:
+      shard.release(key)
@@ -14,3 +14,4 @@
 # ==============================================================================
 
 from .slack_api import SlackAPI
+from .async_slack_api import AsyncSlackAPI
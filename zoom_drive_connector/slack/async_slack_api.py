@@ -0,0 +1,63 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import logging
+import urllib.parse
+
+from zoom_drive_connector.aio import ConnectionPool
+from zoom_drive_connector.monitoring import metrics, tracing
+
+from .slack_api import SlackAPI
+
+log = logging.getLogger('app')
+
+API_URL = 'https://slack.com/api'
+
+
+class AsyncSlackAPI:
+  def __init__(self, slack_api: SlackAPI, pool: ConnectionPool):
+    """Asyncio counterpart of `SlackAPI` for the asyncio engine, calling the Web API directly
+    over `pool` instead of through `slackclient`. The API can be pointed elsewhere with `api_url`.
+
+    :param slack_api: blocking client holding the Slack configuration.
+    :param pool: connection pool shared by all asyncio clients.
+    """
+    self.config = slack_api.config
+    self.pool = pool
+    self.api_url = str(self.config.get('api_url') or API_URL).rstrip('/')
+
+  async def post_message(self, text: str, channel: str):
+    """Sends message to specific Slack channel with given payload.
+
+    :param text: message to sent to Slack channel.
+    :param channel: channel name or ID to send `text` to.
+    :return: None.
+    """
+    body = urllib.parse.urlencode({'channel': channel, 'text': text}).encode('utf-8')
+    timer = metrics.STAGE_SECONDS.labels('slack').time()
+    with timer, tracing.span('slack.post_message', channel=channel) as span:
+      async with await self.pool.request(
+          'POST', f'{self.api_url}/chat.postMessage',
+          headers={'authorization': f'Bearer {self.config.key}',
+                   'content-type': 'application/x-www-form-urlencoded'},
+          body=body) as res:
+        if res.status < 300:
+          response = await res.json()
+        else:
+          response = {'ok': False, 'error': str(res.status)}
+      span.set_tag('ok', response.get('ok', False))
+    if not response.get('ok', False):
+      metrics.API_ERRORS.labels('slack', str(response.get('error', 'unknown'))).inc()
+    log.log(logging.INFO, 'Slack notification sent.')
@@ -16,8 +16,9 @@
 import logging
 from typing import TypeVar, cast
 
-from slackclient import SlackClient
 from zoom_drive_connector.configuration import SlackConfig, APIConfigBase
+from zoom_drive_connector.monitoring import metrics, tracing
+from zoom_drive_connector.monitoring.startup import lazy_import
 
 log = logging.getLogger('app')
 S = TypeVar("S", bound=APIConfigBase)
@@ -25,12 +26,24 @@ S = TypeVar("S", bound=APIConfigBase)
 
 class SlackAPI:
   def __init__(self, config: S):
-    """Class initialization. Stores link config and initializes client with supplied key.
+    """Class initialization. Stores link config; the client is created with the supplied key
+    when it is first used so `slackclient` is not imported during startup.
 
     :param config: Slack configuration object.
     """
     self.config = cast(SlackConfig, config)
-    self.sc = SlackClient(self.config.key)
+    self._sc = None
+
+  @property
+  def sc(self):
+    """Slack client, created on first access."""
+    if self._sc is None:
+      self._sc = lazy_import('slackclient').SlackClient(self.config.key)
+    return self._sc
+
+  @sc.setter
+  def sc(self, client):
+    self._sc = client
 
   def post_message(self, text: str, channel: str):
     """Sends message to specific Slack channel with given payload.
@@ -39,5 +52,10 @@ class SlackAPI:
     :param channel: channel name or ID to send `text` to.
     :return: None.
     """
-    self.sc.api_call('chat.postMessage', channel=channel, text=text)
+    timer = metrics.STAGE_SECONDS.labels('slack').time()
+    with timer, tracing.span('slack.post_message', channel=channel) as span:
+      response = self.sc.api_call('chat.postMessage', channel=channel, text=text)
+      span.set_tag('ok', response.get('ok', False))
+    if not response.get('ok', False):
+      metrics.API_ERRORS.labels('slack', str(response.get('error', 'unknown'))).inc()
     log.log(logging.INFO, 'Slack notification sent.')
@@ -15,3 +15,7 @@
 
 from .zoom_api import ZoomAPI
 from .zoom_api_exception import ZoomAPIException
+from .copy_engine import CopyEngine, CopyResult
+from .rate_limiter import RateLimiter
+from .trash_queue import TrashJournal, TrashQueue
+from .async_zoom_api import AsyncZoomAPI
@@ -0,0 +1,332 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import asyncio
+import base64
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from zoom_drive_connector.aio import ConnectionPool, Response
+from zoom_drive_connector.monitoring import metrics, progress, tracing
+
+from .copy_engine import CopyEngine, CopyResult
+from .zoom_api import PARTIAL_SUFFIX, ZoomAPI, ZoomURLS
+from .zoom_api_exception import ZoomAPIException
+
+log = logging.getLogger('app')
+
+
+class _FileSink:
+  def __init__(self, engine: CopyEngine, path: str, total: Optional[int], offset: int):
+    """Writes the blocks of a download with the settings of `engine`, like `CopyEngine.copy`
+    does for a blocking stream. Every method blocks on the disk, so `AsyncZoomAPI` runs them in
+    the default executor.
+
+    :param engine: copy engine of the account.
+    :param path: destination file; truncated if it exists.
+    :param total: expected size of the file, if known.
+    :param offset: number of bytes already in the file; they are kept and read into the hash.
+    """
+    self.path = path
+    self.copied = 0
+    self._hasher = engine.hash_factory() if engine.hash_factory else None
+    self._file = open(path, 'r+b' if offset else 'wb', buffering=0)
+    try:
+      if offset:
+        self._file.truncate(offset)
+        while self.copied < offset:
+          block = self._file.read(min(engine.block_size, offset - self.copied))
+          if not block:
+            raise OSError(f'Cannot resume {path}: it is shorter than {offset} bytes.')
+          self._update(block)
+      if engine.preallocate and total:
+        engine._fallocate(self._file.fileno(), total)  # pylint: disable=protected-access
+    except BaseException:
+      self._file.close()
+      raise
+
+  def _update(self, block: bytes):
+    if self._hasher:
+      self._hasher.update(block)
+    self.copied += len(block)
+
+  def write(self, block: bytes):
+    view = memoryview(block)
+    written = 0
+    while written < len(view):
+      written += self._file.write(view[written:])
+    self._update(block)
+
+  def finish(self) -> CopyResult:
+    # Drop space that was reserved but never written.
+    self._file.truncate(self.copied)
+    self._file.close()
+    return CopyResult(self.copied, self._hasher.hexdigest() if self._hasher else None)
+
+  def interrupt(self):
+    self._file.truncate(self.copied)
+    os.fsync(self._file.fileno())
+    self._file.close()
+
+  def close(self):
+    self._file.close()
+
+
+class AsyncZoomAPI:
+  def __init__(self, zoom_api: ZoomAPI, pool: ConnectionPool):
+    """Asyncio counterpart of `ZoomAPI` for the lookups and downloads of the asyncio engine.
+    It shares the settings, the token cache, the rate limit, the copy settings, and the cancel
+    event of `zoom_api`, so the blocking client (e.g. in the trash queue) and this one can be
+    used side by side. Requests go through `pool`.
+
+    :param zoom_api: blocking client of the account.
+    :param pool: connection pool shared by all asyncio clients.
+    """
+    self.zoom_api = zoom_api
+    self.pool = pool
+    self.account = zoom_api.account
+    self._token_lock = asyncio.Lock()
+
+  async def _throttle(self):
+    await asyncio.sleep(self.zoom_api.limiter.reserve())
+
+  async def _executor(self, fn: Callable, *args) -> Any:
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+  async def generate_server_to_server_oath_token(self, refresh: bool = False) -> str:
+    """Returns the OAuth token of the account, requesting a new one if the cached one expired.
+    Concurrent callers wait for the same request.
+
+    :param refresh: request a new token even if the cached one is still valid.
+    """
+    token = None if refresh else self.zoom_api.cached_token()
+    if token:
+      return token
+    async with self._token_lock:
+      token = None if refresh else self.zoom_api.cached_token()
+      if token:
+        return token
+      config = self.zoom_api.zoom_config
+      credentials = base64.b64encode(
+          f'{config.client_id}:{config.client_secret}'.encode('utf-8')).decode('ascii')
+      with metrics.STAGE_SECONDS.labels('token').time(), tracing.span('zoom.token') as span:
+        async with await self.pool.request(
+            'POST', self.zoom_api.url(ZoomURLS.oauth_token),
+            headers={'authorization': 'Basic ' + credentials,
+                     'content-type': 'application/x-www-form-urlencoded'},
+            params={'grant_type': 'account_credentials',
+                    'account_id': config.account_id}) as res:
+          span.set_tag('http.status_code', res.status)
+          payload = await res.json()
+      if res.status != 200:
+        metrics.API_ERRORS.labels('zoom', str(res.status)).inc()
+        raise ValueError("Failed to authenticate, error: ", payload)
+      return self.zoom_api.store_token(payload)
+
+  def _error(self, res: Response) -> ZoomAPIException:
+    if res.status == 401:
+      self.zoom_api.invalidate_token()
+    return ZoomAPIException(res.status, res.reason, None, self.zoom_api.message.get(res.status, ''))
+
+  async def get_recording_url(self, meeting_id: str, auth: str) -> Dict[str, Any]:
+    """Same as `ZoomAPI.get_recording_url`.
+
+    :param meeting_id: UUID associated with a meeting room.
+    :param auth: Authorization token
+    :return: recording information, see `ZoomAPI.get_recording_url`.
+    :raises ZoomAPIException: if there is no recording or Zoom answered with an error.
+    """
+    headers = {
+      'authorization': 'Bearer ' + auth,
+      'content-type': 'application/json'
+    }
+    await self._throttle()
+    try:
+      timer = metrics.STAGE_SECONDS.labels('listing').time()
+      url = self.zoom_api.url(ZoomURLS.recordings, id=meeting_id)
+      with timer, tracing.span('zoom.list_recordings', meeting_id=meeting_id) as span:
+        async with await self.pool.request('GET', url, headers=headers) as res:
+          span.set_tag('http.status_code', res.status)
+          payload = {}  # type: Dict[str, Any]
+          if 200 <= res.status <= 299:
+            payload = await res.json()
+          else:
+            # Read the error page so that the connection can be reused.
+            await res.read()
+    except OSError as e:
+      # Like the blocking client, treat a failed connection as no recording.
+      metrics.API_ERRORS.labels('zoom', 'connection').inc()
+      log.log(logging.ERROR, e)
+      raise ZoomAPIException(404, 'File Not Found', None, 'Could not connect')
+
+    if 200 <= res.status <= 299:
+      log.log(logging.DEBUG, payload)
+      recording = self.zoom_api._parse_recording(  # pylint: disable=protected-access
+          payload['recording_files'])
+      if recording:
+        return recording
+      raise ZoomAPIException(404, 'File Not Found', None, 'File not found or no recordings')
+    if res.status != 404:
+      # A 404 only means that there are no recordings for the meeting.
+      metrics.API_ERRORS.labels('zoom', str(res.status)).inc()
+    raise self._error(res)
+
+  async def _copy(self,
+                  res: Response,
+                  partial: str,
+                  total: Optional[int],
+                  offset: int,
+                  update: Callable[[int, Optional[int]], None]) -> CopyResult:
+    """Writes the body of `res` to `partial` in blocks of the copy engine's block size. Only the
+    disk writes run in the executor; the event loop keeps reading the other downloads.
+    """
+    engine = self.zoom_api.copy_engine
+    sink = await self._executor(_FileSink, engine, partial, total, offset)
+    try:
+      pending = bytearray()
+      while True:
+        data = await res.read_some(engine.block_size)
+        if data:
+          pending += data
+          if len(pending) < engine.block_size:
+            continue
+        if engine.cancel.is_set():
+          await self._executor(sink.interrupt)
+          raise InterruptedError(f'Copy to {partial} interrupted after {sink.copied} bytes.')
+        if pending:
+          block, pending = pending, bytearray()
+          await self._executor(sink.write, block)
+          update(sink.copied, total)
+        if not data:
+          break
+      result = await self._executor(sink.finish)
+    finally:
+      sink.close()
+    if total is not None and result.size < total:
+      raise OSError(f'Incomplete copy to {partial}: received {result.size} of {total} bytes.')
+    return result
+
+  async def fetch_recording(self, url: str, auth: str) -> Tuple[str, CopyResult]:
+    """Same as `ZoomAPI.fetch_recording`, including resuming an interrupted download.
+
+    :param url: Download URL for meeting recording.
+    :param auth: Authorization token.
+    :return: tuple of the path to the recording and the result of the copy.
+    :raises InterruptedError: if `cancel` was set; the offset reached is checkpointed.
+    :raises ZoomAPIException: if Zoom answered with an error.
+    """
+    headers = {
+      'authorization': 'Bearer ' + auth,
+      'content-type': 'application/json'
+    }
+    filename = url.split('/')[-1]
+    outfile = os.path.join(str(self.zoom_api.sys_config.target_folder), filename + '.mp4')
+    partial = outfile + PARTIAL_SUFFIX
+    offset = ZoomAPI._resume_offset(partial, url)  # pylint: disable=protected-access
+    if offset:
+      headers['range'] = f'bytes={offset}-'
+
+    await self._throttle()
+    start = time.perf_counter()
+    with tracing.span('zoom.download') as span:
+      async with await self.pool.request('GET', url, headers=headers) as res:
+        span.set_tag('http.status_code', res.status)
+        if res.status >= 400:
+          # Do not write the error page as a recording.
+          metrics.API_ERRORS.labels('zoom', str(res.status)).inc()
+          raise self._error(res)
+
+        content_range = res.headers.get('content-range', '')
+        if offset and res.status != 206:
+          # The server sent the whole file.
+          offset = 0
+        elif offset and not content_range.startswith(f'bytes {offset}-'):
+          ZoomAPI._remove_checkpoint(partial)  # pylint: disable=protected-access
+          raise OSError(f'Cannot resume {outfile}: unexpected range {content_range!r}.')
+        if offset:
+          log.log(logging.INFO, f'Resuming download of {outfile} at {offset} bytes.')
+          span.set_tag('offset', offset)
+
+        total = None
+        if res.headers.get('content-length', '').isdigit():
+          total = offset + int(res.headers['content-length'])
+        tracked = progress.track(os.path.basename(outfile), 'download', 'zoom', total, offset)
+        try:
+          with tracing.span('zoom.download.copy'), tracked as transfer:
+            result = await self._copy(res, partial, total, offset, transfer.update)
+        except InterruptedError:
+          ZoomAPI._save_checkpoint(partial, url, total)  # pylint: disable=protected-access
+          raise
+      os.replace(partial, outfile)
+      ZoomAPI._remove_checkpoint(partial)  # pylint: disable=protected-access
+      span.set_tag('bytes', result.size)
+
+    elapsed = time.perf_counter() - start
+    metrics.STAGE_SECONDS.labels('download').observe(elapsed)
+    metrics.observe_transfer('download', result.size - offset, elapsed)
+    return outfile, result
+
+  async def pull_file_from_zoom(self,
+                                meeting_id: str,
+                                rm: bool = True,
+                                claim: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                                recording: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Same as `ZoomAPI.pull_file_from_zoom`. `claim` blocks, e.g. on the lease store, so it runs
+    in the executor.
+
+    :param meeting_id: UUID for meeting room where recording was just completed.
+    :param rm: If true is passed (default) then the video file is included in `trash`.
+    :param claim: called with the recording information before the download starts; if it
+      returns false the recording is skipped.
+    :param recording: recording information returned by an earlier `get_recording_url` call.
+    :return: dict containing if the operation was successful, see `ZoomAPI.pull_file_from_zoom`.
+    """
+    result = {'success': False, 'date': None, 'filename': None}
+    try:
+      log.log(logging.INFO, f'Found recording for meeting {meeting_id} starting download...')
+      zoom_token = await self.generate_server_to_server_oath_token()
+
+      res = recording or await self.get_recording_url(meeting_id, zoom_token)
+      if claim and not await self._executor(claim, res):
+        log.log(logging.INFO, f'Recording {res["id"]} of meeting {meeting_id} is claimed by '
+                              'another replica.')
+        return {**result, 'skipped': True}
+      filename, copied = await self.fetch_recording(res['url'], zoom_token)
+
+      trash = list(res['trash'])
+      if rm:
+        trash.append({'meeting_id': res['meeting_id'], 'id': res['id']})
+      log.log(logging.INFO, f'File {filename} downloaded for meeting {meeting_id}.')
+      return {'success': True, 'date': res['date'], 'filename': filename, 'trash': trash,
+              'end': res.get('end'), 'id': res['id'], 'size': copied.size,
+              'sha256': copied.digest}
+    except ZoomAPIException as ze:
+      log.log(logging.ERROR, ze)
+      if ze.status_code == 404:
+        return result
+      return {**result, 'status': ze.status_code}
+    except InterruptedError:
+      log.log(logging.INFO, f'Download of meeting {meeting_id} interrupted, it will be resumed '
+                            'by the next run.')
+      return {**result, 'interrupted': True}
+    except OSError as fe:
+      log.log(logging.ERROR, fe)
+      if isinstance(fe, TimeoutError):
+        return {**result, 'status': 'timeout'}
+      if isinstance(fe, ConnectionError):
+        return {**result, 'status': 'connection'}
+      return result
@@ -0,0 +1,145 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import errno
+import logging
+import os
+import threading
+from typing import Any, Callable, NamedTuple, Optional
+
+log = logging.getLogger('app')
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+class CopyResult(NamedTuple):
+  size: int
+  digest: Optional[str]
+
+
+class CopyEngine:
+  def __init__(self,
+               block_size: int = DEFAULT_BLOCK_SIZE,
+               preallocate: bool = False,
+               hash_factory: Optional[Callable[[], Any]] = None,
+               progress: Optional[Callable[[int, Optional[int]], None]] = None,
+               cancel: Optional[threading.Event] = None):
+    """Copies a stream to a file with `readinto` and a preallocated buffer that is reused for
+    every block. Each thread gets its own buffer so one engine can be shared between workers.
+    Copies stop at the next block boundary once `cancel` is set.
+
+    :param block_size: number of bytes read from the source per call.
+    :param preallocate: reserve the full file size on disk before copying when it is known.
+    :param hash_factory: callable returning a `hashlib`-style object that is fed every block.
+    :param progress: callable receiving the number of bytes copied so far and the total size.
+    :param cancel: event that interrupts running copies, e.g. when the process shuts down.
+    """
+    self.block_size = max(4096, int(block_size))
+    self.preallocate = preallocate
+    self.hash_factory = hash_factory
+    self.progress = progress
+    self.cancel = cancel or threading.Event()
+    self._local = threading.local()
+
+  def _buffer(self) -> memoryview:
+    """Returns the buffer of the calling thread, allocating it on first use."""
+    view = getattr(self._local, 'view', None)
+    if view is None or len(view) != self.block_size:
+      view = memoryview(bytearray(self.block_size))
+      self._local.view = view
+    return view
+
+  @staticmethod
+  def _fallocate(fd: int, size: int):
+    """Reserves `size` bytes for the file. Not all platforms and file systems support this, in
+    which case the file simply grows while it is written.
+
+    :param fd: file descriptor of the destination file.
+    :param size: number of bytes to reserve.
+    """
+    if not hasattr(os, 'posix_fallocate') or size <= 0:
+      return
+    try:
+      os.posix_fallocate(fd, 0, size)
+    except OSError as e:
+      if e.errno not in (errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL):
+        raise
+      log.log(logging.DEBUG, f'posix_fallocate not supported: {e}')
+
+  def copy(self,
+           source,
+           path: str,
+           total: Optional[int] = None,
+           offset: int = 0,
+           progress: Optional[Callable[[int, Optional[int]], None]] = None) -> CopyResult:
+    """Copies everything from `source` to the file at `path`.
+
+    :param source: binary stream implementing `readinto`.
+    :param path: destination file; truncated if it exists.
+    :param total: expected size of the file, e.g. from the Content-Length header.
+    :param offset: number of bytes already in the file, to append `source` to a partial copy.
+      The existing bytes are kept and read back into the hash.
+    :param progress: called like the `progress` of the engine, for this copy only and in addition
+      to the one of the engine.
+    :return: size of the file and the hex digest if a hash factory was configured.
+    :raises InterruptedError: if `cancel` was set; everything copied so far is flushed to disk.
+    """
+    view = self._buffer()
+    hasher = self.hash_factory() if self.hash_factory else None
+    copied = 0
+
+    with open(path, 'r+b' if offset else 'wb', buffering=0) as destination:
+      if offset:
+        destination.truncate(offset)
+        while copied < offset:
+          count = destination.readinto(view[:min(self.block_size, offset - copied)])
+          if not count:
+            raise OSError(f'Cannot resume {path}: it is shorter than {offset} bytes.')
+          if hasher:
+            hasher.update(view[:count])
+          copied += count
+
+      if self.preallocate and total:
+        self._fallocate(destination.fileno(), total)
+
+      while True:
+        if self.cancel.is_set():
+          destination.truncate(copied)
+          os.fsync(destination.fileno())
+          raise InterruptedError(f'Copy to {path} interrupted after {copied} bytes.')
+        count = source.readinto(view)
+        if not count:
+          break
+        block = view[:count]
+        written = 0
+        while written < count:
+          # Unbuffered writes may be partial.
+          written += destination.write(block[written:])
+        if hasher:
+          hasher.update(block)
+        copied += count
+        if self.progress:
+          self.progress(copied, total)
+        if progress:
+          progress(copied, total)
+
+      if self.preallocate and total and copied < total:
+        # Drop the reserved space that was never written.
+        destination.truncate(copied)
+
+    if total is not None and copied < total:
+      raise OSError(f'Incomplete copy to {path}: received {copied} of {total} bytes.')
+
+    return CopyResult(copied, hasher.hexdigest() if hasher else None)
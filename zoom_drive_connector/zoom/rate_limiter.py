@@ -0,0 +1,83 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import threading
+import time
+
+
+class RateLimiter:
+  def __init__(self, rate: float, burst: int = 1):
+    """Token bucket limiting the number of calls made per second.
+
+    :param rate: number of calls allowed per second. A rate of 0 or less disables limiting.
+    :param burst: maximum number of calls that can be made back-to-back.
+    """
+    self.rate = float(rate)
+    self.burst = max(1, int(burst))
+
+    self._tokens = float(self.burst)
+    self._last = time.monotonic()
+    self._lock = threading.Lock()
+
+  def _refill(self, now: float):
+    """Adds the tokens accumulated since the last refill, capped at `burst`.
+
+    :param now: current value of the monotonic clock.
+    """
+    self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+    self._last = now
+
+  def try_acquire(self) -> bool:
+    """Takes a token if one is available without blocking.
+
+    :return: true if the caller may proceed.
+    """
+    if self.rate <= 0:
+      return True
+
+    with self._lock:
+      self._refill(time.monotonic())
+      if self._tokens >= 1:
+        self._tokens -= 1
+        return True
+      return False
+
+  def reserve(self) -> float:
+    """Takes a token without blocking, borrowing it from the future if none is available, e.g.
+    for callers that wait with `asyncio.sleep`.
+
+    :return: number of seconds the caller has to wait before using the token.
+    """
+    if self.rate <= 0:
+      return 0.0
+
+    with self._lock:
+      self._refill(time.monotonic())
+      self._tokens -= 1
+      return max(0.0, -self._tokens / self.rate)
+
+  def acquire(self):
+    """Blocks until a token is available and takes it."""
+    if self.rate <= 0:
+      return
+
+    while True:
+      with self._lock:
+        self._refill(time.monotonic())
+        if self._tokens >= 1:
+          self._tokens -= 1
+          return
+        wait = (1 - self._tokens) / self.rate
+      time.sleep(wait)
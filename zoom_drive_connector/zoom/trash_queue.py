@@ -0,0 +1,327 @@
+# Copyright 2018 Minds.ai, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+import heapq
+import itertools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from zoom_drive_connector.monitoring import metrics, tracing
+
+from .rate_limiter import RateLimiter
+from .zoom_api import ZoomAPI
+from .zoom_api_exception import ZoomAPIException
+
+log = logging.getLogger('app')
+
+# Status codes after which retrying the trash request is pointless because the file is gone.
+_ALREADY_TRASHED = (404, 409)
+
+_SCHEMA = ('CREATE TABLE IF NOT EXISTS trash ('
+           'recording_id TEXT PRIMARY KEY, meeting_id TEXT NOT NULL, account TEXT NOT NULL, '
+           'state TEXT NOT NULL, updated REAL NOT NULL) WITHOUT ROWID')
+
+
+class TrashJournal:
+  def __init__(self, path: str):
+    """Keeps the recordings that were stored at their destinations but are not trashed on Zoom
+    yet in an SQLite table, either because the trash request is still pending or because it
+    failed. Pending items are handed to the trash queue again after a restart, and the scheduler
+    skips recordings that are in the journal so they are not transferred a second time while they
+    are still on Zoom. Errors of the database are logged and otherwise ignored; the journal only
+    prevents duplicates and must not stop transfers.
+
+    :param path: path of the database file; created if it does not exist.
+    """
+    self.path = path
+    self._lock = threading.Lock()
+    self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    self._db.execute('PRAGMA journal_mode=WAL')
+    self._db.execute(_SCHEMA)
+
+  def _execute(self, statement: str, *args) -> List[Tuple]:
+    try:
+      with self._lock:
+        return self._db.execute(statement, args).fetchall()
+    except sqlite3.Error as e:
+      log.log(logging.WARNING, f'Could not update the trash journal {self.path}: {e}')
+      return []
+
+  def add(self, account: str, meeting_id: str, recording_id: str):
+    """Records that a recording is waiting to be trashed.
+
+    :param account: name of the Zoom account.
+    :param meeting_id: UUID associated with a meeting instance.
+    :param recording_id: The ID of the recording to trash.
+    """
+    self._execute('INSERT OR REPLACE INTO trash VALUES (?, ?, ?, ?, ?)', recording_id, meeting_id,
+                  account, 'pending', time.time())
+
+  def fail(self, recording_id: str):
+    """Records that trashing a recording was given up on. It stays in the journal."""
+    self._execute('UPDATE trash SET state = ?, updated = ? WHERE recording_id = ?', 'failed',
+                  time.time(), recording_id)
+
+  def remove(self, recording_id: str):
+    """Forgets a recording once it was trashed."""
+    self._execute('DELETE FROM trash WHERE recording_id = ?', recording_id)
+
+  def items(self, account: str) -> List[Tuple]:
+    """Returns the meeting UUID, recording ID, and state (`pending` or `failed`) of every
+    recording of an account that is not trashed yet.
+
+    :param account: name of the Zoom account.
+    """
+    return self._execute('SELECT meeting_id, recording_id, state FROM trash WHERE account = ? '
+                         'ORDER BY updated', account)
+
+  def __contains__(self, recording_id: str) -> bool:
+    return bool(self._execute('SELECT 1 FROM trash WHERE recording_id = ?', recording_id))
+
+  def close(self):
+    """Closes the database."""
+    with self._lock:
+      self._db.close()
+
+
+class TrashQueue:
+  def __init__(self,
+               zoom_conn: ZoomAPI,
+               max_retries: int = 5,
+               rate: float = 5.0,
+               batch_size: int = 50,
+               backoff: float = 2.0,
+               name: str = 'zoom-trash',
+               journal: Optional[TrashJournal] = None,
+               account: str = 'default'):
+    """Background queue that moves recordings to the Zoom trash once they are safely stored in
+    Google Drive. Items are processed in batches that share a single OAuth token. With a
+    `journal`, items that are not trashed yet survive a restart, see `load`.
+
+    :param zoom_conn: API object instance for Zoom.
+    :param max_retries: number of times a failed trash request is retried before giving up.
+    :param rate: maximum number of trash requests sent to Zoom per second.
+    :param batch_size: maximum number of items processed with the same OAuth token.
+    :param backoff: base delay in seconds for the exponential retry backoff.
+    :param name: name of the worker thread.
+    :param journal: journal the items that are not trashed yet are kept in.
+    :param account: name of the Zoom account the items are journaled under.
+    """
+    self.zoom_conn = zoom_conn
+    self.max_retries = max_retries
+    self.batch_size = max(1, batch_size)
+    self.backoff = backoff
+    self.limiter = RateLimiter(rate)
+    self.name = name
+    self.journal = journal
+    self.account = account
+
+    self._queue = queue.Queue()  # type: queue.Queue
+    self._delayed = []  # type: List[Tuple[float, int, Dict]]
+    self._sequence = itertools.count()
+    self._pending = 0
+    self._cond = threading.Condition()
+    self._stop = threading.Event()
+    self._thread = None  # type: Optional[threading.Thread]
+
+    self.stats = {'enqueued': 0, 'trashed': 0, 'retried': 0, 'failed': 0, 'batches': 0}
+
+  def start(self):
+    """Starts the background worker thread."""
+    if self._thread and self._thread.is_alive():
+      return
+    self._stop.clear()
+    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+    self._thread.start()
+
+  def stop(self, timeout: Optional[float] = None):
+    """Stops the worker thread after the batch it is currently processing.
+
+    :param timeout: number of seconds to wait for the worker to exit.
+    """
+    self._stop.set()
+    if self._thread:
+      self._thread.join(timeout)
+
+  def put(self, meeting_id: str, recording_id: str):
+    """Schedules a recording to be moved to the trash on Zoom.
+
+    :param meeting_id: UUID associated with a meeting instance.
+    :param recording_id: The ID of the recording to trash.
+    """
+    if self.journal:
+      self.journal.add(self.account, meeting_id, recording_id)
+    self._enqueue(meeting_id, recording_id)
+
+  def _enqueue(self, meeting_id: str, recording_id: str):
+    with self._cond:
+      self._pending += 1
+      self.stats['enqueued'] += 1
+    # Remember the job the recording belongs to so the trash request shows up in its trace.
+    self._queue.put({'meeting_id': meeting_id, 'id': recording_id, 'attempts': 0,
+                     'span': tracing.current_span()})
+
+  def load(self) -> int:
+    """Enqueues the recordings of the account that the journal holds, i.e. those a previous
+    process stored but did not trash. Recordings it gave up on are tried again.
+
+    :return: number of enqueued recordings.
+    """
+    items = self.journal.items(self.account) if self.journal else []
+    for meeting_id, recording_id, _ in items:
+      self._enqueue(meeting_id, recording_id)
+    if items:
+      log.log(logging.INFO, f'Trashing {len(items)} recordings of account {self.account} that a '
+                            'previous run stored.')
+    return len(items)
+
+  def stored(self, recording_id: Optional[str]) -> bool:
+    """Returns true if a recording was stored and is waiting to be trashed, or trashing it
+    failed, so it must not be transferred again.
+
+    :param recording_id: ID of the recording on Zoom.
+    """
+    return bool(self.journal and recording_id and recording_id in self.journal)
+
+  @property
+  def depth(self) -> int:
+    """Number of items that have been enqueued but not yet trashed or given up on."""
+    with self._cond:
+      return self._pending
+
+  def join(self, timeout: Optional[float] = None) -> bool:
+    """Waits until every enqueued item has been processed.
+
+    :param timeout: maximum number of seconds to wait.
+    :return: true if the queue was fully drained.
+    """
+    with self._cond:
+      return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+  def _done(self, item: Dict, outcome: str):
+    """Marks one item as finished and wakes up anyone waiting in `join`. Trashed items are
+    removed from the journal; items that failed stay in it.
+
+    :param item: queue item that is finished.
+    :param outcome: name of the counter in `stats` to increment.
+    """
+    if self.journal:
+      if outcome == 'trashed':
+        self.journal.remove(item['id'])
+      else:
+        self.journal.fail(item['id'])
+    with self._cond:
+      self.stats[outcome] += 1
+      self._pending -= 1
+      self._cond.notify_all()
+    metrics.TRASH_RESULTS.labels(outcome).inc()
+
+  def _retry(self, item: Dict, reason):
+    """Re-schedules an item with exponential backoff or gives up on it once `max_retries` has been
+    exceeded.
+
+    :param item: queue item that failed.
+    :param reason: exception or message describing the failure.
+    """
+    item['attempts'] += 1
+    if item['attempts'] > self.max_retries:
+      log.log(logging.ERROR, f'Giving up on trashing recording {item["id"]}: {reason}')
+      self._done(item, 'failed')
+      return
+
+    delay = self.backoff * (2 ** (item['attempts'] - 1))
+    log.log(logging.WARNING, f'Trashing recording {item["id"]} failed ({reason}), '
+                             f'retrying in {delay:.0f}s.')
+    metrics.TRASH_RESULTS.labels('retried').inc()
+    with self._cond:
+      self.stats['retried'] += 1
+      heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), item))
+
+  def _next_batch(self) -> List[Dict]:
+    """Collects up to `batch_size` items whose retry delay has elapsed.
+
+    :return: list of queue items, possibly empty.
+    """
+    batch = []  # type: List[Dict]
+
+    with self._cond:
+      now = time.monotonic()
+      while self._delayed and self._delayed[0][0] <= now and len(batch) < self.batch_size:
+        batch.append(heapq.heappop(self._delayed)[2])
+      next_due = self._delayed[0][0] - now if self._delayed else 0.5
+
+    try:
+      if not batch:
+        batch.append(self._queue.get(timeout=max(0.01, min(0.5, next_due))))
+      while len(batch) < self.batch_size:
+        batch.append(self._queue.get_nowait())
+    except queue.Empty:
+      pass
+
+    return batch
+
+  def _process_batch(self, batch: List[Dict]):
+    """Trashes every recording in `batch` using one OAuth token.
+
+    :param batch: list of queue items.
+    """
+    self.stats['batches'] += 1
+    try:
+      token = self.zoom_conn.generate_server_to_server_oath_token()
+    except (ValueError, requests.exceptions.RequestException) as e:
+      for item in batch:
+        self._retry(item, e)
+      return
+    except Exception as e:  # pylint: disable=broad-except
+      log.log(logging.ERROR, f'Unexpected error while fetching a Zoom token: {e!r}')
+      for item in batch:
+        self._retry(item, e)
+      return
+
+    for item in batch:
+      self.limiter.acquire()
+      try:
+        with tracing.activate(item['span']):
+          self.zoom_conn.delete_recording(item['meeting_id'], item['id'], token)
+        self._done(item, 'trashed')
+      except ZoomAPIException as ze:
+        if ze.status_code in _ALREADY_TRASHED:
+          log.log(logging.INFO, ze)
+          self._done(item, 'trashed')
+        elif ze.status_code in (401, 429) or ze.status_code >= 500:
+          # After a 401 the token was dropped, the retry uses a new one.
+          self._retry(item, ze)
+        else:
+          log.log(logging.ERROR, ze)
+          self._done(item, 'failed')
+      except requests.exceptions.RequestException as e:
+        self._retry(item, e)
+      except Exception as e:  # pylint: disable=broad-except
+        # Keeps the worker thread alive; otherwise `join` would wait for this item forever.
+        log.log(logging.ERROR, f'Unexpected error while trashing recording {item["id"]}: {e!r}')
+        self._retry(item, e)
+
+  def _run(self):
+    """Worker loop; runs until `stop` is called."""
+    while not self._stop.is_set():
+      batch = self._next_batch()
+      if batch:
+        self._process_batch(batch)
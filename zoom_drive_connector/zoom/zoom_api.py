@@ -15,16 +15,23 @@
 
 import datetime
 from enum import Enum
+import hashlib
+import json
 import os
-import shutil
 import logging
-from typing import TypeVar, cast, Dict, Any
+import threading
+import time
+from typing import TypeVar, cast, Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 import requests
 from requests.auth import HTTPBasicAuth
+import urllib3
 
 from zoom_drive_connector.configuration import APIConfigBase, ZoomConfig, SystemConfig
+from zoom_drive_connector.monitoring import metrics, progress, tracing
 
+from .copy_engine import CopyEngine, CopyResult, DEFAULT_BLOCK_SIZE
+from .rate_limiter import RateLimiter
 from .zoom_api_exception import ZoomAPIException
 
 log = logging.getLogger('app')
@@ -33,24 +40,55 @@ S = TypeVar("S", bound=APIConfigBase)
 
 class ZoomURLS(Enum):
   recordings = 'https://api.zoom.us/v2/meetings/{id}/recordings'
+  user_recordings = 'https://api.zoom.us/v2/users/{user}/recordings'
   zak_token = 'https://api.zoom.us/v2/users/{user}/token?type=zak'
   delete_recordings = 'https://api.zoom.us/v2/meetings/{id}/recordings/{rid}'
   signin = 'https://api.zoom.us/signin'
   oauth_token = 'https://zoom.us/oauth/token'
 
 
+# Hosts used by `ZoomURLS`. They can be overridden in the configuration, e.g. to run against a
+# local stand-in server.
+API_HOST = 'https://api.zoom.us'
+OAUTH_HOST = 'https://zoom.us'
+
+# Downloads are written to `<recording>.mp4.part` and renamed once complete. An interrupted
+# download leaves a checkpoint next to the partial file so it can be resumed with a range request.
+PARTIAL_SUFFIX = '.part'
+CHECKPOINT_SUFFIX = '.json'
+
+
 class ZoomAPI:
-  def __init__(self, zoom_config: S, sys_config: S):
+  def __init__(self, zoom_config: S, sys_config: S, cancel: Optional[threading.Event] = None):
     """Class initialization; sets client key, secret, and download folder path.
 
     :param zoom_config: configuration class containing all relevant parameters for Zoom API.
     :param sys_config: configuration class containing target folder where to download contains.
+    :param cancel: event that interrupts running downloads at the next block, e.g. on shutdown.
     """
     self.zoom_config = cast(ZoomConfig, zoom_config)
     self.sys_config = cast(SystemConfig, sys_config)
 
     self.timeout = 1800  # Default expiration time is 30 minutes.
 
+    # OAuth token shared by downloads and the trash queue until shortly before it expires.
+    self._token = None  # type: Optional[str]
+    self._token_expiry = 0.0
+    self._token_lock = threading.Lock()
+
+    # Zoom applies rate limits per account, so every account has its own budget.
+    self.account = self.zoom_config.account_name
+    self.limiter = RateLimiter(float(self.zoom_config.get('api_rate', 0)))
+
+    self.api_host = str(self.zoom_config.get('api_host', API_HOST)).rstrip('/')
+    self.oauth_host = str(self.zoom_config.get('oauth_host', OAUTH_HOST)).rstrip('/')
+
+    self.copy_engine = CopyEngine(
+        block_size=int(self.sys_config.get('download_block_size', DEFAULT_BLOCK_SIZE)),
+        preallocate=bool(self.sys_config.get('preallocate', False)),
+        hash_factory=hashlib.sha256,
+        cancel=cancel)
+
     # Clarified HTTP status messages
     self.message = {
         401: 'Not authenticated.',
@@ -58,27 +96,76 @@ class ZoomAPI:
         409: 'File deleted already.'
     }
 
-  def generate_server_to_server_oath_token(self) -> bytes:
+  def url(self, endpoint: ZoomURLS, **kwargs) -> str:
+    """Builds the URL for an endpoint, taking configured host overrides into account.
+
+    :param endpoint: endpoint to build the URL for.
+    :param kwargs: values for the placeholders in the endpoint URL.
+    :return: absolute URL.
+    """
+    url = str(endpoint.value).format(**kwargs)
+    if url.startswith(OAUTH_HOST + '/'):
+      return self.oauth_host + url[len(OAUTH_HOST):]
+    return self.api_host + url[len(API_HOST):]
+
+  def generate_server_to_server_oath_token(self, refresh: bool = False) -> str:
     """Generates the OATH token used for authenticating with Zoom.
 
-    Sends OATH information and receives a token to use for the next hour.
+    Sends OATH information and receives a token to use for the next hour. The token is cached and
+    reused until one minute before it expires.
+
+    :param refresh: request a new token even if the cached one is still valid.
     """
-    data = {
-      "grant_type" : "account_credentials",
-      "account_id" : self.zoom_config.account_id
-    }
-    headers = {
-     'content-type': 'application/x-www-form-urlencoded'
-    }
-    res = requests.post(
-      ZoomURLS.oauth_token.value,
-      headers=headers,
-      params=data,
-      auth=HTTPBasicAuth(self.zoom_config.client_id, self.zoom_config.client_secret)
-    )
-    if res.status_code != 200:
-      raise ValueError("Failed to authenticate, error: ", res.json())
-    return res.json()["access_token"]
+    with self._token_lock:
+      if not refresh and self._token and time.monotonic() < self._token_expiry:
+        return self._token
+
+      data = {
+        "grant_type" : "account_credentials",
+        "account_id" : self.zoom_config.account_id
+      }
+      headers = {
+       'content-type': 'application/x-www-form-urlencoded'
+      }
+      with metrics.STAGE_SECONDS.labels('token').time(), tracing.span('zoom.token') as span:
+        res = requests.post(
+          self.url(ZoomURLS.oauth_token),
+          headers=headers,
+          params=data,
+          auth=HTTPBasicAuth(self.zoom_config.client_id, self.zoom_config.client_secret)
+        )
+        span.set_tag('http.status_code', res.status_code)
+      if res.status_code != 200:
+        metrics.API_ERRORS.labels('zoom', str(res.status_code)).inc()
+        raise ValueError("Failed to authenticate, error: ", res.json())
+      return self._store_token(res.json())
+
+  def _store_token(self, payload: Dict[str, Any]) -> str:
+    self._token = payload["access_token"]
+    self._token_expiry = time.monotonic() + max(0, int(payload.get('expires_in', 3600)) - 60)
+    return self._token
+
+  def cached_token(self) -> Optional[str]:
+    """Returns the cached OAuth token if it is still valid, without requesting a new one."""
+    with self._token_lock:
+      if self._token and time.monotonic() < self._token_expiry:
+        return self._token
+      return None
+
+  def store_token(self, payload: Dict[str, Any]) -> str:
+    """Caches a token that was requested elsewhere, e.g. by `AsyncZoomAPI`, for all users of this
+    client.
+
+    :param payload: answer of the OAuth token endpoint.
+    :return: the token.
+    """
+    with self._token_lock:
+      return self._store_token(payload)
+
+  def invalidate_token(self):
+    """Drops the cached OAuth token, e.g. after Zoom rejected it."""
+    with self._token_lock:
+      self._token = None
 
   def delete_recording(self, meeting_id: str, recording_id: str, auth: bytes):
     """Given a specific meeting room ID and recording ID, this function moves the recording to the
@@ -88,66 +175,151 @@ class ZoomAPI:
     :param recording_id: The ID of the recording to trash.
     :param auth: OAUTH token.
     """
-    zoom_url = str(ZoomURLS.delete_recordings.value).format(id=meeting_id, rid=recording_id)
+    zoom_url = self.url(ZoomURLS.delete_recordings, id=meeting_id, rid=recording_id)
     headers = {
       'authorization': 'Bearer ' + auth,
       'content-type': 'application/json'
     }
     # trash, not delete
-    res = requests.delete(zoom_url, headers=headers, params={'action': 'trash'})
+    timer = metrics.STAGE_SECONDS.labels('trash').time()
+    with timer, tracing.span('zoom.trash', recording_id=recording_id) as span:
+      res = requests.delete(zoom_url, headers=headers, params={'action': 'trash'})
+      span.set_tag('http.status_code', res.status_code)
     status_code = res.status_code
-    if 400 <= status_code <= 499:
+    if status_code == 401:
+      self.invalidate_token()
+    if 400 <= status_code <= 599:
+      metrics.API_ERRORS.labels('zoom', str(status_code)).inc()
       raise ZoomAPIException(status_code, res.reason, res.request, self.message.get(
           status_code, ''))
 
   def get_recording_url(self, meeting_id: str, auth: str) -> Dict[str, Any]:
     """Given a specific meeting room ID and auth token, this function gets the download url
-    for most recent recording in the given meeting room.
+    for most recent recording in the given meeting room. This function is read-only; chat and
+    transcript files are returned in `trash` so they can be trashed once the video is uploaded.
 
     :param meeting_id: UUID associated with a meeting room.
     :param auth: Authorization token
-    :return: dict containing the date of the recording, the ID of the recording, and the video url.
+    :return: dict containing the start and end date of the recording, the ID of the recording,
+      the video url, the size of the video if Zoom reports it, and the list of side files that
+      belong to the recording.
     """
-    zoom_url = str(ZoomURLS.recordings.value).format(id=meeting_id)
+    zoom_url = self.url(ZoomURLS.recordings, id=meeting_id)
 
     try:
       headers = {
         'authorization': 'Bearer ' + auth,
         'content-type': 'application/json'
       }
-      zoom_request = requests.get(zoom_url, headers=headers)
+      self.limiter.acquire()
+      timer = metrics.STAGE_SECONDS.labels('listing').time()
+      with timer, tracing.span('zoom.list_recordings', meeting_id=meeting_id) as span:
+        zoom_request = requests.get(zoom_url, headers=headers)
+        span.set_tag('http.status_code', zoom_request.status_code)
     except requests.exceptions.RequestException as e:
       # Failed to make a connection so let's just return a 404, as there is no file
       # but print an additional warning in case it was a configuration error
+      metrics.API_ERRORS.labels('zoom', 'connection').inc()
       log.log(logging.ERROR, e)
       raise ZoomAPIException(404, 'File Not Found', None, 'Could not connect')
 
     status_code = zoom_request.status_code
     if 200 <= status_code <= 299:
       log.log(logging.DEBUG, zoom_request.json())
-      for req in zoom_request.json()['recording_files']:
-        # TODO(jbedorf): For now just delete the chat messages and continue processing other files.
-        if req['file_type'] == 'CHAT':
-          self.delete_recording(req['meeting_id'], req['id'], auth)
-        elif req['file_type'] == 'TRANSCRIPT':
-          self.delete_recording(req['meeting_id'], req['id'], auth)
-        elif req['file_type'] == 'MP4':
-          date = datetime.datetime.strptime(req['recording_start'], '%Y-%m-%dT%H:%M:%SZ')
-          return {
-            'date': date,
-            'id': req['id'],
-            'url': req['download_url'],
-            'meeting_id': req['meeting_id']
-          }
+      recording = self._parse_recording(zoom_request.json()['recording_files'])
+      if recording:
+        return recording
       # Raise 404 when we do not recognize the file type.
       raise ZoomAPIException(404, 'File Not Found', zoom_request.request, # pylint: no-else-raise
                              'File not found or no recordings')
     elif 300 <= status_code <= 599:
+      if status_code == 401:
+        self.invalidate_token()
+      if status_code != 404:
+        # A 404 only means that there are no recordings for the meeting.
+        metrics.API_ERRORS.labels('zoom', str(status_code)).inc()
       raise ZoomAPIException(status_code, zoom_request.reason, zoom_request.request,
                              self.message.get(status_code, ''))
     else:
       raise ZoomAPIException(status_code, zoom_request.reason, zoom_request.request, '')
 
+  @staticmethod
+  def _parse_recording(files: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Picks the video out of the files of a recording.
+
+    :param files: `recording_files` as returned by Zoom.
+    :return: recording information as returned by `get_recording_url`, or None if there is no
+      video.
+    """
+    side_files = []
+    for req in files:
+      # TODO(jbedorf): For now just trash the chat messages together with the video.
+      if req['file_type'] in ('CHAT', 'TRANSCRIPT'):
+        side_files.append({'meeting_id': req['meeting_id'], 'id': req['id']})
+      elif req['file_type'] == 'MP4':
+        date = datetime.datetime.strptime(req['recording_start'], '%Y-%m-%dT%H:%M:%SZ')
+        end = None
+        if req.get('recording_end'):
+          end = datetime.datetime.strptime(req['recording_end'], '%Y-%m-%dT%H:%M:%SZ')
+        return {
+          'date': date,
+          'end': end,
+          'id': req['id'],
+          'url': req['download_url'],
+          'meeting_id': req['meeting_id'],
+          'size': req.get('file_size'),
+          'trash': side_files
+        }
+    return None
+
+  def list_recordings(self,
+                      user: str,
+                      start: datetime.date,
+                      end: datetime.date,
+                      page_size: int = 300) -> Iterator[Dict[str, Any]]:
+    """Lists the cloud recordings of a user between two dates, page by page. Zoom accepts
+    windows of at most one month.
+
+    :param user: Zoom user ID or email address, or `me` for the user the app belongs to.
+    :param start: first day of the window.
+    :param end: last day of the window, inclusive.
+    :param page_size: number of meetings per page, at most 300.
+    :return: iterator over recording information in the format of `get_recording_url`, plus the
+      ID and UUID of the meeting as `meeting` and `uuid`.
+    :raises ZoomAPIException: if Zoom answered with an error.
+    """
+    params = {'from': start.isoformat(), 'to': end.isoformat(),
+              'page_size': page_size}  # type: Dict[str, Any]
+    while True:
+      # A token is fetched for every page, so long listings outlive the token they started with.
+      headers = {
+        'authorization': 'Bearer ' + self.generate_server_to_server_oath_token(),
+        'content-type': 'application/json'
+      }
+      self.limiter.acquire()
+      timer = metrics.STAGE_SECONDS.labels('listing').time()
+      with timer, tracing.span('zoom.list_user_recordings', user=user) as span:
+        res = requests.get(self.url(ZoomURLS.user_recordings, user=user), headers=headers,
+                           params=params)
+        span.set_tag('http.status_code', res.status_code)
+      if res.status_code == 401:
+        self.invalidate_token()
+      if res.status_code >= 300:
+        metrics.API_ERRORS.labels('zoom', str(res.status_code)).inc()
+        raise ZoomAPIException(res.status_code, res.reason, res.request,
+                               self.message.get(res.status_code, ''))
+
+      payload = res.json()
+      for meeting in payload.get('meetings', []):
+        recording = self._parse_recording(meeting.get('recording_files', []))
+        if recording:
+          recording['meeting'] = str(meeting.get('id', ''))
+          recording['uuid'] = meeting.get('uuid')
+          yield recording
+      if not payload.get('next_page_token'):
+        return
+      params['next_page_token'] = payload['next_page_token']
+
   def download_recording(self, url: str, auth: str) -> str:
     """Downloads video file from Zoom to local folder.
 
@@ -155,28 +327,135 @@ class ZoomAPI:
     :param auth: Authorization token.
     :return: Path to the recording
     """
+    return self.fetch_recording(url, auth)[0]
+
+  @staticmethod
+  def _resume_offset(partial: str, url: str) -> int:
+    """Returns the number of bytes of an interrupted download that can be kept, or 0 if there is
+    no usable checkpoint. Bytes after the checkpointed offset may not have reached the disk.
+
+    :param partial: path of the partial file.
+    :param url: download URL the partial file must have been downloaded from.
+    """
+    try:
+      with open(partial + CHECKPOINT_SUFFIX, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+      offset = int(checkpoint['offset'])
+      if checkpoint.get('url') == url and 0 < offset <= os.path.getsize(partial):
+        return offset
+    except (OSError, ValueError, KeyError, TypeError):
+      pass
+    return 0
+
+  @staticmethod
+  def _save_checkpoint(partial: str, url: str, total: Optional[int]):
+    with open(partial + CHECKPOINT_SUFFIX + '.tmp', 'w', encoding='utf-8') as f:
+      json.dump({'url': url, 'offset': os.path.getsize(partial), 'total': total}, f)
+    os.replace(partial + CHECKPOINT_SUFFIX + '.tmp', partial + CHECKPOINT_SUFFIX)
+
+  @staticmethod
+  def _remove_checkpoint(partial: str):
+    try:
+      os.remove(partial + CHECKPOINT_SUFFIX)
+    except FileNotFoundError:
+      pass
+
+  def fetch_recording(self, url: str, auth: str) -> Tuple[str, CopyResult]:
+    """Same as `download_recording`, but also returns the size and SHA-256 digest of the file,
+    which are computed while it is written. A download that was interrupted by `cancel` is
+    continued where it stopped if the server honours range requests.
+
+    :param url: Download URL for meeting recording.
+    :param auth: Authorization token.
+    :return: tuple of the path to the recording and the result of the copy.
+    :raises InterruptedError: if `cancel` was set; the offset reached is checkpointed.
+    :raises ZoomAPIException: if Zoom answered with an error.
+    """
     headers = {
       'authorization': 'Bearer ' + auth,
       'content-type': 'application/json'
     }
-    zoom_request = requests.get(url, stream=True, headers=headers)
-
     filename = url.split('/')[-1]
     outfile = os.path.join(str(self.sys_config.target_folder), filename + '.mp4')
-    with open(outfile, 'wb') as source:
-      shutil.copyfileobj(zoom_request.raw, source)  # Copy raw file data to local file.
+    partial = outfile + PARTIAL_SUFFIX
+    offset = self._resume_offset(partial, url)
+    if offset:
+      headers['range'] = f'bytes={offset}-'
+
+    self.limiter.acquire()
+    start = time.perf_counter()
+    with tracing.span('zoom.download') as span:
+      zoom_request = requests.get(url, stream=True, headers=headers)
+      span.set_tag('http.status_code', zoom_request.status_code)
+      if zoom_request.status_code >= 400:
+        # Do not write the error page as a recording.
+        zoom_request.close()
+        if zoom_request.status_code == 401:
+          self.invalidate_token()
+        metrics.API_ERRORS.labels('zoom', str(zoom_request.status_code)).inc()
+        raise ZoomAPIException(zoom_request.status_code, zoom_request.reason,
+                               zoom_request.request,
+                               self.message.get(zoom_request.status_code, ''))
 
-    return outfile
+      content_range = zoom_request.headers.get('content-range', '')
+      if offset and zoom_request.status_code != 206:
+        # The server sent the whole file.
+        offset = 0
+      elif offset and not content_range.startswith(f'bytes {offset}-'):
+        zoom_request.close()
+        self._remove_checkpoint(partial)
+        raise OSError(f'Cannot resume {outfile}: unexpected range {content_range!r}.')
+      if offset:
+        log.log(logging.INFO, f'Resuming download of {outfile} at {offset} bytes.')
+        span.set_tag('offset', offset)
 
-  def pull_file_from_zoom(self, meeting_id: str, rm: bool = True) -> Dict[str, Any]:
-    """Interface for downloading recordings from Zoom. Optionally trashes recorded file on Zoom.
+      # Decode compressed responses; the size is only known up front for identity encoding.
+      zoom_request.raw.decode_content = True
+      total = None
+      length = zoom_request.headers.get('content-length', '')
+      if 'content-encoding' not in zoom_request.headers and length.isdigit():
+        total = offset + int(length)
+
+      tracked = progress.track(os.path.basename(outfile), 'download', 'zoom', total, offset)
+      try:
+        with tracing.span('zoom.download.copy'), tracked as transfer:
+          # Copy raw file data to local file.
+          result = self.copy_engine.copy(zoom_request.raw, partial, total, offset,
+                                         transfer.update)
+      except InterruptedError:
+        zoom_request.close()
+        self._save_checkpoint(partial, url, total)
+        raise
+      os.replace(partial, outfile)
+      self._remove_checkpoint(partial)
+      span.set_tag('bytes', result.size)
+
+    elapsed = time.perf_counter() - start
+    metrics.STAGE_SECONDS.labels('download').observe(elapsed)
+    metrics.observe_transfer('download', result.size - offset, elapsed)
+    return outfile, result
+
+  def pull_file_from_zoom(self,
+                          meeting_id: str,
+                          rm: bool = True,
+                          claim: Optional[Callable[[Dict[str, Any]], bool]] = None,
+                          recording: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Interface for downloading recordings from Zoom. Nothing is trashed here; the files that
+    should be trashed once the recording is stored in Google Drive are returned in `trash`.
     Returns a dictionary containing success state and/or recording information.
 
     :param meeting_id: UUID for meeting room where recording was just completed.
-    :param rm: If true is passed (default) then file is trashed on Zoom.
-    :return: dict containing if the operation was successful. If downloading and (optionally)
-      deleting the recording on Zoom completed successfully, include the recording date and the
-      recording filename.
+    :param rm: If true is passed (default) then the video file is included in `trash`.
+    :param claim: called with the recording information before the download starts; if it
+      returns false the recording is skipped, e.g. because another replica is processing it.
+    :param recording: recording information returned by an earlier `get_recording_url` call;
+      the recordings are listed again if it is not given.
+    :return: dict containing if the operation was successful. If downloading the recording
+      completed successfully, include the recording start and end date, the recording filename,
+      the list of files to trash on Zoom after the upload, and the recording ID, size, and SHA-256
+      digest. `interrupted` is set if the download was stopped by `cancel`. If an API call failed
+      other than with 404, `status` holds its HTTP status, or `timeout` or `connection` for
+      network errors.
     """
     result = {'success': False, 'date': None, 'filename': None}
     try:
@@ -185,22 +464,36 @@ class ZoomAPI:
       zoom_token = self.generate_server_to_server_oath_token()
 
       # Get URL and download the file.
-      res = self.get_recording_url(meeting_id, zoom_token)
-      filename = self.download_recording(res['url'], zoom_token)
+      res = recording or self.get_recording_url(meeting_id, zoom_token)
+      if claim and not claim(res):
+        log.log(logging.INFO, f'Recording {res["id"]} of meeting {meeting_id} is claimed by '
+                              'another replica.')
+        return {**result, 'skipped': True}
+      filename, copied = self.fetch_recording(res['url'], zoom_token)
 
+      trash = list(res['trash'])
       if rm:
-        self.delete_recording(res['meeting_id'], res['id'], zoom_token)
+        trash.append({'meeting_id': res['meeting_id'], 'id': res['id']})
       log.log(logging.INFO, f'File {filename} downloaded for meeting {meeting_id}.')
-      return {'success': True, 'date': res['date'], 'filename': filename}
+      return {'success': True, 'date': res['date'], 'filename': filename, 'trash': trash,
+              'end': res.get('end'), 'id': res['id'], 'size': copied.size,
+              'sha256': copied.digest}
     except ZoomAPIException as ze:
-      if ze.http_method and ze.http_method == 'DELETE':
-        log.log(logging.INFO, ze)
-        # Allow other systems to proceed if delete fails.
-        result['success'] = True
-        return result
       log.log(logging.ERROR, ze)
-      return result
-    except OSError as fe:
-      # Catches general filesystem errors. If download could not be written to disk, stop.
+      if ze.status_code == 404:
+        # There is no recording.
+        return result
+      return {**result, 'status': ze.status_code}
+    except InterruptedError:
+      log.log(logging.INFO, f'Download of meeting {meeting_id} interrupted, it will be resumed '
+                            'by the next run.')
+      return {**result, 'interrupted': True}
+    except (OSError, urllib3.exceptions.HTTPError) as fe:
+      # Catches general filesystem errors and connections that broke during the download. If
+      # download could not be written to disk, stop.
       log.log(logging.ERROR, fe)
+      if isinstance(fe, (requests.exceptions.Timeout, urllib3.exceptions.TimeoutError)):
+        return {**result, 'status': 'timeout'}
+      if isinstance(fe, (requests.exceptions.ConnectionError, urllib3.exceptions.HTTPError)):
+        return {**result, 'status': 'connection'}
       return result